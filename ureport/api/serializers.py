@@ -6,6 +6,8 @@ from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from sorl.thumbnail import get_thumbnail
 
+from django.db import models
+
 from dash.categories.models import Category
 from dash.dashblocks.models import DashBlock
 from dash.orgs.models import Org
@@ -145,6 +147,17 @@ class StoryReadSerializer(serializers.ModelSerializer):
         )
 
 
+class PollListReadSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        polls = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        # the results of all the questions of the page are read from the cache at once
+        if "questions" in self.child.fields:
+            Poll.prefetch_polls_questions_results(polls)
+
+        return super(PollListReadSerializer, self).to_representation(polls)
+
+
 class PollReadSerializer(serializers.ModelSerializer):
     category = CategoryReadSerializer()
     questions = SerializerMethodField()
@@ -173,8 +186,14 @@ class PollReadSerializer(serializers.ModelSerializer):
                 self.fields.pop(field_names, None)
 
     def get_questions(self, obj):
+        # the polls of a list have their questions prefetched by the list serializer
+        if hasattr(obj, "prefetched_questions"):
+            poll_questions = obj.get_questions()
+        else:
+            poll_questions = obj.prefetch_questions_results()
+
         questions = []
-        for question in obj.get_questions():
+        for question in poll_questions:
             open_ended = question.is_open_ended()
             results_dict = dict(open_ended=open_ended)
             results = question.get_results()
@@ -203,6 +222,7 @@ class PollReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Poll
         fields = ("id", "flow_uuid", "title", "org", "category", "poll_date", "modified_on", "created_on", "questions")
+        list_serializer_class = PollListReadSerializer
 
 
 class NewsItemReadSerializer(serializers.ModelSerializer):
@@ -10,6 +10,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.utils import timezone
 
 from dash.categories.models import Category
@@ -432,6 +433,43 @@ class UreportAPITests(APITestCase):
             ),
         )
 
+    def test_polls_by_org_list_prefetches_questions_results(self):
+        questions = [
+            self.create_poll_question(self.superuser, poll, "What's on mind? :)", "uuid-%d" % poll.pk)
+            for poll in (self.reg_poll, self.another_poll, self.first_featured_poll)
+        ]
+        question_keys = {
+            question.get_results_cache_key(segment) for question in questions for segment in (None, dict(age="Age"))
+        }
+
+        for url, num_questions in (
+            ("/api/v1/polls/org/%d/" % self.uganda.pk, 3),
+            ("/api/v1/polls/org/%d/featured/" % self.uganda.pk, 1),
+        ):
+            with (
+                patch("django.core.cache.cache.get_many", wraps=cache.get_many) as mock_cache_get_many,
+                patch("django.core.cache.cache.get", wraps=cache.get) as mock_cache_get,
+            ):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # the results of all the questions of the page are read with a single cache call
+            results_calls = [call for call in mock_cache_get_many.call_args_list if question_keys & set(call.args[0])]
+            self.assertEqual(len(results_calls), 1)
+            self.assertEqual(
+                len(results_calls[0].args[0]), num_questions * (len(PollQuestion.POLL_QUESTION_RESULTS_SEGMENTS) + 2)
+            )
+            self.assertFalse([call for call in mock_cache_get.call_args_list if call.args[0] in question_keys])
+
+        # a single poll still reads all the results of its questions at once
+        with patch("django.core.cache.cache.get_many", wraps=cache.get_many) as mock_cache_get_many:
+            response = self.client.get("/api/v1/polls/%d/" % self.reg_poll.pk)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(
+            len([call for call in mock_cache_get_many.call_args_list if question_keys & set(call.args[0])]), 1
+        )
+
     def test_featured_poll_by_org_list_when_featured_polls_exists(self):
         url = "/api/v1/polls/org/%d/featured/" % self.uganda.pk
         response = self.client.get(url)
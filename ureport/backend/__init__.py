@@ -14,21 +14,34 @@ class ChunkResult:
     passed to the next chunk call (duplicate work is acceptable - writes are upserts);
     done is True when the pull has no work left; rate_limited is True when the chunk
     stopped early because the API rate limit was exhausted and the caller should back off
-    before the next chunk.
+    before the next chunk, for retry_after seconds when the API said how long; requests is
+    the number of API requests the chunk made, None when the backend can't tell.
     """
 
     counts: dict = field(default_factory=dict)
     cursor: dict = field(default_factory=dict)
     done: bool = False
     rate_limited: bool = False
+    requests: int = None
+    retry_after: int = None
 
 
 class BaseBackend(object):
     __metaclass__ = ABCMeta
 
+    # whether pull_results_chunk adds results counters deltas itself, so no full rebuild is needed after a pull
+    supports_incremental_results_counts = False
+
     def __init__(self, backend):
         self.backend = backend
 
+    def get_rate_budget(self, org):
+        """
+        Gets the budget of API requests the pulls of the org from this backend draw from, None if they aren't rate
+        limited
+        """
+        return None
+
     @abstractmethod
     def pull_fields(self, org):
         """
@@ -60,31 +73,65 @@ class BaseBackend(object):
         pass
 
     # ------------------------------------------------------------------------------
-    # Chunked pulls - bounded, resumable units of the pulls above. These defaults do
+    # Chunked pulls - bounded, resumable units of syncing. The contacts default does
     # the entire pull as a single chunk; backends that support real pagination should
-    # override them to do a bounded amount of work per call and return a cursor.
+    # override it to do a bounded amount of work per call and return a cursor.
     # ------------------------------------------------------------------------------
 
-    def pull_contacts_chunk(self, org, modified_after, modified_before, cursor, time_budget=None):
+    # API requests a chunk of each pull asks the rate budget for, a results chunk fetches as many pages as granted
+    RESULTS_CHUNK_REQUESTS = 20
+    ARCHIVES_CHUNK_REQUESTS = 5
+    CONTACTS_CHUNK_REQUESTS = 25
+
+    # seconds to wait after hitting the API rate limit when neither the API nor a budget tell how long it takes
+    RATE_LIMIT_BACKOFF = 60 * 5
+
+    def pull_budgeted_chunk(self, org, priority, cost, pull):
+        """
+        Runs one chunk of a pull within the org's rate budget, for the priority class of the pull.
+        :param pull: called with the number of API requests granted, None without a budget, returns a ChunkResult
+        :return: the ChunkResult, None if the budget had nothing to grant, and the seconds to wait before the next
+        chunk, 0 when it can follow straight away
+        """
+        budget = self.get_rate_budget(org)
+        if not budget:
+            result = pull(None)
+            return result, (result.retry_after or self.RATE_LIMIT_BACKOFF) if result.rate_limited else 0
+
+        granted, wait = budget.acquire(priority, cost)
+        if not granted:
+            return None, wait
+
+        result = pull(granted)
+        budget.settle(priority, granted, result.requests)
+
+        if result.rate_limited:
+            # the API knows best when it accepts requests again, the budget refill covers our own share
+            return result, max(budget.exhaust(priority, cost), result.retry_after or 0)
+        return result, 0
+
+    def pull_contacts_chunk(self, org, modified_after, modified_before, cursor, time_budget=None, page_budget=None):
         """
         Pulls one bounded chunk of contacts modified in the given time window. The window
         must stay fixed for the life of a cursor: a resumed page cursor is only valid
         against the exact query it came from, so callers freeze (after, before) when a
         traversal starts and roll the window only after done.
         :param cursor: the resume position returned by the previous chunk, or {} to start
+        :param page_budget: the API pages of contacts the chunk may fetch, the backend default when None
         :return: a ChunkResult whose counts dict has the created/updated/deleted/ignored keys
         """
         counts, _ = self.pull_contacts(org, modified_after, modified_before)
         return ChunkResult(counts=self._outcome_counts_dict(counts), cursor={}, done=True)
 
-    def pull_results_chunk(self, poll, cursor, page_budget=None):
+    @abstractmethod
+    def pull_results_chunk(self, poll, cursor, page_budget=None, incremental_counts=False):
         """
         Pulls one bounded chunk of results for the given poll.
         :param cursor: the resume position returned by the previous chunk, or {} to start
+        :param incremental_counts: whether to add the results counters deltas, only when the backend supports them
         :return: a ChunkResult whose counts dict has the num_val_* / num_path_* / num_synced keys
         """
-        counts = self.pull_results(poll, None, None)
-        return ChunkResult(counts=self._results_counts_dict(counts), cursor=dict(cursor), done=True)
+        pass
 
     def pull_results_from_archives_chunk(self, poll, cursor, archive_budget=None):
         """
@@ -95,6 +142,18 @@ class BaseBackend(object):
         """
         return ChunkResult(counts=self._results_counts_dict(()), cursor=dict(cursor), done=True)
 
+    def pull_results_from_archives_fanout_chunk(self, polls, cursors, archive_budget=None):
+        """
+        Pulls one bounded chunk of archived results for several polls of the same org. Backends that can't share an
+        archive pass between polls pull each poll on its own.
+        :param cursors: the resume positions returned by the previous chunk by poll id, missing polls start over
+        :return: a dict of ChunkResult by poll id
+        """
+        return {
+            poll.id: self.pull_results_from_archives_chunk(poll, cursors.get(poll.id) or dict(), archive_budget)
+            for poll in polls
+        }
+
     @staticmethod
     def _results_counts_dict(counts_tuple):
         keys = (
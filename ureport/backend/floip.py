@@ -1,28 +1,202 @@
 # -*- coding: utf-8 -*-
 
+import codecs
 import gc
+import json
 import logging
-import time
+import re
+import threading
 from collections import defaultdict
 
 import requests
-from django_valkey import get_valkey_connection
+from requests.adapters import HTTPAdapter
 from temba_client.v2 import TembaClient
+from urllib3.util.retry import Retry
 
 from django.conf import settings
-from django.core.cache import cache
-from django.utils import timezone
 
 from dash.utils.sync import BaseSyncer, SyncOutcome, sync_local_to_changes
 from ureport.contacts.models import Contact
 from ureport.locations.models import Boundary
-from ureport.polls.models import Poll, PollQuestion, PollResponseCategory, PollResult
-from ureport.utils import datetime_to_json_date, json_date_to_datetime
+from ureport.polls.models import PollQuestion, PollResponseCategory, PollResult
+from ureport.utils import chunk_list, json_date_to_datetime
 
-from . import BaseBackend
+from . import BaseBackend, ChunkResult
 
 logger = logging.getLogger(__name__)
 
+FLOIP_API_URL = "https://go.votomobile.org/flow-results/packages/"
+
+RESPONSES_ARRAY_REGEX = re.compile(r'"responses"\s*:\s*\[')
+JSON_DECODER = json.JSONDecoder()
+
+
+class FLOIPRateExceededError(Exception):
+    """
+    Raised when the FLOIP API still refuses a request as over its rate limit after the retries
+    """
+
+
+class FLOIPResponsesPage:
+    """
+    A page of the responses of a flow results package, decoded as it streams in. Iterating gives the response rows
+    one at a time, without loading the whole page, and the link to the next page is known once they have all been
+    read.
+    """
+
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, response):
+        self.response = response
+        self.next_url = None
+
+        self._chunks = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+
+    def __iter__(self):
+        self._chunks = self.response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+
+        try:
+            match = RESPONSES_ARRAY_REGEX.search(self._buffer)
+            while not match:
+                if not self._read():
+                    raise ValueError("FLOIP page has no responses")
+                match = RESPONSES_ARRAY_REGEX.search(self._buffer)
+
+            # the rest of the document, with an empty responses array, is decoded once the rows are read
+            head = self._buffer[: match.end()]
+            self._pos = match.end()
+
+            while True:
+                self._skip_separators()
+                if self._buffer[self._pos] == "]":
+                    break
+
+                try:
+                    row, end = JSON_DECODER.raw_decode(self._buffer, self._pos)
+                except json.JSONDecodeError:
+                    if self._read():
+                        continue
+                    raise
+
+                # a value ending with the buffer may carry on in the next chunk
+                if end == len(self._buffer) and self._read():
+                    continue
+
+                self._pos = end
+                yield row
+
+            while self._read():
+                pass
+
+            document = json.loads(head + self._buffer[self._pos :])
+            self.next_url = document["data"]["relationships"]["links"]["next"]
+        finally:
+            self.response.close()
+
+    def _read(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+
+        self._buffer = self._buffer[self._pos :] + self._decoder.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _skip_separators(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n,":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return
+            if not self._read():
+                raise ValueError("FLOIP page ended within its responses")
+
+
+class FLOIPClient:
+    """
+    Client for the flow results API of a FLOIP backend. Requests made with the same token share a session, so pages
+    are fetched over pooled keep-alive connections, and time out instead of hanging. Requests failing because the
+    server is briefly unavailable or rate limiting are retried with back-off.
+    """
+
+    TIMEOUT = (10, 120)  # seconds to connect and between bytes read
+    RETRIES = 3
+    RETRY_BACKOFF = 2
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    _sessions = dict()
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, api_token):
+        self.session = self._get_session(api_token)
+
+    @classmethod
+    def _get_session(cls, api_token):
+        with cls._sessions_lock:
+            session = cls._sessions.get(api_token)
+            if session is None:
+                session = requests.Session()
+                session.headers.update(
+                    {
+                        "Content-type": "application/json",
+                        "Accept": "application/json",
+                        "Authorization": "Token %s" % api_token,
+                    }
+                )
+
+                agent = getattr(settings, "SITE_API_USER_AGENT", None)
+                if agent:
+                    session.headers["User-Agent"] = agent
+
+                retries = Retry(
+                    total=cls.RETRIES,
+                    backoff_factor=cls.RETRY_BACKOFF,
+                    status_forcelist=cls.RETRY_STATUSES,
+                    allowed_methods=("GET",),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(max_retries=retries)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                cls._sessions[api_token] = session
+            return session
+
+    def _get(self, url, params=None, stream=False):
+        response = self.session.get(url, params=params, timeout=self.TIMEOUT, stream=stream)
+        if response.status_code == 429:
+            response.close()
+            raise FLOIPRateExceededError()
+
+        response.raise_for_status()
+        return response
+
+    def get_flows(self):
+        flows = []
+        flow_url = FLOIP_API_URL
+
+        while flow_url:
+            response_json = self._get(flow_url).json()
+
+            flows += response_json["data"]
+            flow_url = response_json["links"]["next"]
+        return flows
+
+    def get_definition(self, flow_uuid):
+        return self._get(FLOIP_API_URL + flow_uuid).json()
+
+    def get_responses(self, flow_uuid, after=None, url=None):
+        """
+        Gets a page of the responses of a flow after the given time, the first one or the one at the next link of a
+        previous page of the same query
+        """
+        params = dict(filter={"start-timestamp": after})
+        url = url or FLOIP_API_URL + "%s/responses" % flow_uuid
+        return FLOIPResponsesPage(self._get(url, params=params, stream=True))
+
 
 class ContactSyncer(BaseSyncer):
     model = Contact
@@ -33,26 +207,10 @@ class ContactSyncer(BaseSyncer):
         if hasattr(self, cache_attr):
             return getattr(self, cache_attr)
 
-        org_state_boundaries_data = dict()
-        org_district_boundaries_data = dict()
-        org_ward_boundaries_data = dict()
-        state_boundaries = Boundary.objects.filter(org=org, level=Boundary.STATE_LEVEL)
-        for state in state_boundaries:
-            org_state_boundaries_data[state.name.lower()] = state.osm_id
-            state_district_data = dict()
-            district_boundaries = Boundary.objects.filter(org=org, level=Boundary.DISTRICT_LEVEL, parent=state)
-            for district in district_boundaries:
-                state_district_data[district.name.lower()] = district.osm_id
-                district_ward_data = dict()
-                ward_boundaries = Boundary.objects.filter(org=org, level=Boundary.WARD_LEVEL, parent=district)
-                for ward in ward_boundaries:
-                    district_ward_data[ward.name.lower()] = ward.osm_id
-                org_ward_boundaries_data[district.osm_id] = district_ward_data
-
-            org_district_boundaries_data[state.osm_id] = state_district_data
-
-        setattr(self, cache_attr, (org_state_boundaries_data, org_district_boundaries_data, org_ward_boundaries_data))
-        return org_state_boundaries_data, org_district_boundaries_data, org_ward_boundaries_data
+        boundaries_data = Boundary.get_index(org)
+
+        setattr(self, cache_attr, boundaries_data)
+        return boundaries_data
 
     def local_kwargs(self, org, remote):
         from ureport.utils import json_date_to_datetime
@@ -77,7 +235,7 @@ class ContactSyncer(BaseSyncer):
                 state_path = remote.fields.get(state_field, None)
                 if state_path:
                     state_name = state_path.split(" > ")[-1]
-                    state_name = state_name.lower()
+                    state_name = Boundary.normalize_name(state_name)
                     state = org_state_boundaries_data.get(state_name, "")
 
                 district_field = org.get_config("%s.district_label" % self.backend.slug, default="")
@@ -86,7 +244,7 @@ class ContactSyncer(BaseSyncer):
                     district_path = remote.fields.get(district_field, None)
                     if district_path:
                         district_name = district_path.split(" > ")[-1]
-                        district_name = district_name.lower()
+                        district_name = Boundary.normalize_name(district_name)
                         district = org_district_boundaries_data.get(state, dict()).get(district_name, "")
 
                 ward_field = org.get_config("%s.ward_label" % self.backend.slug, default="")
@@ -95,7 +253,7 @@ class ContactSyncer(BaseSyncer):
                     ward_path = remote.fields.get(ward_field, None)
                     if ward_path:
                         ward_name = ward_path.split(" > ")[-1]
-                        ward_name = ward_name.lower()
+                        ward_name = Boundary.normalize_name(ward_name)
                         ward = org_ward_boundaries_data.get(district, dict()).get(ward_name, "")
 
         registered_on = None
@@ -174,10 +332,16 @@ class FLOIPBackend(BaseBackend):
     FLOIP instance as a backend
     """
 
+    # response rows processed together, so a large page doesn't need lookup maps for all of its rows at once
+    RESULTS_BATCH_SIZE = 500
+
     def _get_client(self, org):
         agent = getattr(settings, "SITE_API_USER_AGENT", None)
         return TembaClient(self.backend.host, self.backend.api_token, user_agent=agent)
 
+    def _get_results_client(self):
+        return FLOIPClient(self.backend.api_token)
+
     def pull_fields(self, org):
         # Not needed
         return {SyncOutcome.created: 0, SyncOutcome.updated: 0, SyncOutcome.deleted: 0, SyncOutcome.ignored: 0}
@@ -202,22 +366,7 @@ class FLOIPBackend(BaseBackend):
         )
 
     def fetch_flows(self, org):
-        flow_url = "https://go.votomobile.org/flow-results/packages/"
-
-        headers = {
-            "Content-type": "application/json",
-            "Accept": "application/json",
-            "Authorization": "Token %s" % self.backend.api_token,
-        }
-
-        flows = []
-
-        while flow_url:
-            response = requests.request("GET", flow_url, headers=headers)
-            response_json = response.json()
-
-            flows += response_json["data"]
-            flow_url = response_json["links"]["next"]
+        flows = self._get_results_client().get_flows()
 
         all_flows = dict()
         for flow in flows:
@@ -236,16 +385,7 @@ class FLOIPBackend(BaseBackend):
         return all_flows
 
     def get_definition(self, org, flow_uuid):
-        flow_url = "https://go.votomobile.org/flow-results/packages/" + flow_uuid
-
-        headers = {
-            "Content-type": "application/json",
-            "Accept": "application/json",
-            "Authorization": "Token %s" % self.backend.api_token,
-        }
-
-        response = requests.request("GET", flow_url, headers=headers)
-        response_json = response.json()
+        response_json = self._get_results_client().get_definition(flow_uuid)
 
         flow_definition = None
         try:
@@ -284,10 +424,22 @@ class FLOIPBackend(BaseBackend):
             for category in choices:
                 PollResponseCategory.update_or_create(question, None, category)
 
-    def pull_results(self, poll, modified_after, modified_before, progress_callback=None):
+    # ------------------------------------------------------------------------------
+    # Chunked pulls - bounded, resumable units of syncing, holding no locks and
+    # writing no cache bookkeeping like the RapidPro ones
+    # ------------------------------------------------------------------------------
+
+    RESULTS_PAGE_BUDGET = 20  # API pages of responses per chunk
+
+    def pull_results_chunk(self, poll, cursor, page_budget=None, incremental_counts=False):
+        """
+        Pulls up to page_budget API pages of responses for the poll. The cursor's "after" key is the newest response
+        time synced, and while a traversal is under way its "next" key is the link to its next page and its "start"
+        key the time the traversal started from.
+        """
+        if page_budget is None:
+            page_budget = self.RESULTS_PAGE_BUDGET
         org = poll.org
-        r = get_valkey_connection()
-        key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (org.pk, poll.flow_uuid)
 
         stats_dict = dict(
             num_val_created=0,
@@ -299,150 +451,80 @@ class FLOIPBackend(BaseBackend):
             num_synced=0,
         )
 
-        if r.get(key):
-            logger.info("Skipping pulling results for poll #%d on org #%d as it is still running" % (poll.pk, org.pk))
-        else:
-            with r.lock(key, timeout=Poll.POLL_SYNC_LOCK_TIMEOUT):
-                lock_expiration = time.time() + 0.8 * Poll.POLL_SYNC_LOCK_TIMEOUT
-
-                poll_results_url = "https://go.votomobile.org/flow-results/packages/%s/responses" % poll.flow_uuid
+        if poll.stopped_syncing:
+            return ChunkResult(counts=stats_dict, cursor=dict(cursor), done=True)
 
-                headers = {
-                    "Content-type": "application/json",
-                    "Accept": "application/json",
-                    "Authorization": "Token %s" % self.backend.api_token,
-                }
+        client = self._get_results_client()
+        questions_uuids = poll.get_question_uuids()
 
-                results = []
+        latest_synced_obj_time = cursor.get("after")
+        next_url = cursor.get("next")
+        query_start = cursor.get("start") if next_url else latest_synced_obj_time
 
-                questions_uuids = poll.get_question_uuids()
+        pages = 0
+        rate_limited = False
 
-                # ignore the TaskState time and use the time we stored in valkey
-                (
-                    latest_synced_obj_time,
-                    pull_after_delete,
-                ) = poll.get_pull_cached_params()
+        try:
+            while True:
+                page = client.get_responses(poll.flow_uuid, after=query_start, url=next_url)
+                latest_synced_obj_time = self._pull_results_page(
+                    org, poll, questions_uuids, page, latest_synced_obj_time, stats_dict
+                )
+                next_url = page.next_url
+
+                pages += 1
+                if not next_url or pages >= page_budget:
+                    break
+        except FLOIPRateExceededError:
+            rate_limited = True
+
+        next_cursor = {"after": latest_synced_obj_time}
+        if next_url:
+            next_cursor.update(start=query_start, next=next_url)
+
+        return ChunkResult(
+            counts=stats_dict,
+            cursor=next_cursor,
+            done=not next_url and not rate_limited,
+            rate_limited=rate_limited,
+            requests=pages + int(rate_limited),
+        )
 
-                if pull_after_delete is not None:
-                    latest_synced_obj_time = None
-                    poll.delete_poll_results()
+    def _pull_results_page(self, org, poll, questions_uuids, page, latest_synced_obj_time, stats_dict):
+        """
+        Syncs the responses of a page as they stream in, in batches. Returns the newest response time synced.
+        """
+        for batch in chunk_list(page, self.RESULTS_BATCH_SIZE):
+            results = list(batch)
+
+            (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(results, org, poll)
+
+            for result in results:
+                if latest_synced_obj_time is None or json_date_to_datetime(result[0]) > json_date_to_datetime(
+                    latest_synced_obj_time
+                ):
+                    latest_synced_obj_time = result[0]
+
+                contact_obj = contacts_map.get(result[2], None)
+                self._process_run_poll_results(
+                    org,
+                    poll.flow_uuid,
+                    questions_uuids,
+                    result,
+                    contact_obj,
+                    poll_results_map,
+                    poll_results_to_save_map,
+                    stats_dict,
+                )
 
-                start = time.time()
-                logger.info("Start fetching runs for poll #%d on org #%d" % (poll.pk, org.pk))
+            stats_dict["num_synced"] += len(results)
+            self._save_new_poll_results_to_database(poll_results_to_save_map)
 
-                params = dict(
-                    filter={"start-timestamp": latest_synced_obj_time},
-                )
+            # release per-batch lookup maps holding cyclic references before next allocation
+            del contacts_map, poll_results_map, poll_results_to_save_map
+            gc.collect()
 
-                while poll_results_url:
-                    response = requests.request("GET", poll_results_url, headers=headers, params=params)
-                    response_json = response.json()
-
-                    results = response_json["data"]["attributes"]["responses"]
-                    poll_results_url = response_json["data"]["relationships"]["links"]["next"]
-
-                    (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(
-                        results, org, poll
-                    )
-
-                    for result in results:
-                        if latest_synced_obj_time is None or json_date_to_datetime(result[0]) > json_date_to_datetime(
-                            latest_synced_obj_time
-                        ):
-                            latest_synced_obj_time = result[0]
-
-                        contact_obj = contacts_map.get(result[2], None)
-                        self._process_run_poll_results(
-                            org,
-                            poll.flow_uuid,
-                            questions_uuids,
-                            result,
-                            contact_obj,
-                            poll_results_map,
-                            poll_results_to_save_map,
-                            stats_dict,
-                        )
-
-                    stats_dict["num_synced"] += len(results)
-                    if progress_callback:
-                        progress_callback(stats_dict["num_synced"])
-
-                    self._save_new_poll_results_to_database(poll_results_to_save_map)
-
-                    logger.info(
-                        "Processed fetch of %d - %d "
-                        "runs for poll #%d on org #%d"
-                        % (stats_dict["num_synced"] - len(results), stats_dict["num_synced"], poll.pk, org.pk)
-                    )
-
-                    # release per-page lookup maps holding cyclic references before next allocation
-                    del contacts_map, poll_results_map, poll_results_to_save_map
-                    gc.collect()
-
-                    # fetch_start = time.time()
-                    logger.info("=" * 40)
-
-                    if stats_dict["num_synced"] >= Poll.POLL_RESULTS_MAX_SYNC_RUNS or time.time() > lock_expiration:
-                        poll.rebuild_poll_results_counts()
-
-                        self._mark_poll_results_sync_paused(org, poll, latest_synced_obj_time)
-
-                        logger.info(
-                            "Break pull results for poll #%d on org #%d in %ds, "
-                            "Times: sync_latest= %s, "
-                            "Objects: created %d, updated %d, ignored %d. "
-                            % (
-                                poll.pk,
-                                org.pk,
-                                time.time() - start,
-                                latest_synced_obj_time,
-                                stats_dict["num_val_created"],
-                                stats_dict["num_val_updated"],
-                                stats_dict["num_val_ignored"],
-                            )
-                        )
-
-                        return (
-                            stats_dict["num_val_created"],
-                            stats_dict["num_val_updated"],
-                            stats_dict["num_val_ignored"],
-                            stats_dict["num_path_created"],
-                            stats_dict["num_path_updated"],
-                            stats_dict["num_path_ignored"],
-                        )
-
-                self._mark_poll_results_sync_completed(poll, org, latest_synced_obj_time)
-
-                # from django.db import connection as db_connection, reset_queries
-                # slowest_queries = sorted(db_connection.queries, key=lambda q: q['time'], reverse=True)[:10]
-                # for q in slowest_queries:
-                #     print "=" * 60
-                #     print "\n\n\n"
-                #     print "%s -- %s" % (q['time'], q['sql'])
-                # reset_queries()
-
-                logger.info(
-                    "Finished pulling results for poll #%d on org #%d runs in %ds, "
-                    "Times: sync_latest= %s,"
-                    "Objects: created %d, updated %d, ignored %d"
-                    % (
-                        poll.pk,
-                        org.pk,
-                        time.time() - start,
-                        latest_synced_obj_time,
-                        stats_dict["num_val_created"],
-                        stats_dict["num_val_updated"],
-                        stats_dict["num_val_ignored"],
-                    )
-                )
-        return (
-            stats_dict["num_val_created"],
-            stats_dict["num_val_updated"],
-            stats_dict["num_val_ignored"],
-            stats_dict["num_path_created"],
-            stats_dict["num_path_updated"],
-            stats_dict["num_path_ignored"],
-        )
+        return latest_synced_obj_time
 
     def _initiate_lookup_maps(self, fetch, org, poll):
         contact_uuids = [run[2] for run in fetch]
@@ -606,35 +688,3 @@ class FLOIPBackend(BaseBackend):
                 if obj_to_create is not None:
                     new_poll_results.append(obj_to_create)
         PollResult.objects.bulk_create(new_poll_results)
-
-    @staticmethod
-    def _mark_poll_results_sync_paused(org, poll, latest_synced_obj_time):
-        # update the time for this poll from which we fetch next time
-        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (org.pk, poll.flow_uuid), latest_synced_obj_time, None)
-
-        from ureport.polls.tasks import pull_refresh
-
-        pull_refresh.apply_async((poll.pk,), countdown=300, queue="sync")
-
-    @staticmethod
-    def _mark_poll_results_sync_completed(poll, org, latest_synced_obj_time):
-        # update the time for this poll from which we fetch next time
-        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (org.pk, poll.flow_uuid), latest_synced_obj_time, None)
-
-        # update the last time the sync happened, for displaying in polls list on admin page
-        now = timezone.now()
-        cache.set(
-            Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (org.pk, poll.flow_uuid),
-            datetime_to_json_date(now),
-            None,
-        )
-
-        # Use Valkey cache with expiring(in 48 hrs) key to allow other polls task
-        # to sync all polls without hitting the API rate limit
-        cache.set(
-            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (org.id, poll.flow_uuid),
-            datetime_to_json_date(now),
-            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_TIMEOUT,
-        )
-
-        Poll.objects.filter(id=poll.pk).update(modified_on=now)
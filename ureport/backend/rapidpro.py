@@ -2,7 +2,6 @@
 
 import gc
 import gzip
-import io
 import json
 import logging
 import time
@@ -10,22 +9,23 @@ from collections import defaultdict
 from datetime import timedelta, timezone as tzone
 
 import requests
-from django_valkey import get_valkey_connection
 from temba_client.exceptions import TembaRateExceededError
 from temba_client.v2.types import Run
 
-from django.core.cache import cache
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 from dash.utils import is_dict_equal
-from dash.utils.sync import BaseSyncer, sync_local_to_changes, sync_local_to_set
+from dash.utils.sync import BaseSyncer, SyncOutcome, sync_local_to_changes, sync_local_to_set
 from ureport.contacts.models import Contact, ContactField
 from ureport.flows.models import FlowResultCategory
 from ureport.locations.models import Boundary
-from ureport.polls.models import Poll, PollQuestion, PollResponseCategory, PollResult
-from ureport.polls.tasks import pull_refresh_from_archives
+from ureport.polls.models import PollQuestion, PollResponseCategory, PollResult
 from ureport.stats.models import ContactActivity
 from ureport.utils import chunk_list, datetime_to_json_date, json_date_to_datetime
+from ureport.utils.prefetch import PrefetchedFetches
+from ureport.utils.rate_budget import RateBudget
 
 from . import BaseBackend, ChunkResult
 
@@ -131,30 +131,10 @@ class ContactSyncer(BaseSyncer):
         if hasattr(self, cache_attr):
             return getattr(self, cache_attr)
 
-        org_state_boundaries_data = dict()
-        org_district_boundaries_data = dict()
-        org_ward_boundaries_data = dict()
-        state_boundaries = Boundary.objects.filter(org=org, level=Boundary.STATE_LEVEL, backend=self.backend)
-        for state in state_boundaries:
-            org_state_boundaries_data[state.name.lower()] = state.osm_id
-            state_district_data = dict()
-            district_boundaries = Boundary.objects.filter(
-                org=org, level=Boundary.DISTRICT_LEVEL, parent=state, backend=self.backend
-            )
-            for district in district_boundaries:
-                state_district_data[district.name.lower()] = district.osm_id
-                district_ward_data = dict()
-                ward_boundaries = Boundary.objects.filter(
-                    org=org, level=Boundary.WARD_LEVEL, parent=district, backend=self.backend
-                )
-                for ward in ward_boundaries:
-                    district_ward_data[ward.name.lower()] = ward.osm_id
-                org_ward_boundaries_data[district.osm_id] = district_ward_data
-
-            org_district_boundaries_data[state.osm_id] = state_district_data
+        boundaries_data = Boundary.get_index(org, self.backend)
 
-        setattr(self, cache_attr, (org_state_boundaries_data, org_district_boundaries_data, org_ward_boundaries_data))
-        return org_state_boundaries_data, org_district_boundaries_data, org_ward_boundaries_data
+        setattr(self, cache_attr, boundaries_data)
+        return boundaries_data
 
     def get_contact_fields(self, org):
         cache_attr = "__contact_fields__%d:%s" % (org.pk, self.backend.slug)
@@ -201,7 +181,7 @@ class ContactSyncer(BaseSyncer):
                 state_path = remote.fields.get(contact_fields.get(state_field), None)
                 if state_path:
                     state_name = state_path.split(" > ")[-1]
-                    state_name = state_name.lower()
+                    state_name = Boundary.normalize_name(state_name)
                     state = org_state_boundaries_data.get(state_name, "")
 
                 district_field = org.get_config("%s.district_label" % self.backend.slug, default="")
@@ -210,7 +190,7 @@ class ContactSyncer(BaseSyncer):
                     district_path = remote.fields.get(contact_fields.get(district_field), None)
                     if district_path:
                         district_name = district_path.split(" > ")[-1]
-                        district_name = district_name.lower()
+                        district_name = Boundary.normalize_name(district_name)
                         district = org_district_boundaries_data.get(state, dict()).get(district_name, "")
 
                 ward_field = org.get_config("%s.ward_label" % self.backend.slug, default="")
@@ -219,7 +199,7 @@ class ContactSyncer(BaseSyncer):
                     ward_path = remote.fields.get(contact_fields.get(ward_field), None)
                     if ward_path:
                         ward_name = ward_path.split(" > ")[-1]
-                        ward_name = ward_name.lower()
+                        ward_name = Boundary.normalize_name(ward_name)
                         ward = org_ward_boundaries_data.get(district, dict()).get(ward_name, "")
 
         registered_on = None
@@ -326,6 +306,22 @@ class RapidProBackend(BaseBackend):
     RapidPro instance as a backend
     """
 
+    supports_incremental_results_counts = True
+
+    # the fields of existing results updated by a sync
+    POLL_RESULT_UPDATE_FIELDS = (
+        "category",
+        "text",
+        "state",
+        "district",
+        "ward",
+        "date",
+        "born",
+        "gender",
+        "scheme",
+        "completed",
+    )
+
     @staticmethod
     def _get_client(org, api_version):
         from temba_client.v2.types import Field
@@ -340,6 +336,9 @@ class RapidProBackend(BaseBackend):
 
         return org.get_temba_client(api_version=api_version, transformer=convert_old_fields)
 
+    def get_rate_budget(self, org):
+        return RateBudget(org.id, self.backend.slug, settings.RAPIDPRO_API_RATE_LIMIT)
+
     def fetch_flows(self, org):
         client = self._get_client(org, 2)
         flows = client.get_flows().all()
@@ -412,7 +411,13 @@ class RapidProBackend(BaseBackend):
             client = self._get_client(org, 2)
             incoming_objects = client.get_boundaries(geometry=True).all()
 
-        return sync_local_to_set(org, BoundarySyncer(backend=self.backend), incoming_objects)
+        results = sync_local_to_set(org, BoundarySyncer(backend=self.backend), incoming_objects)
+
+        if results[SyncOutcome.created] or results[SyncOutcome.updated] or results[SyncOutcome.deleted]:
+            Boundary.clear_geojson_cache(org)
+            Boundary.clear_index(org, self.backend)
+
+        return results
 
     def pull_contacts(self, org, modified_after, modified_before, progress_callback=None):
         client = self._get_client(org, 2)
@@ -429,358 +434,84 @@ class RapidProBackend(BaseBackend):
             org, ContactSyncer(backend=self.backend), fetches, deleted_fetches, progress_callback
         )
 
-    def _iter_archive_records(self, archive, flow_uuid):
-        r = requests.get(archive.download_url, stream=True)
-        stream = gzip.GzipFile(fileobj=io.BytesIO(r.content))
-
-        while True:
-            line = stream.readline()
-            if not line:
-                break
-            line_decoded = line.decode("utf-8")
-            if line_decoded.find(flow_uuid) > 0:
-                yield json.loads(line_decoded)
-
-    def _iter_poll_record_runs(self, archive, poll_flow_uuid):
-        for record_batch in chunk_list(self._iter_archive_records(archive, poll_flow_uuid), 1000):
-            matching = []
-            for record in record_batch:
-                if record["flow"]["uuid"] == poll_flow_uuid:
-                    record.update(start=None)
-                    matching.append(record)
-            yield Run.deserialize_list(matching)
-
-    def pull_results_from_archives(self, poll):
-        org = poll.org
-        r = get_valkey_connection()
-        key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (org.pk, poll.flow_uuid)
-
-        stats_dict = dict(
-            num_val_created=0,
-            num_val_updated=0,
-            num_val_ignored=0,
-            num_path_created=0,
-            num_path_updated=0,
-            num_path_ignored=0,
-            num_synced=0,
-        )
-
-        if poll.stopped_syncing:
-            return (
-                stats_dict["num_val_created"],
-                stats_dict["num_val_updated"],
-                stats_dict["num_val_ignored"],
-                stats_dict["num_path_created"],
-                stats_dict["num_path_updated"],
-                stats_dict["num_path_ignored"],
-            )
-
-        with r.lock(key, timeout=Poll.POLL_PULL_ARCHIVES_LOCK_TIMEOUT):
-            flow_date_json = poll.get_flow_date()
-            first = (
-                json_date_to_datetime(flow_date_json).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                if flow_date_json
-                else None
-            )
-
-            client = self._get_client(org, 2)
-
-            questions_uuids = poll.get_question_uuids()
-            archives_query = client.get_archives(type="run", after=first)
-            archives_fetches = archives_query.iterfetches(retry_on_rate_exceed=True)
-
-            i = 0
-            for archives in archives_fetches:
-                for archive in archives:
-                    i += 1
-                    logger.info("Archive %d with %d records, size %d" % (i, archive.record_count, archive.size))
-
-                    try:
-                        start_archive = time.time()
-                        logger.info("Archive %d has %d records" % (i, archive.record_count))
-
-                        if archive.record_count <= 0:
-                            continue
-
-                        flow_uuid = poll.flow_uuid
-
-                        for fetch in self._iter_poll_record_runs(archive, flow_uuid):
-                            fetch_start = time.time()
-
-                            (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(
-                                fetch, org, poll
-                            )
-
-                            for temba_run in fetch:
-                                contact_obj = contacts_map.get(temba_run.contact.uuid, None)
-                                self._process_run_poll_results(
-                                    org,
-                                    questions_uuids,
-                                    temba_run,
-                                    contact_obj,
-                                    poll_results_map,
-                                    poll_results_to_save_map,
-                                    stats_dict,
-                                )
-
-                            stats_dict["num_synced"] += len(fetch)
-
-                            self._save_new_poll_results_to_database(poll_results_to_save_map)
-
-                            logger.info(
-                                "Processing archive %d took %ds for fetch of %d"
-                                % (i, time.time() - fetch_start, len(fetch))
-                            )
-
-                            # release per-page lookup maps holding cyclic references before next allocation
-                            del contacts_map, poll_results_map, poll_results_to_save_map
-                            gc.collect()
+    def _iter_archive_records(self, archive, flow_uuids):
+        """
+        Iterates the records of the flows in the archive, decompressing the archive as it is downloaded so memory use
+        doesn't grow with the archive size. Only the lines containing one of the flow UUIDs are parsed.
+        """
+        flow_uuids_bytes = [flow_uuid.encode("utf-8") for flow_uuid in flow_uuids]
 
-                        logger.info("Full poll process archive in %ds" % (time.time() - start_archive))
-                    except Exception as e:
-                        logger.info(e)
-                        import traceback
+        with requests.get(archive.download_url, stream=True) as r:
+            r.raise_for_status()
 
-                        traceback.print_exc()
+            # apply any content encoding of the response, as reading the content would
+            r.raw.decode_content = True
 
-                    gc.collect()
+            with gzip.GzipFile(fileobj=r.raw) as stream:
+                for line in stream:
+                    if any(flow_uuid_bytes in line for flow_uuid_bytes in flow_uuids_bytes):
+                        yield json.loads(line)
 
-        return (
-            stats_dict["num_val_created"],
-            stats_dict["num_val_updated"],
-            stats_dict["num_val_ignored"],
-            stats_dict["num_path_created"],
-            stats_dict["num_path_updated"],
-            stats_dict["num_path_ignored"],
-        )
+    def _iter_archive_record_runs(self, archive, flow_uuids):
+        """
+        Iterates the runs of several flows in one pass over the archive, as batches of (flow UUID, runs)
+        """
+        flow_uuids = set(flow_uuids)
 
-    def pull_results(self, poll, modified_after, modified_before, progress_callback=None):
-        org = poll.org
-        r = get_valkey_connection()
-        key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (org.pk, poll.flow_uuid)
+        for record_batch in chunk_list(self._iter_archive_records(archive, flow_uuids), 1000):
+            matching = defaultdict(list)
+            for record in record_batch:
+                if record["flow"]["uuid"] in flow_uuids:
+                    record.update(start=None)
+                    matching[record["flow"]["uuid"]].append(record)
 
-        stats_dict = dict(
-            num_val_created=0,
-            num_val_updated=0,
-            num_val_ignored=0,
-            num_path_created=0,
-            num_path_updated=0,
-            num_path_ignored=0,
-            num_synced=0,
-        )
+            for flow_uuid, records in matching.items():
+                yield flow_uuid, Run.deserialize_list(records)
 
-        if poll.stopped_syncing:
-            return (
-                stats_dict["num_val_created"],
-                stats_dict["num_val_updated"],
-                stats_dict["num_val_ignored"],
-                stats_dict["num_path_created"],
-                stats_dict["num_path_updated"],
-                stats_dict["num_path_ignored"],
+    def _process_archive_runs(self, org, poll, questions_uuids, fetch, stats_dict):
+        """
+        Saves the poll results of a batch of archived runs of the poll flow
+        """
+        (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(fetch, org, poll)
+
+        for temba_run in fetch:
+            contact_obj = contacts_map.get(temba_run.contact.uuid, None)
+            self._process_run_poll_results(
+                org,
+                questions_uuids,
+                temba_run,
+                contact_obj,
+                poll_results_map,
+                poll_results_to_save_map,
+                stats_dict,
             )
 
-        if r.get(key):
-            logger.info("Skipping pulling results for poll #%d on org #%d as it is still running" % (poll.pk, org.pk))
-        else:
-            with r.lock(key, timeout=Poll.POLL_SYNC_LOCK_TIMEOUT):
-                lock_expiration = time.time() + 0.8 * Poll.POLL_SYNC_LOCK_TIMEOUT
-                client = self._get_client(org, 2)
-
-                questions_uuids = poll.get_question_uuids()
-
-                # ignore the TaskState time and use the time we stored in valkey
-                (
-                    latest_synced_obj_time,
-                    pull_after_delete,
-                ) = poll.get_pull_cached_params()
-
-                if pull_after_delete is not None:
-                    latest_synced_obj_time = None
-                    poll.delete_poll_results()
-                    pull_refresh_from_archives.apply_async((poll.pk,), queue="sync")
-
-                start = time.time()
-                logger.info("Start fetching runs for poll #%d on org #%d" % (poll.pk, org.pk))
-
-                # fetch runs from API, respecting rate limits
-                poll_runs_query = client.get_runs(
-                    flow=poll.flow_uuid, after=latest_synced_obj_time, reverse=True, paths=True
-                )
-                fetches = poll_runs_query.iterfetches(retry_on_rate_exceed=True)
-
-                try:
-                    fetch_start = time.time()
-
-                    for fetch in fetches:
-                        logger.info(
-                            "RapidPro API fetch for poll #%d "
-                            "on org #%d %d - %d took %ds"
-                            % (
-                                poll.pk,
-                                org.pk,
-                                stats_dict["num_synced"],
-                                stats_dict["num_synced"] + len(fetch),
-                                time.time() - fetch_start,
-                            )
-                        )
-
-                        # for each API page fetched, initiate the maps for quick lookups and as cache for the sync task
-                        (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(
-                            fetch, org, poll
-                        )
-
-                        for temba_run in fetch:
-                            if latest_synced_obj_time is None or temba_run.modified_on > json_date_to_datetime(
-                                latest_synced_obj_time
-                            ):
-                                latest_synced_obj_time = datetime_to_json_date(
-                                    temba_run.modified_on.replace(tzinfo=tzone.utc)
-                                )
-
-                            contact_obj = contacts_map.get(temba_run.contact.uuid, None)
-                            # for each run process, the results we can for the values and path for not yet responded
-                            self._process_run_poll_results(
-                                org,
-                                questions_uuids,
-                                temba_run,
-                                contact_obj,
-                                poll_results_map,
-                                poll_results_to_save_map,
-                                stats_dict,
-                            )
-
-                        stats_dict["num_synced"] += len(fetch)
-                        if progress_callback:
-                            progress_callback(stats_dict["num_synced"])
-
-                        # Save the objects to the DB for new objects in the respective map
-                        self._save_new_poll_results_to_database(poll_results_to_save_map)
-
-                        logger.info(
-                            "Processed fetch of %d - %d "
-                            "runs for poll #%d on org #%d"
-                            % (stats_dict["num_synced"] - len(fetch), stats_dict["num_synced"], poll.pk, org.pk)
-                        )
-
-                        # release per-page lookup maps holding cyclic references before next allocation
-                        del contacts_map, poll_results_map, poll_results_to_save_map
-                        gc.collect()
-
-                        fetch_start = time.time()
-                        logger.info("=" * 40)
-
-                        # Pause the sync for this poll when we have synced Poll.POLL_RESULTS_MAX_SYNC_RUNS runs this time
-                        if stats_dict["num_synced"] >= Poll.POLL_RESULTS_MAX_SYNC_RUNS or time.time() > lock_expiration:
-                            # rebuild the aggregated counts
-                            poll.rebuild_poll_results_counts()
-
-                            # mark this poll as paused, so we can resume from the proper time later
-                            self._mark_poll_results_sync_paused(org, poll, latest_synced_obj_time)
-
-                            logger.info(
-                                "Break pull results for poll #%d on org #%d in %ds, "
-                                "Times: sync_latest= %s, "
-                                "Objects: created %d, updated %d, ignored %d. "
-                                % (
-                                    poll.pk,
-                                    org.pk,
-                                    time.time() - start,
-                                    latest_synced_obj_time,
-                                    stats_dict["num_val_created"],
-                                    stats_dict["num_val_updated"],
-                                    stats_dict["num_val_ignored"],
-                                )
-                            )
-
-                            return (
-                                stats_dict["num_val_created"],
-                                stats_dict["num_val_updated"],
-                                stats_dict["num_val_ignored"],
-                                stats_dict["num_path_created"],
-                                stats_dict["num_path_updated"],
-                                stats_dict["num_path_ignored"],
-                            )
-                except TembaRateExceededError:
-                    # rebuild the aggregated counts
-                    poll.rebuild_poll_results_counts()
-
-                    # mark this poll as paused, so we can resume from the proper time later
-                    self._mark_poll_results_sync_paused(org, poll, latest_synced_obj_time)
+        stats_dict["num_synced"] += len(fetch)
 
-                    logger.info(
-                        "Break pull results for poll #%d on org #%d in %ds, "
-                        "Times: sync_latest= %s,"
-                        "Objects: created %d, updated %d, ignored %d. "
-                        % (
-                            poll.pk,
-                            org.pk,
-                            time.time() - start,
-                            latest_synced_obj_time,
-                            stats_dict["num_val_created"],
-                            stats_dict["num_val_updated"],
-                            stats_dict["num_val_ignored"],
-                        )
-                    )
+        self._save_poll_results_to_database(poll_results_to_save_map)
 
-                    return (
-                        stats_dict["num_val_created"],
-                        stats_dict["num_val_updated"],
-                        stats_dict["num_val_ignored"],
-                        stats_dict["num_path_created"],
-                        stats_dict["num_path_updated"],
-                        stats_dict["num_path_ignored"],
-                    )
-
-                # mark this poll as completed, so we can fetch from the proper time for future results from that time
-                self._mark_poll_results_sync_completed(poll, org, latest_synced_obj_time)
-
-                # from django.db import connection as db_connection, reset_queries
-                # slowest_queries = sorted(db_connection.queries, key=lambda q: q['time'], reverse=True)[:10]
-                # for q in slowest_queries:
-                #     print "=" * 60
-                #     print "\n\n\n"
-                #     print "%s -- %s" % (q['time'], q['sql'])
-                # reset_queries()
-
-                logger.info(
-                    "Finished pulling results for poll #%d on org #%d runs in %ds, "
-                    "Times: sync_latest= %s, "
-                    "Objects: created %d, updated %d, ignored %d"
-                    % (
-                        poll.pk,
-                        org.pk,
-                        time.time() - start,
-                        latest_synced_obj_time,
-                        stats_dict["num_val_created"],
-                        stats_dict["num_val_updated"],
-                        stats_dict["num_val_ignored"],
-                    )
-                )
-        return (
-            stats_dict["num_val_created"],
-            stats_dict["num_val_updated"],
-            stats_dict["num_val_ignored"],
-            stats_dict["num_path_created"],
-            stats_dict["num_path_updated"],
-            stats_dict["num_path_ignored"],
-        )
+        # release per-page lookup maps holding cyclic references before next allocation
+        del contacts_map, poll_results_map, poll_results_to_save_map
+        gc.collect()
 
     # ------------------------------------------------------------------------------
-    # Chunked pulls - bounded, resumable units of the pulls above. Unlike the methods
-    # they mirror, these hold no locks and write no cache bookkeeping: the caller owns
-    # cursor persistence, scheduling of the next chunk, and count rebuilds.
+    # Chunked pulls - bounded, resumable units of syncing. These hold no locks and
+    # write no cache bookkeeping: the caller owns cursor persistence, scheduling of
+    # the next chunk, and count rebuilds.
     # ------------------------------------------------------------------------------
 
     RESULTS_PAGE_BUDGET = 20  # API pages of runs per chunk
     CONTACTS_TIME_BUDGET = 60 * 2  # seconds of active contact syncing per chunk
-    CONTACTS_DELETED_PAGE_BUDGET = 25  # API pages of deleted contacts per chunk
+    CONTACTS_PAGE_BUDGET = 25  # API pages of active or deleted contacts per chunk
     ARCHIVES_BUDGET = 1  # archive files with records per chunk
+    PREFETCH_PAGES = 2  # API pages fetched ahead while the current page is processed
 
-    def pull_results_chunk(self, poll, cursor, page_budget=None):
+    def pull_results_chunk(self, poll, cursor, page_budget=None, incremental_counts=False):
         """
         Pulls up to page_budget API pages of runs for the poll. The cursor's "after" key is
         the durable incremental position (newest modified_on synced) and its "resume" key
-        is the API page cursor within the current traversal.
+        is the API page cursor within the current traversal. With incremental_counts, each
+        page adds the counters deltas of its results in the transaction saving them.
         """
         if page_budget is None:
             page_budget = self.RESULTS_PAGE_BUDGET
@@ -805,17 +536,23 @@ class RapidProBackend(BaseBackend):
         latest_synced_obj_time = cursor.get("after")
 
         poll_runs_query = client.get_runs(flow=poll.flow_uuid, after=latest_synced_obj_time, reverse=True, paths=True)
-        fetches = poll_runs_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume"))
+        fetches = PrefetchedFetches(
+            poll_runs_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume")),
+            depth=self.PREFETCH_PAGES,
+            limit=page_budget,
+        )
 
         pages = 0
         done = False
         rate_limited = False
+        retry_after = None
 
         try:
             for fetch in fetches:
                 (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(
                     fetch, org, poll
                 )
+                stats_deltas = defaultdict(int) if incremental_counts else None
 
                 for temba_run in fetch:
                     if latest_synced_obj_time is None or temba_run.modified_on > json_date_to_datetime(
@@ -832,10 +569,16 @@ class RapidProBackend(BaseBackend):
                         poll_results_map,
                         poll_results_to_save_map,
                         stats_dict,
+                        stats_deltas,
                     )
 
                 stats_dict["num_synced"] += len(fetch)
-                self._save_new_poll_results_to_database(poll_results_to_save_map)
+
+                with transaction.atomic():
+                    self._save_poll_results_to_database(poll_results_to_save_map, stats_deltas)
+
+                    if stats_deltas:
+                        poll.apply_poll_results_deltas(stats_deltas)
 
                 # release per-page lookup maps holding cyclic references before next allocation
                 del contacts_map, poll_results_map, poll_results_to_save_map
@@ -846,8 +589,11 @@ class RapidProBackend(BaseBackend):
                     break
             else:
                 done = True
-        except TembaRateExceededError:
+        except TembaRateExceededError as e:
             rate_limited = True
+            retry_after = e.retry_after
+        finally:
+            fetches.close()
 
         next_cursor = {"after": latest_synced_obj_time}
         if not done:
@@ -862,20 +608,29 @@ class RapidProBackend(BaseBackend):
                 # budget was hit on the traversal's last page - there is nothing left
                 done = True
 
-        return ChunkResult(counts=stats_dict, cursor=next_cursor, done=done, rate_limited=rate_limited)
+        return ChunkResult(
+            counts=stats_dict,
+            cursor=next_cursor,
+            done=done,
+            rate_limited=rate_limited,
+            requests=pages + int(rate_limited),
+            retry_after=retry_after,
+        )
 
-    def pull_contacts_chunk(self, org, modified_after, modified_before, cursor, time_budget=None):
+    def pull_contacts_chunk(self, org, modified_after, modified_before, cursor, time_budget=None, page_budget=None):
         """
         Pulls one bounded chunk of contacts modified in the given time window. The pull
         moves through two stages recorded in the cursor: "active" (changed contacts, time
-        boxed) then "deleted" (removed contacts, page bounded), each resumable from a page
-        cursor. The window must stay fixed for the life of the cursor: a resumed page
-        cursor is only valid against the exact query it came from, so callers freeze
-        (modified_after, modified_before) when a traversal starts and roll the window only
-        after done.
+        boxed) then "deleted" (removed contacts), both bounded to page_budget pages and
+        each resumable from a page cursor. The window must stay fixed for the life of the
+        cursor: a resumed page cursor is only valid against the exact query it came from,
+        so callers freeze (modified_after, modified_before) when a traversal starts and
+        roll the window only after done.
         """
         if time_budget is None:
             time_budget = self.CONTACTS_TIME_BUDGET
+        if page_budget is None:
+            page_budget = self.CONTACTS_PAGE_BUDGET
         client = self._get_client(org, 2)
         syncer = ContactSyncer(backend=self.backend)
 
@@ -883,11 +638,23 @@ class RapidProBackend(BaseBackend):
 
         if stage == "active":
             active_query = client.get_contacts(after=modified_after, before=modified_before)
-            fetches = active_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume"))
+            fetches = PrefetchedFetches(
+                active_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume")),
+                depth=self.PREFETCH_PAGES,
+                limit=page_budget,
+            )
+
+            pages = 0
+
+            def count_page(num_synced):
+                nonlocal pages
+                pages += 1
 
             try:
-                outcome_counts, resume_cursor = sync_local_to_changes(org, syncer, fetches, [], time_limit=time_budget)
-            except TembaRateExceededError:
+                outcome_counts, resume_cursor = sync_local_to_changes(
+                    org, syncer, fetches, [], progress_callback=count_page, time_limit=time_budget
+                )
+            except TembaRateExceededError as e:
                 # objects synced before the limit hit are already saved, only their counts
                 # are lost; the iterator has no cursor until a fetch succeeds so fall back
                 # to the incoming position
@@ -895,16 +662,35 @@ class RapidProBackend(BaseBackend):
                 page_cursor = fetches.get_cursor() or cursor.get("resume")
                 if page_cursor:
                     next_cursor["resume"] = page_cursor
-                return ChunkResult(counts=self._outcome_counts_dict({}), cursor=next_cursor, rate_limited=True)
+                return ChunkResult(
+                    counts=self._outcome_counts_dict({}),
+                    cursor=next_cursor,
+                    rate_limited=True,
+                    requests=pages + 1,
+                    retry_after=e.retry_after,
+                )
+            finally:
+                # pages fetched ahead of the time box are fetched again by the next chunk
+                fetches.close()
+
+            if not resume_cursor and pages >= page_budget:
+                # the page budget ran out before the time box, the traversal goes on unless that was its last page
+                resume_cursor = fetches.get_cursor()
 
             counts = self._outcome_counts_dict(outcome_counts)
             if resume_cursor:
-                return ChunkResult(counts=counts, cursor={"stage": "active", "resume": resume_cursor}, done=False)
-            return ChunkResult(counts=counts, cursor={"stage": "deleted"}, done=False)
+                return ChunkResult(
+                    counts=counts, cursor={"stage": "active", "resume": resume_cursor}, done=False, requests=pages
+                )
+            return ChunkResult(counts=counts, cursor={"stage": "deleted"}, done=False, requests=pages)
 
         # deleted stage - page bounded so a bulk contact purge can't run unbounded
         deleted_query = client.get_contacts(deleted=True, after=modified_after, before=modified_before)
-        deleted_fetches = deleted_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume"))
+        deleted_fetches = PrefetchedFetches(
+            deleted_query.iterfetches(retry_on_rate_exceed=True, resume_cursor=cursor.get("resume")),
+            depth=self.PREFETCH_PAGES,
+            limit=page_budget,
+        )
 
         counts = self._outcome_counts_dict({})
         pages = 0
@@ -921,19 +707,23 @@ class RapidProBackend(BaseBackend):
                             counts["deleted"] += 1
 
                 pages += 1
-                if pages >= self.CONTACTS_DELETED_PAGE_BUDGET:
+                if pages >= page_budget:
                     break
             else:
                 done = True
-        except TembaRateExceededError:
+        except TembaRateExceededError as e:
             next_cursor = {"stage": "deleted"}
             page_cursor = deleted_fetches.get_cursor() or cursor.get("resume")
             if page_cursor:
                 next_cursor["resume"] = page_cursor
-            return ChunkResult(counts=counts, cursor=next_cursor, rate_limited=True)
+            return ChunkResult(
+                counts=counts, cursor=next_cursor, rate_limited=True, requests=pages + 1, retry_after=e.retry_after
+            )
+        finally:
+            deleted_fetches.close()
 
         if done:
-            return ChunkResult(counts=counts, cursor={}, done=True)
+            return ChunkResult(counts=counts, cursor={}, done=True, requests=pages)
 
         next_cursor = {"stage": "deleted"}
         page_cursor = deleted_fetches.get_cursor()
@@ -941,134 +731,189 @@ class RapidProBackend(BaseBackend):
             next_cursor["resume"] = page_cursor
         else:
             # budget was hit on the traversal's last page - there is nothing left
-            return ChunkResult(counts=counts, cursor={}, done=True)
-        return ChunkResult(counts=counts, cursor=next_cursor, done=False)
+            return ChunkResult(counts=counts, cursor={}, done=True, requests=pages)
+        return ChunkResult(counts=counts, cursor=next_cursor, done=False, requests=pages)
 
-    def pull_results_from_archives_chunk(self, poll, cursor, archive_budget=None):
+    def pull_results_from_archives_fanout_chunk(self, polls, cursors, archive_budget=None):
         """
-        Pulls archived results for the poll, processing up to archive_budget archive files
-        with records per chunk. Archives are listed newest first (by start_date, with
-        rolled-up dailies excluded), and the cursor is content addressed so the traversal
-        survives the listing changing between chunks (new archives appearing, dailies
-        rolling up into monthlies): "before" is the start_date of the last archive visited
-        and "seen" the period keys already processed at that exact date - together they
-        say "resume strictly below this position". Archives newer than "before" are
-        outside this traversal; their runs were still in the live API when the traversal
-        started. Archives that fail to process are recorded under "failed" and skipped.
+        Pulls archived results for several polls of the same org in a single pass over the archives: each archive is
+        downloaded and scanned once and its runs are routed to every poll of their flow that still needs it. The
+        budget counts archive files downloaded, whatever the number of polls they serve.
+
+        Archives are listed newest first (by start_date, with rolled-up dailies excluded), and every poll keeps its
+        own cursor, content addressed so the traversal survives the listing changing between chunks (new archives
+        appearing, dailies rolling up into monthlies): "before" is the start_date of the last archive visited and
+        "seen" the period keys already processed at that exact date - together they say "resume strictly below this
+        position". Archives newer than "before" are outside the poll traversal, their runs were still in the live API
+        when it started, and a poll already past an archive skips it, so an archive no poll needs isn't downloaded.
+        Archives that fail to process are recorded under "failed" and skipped.
         """
         if archive_budget is None:
             archive_budget = self.ARCHIVES_BUDGET
-        org = poll.org
 
-        stats_dict = dict(
-            num_val_created=0,
-            num_val_updated=0,
-            num_val_ignored=0,
-            num_path_created=0,
-            num_path_updated=0,
-            num_path_ignored=0,
-            num_synced=0,
-        )
+        results = dict()
+        states = []
+
+        for poll in polls:
+            stats_dict = dict(
+                num_val_created=0,
+                num_val_updated=0,
+                num_val_ignored=0,
+                num_path_created=0,
+                num_path_updated=0,
+                num_path_ignored=0,
+                num_synced=0,
+            )
+            cursor = cursors.get(poll.id) or dict()
 
-        if poll.stopped_syncing:
-            return ChunkResult(counts=stats_dict, cursor=dict(cursor), done=True)
+            if poll.stopped_syncing:
+                results[poll.id] = ChunkResult(counts=stats_dict, cursor=dict(cursor), done=True)
+                continue
 
-        flow_date_json = poll.get_flow_date()
-        first = (
-            json_date_to_datetime(flow_date_json).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if flow_date_json
-            else None
-        )
+            flow_date_json = poll.get_flow_date()
+            first = (
+                json_date_to_datetime(flow_date_json).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                if flow_date_json
+                else None
+            )
 
-        client = self._get_client(org, 2)
-        questions_uuids = poll.get_question_uuids()
+            states.append(
+                dict(
+                    poll=poll,
+                    questions_uuids=poll.get_question_uuids(),
+                    first=first,
+                    before=cursor.get("before"),
+                    seen=set(cursor.get("seen") or []),
+                    failed=list(cursor.get("failed") or []),
+                    stats=stats_dict,
+                )
+            )
 
-        before = cursor.get("before")
-        seen = set(cursor.get("seen") or [])
-        failed = list(cursor.get("failed") or [])
+        if not states:
+            return results
 
-        # before filters start_date inclusively server-side, so archives at the boundary
-        # date reappear and are dropped by the seen set below
-        archives_query = client.get_archives(type="run", after=first, before=before)
+        org = states[0]["poll"].org
+        client = self._get_client(org, 2)
+
+        # list from the oldest archive any poll needs, down from the newest position any poll is at
+        firsts = [state["first"] for state in states]
+        befores = [state["before"] for state in states]
+        archives_query = client.get_archives(
+            type="run",
+            after=None if None in firsts else min(firsts),
+            before=None if None in befores else max(befores),
+        )
         archives_fetches = archives_query.iterfetches(retry_on_rate_exceed=True)
 
         processed = 0
+        pages = 0
         more = False
         rate_limited = False
+        retry_after = None
 
         try:
             for archives in archives_fetches:
+                pages += 1
                 for archive in archives:
                     # YYYY-MM-DD, so lexicographic comparison is chronological
                     start_iso = str(archive.start_date)[:10]
                     key = f"{start_iso}|{archive.period}"
 
-                    if before is not None:
-                        if start_iso > before:
-                            # appeared after this traversal started - its runs were still
-                            # in the live API then, so the API pull covers them
-                            continue
-                        if start_iso == before and key in seen:
-                            continue
+                    pending = [state for state in states if self._is_archive_pending(state, start_iso, key)]
+                    if not pending:
+                        continue
 
                     if processed >= archive_budget:
                         more = True
                         break
 
-                    logger.info("Archive %s with %d records, size %d" % (key, archive.record_count, archive.size))
-
-                    try:
-                        if archive.record_count > 0:
-                            start_archive = time.time()
-
-                            for fetch in self._iter_poll_record_runs(archive, poll.flow_uuid):
-                                (contacts_map, poll_results_map, poll_results_to_save_map) = self._initiate_lookup_maps(
-                                    fetch, org, poll
-                                )
-
-                                for temba_run in fetch:
-                                    contact_obj = contacts_map.get(temba_run.contact.uuid, None)
-                                    self._process_run_poll_results(
-                                        org,
-                                        questions_uuids,
-                                        temba_run,
-                                        contact_obj,
-                                        poll_results_map,
-                                        poll_results_to_save_map,
-                                        stats_dict,
-                                    )
-
-                                stats_dict["num_synced"] += len(fetch)
-                                self._save_new_poll_results_to_database(poll_results_to_save_map)
-
-                                # release per-page lookup maps holding cyclic references before next allocation
-                                del contacts_map, poll_results_map, poll_results_to_save_map
-                                gc.collect()
-
-                            logger.info("Full poll process archive in %ds" % (time.time() - start_archive))
-                            processed += 1
-                    except Exception as e:
-                        # advance past the broken archive but keep its key so the caller can
-                        # see the traversal was not clean
-                        failed.append(key)
+                    logger.info(
+                        "Archive %s with %d records, size %d for %d polls"
+                        % (key, archive.record_count, archive.size, len(pending))
+                    )
+
+                    if archive.record_count > 0:
+                        start_archive = time.time()
+
+                        flow_states = defaultdict(list)
+                        for state in pending:
+                            flow_states[state["poll"].flow_uuid].append(state)
+
+                        failed_polls = set()
+                        try:
+                            for flow_uuid, fetch in self._iter_archive_record_runs(archive, flow_states.keys()):
+                                for state in flow_states[flow_uuid]:
+                                    poll = state["poll"]
+                                    if poll.id in failed_polls:
+                                        continue
+
+                                    try:
+                                        self._process_archive_runs(
+                                            org, poll, state["questions_uuids"], fetch, state["stats"]
+                                        )
+                                    except Exception as e:
+                                        failed_polls.add(poll.id)
+                                        logger.error(
+                                            "Error processing archive %s for poll #%d" % (key, poll.pk), exc_info=e
+                                        )
+                        except Exception as e:
+                            # the archive itself couldn't be read, so none of the polls got all its runs
+                            failed_polls.update(state["poll"].id for state in pending)
+                            logger.error("Error processing archive %s for org #%d" % (key, org.pk), exc_info=e)
+
+                        for state in pending:
+                            if state["poll"].id in failed_polls:
+                                state["failed"].append(key)
+
+                        logger.info("Full polls process archive in %ds" % (time.time() - start_archive))
                         processed += 1
-                        logger.error("Error processing archive %s for poll #%d" % (key, poll.pk), exc_info=e)
 
-                    if start_iso == before:
-                        seen.add(key)
-                    else:
-                        before = start_iso
-                        seen = {key}
+                    for state in pending:
+                        if start_iso == state["before"]:
+                            state["seen"].add(key)
+                        else:
+                            state["before"] = start_iso
+                            state["seen"] = {key}
                 if more:
                     break
-        except TembaRateExceededError:
+        except TembaRateExceededError as e:
             rate_limited = True
+            retry_after = e.retry_after
 
         done = not more and not rate_limited
-        next_cursor = {"before": before, "seen": sorted(seen)}
-        if failed:
-            next_cursor["failed"] = failed
-        return ChunkResult(counts=stats_dict, cursor=next_cursor, done=done, rate_limited=rate_limited)
+        for state in states:
+            next_cursor = {"before": state["before"], "seen": sorted(state["seen"])}
+            if state["failed"]:
+                next_cursor["failed"] = state["failed"]
+
+            results[state["poll"].id] = ChunkResult(
+                counts=state["stats"],
+                cursor=next_cursor,
+                done=done,
+                rate_limited=rate_limited,
+                requests=pages + int(rate_limited),
+                retry_after=retry_after,
+            )
+
+        return results
+
+    @staticmethod
+    def _is_archive_pending(state, start_iso, key):
+        """
+        Whether the archive still has to be processed for the poll, i.e. it isn't older than the poll flow and the
+        poll cursor isn't past it yet
+        """
+        if state["first"] is not None and start_iso < str(state["first"])[:10]:
+            return False
+
+        before = state["before"]
+        if before is not None:
+            if start_iso > before:
+                return False
+            if start_iso == before and key in state["seen"]:
+                return False
+
+        return True
 
     def _initiate_lookup_maps(self, fetch, org, poll):
         """
@@ -1099,6 +944,7 @@ class RapidProBackend(BaseBackend):
         existing_db_poll_results_map,
         poll_results_to_save_map,
         stats_dict,
+        stats_deltas=None,
     ):
         """
         This method is to extract results from the run, we fetch from the RapidPro API.
@@ -1106,6 +952,7 @@ class RapidProBackend(BaseBackend):
         - First look on values for results set on the run and save them
         - Second loop on the path to save the path for which the contact is waiting for a response/result to be set
         - For each case we only update the lookup maps
+        - When stats_deltas is given, the -1/+1 stats deltas of the updated DB results are added to it
         """
 
         flow_uuid = temba_run.flow.uuid
@@ -1155,21 +1002,9 @@ class RapidProBackend(BaseBackend):
                 )
 
                 if update_required:
-                    # update the db object
-                    PollResult.objects.filter(pk=existing_poll_result.pk).update(
-                        category=category,
-                        text=text,
-                        state=state,
-                        district=district,
-                        ward=ward,
-                        date=value_date,
-                        born=born,
-                        gender=gender,
-                        scheme=scheme,
-                        completed=completed,
-                    )
+                    self._add_poll_result_stats_deltas(stats_deltas, existing_poll_result, -1)
 
-                    # update the map object as well
+                    # update the map object, it is saved later in bulk to the DB with the other results of the page
                     existing_poll_result.category = category
                     existing_poll_result.text = text
                     existing_poll_result.state = state
@@ -1182,6 +1017,8 @@ class RapidProBackend(BaseBackend):
                     existing_poll_result.completed = completed
 
                     existing_db_poll_results_map[contact_uuid][ruleset_uuid] = existing_poll_result
+                    poll_results_to_save_map[contact_uuid][ruleset_uuid] = existing_poll_result
+                    self._add_poll_result_stats_deltas(stats_deltas, existing_poll_result, 1)
 
                     stats_dict["num_val_updated"] += 1
                 else:
@@ -1266,21 +1103,9 @@ class RapidProBackend(BaseBackend):
                     if existing_poll_result.date is None or value_date > (
                         existing_poll_result.date + timedelta(seconds=5)
                     ):
-                        # update the db object
-                        PollResult.objects.filter(pk=existing_poll_result.pk).update(
-                            category=category,
-                            text=text,
-                            state=state,
-                            district=district,
-                            ward=ward,
-                            date=value_date,
-                            born=born,
-                            gender=gender,
-                            scheme=scheme,
-                            completed=completed,
-                        )
+                        self._add_poll_result_stats_deltas(stats_deltas, existing_poll_result, -1)
 
-                        # update the map object as well
+                        # update the map object, it is saved later in bulk to the DB with the other results of the page
                         existing_poll_result.category = category
                         existing_poll_result.text = text
                         existing_poll_result.state = state
@@ -1293,6 +1118,8 @@ class RapidProBackend(BaseBackend):
                         existing_poll_result.completed = completed
 
                         existing_db_poll_results_map[contact_uuid][ruleset_uuid] = existing_poll_result
+                        poll_results_to_save_map[contact_uuid][ruleset_uuid] = existing_poll_result
+                        self._add_poll_result_stats_deltas(stats_deltas, existing_poll_result, 1)
 
                         stats_dict["num_path_updated"] += 1
                     else:
@@ -1373,55 +1200,37 @@ class RapidProBackend(BaseBackend):
         return update_required
 
     @staticmethod
-    def _save_new_poll_results_to_database(poll_results_to_save_map):
-        """
-        Save all the new objects to create to the DB in bulk, by bulk_create
-        """
-        new_poll_results = []
-        for c_key in poll_results_to_save_map.keys():
-            for r_key in poll_results_to_save_map.get(c_key, dict()):
-                obj_to_create = poll_results_to_save_map.get(c_key, dict()).get(r_key, None)
-                if obj_to_create is not None:
-                    new_poll_results.append(obj_to_create)
-        PollResult.objects.bulk_create(new_poll_results, batch_size=1000)
-
-    @staticmethod
-    def _mark_poll_results_sync_paused(org, poll, latest_synced_obj_time):
+    def _add_poll_result_stats_deltas(stats_deltas, poll_result, delta):
         """
-        Use valkey to set the time when we paused, where we will resume from.
-        This is a way to allow sharing the API throttle rate to multiple polls, to allow each to progress
+        Add the stats of the result to the deltas with the given sign, does nothing when deltas are not tracked
         """
-        # update the time for this poll from which we fetch next time
-        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (org.pk, poll.flow_uuid), latest_synced_obj_time, None)
-
-        from ureport.polls.tasks import pull_refresh
+        if stats_deltas is None:
+            return
 
-        pull_refresh.apply_async((poll.pk,), countdown=300, queue="sync")
+        for stat_tuple, count in poll_result.generate_poll_stats().items():
+            stats_deltas[stat_tuple] += delta * count
 
-    @staticmethod
-    def _mark_poll_results_sync_completed(poll, org, latest_synced_obj_time):
+    @classmethod
+    def _save_poll_results_to_database(cls, poll_results_to_save_map, stats_deltas=None):
         """
-        Use Valkey key to mark we finished to sync existing results.
-        And future sync will only look for newer results that the time in Valkey.
+        Save all the objects of the page to the DB in a single transaction, the new objects by bulk_create and the
+        existing objects that changed by bulk_update
         """
+        new_poll_results = []
+        updated_poll_results = []
+        for c_key in poll_results_to_save_map.keys():
+            for r_key in poll_results_to_save_map.get(c_key, dict()):
+                obj_to_save = poll_results_to_save_map.get(c_key, dict()).get(r_key, None)
+                if obj_to_save is None:
+                    continue
 
-        # update the time for this poll from which we fetch next time
-        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (org.pk, poll.flow_uuid), latest_synced_obj_time, None)
-
-        # update the last time the sync happened, for displaying in polls list on admin page
-        now = timezone.now()
-        cache.set(
-            Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (org.pk, poll.flow_uuid),
-            datetime_to_json_date(now),
-            None,
-        )
-
-        # Use valkey cache with expiring(in 48 hrs) key to allow other polls task
-        # to sync all polls without hitting the API rate limit
-        cache.set(
-            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (org.id, poll.flow_uuid),
-            datetime_to_json_date(now),
-            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_TIMEOUT,
-        )
+                if obj_to_save.pk:
+                    # the stats deltas of existing objects are added as they are updated in the maps
+                    updated_poll_results.append(obj_to_save)
+                else:
+                    new_poll_results.append(obj_to_save)
+                    cls._add_poll_result_stats_deltas(stats_deltas, obj_to_save, 1)
 
-        Poll.objects.filter(id=poll.pk).update(modified_on=now)
+        with transaction.atomic(savepoint=False):
+            PollResult.objects.bulk_update(updated_poll_results, cls.POLL_RESULT_UPDATE_FIELDS, batch_size=1000)
+            PollResult.objects.bulk_create(new_poll_results, batch_size=1000)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import json
+import time
 
-from mock import patch
+from django_valkey import get_valkey_connection
+from mock import Mock, patch
 from temba_client.exceptions import TembaRateExceededError
 from temba_client.v2.types import Archive as TembaArchive, Contact as TembaContact, ObjectRef, Run as TembaRun
 
@@ -15,6 +17,7 @@ from ureport.contacts.models import Contact
 from ureport.polls.models import PollResult
 from ureport.tests import UreportTest
 from ureport.utils import datetime_to_json_date
+from ureport.utils.rate_budget import PRIORITY_ARCHIVES, PRIORITY_CONTACTS, PRIORITY_MAIN_POLL
 
 
 class CursorMockIterator:
@@ -57,7 +60,10 @@ class CursorMockQuery:
         self.raise_on_fetch = raise_on_fetch
 
     def iterfetches(self, retry_on_rate_exceed=False, resume_cursor=None):
-        return CursorMockIterator(self.fetches, int(resume_cursor) if resume_cursor else 0, self.raise_on_fetch)
+        self.iterator = CursorMockIterator(
+            self.fetches, int(resume_cursor) if resume_cursor else 0, self.raise_on_fetch
+        )
+        return self.iterator
 
 
 class PullResultsChunkTest(UreportTest):
@@ -111,6 +117,30 @@ class PullResultsChunkTest(UreportTest):
 
         mock_get_runs.assert_called_with(flow="flow-uuid", after=None, reverse=True, paths=True)
 
+    @patch("dash.orgs.models.TembaClient.get_runs")
+    def test_incremental_counts(self, mock_get_runs):
+        now = timezone.now()
+        mock_get_runs.return_value = CursorMockQuery(
+            [self._run(1234, "C-001", "yes", now)], [self._run(1235, "C-002", "no", now)]
+        )
+
+        with patch("ureport.polls.models.Poll.apply_poll_results_deltas") as mock_apply_deltas:
+            self.backend.pull_results_chunk(self.poll, {})
+            self.assertFalse(mock_apply_deltas.called)
+
+        PollResult.objects.all().delete()
+
+        with patch("ureport.polls.models.Poll.apply_poll_results_deltas") as mock_apply_deltas:
+            result = self.backend.pull_results_chunk(self.poll, {}, incremental_counts=True)
+
+            # the deltas of each page are added with the page results
+            self.assertEqual(mock_apply_deltas.call_count, 2)
+            for call in mock_apply_deltas.call_args_list:
+                self.assertTrue(call.args[0])
+                self.assertTrue(all(count > 0 for count in call.args[0].values()))
+
+        self.assertEqual(result.counts["num_val_created"], 2)
+
     @patch("dash.orgs.models.TembaClient.get_runs")
     def test_empty_first_page(self, mock_get_runs):
         mock_get_runs.return_value = CursorMockQuery()
@@ -148,6 +178,23 @@ class PullResultsChunkTest(UreportTest):
             set(PollResult.objects.filter(flow="flow-uuid").values_list("contact", flat=True)), {"C-001", "C-002"}
         )
 
+    @patch("dash.orgs.models.TembaClient.get_runs")
+    def test_pages_fetched_ahead_stay_within_budget(self, mock_get_runs):
+        now = timezone.now()
+        query = CursorMockQuery(
+            [self._run(1234, "C-001", "yes", now)], [self._run(1235, "C-002", "no", now)], [], [], []
+        )
+        mock_get_runs.return_value = query
+
+        result = self.backend.pull_results_chunk(self.poll, {}, page_budget=2)
+
+        self.assertFalse(result.done)
+        self.assertEqual(result.cursor["resume"], "2")
+        self.assertEqual(result.requests, 2)
+
+        # no page past the budget was requested from the API
+        self.assertEqual(query.iterator.pos, 2)
+
     @patch("dash.orgs.models.TembaClient.get_runs")
     def test_budget_ending_on_last_page_is_done(self, mock_get_runs):
         now = timezone.now()
@@ -246,23 +293,49 @@ class PullContactsChunkTest(UreportTest):
         self.assertEqual(third.cursor, {})
         mock_get_contacts.assert_called_with(deleted=True, after=None, before=None)
 
+    @patch("dash.orgs.models.TembaClient.get_contacts")
+    def test_active_stage_page_budget(self, mock_get_contacts):
+        mock_get_contacts.return_value = CursorMockQuery(*[[self._contact(f"C-{i:03}")] for i in range(3)])
+
+        result = self.backend.pull_contacts_chunk(self.nigeria, None, None, {}, time_budget=600, page_budget=2)
+
+        self.assertFalse(result.done)
+        self.assertEqual(result.cursor, {"stage": "active", "resume": "2"})
+        self.assertEqual(result.counts["ignored"], 2)
+        self.assertEqual(result.requests, 2)
+
+        # the last page moves to the deleted stage, even when it uses up the budget
+        second = self.backend.pull_contacts_chunk(self.nigeria, None, None, result.cursor, page_budget=1)
+
+        self.assertEqual(second.cursor, {"stage": "deleted"})
+        self.assertEqual(second.counts["ignored"], 1)
+        self.assertEqual(second.requests, 1)
+
     @patch("dash.orgs.models.TembaClient.get_contacts")
     def test_deleted_stage_is_page_bounded(self, mock_get_contacts):
-        pages = [[self._contact(f"C-{i:03}")] for i in range(RapidProBackend.CONTACTS_DELETED_PAGE_BUDGET + 2)]
+        pages = [[self._contact(f"C-{i:03}")] for i in range(RapidProBackend.CONTACTS_PAGE_BUDGET + 2)]
         mock_get_contacts.return_value = CursorMockQuery(*pages)
 
         result = self.backend.pull_contacts_chunk(self.nigeria, None, None, {"stage": "deleted"})
 
         self.assertFalse(result.done)
-        self.assertEqual(
-            result.cursor, {"stage": "deleted", "resume": str(RapidProBackend.CONTACTS_DELETED_PAGE_BUDGET)}
-        )
+        self.assertEqual(result.cursor, {"stage": "deleted", "resume": str(RapidProBackend.CONTACTS_PAGE_BUDGET)})
 
         # resuming finishes the remaining pages
         second = self.backend.pull_contacts_chunk(self.nigeria, None, None, result.cursor)
         self.assertTrue(second.done)
         self.assertEqual(second.cursor, {})
 
+    @patch("dash.orgs.models.TembaClient.get_contacts")
+    def test_deleted_stage_page_budget(self, mock_get_contacts):
+        mock_get_contacts.return_value = CursorMockQuery(*[[self._contact(f"C-{i:03}")] for i in range(3)])
+
+        result = self.backend.pull_contacts_chunk(self.nigeria, None, None, {"stage": "deleted"}, page_budget=2)
+
+        self.assertFalse(result.done)
+        self.assertEqual(result.cursor, {"stage": "deleted", "resume": "2"})
+        self.assertEqual(result.requests, 2)
+
     @patch("dash.orgs.models.TembaClient.get_contacts")
     def test_rate_limit_returns_resume_cursor(self, mock_get_contacts):
         mock_get_contacts.return_value = CursorMockQuery(
@@ -274,6 +347,7 @@ class PullContactsChunkTest(UreportTest):
         self.assertFalse(result.done)
         self.assertTrue(result.rate_limited)
         self.assertEqual(result.cursor, {"stage": "active", "resume": "1"})
+        self.assertEqual(result.requests, 2)
 
     @patch("dash.orgs.models.TembaClient.get_contacts")
     def test_rate_limit_on_first_page_of_resumed_chunk_keeps_resume_cursor(self, mock_get_contacts):
@@ -317,10 +391,16 @@ class PullArchivesChunkTest(UreportTest):
     def _key(self, archive):
         return f"{str(archive.start_date)[:10]}|{archive.period}"
 
-    def _run(self, uuid, contact_uuid, modified_on):
+    def _pull_chunk(self, cursor):
+        results = self.backend.pull_results_from_archives_fanout_chunk(
+            [self.poll], {self.poll.id: cursor}, archive_budget=1
+        )
+        return results[self.poll.id]
+
+    def _run(self, uuid, contact_uuid, modified_on, flow_uuid="flow-uuid"):
         return TembaRun.create(
             uuid=uuid,
-            flow=ObjectRef.create(uuid="flow-uuid", name="Flow 1"),
+            flow=ObjectRef.create(uuid=flow_uuid, name="Flow 1"),
             contact=ObjectRef.create(uuid=contact_uuid, name="Reporter"),
             responded=True,
             values={"q1": TembaRun.Value.create(value="yes", category="Win", node="ruleset-uuid", time=modified_on)},
@@ -331,18 +411,18 @@ class PullArchivesChunkTest(UreportTest):
             exit_type="completed",
         )
 
-    @patch("ureport.backend.rapidpro.RapidProBackend._iter_poll_record_runs")
+    @patch("ureport.backend.rapidpro.RapidProBackend._iter_archive_record_runs")
     @patch("dash.orgs.models.TembaClient.get_archives")
     def test_one_archive_per_chunk(self, mock_get_archives, mock_iter_records):
         now = timezone.now()
         newer, older = self._archive("2026-03-03"), self._archive("2026-03-02")
         mock_get_archives.return_value = CursorMockQuery([newer, older])
         mock_iter_records.side_effect = [
-            iter([[self._run(1234, "C-001", now)]]),
-            iter([[self._run(1235, "C-002", now)]]),
+            iter([("flow-uuid", [self._run(1234, "C-001", now)])]),
+            iter([("flow-uuid", [self._run(1235, "C-002", now)])]),
         ]
 
-        first = self.backend.pull_results_from_archives_chunk(self.poll, {}, archive_budget=1)
+        first = self._pull_chunk({})
 
         self.assertFalse(first.done)
         self.assertEqual(first.cursor, {"before": self._key(newer).split("|")[0], "seen": [self._key(newer)]})
@@ -351,7 +431,7 @@ class PullArchivesChunkTest(UreportTest):
         json.dumps(first.cursor)
 
         mock_get_archives.return_value = CursorMockQuery([newer, older])
-        second = self.backend.pull_results_from_archives_chunk(self.poll, first.cursor, archive_budget=1)
+        second = self._pull_chunk(first.cursor)
 
         self.assertTrue(second.done)
         self.assertEqual(second.cursor, {"before": self._key(older).split("|")[0], "seen": [self._key(older)]})
@@ -361,21 +441,21 @@ class PullArchivesChunkTest(UreportTest):
         # only the unvisited archive was downloaded on the second chunk
         self.assertEqual(mock_iter_records.call_count, 2)
 
-    @patch("ureport.backend.rapidpro.RapidProBackend._iter_poll_record_runs")
+    @patch("ureport.backend.rapidpro.RapidProBackend._iter_archive_record_runs")
     @patch("dash.orgs.models.TembaClient.get_archives")
     def test_survives_listing_changing_between_chunks(self, mock_get_archives, mock_iter_records):
         now = timezone.now()
         processed_dates = []
 
-        def record(archive, flow_uuid):
+        def record(archive, flow_uuids):
             processed_dates.append(str(archive.start_date)[:10])
-            return iter([[self._run(1000 + len(processed_dates), "C-001", now)]])
+            return iter([("flow-uuid", [self._run(1000 + len(processed_dates), "C-001", now)])])
 
         mock_iter_records.side_effect = record
 
         # chunk 1 processes the newest daily
         mock_get_archives.return_value = CursorMockQuery([self._archive("2026-02-03"), self._archive("2026-02-02")])
-        first = self.backend.pull_results_from_archives_chunk(self.poll, {}, archive_budget=1)
+        first = self._pull_chunk({})
         self.assertFalse(first.done)
 
         # before chunk 2: a NEW newer archive appears and the Feb dailies roll up into a
@@ -387,7 +467,7 @@ class PullArchivesChunkTest(UreportTest):
                 self._archive("2026-01-15"),
             ]
         )
-        second = self.backend.pull_results_from_archives_chunk(self.poll, first.cursor, archive_budget=1)
+        second = self._pull_chunk(first.cursor)
         self.assertFalse(second.done)
 
         mock_get_archives.return_value = CursorMockQuery(
@@ -397,14 +477,14 @@ class PullArchivesChunkTest(UreportTest):
                 self._archive("2026-01-15"),
             ]
         )
-        third = self.backend.pull_results_from_archives_chunk(self.poll, second.cursor, archive_budget=1)
+        third = self._pull_chunk(second.cursor)
         self.assertTrue(third.done)
 
         # the new head archive was skipped (its runs were live when the traversal started),
         # and the monthly rollup and older archive were both processed - nothing lost
         self.assertEqual(processed_dates, ["2026-02-03", "2026-02-01", "2026-01-15"])
 
-    @patch("ureport.backend.rapidpro.RapidProBackend._iter_poll_record_runs")
+    @patch("ureport.backend.rapidpro.RapidProBackend._iter_archive_record_runs")
     @patch("dash.orgs.models.TembaClient.get_archives")
     def test_empty_archives_do_not_consume_budget(self, mock_get_archives, mock_iter_records):
         now = timezone.now()
@@ -412,7 +492,7 @@ class PullArchivesChunkTest(UreportTest):
             [self._archive("2026-03-03", record_count=0), self._archive("2026-03-02", record_count=0)]
         )
 
-        first = self.backend.pull_results_from_archives_chunk(self.poll, {}, archive_budget=1)
+        first = self._pull_chunk({})
 
         # both empties were passed in a single chunk without consuming the budget
         self.assertTrue(first.done)
@@ -423,23 +503,153 @@ class PullArchivesChunkTest(UreportTest):
         mock_get_archives.return_value = CursorMockQuery(
             [self._archive("2026-03-05", record_count=0), self._archive("2026-03-04", record_count=1)]
         )
-        mock_iter_records.side_effect = [iter([[self._run(1234, "C-001", now)]])]
-        result = self.backend.pull_results_from_archives_chunk(self.poll, {}, archive_budget=1)
+        mock_iter_records.side_effect = [iter([("flow-uuid", [self._run(1234, "C-001", now)])])]
+        result = self._pull_chunk({})
         self.assertTrue(result.done)
         self.assertEqual(result.counts["num_val_created"], 1)
 
+    @patch("ureport.backend.rapidpro.RapidProBackend._iter_archive_record_runs")
     @patch("dash.orgs.models.TembaClient.get_archives")
-    def test_failing_archive_is_recorded_and_does_not_block_progress(self, mock_get_archives):
+    def test_fanout_processes_each_archive_once(self, mock_get_archives, mock_iter_runs):
+        now = timezone.now()
+        poll2 = self.create_poll(self.nigeria, "Flow 2", "flow-uuid-2", self.poll.category, self.admin)
+        self.create_poll_question(self.admin, poll2, "question 1", "ruleset-uuid")
+
+        newer, older = self._archive("2026-03-03"), self._archive("2026-03-02")
+        downloads = []
+
+        def iter_runs(archive, flow_uuids):
+            downloads.append((self._key(archive), sorted(flow_uuids)))
+            runs = [
+                ("flow-uuid", [self._run(1000 + len(downloads), "C-001", now)]),
+                ("flow-uuid-2", [self._run(2000 + len(downloads), "C-002", now, flow_uuid="flow-uuid-2")]),
+            ]
+            return iter([(flow_uuid, fetch) for flow_uuid, fetch in runs if flow_uuid in flow_uuids])
+
+        mock_iter_runs.side_effect = iter_runs
+        mock_get_archives.return_value = CursorMockQuery([newer, older])
+
+        # the second poll is already past the newer archive
+        cursors = {poll2.id: {"before": "2026-03-03", "seen": [self._key(newer)]}}
+        results = self.backend.pull_results_from_archives_fanout_chunk([self.poll, poll2], cursors, archive_budget=2)
+
+        self.assertEqual(
+            downloads, [(self._key(newer), ["flow-uuid"]), (self._key(older), ["flow-uuid", "flow-uuid-2"])]
+        )
+
+        self.assertTrue(results[self.poll.id].done)
+        self.assertEqual(results[self.poll.id].cursor, {"before": "2026-03-02", "seen": [self._key(older)]})
+        self.assertEqual(results[self.poll.id].counts["num_synced"], 2)
+        self.assertTrue(results[poll2.id].done)
+        self.assertEqual(results[poll2.id].cursor, {"before": "2026-03-02", "seen": [self._key(older)]})
+        self.assertEqual(results[poll2.id].counts["num_synced"], 1)
+        self.assertEqual(PollResult.objects.filter(flow="flow-uuid").count(), 1)
+        self.assertEqual(PollResult.objects.filter(flow="flow-uuid-2").count(), 1)
+
+        # nothing left to process for either poll, so nothing is downloaded
+        downloads.clear()
+        mock_get_archives.return_value = CursorMockQuery([newer, older])
+        cursors = {poll_id: result.cursor for poll_id, result in results.items()}
+        results = self.backend.pull_results_from_archives_fanout_chunk([self.poll, poll2], cursors, archive_budget=2)
+
+        self.assertEqual(downloads, [])
+        self.assertTrue(results[self.poll.id].done)
+        self.assertTrue(results[poll2.id].done)
+
+        # the budget counts downloads, whatever the number of polls they serve
+        mock_get_archives.return_value = CursorMockQuery([newer, older])
+        results = self.backend.pull_results_from_archives_fanout_chunk([self.poll, poll2], {}, archive_budget=1)
+
+        self.assertEqual(downloads, [(self._key(newer), ["flow-uuid", "flow-uuid-2"])])
+        self.assertFalse(results[self.poll.id].done)
+        self.assertEqual(results[self.poll.id].cursor, {"before": "2026-03-03", "seen": [self._key(newer)]})
+        self.assertEqual(results[poll2.id].cursor, {"before": "2026-03-03", "seen": [self._key(newer)]})
+
+    @patch("dash.orgs.models.TembaClient.get_archives")
+    def test_fanout_failing_archive_is_recorded_for_its_polls(self, mock_get_archives):
+        poll2 = self.create_poll(self.nigeria, "Flow 2", "flow-uuid-2", self.poll.category, self.admin)
+        poll2.stopped_syncing = True
+        poll2.save()
+
         broken = self._archive("2026-03-03")
         mock_get_archives.return_value = CursorMockQuery([broken])
 
-        with patch.object(RapidProBackend, "_iter_poll_record_runs", side_effect=ValueError("corrupt")):
-            result = self.backend.pull_results_from_archives_chunk(self.poll, {}, archive_budget=1)
+        with patch.object(RapidProBackend, "_iter_archive_record_runs", side_effect=ValueError("corrupt")):
+            results = self.backend.pull_results_from_archives_fanout_chunk(
+                [self.poll, poll2], {poll2.id: {"before": "t"}}, archive_budget=1
+            )
 
-        self.assertTrue(result.done)
-        self.assertEqual(result.cursor["failed"], [self._key(broken)])
-        self.assertEqual(result.counts["num_val_created"], 0)
-        json.dumps(result.cursor)
+        self.assertTrue(results[self.poll.id].done)
+        self.assertEqual(results[self.poll.id].cursor["failed"], [self._key(broken)])
+
+        # stopped polls are left as they are
+        self.assertTrue(results[poll2.id].done)
+        self.assertEqual(results[poll2.id].cursor, {"before": "t"})
+        json.dumps(results[self.poll.id].cursor)
+
+
+class PullBudgetedChunkTest(UreportTest):
+    def setUp(self):
+        super().setUp()
+        self.backend = RapidProBackend(self.rapidpro_backend)
+        self.budget = self.backend.get_rate_budget(self.nigeria)
+
+        get_valkey_connection().delete(self.budget.key)
+        self.addCleanup(get_valkey_connection().delete, self.budget.key)
+
+    def test_grant_is_settled_by_requests_made(self):
+        pull = Mock(return_value=ChunkResult(cursor={"after": "t"}, requests=3))
+
+        result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_MAIN_POLL, 20, pull)
+
+        pull.assert_called_once_with(20)
+        self.assertEqual(result.cursor, {"after": "t"})
+        self.assertEqual(wait, 0)
+
+        # only the requests made are drawn from the budget
+        self.assertAlmostEqual(self.budget.get_tokens(), self.budget.capacity - 3, delta=1)
+
+    def test_low_budget_is_left_to_higher_priorities(self):
+        get_valkey_connection().hset(
+            self.budget.key, mapping={"tokens": self.budget.capacity * 0.3, "updated": time.time()}
+        )
+        pull = Mock(return_value=ChunkResult(requests=1))
+
+        result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_CONTACTS, 25, pull)
+
+        self.assertIsNone(result)
+        self.assertGreater(wait, 0)
+        self.assertFalse(pull.called)
+
+        result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_MAIN_POLL, 25, pull)
+
+        self.assertEqual(result.requests, 1)
+        self.assertEqual(wait, 0)
+        pull.assert_called_once_with(25)
+
+    def test_rate_limited_pull_empties_budget(self):
+        pull = Mock(return_value=ChunkResult(rate_limited=True, requests=2))
+
+        result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_ARCHIVES, 5, pull)
+
+        self.assertTrue(result.rate_limited)
+        self.assertEqual(wait, self.budget.exhaust(PRIORITY_ARCHIVES, 5))
+        self.assertLess(self.budget.get_tokens(), 5)
+
+        # the API telling when it accepts requests again is waited for when longer than the refill
+        pull = Mock(return_value=ChunkResult(rate_limited=True, requests=1, retry_after=60 * 60 * 24))
+
+        with patch("ureport.utils.rate_budget.RateBudget.acquire", return_value=(5, 0)):
+            result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_ARCHIVES, 5, pull)
+
+        self.assertEqual(wait, 60 * 60 * 24)
+
+    def test_requests_beyond_grant_are_charged(self):
+        pull = Mock(return_value=ChunkResult(requests=30))
+
+        self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_MAIN_POLL, 20, pull)
+
+        self.assertAlmostEqual(self.budget.get_tokens(), self.budget.capacity - 30, delta=1)
 
 
 class DummyBackend(BaseBackend):
@@ -454,15 +664,15 @@ class DummyBackend(BaseBackend):
 
         return ({SyncOutcome.created: 3, SyncOutcome.updated: 1}, None)
 
-    def pull_results(self, poll, modified_after, modified_before):
-        return (1, 2, 3, 4, 5, 6)
+    def pull_results_chunk(self, poll, cursor, page_budget=None, incremental_counts=False):
+        return ChunkResult(counts=self._results_counts_dict(()), cursor=dict(cursor), done=True)
 
 
 class BaseBackendChunkDefaultsTest(UreportTest):
     """
-    Backends without real pagination support (e.g. FLOIP) inherit single chunk defaults
-    so callers can use the chunked interface uniformly, with the same counts schema as
-    the chunked implementations.
+    Backends without real pagination support (e.g. FLOIP contacts) inherit single chunk
+    defaults so callers can use the chunked interface uniformly, with the same counts
+    schema as the chunked implementations.
     """
 
     def setUp(self):
@@ -477,17 +687,32 @@ class BaseBackendChunkDefaultsTest(UreportTest):
         self.assertEqual(result.counts, {"created": 3, "updated": 1, "deleted": 0, "ignored": 0})
         json.dumps(result.counts)
 
-    def test_pull_results_chunk_default(self):
-        result = self.backend.pull_results_chunk(None, {})
-
-        self.assertTrue(result.done)
-        self.assertEqual(result.counts["num_val_created"], 1)
-        self.assertEqual(result.counts["num_path_ignored"], 6)
-        self.assertEqual(result.counts["num_synced"], 0)
-
     def test_pull_archives_chunk_default(self):
         result = self.backend.pull_results_from_archives_chunk(None, {"before": "t"})
 
         self.assertTrue(result.done)
         self.assertEqual(result.cursor, {"before": "t"})
         self.assertEqual(result.counts["num_synced"], 0)
+
+    def test_pull_archives_fanout_chunk_default(self):
+        education = Category.objects.create(
+            org=self.nigeria, name="Education", created_by=self.admin, modified_by=self.admin
+        )
+        poll1 = self.create_poll(self.nigeria, "Flow 1", "flow-uuid", education, self.admin)
+        poll2 = self.create_poll(self.nigeria, "Flow 2", "flow-uuid-2", education, self.admin)
+
+        results = self.backend.pull_results_from_archives_fanout_chunk([poll1, poll2], {poll1.id: {"before": "t"}})
+
+        self.assertEqual(set(results.keys()), {poll1.id, poll2.id})
+        self.assertEqual(results[poll1.id].cursor, {"before": "t"})
+        self.assertEqual(results[poll2.id].cursor, {})
+        self.assertTrue(results[poll2.id].done)
+
+    def test_pull_budgeted_chunk_without_budget(self):
+        pull = Mock(return_value=ChunkResult(rate_limited=True))
+
+        result, wait = self.backend.pull_budgeted_chunk(self.nigeria, PRIORITY_MAIN_POLL, 20, pull)
+
+        pull.assert_called_once_with(None)
+        self.assertTrue(result.rate_limited)
+        self.assertEqual(wait, BaseBackend.RATE_LIMIT_BACKOFF)
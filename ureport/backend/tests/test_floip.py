@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 
+import json
+
 from mock import patch
 from temba_client.v2.types import Contact as TembaContact, ObjectRef
 
 from dash.categories.models import Category
 from dash.test import MockClientQuery
 from dash.utils.sync import SyncOutcome
-from ureport.backend.floip import ContactSyncer, FLOIPBackend
+from ureport.backend.floip import (
+    ContactSyncer,
+    FLOIPBackend,
+    FLOIPClient,
+    FLOIPRateExceededError,
+    FLOIPResponsesPage,
+)
 from ureport.contacts.models import Contact
 from ureport.flows.models import FlowResult, FlowResultCategory
 from ureport.locations.models import Boundary
-from ureport.polls.models import Poll, PollQuestion, PollResponseCategory, PollResult
+from ureport.polls.models import PollQuestion, PollResponseCategory, PollResult
 from ureport.tests import MockResponse, UreportTest
 from ureport.utils import json_date_to_datetime
 
@@ -275,7 +283,7 @@ class FLOIPBackendTest(UreportTest):
             geometry='{"foo":"bar-state"}',
         )
 
-    @patch("requests.request")
+    @patch("requests.Session.request")
     def test_fetch_flows(self, mock_get):
         response_contents = """{
             "links": {
@@ -315,7 +323,7 @@ class FLOIPBackendTest(UreportTest):
 
         self.assertEqual(self.backend.fetch_flows(self.nigeria), fetched_flows)
 
-    @patch("requests.request")
+    @patch("requests.Session.request")
     def test_get_definition(self, mock_get):
         response_contents = """
         {
@@ -579,7 +587,7 @@ class FLOIPBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(8):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -638,7 +646,7 @@ class FLOIPBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(7):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -699,7 +707,7 @@ class FLOIPBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(7):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -761,7 +769,7 @@ class FLOIPBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(7):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -822,7 +830,7 @@ class FLOIPBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(7):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -868,10 +876,9 @@ class FLOIPBackendTest(UreportTest):
 
         self.assertFalse(Contact.objects.filter(uuid="C-002", is_active=True))
 
-    @patch("requests.request")
-    @patch("valkey.client.StrictValkey.lock")
+    @patch("requests.Session.request")
     @patch("django.core.cache.cache.get")
-    def test_pull_results(self, mock_cache_get, mock_valkey_lock, mock_request):
+    def test_pull_results(self, mock_cache_get, mock_request):
         response_contents = """
         {
             "data": {
@@ -1138,30 +1145,26 @@ class FLOIPBackendTest(UreportTest):
         self.create_poll_question(self.admin, poll, "question 2", "q_1522956746998_26")
         self.create_poll_question(self.admin, poll, "question 3", "q_1522957067432_34")
 
-        progress_calls = []
-
-        with self.assertNumQueries(4):
-            (
-                num_val_created,
-                num_val_updated,
-                num_val_ignored,
-                num_path_created,
-                num_path_updated,
-                num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None, progress_callback=progress_calls.append)
+        with self.assertNumQueries(3):
+            result = self.backend.pull_results_chunk(poll, {})
 
+        self.assertTrue(result.done)
         self.assertEqual(
-            (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
+            (
+                result.counts["num_val_created"],
+                result.counts["num_val_updated"],
+                result.counts["num_val_ignored"],
+                result.counts["num_path_created"],
+                result.counts["num_path_updated"],
+                result.counts["num_path_ignored"],
+            ),
             (15, 0, 8, 0, 0, 0),
         )
 
-        # progress_callback should be called once per page with the cumulative number of synced runs.
         # The mocked response has 23 entries on a single page, so num_synced must be 23 — not 23*23 (the
         # value seen when the per-page increment was incorrectly nested inside the per-result loop).
-        self.assertEqual(progress_calls, [23])
-        mock_valkey_lock.assert_called_once_with(
-            Poll.POLL_PULL_RESULTS_TASK_LOCK % (poll.org.pk, poll.flow_uuid), timeout=7200
-        )
+        self.assertEqual(result.counts["num_synced"], 23)
+        self.assertEqual(result.cursor, {"after": "2018-04-05 19:57:43"})
 
         poll_result = PollResult.objects.filter(
             flow="2a754346-a0dc-4176-a8b9-0f978f6b04c7", ruleset="q_1522956745304_75", contact="160786609"
@@ -1173,3 +1176,137 @@ class FLOIPBackendTest(UreportTest):
         self.assertEqual(poll_result.flow, "2a754346-a0dc-4176-a8b9-0f978f6b04c7")
         self.assertEqual(poll_result.category, "Man")
         self.assertEqual(poll_result.text, "Man")
+
+
+def responses_page(responses, next_url=None):
+    return json.dumps(
+        {
+            "data": {
+                "type": "flow-results-data",
+                "attributes": {"responses": responses},
+                "relationships": {"links": {"next": next_url, "previous": None}},
+            }
+        }
+    )
+
+
+class FLOIPClientTest(UreportTest):
+    def test_session_is_shared(self):
+        client = FLOIPClient("token-1")
+
+        self.assertIs(FLOIPClient("token-1").session, client.session)
+        self.assertIsNot(FLOIPClient("token-2").session, client.session)
+        self.assertEqual(client.session.headers["Authorization"], "Token token-1")
+
+        # failed requests are retried with back-off
+        retries = client.session.get_adapter("https://go.votomobile.org").max_retries
+        self.assertEqual(retries.total, FLOIPClient.RETRIES)
+        self.assertIn(503, retries.status_forcelist)
+
+    @patch("requests.Session.request")
+    def test_get_responses(self, mock_request):
+        mock_request.return_value = MockResponse(200, responses_page([["2018-04-05 19:37:09", "1", "C1"]], "next-url"))
+
+        page = FLOIPClient("token-1").get_responses("flow-uuid", after="2018-04-05 19:00:00")
+
+        self.assertEqual(list(page), [["2018-04-05 19:37:09", "1", "C1"]])
+        self.assertEqual(page.next_url, "next-url")
+        mock_request.assert_called_once_with(
+            "GET",
+            "https://go.votomobile.org/flow-results/packages/flow-uuid/responses",
+            params={"filter": {"start-timestamp": "2018-04-05 19:00:00"}},
+            timeout=FLOIPClient.TIMEOUT,
+            stream=True,
+            allow_redirects=True,
+        )
+
+        mock_request.return_value = MockResponse(429, "")
+        with self.assertRaises(FLOIPRateExceededError):
+            FLOIPClient("token-1").get_responses("flow-uuid", url="next-url")
+
+    def test_responses_page_streaming(self):
+        responses = [["2018-04-05 19:37:09", "1", "C1", "S1", "Q1", 'Ça "responses": [', {}], ["x", 12.5e3], []]
+        content = responses_page(responses, "next-url")
+
+        # whatever the size of the chunks the page arrives in
+        for chunk_size in (1, 3, 64, 1024 * 1024):
+            with patch.object(FLOIPResponsesPage, "STREAM_CHUNK_SIZE", chunk_size):
+                response = MockResponse(200, content)
+                page = FLOIPResponsesPage(response)
+
+                self.assertEqual(list(page), responses)
+                self.assertEqual(page.next_url, "next-url")
+                self.assertTrue(response.raw.closed)
+
+        with self.assertRaises(ValueError):
+            list(FLOIPResponsesPage(MockResponse(200, content[:-40])))
+
+
+class FLOIPPullResultsChunkTest(UreportTest):
+    def setUp(self):
+        super().setUp()
+        self.backend = FLOIPBackend(self.floip_backend)
+        education = Category.objects.create(
+            org=self.nigeria, name="Education", created_by=self.admin, modified_by=self.admin
+        )
+        self.poll = self.create_poll(self.nigeria, "Flow 1", "flow-uuid", education, self.admin)
+        self.create_poll_question(self.admin, self.poll, "question 1", "q1")
+
+        PollResult.objects.all().delete()
+        Contact.objects.create(org=self.nigeria, uuid="C1", gender="M", born=1990)
+
+    @patch("requests.Session.request")
+    def test_resumes_across_chunks(self, mock_request):
+        mock_request.side_effect = [
+            MockResponse(200, responses_page([["2018-04-05 19:37:09", "1", "C1", "S1", "q1", "Yes", {}]], "page-2")),
+            MockResponse(200, responses_page([["2018-04-05 19:38:09", "2", "C2", "S2", "q1", "No", {}]])),
+        ]
+
+        first = self.backend.pull_results_chunk(self.poll, {"after": "2018-04-05 19:00:00"}, page_budget=1)
+
+        self.assertFalse(first.done)
+        self.assertEqual(first.counts["num_val_created"], 1)
+        self.assertEqual(
+            first.cursor, {"after": "2018-04-05 19:37:09", "start": "2018-04-05 19:00:00", "next": "page-2"}
+        )
+        self.assertEqual(first.requests, 1)
+        json.dumps(first.cursor)
+
+        second = self.backend.pull_results_chunk(self.poll, first.cursor, page_budget=1)
+
+        self.assertTrue(second.done)
+        self.assertEqual(second.counts["num_val_created"], 1)
+        self.assertEqual(second.cursor, {"after": "2018-04-05 19:38:09"})
+        self.assertEqual(PollResult.objects.filter(flow="flow-uuid").count(), 2)
+
+        # the next page of the traversal is fetched with the query it started with
+        self.assertEqual(mock_request.call_args.args, ("GET", "page-2"))
+        self.assertEqual(
+            mock_request.call_args.kwargs["params"], {"filter": {"start-timestamp": "2018-04-05 19:00:00"}}
+        )
+
+    @patch("requests.Session.request")
+    def test_rate_limit_keeps_progress(self, mock_request):
+        mock_request.side_effect = [
+            MockResponse(200, responses_page([["2018-04-05 19:37:09", "1", "C1", "S1", "q1", "Yes", {}]], "page-2")),
+            MockResponse(429, ""),
+        ]
+
+        result = self.backend.pull_results_chunk(self.poll, {"after": None})
+
+        self.assertFalse(result.done)
+        self.assertTrue(result.rate_limited)
+        self.assertEqual(result.counts["num_val_created"], 1)
+        self.assertEqual(result.cursor, {"after": "2018-04-05 19:37:09", "start": None, "next": "page-2"})
+        self.assertEqual(result.requests, 2)
+
+    @patch("requests.Session.request")
+    def test_stopped_syncing_poll_is_done_immediately(self, mock_request):
+        self.poll.stopped_syncing = True
+        self.poll.save()
+
+        result = self.backend.pull_results_chunk(self.poll, {"after": "t1"})
+
+        self.assertTrue(result.done)
+        self.assertEqual(result.cursor, {"after": "t1"})
+        mock_request.assert_not_called()
@@ -6,8 +6,7 @@ import json
 import logging
 from datetime import timedelta
 
-from mock import PropertyMock, patch
-from temba_client.exceptions import TembaRateExceededError
+from mock import patch
 from temba_client.v2.types import (
     Archive as TembaArchive,
     Boundary as TembaBoundary,
@@ -17,8 +16,10 @@ from temba_client.v2.types import (
     Run as TembaRun,
 )
 
+from django.core.cache import cache
 from django.db import connection, reset_queries
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from dash.categories.models import Category
@@ -29,13 +30,32 @@ from ureport.contacts.models import Contact, ContactField
 from ureport.flows.models import FlowResult, FlowResultCategory
 from ureport.locations.models import Boundary
 from ureport.polls.models import Poll, PollQuestion, PollResponseCategory, PollResult
-from ureport.stats.models import ContactActivity
+from ureport.stats.models import ContactActivity, PollEngagementDailyCount, PollStatsCounter
 from ureport.tests import MockResponse, UreportTest
-from ureport.utils import datetime_to_json_date, json_date_to_datetime
+from ureport.utils import json_date_to_datetime
 
 logger = logging.getLogger(__name__)
 
 
+def pull_results(backend, poll):
+    """
+    Pulls all the runs of the poll as a single chunk, returning the created, updated and ignored counts of the values
+    and of the path steps
+    """
+    result = backend.pull_results_chunk(poll, {}, incremental_counts=poll.has_incremental_results_counts())
+    return tuple(
+        result.counts[key]
+        for key in (
+            "num_val_created",
+            "num_val_updated",
+            "num_val_ignored",
+            "num_path_created",
+            "num_path_updated",
+            "num_path_ignored",
+        )
+    )
+
+
 class FieldSyncerTest(UreportTest):
     def setUp(self):
         super(FieldSyncerTest, self).setUp()
@@ -896,7 +916,7 @@ class RapidProBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(8):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -961,7 +981,7 @@ class RapidProBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(11):
+        with self.assertNumQueries(8):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -1027,7 +1047,7 @@ class RapidProBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(12):
+        with self.assertNumQueries(9):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -1091,7 +1111,7 @@ class RapidProBackendTest(UreportTest):
             ),
         ]
 
-        with self.assertNumQueries(14):
+        with self.assertNumQueries(11):
             contact_results, resume_cursor = self.backend.pull_contacts(self.nigeria, None, None)
 
         self.assertEqual(
@@ -1259,6 +1279,17 @@ class RapidProBackendTest(UreportTest):
             {SyncOutcome.created: 0, SyncOutcome.updated: 1, SyncOutcome.deleted: 0, SyncOutcome.ignored: 1},
         )
 
+        # the cached GeoJSON is only moved to a new version when boundaries change
+        geojson_version = cache.get(Boundary.GEOJSON_VERSION_CACHE_KEY % self.nigeria.pk)
+        self.assertIsNotNone(geojson_version)
+
+        boundaries_results = self.backend.pull_boundaries(self.nigeria)
+        self.assertEqual(
+            boundaries_results,
+            {SyncOutcome.created: 0, SyncOutcome.updated: 0, SyncOutcome.deleted: 0, SyncOutcome.ignored: 2},
+        )
+        self.assertEqual(geojson_version, cache.get(Boundary.GEOJSON_VERSION_CACHE_KEY % self.nigeria.pk))
+
         mock_get_boundaries.return_value = MockClientQuery(
             [
                 TembaBoundary.create(
@@ -1340,11 +1371,101 @@ class RapidProBackendTest(UreportTest):
             {SyncOutcome.created: 2, SyncOutcome.updated: 0, SyncOutcome.deleted: 2, SyncOutcome.ignored: 0},
         )
 
-    @patch("valkey.client.StrictValkey.lock")
+    @patch("dash.orgs.models.TembaClient.get_runs")
+    def test_pull_results_incremental_counts(self, mock_get_runs):
+        from django_valkey import get_valkey_connection
+
+        valkey_client = get_valkey_connection()
+
+        poll = self.create_poll(
+            self.nigeria, "Flow 1", "flow-uuid", self.education_nigeria, self.admin, has_synced=True
+        )
+        question = self.create_poll_question(self.admin, poll, "question 1", "ruleset-uuid-0")
+        yes_category = self.create_poll_response_category(question, "rule-uuid-1", "Yes")
+        no_category = self.create_poll_response_category(question, "rule-uuid-2", "No")
+
+        self.assertTrue(poll.has_incremental_results_counts())
+
+        now = timezone.now()
+
+        def create_runs(category, value_time):
+            return [
+                TembaRun.create(
+                    uuid=num,
+                    flow=ObjectRef.create(uuid="flow-uuid", name="Flow 1"),
+                    contact=ObjectRef.create(uuid="C-00%d" % num, name="Ann"),
+                    responded=True,
+                    path=[],
+                    values={
+                        "question 1": TembaRun.Value.create(
+                            value=category, category=category, node="ruleset-uuid-0", time=value_time
+                        )
+                    },
+                    created_on=now,
+                    modified_on=value_time,
+                    exited_on=value_time,
+                    exit_type="completed",
+                )
+                for num in range(3)
+            ]
+
+        mock_get_runs.side_effect = [MockClientQuery(create_runs("Yes", now))]
+        self.assertEqual((3, 0, 0, 0, 0, 0), pull_results(self.backend, poll))
+
+        # new results added +1 deltas
+        counters = PollStatsCounter.objects.filter(flow_result=question.flow_result)
+        self.assertEqual(3, counters.filter(flow_result_category=yes_category.flow_result_category).sum())
+        self.assertFalse(counters.filter(is_squashed=True).exists())
+        self.assertEqual(3, PollEngagementDailyCount.objects.filter(flow_result=question.flow_result).sum())
+
+        mock_get_runs.side_effect = [MockClientQuery(create_runs("No", now + timedelta(minutes=1)))]
+        self.assertEqual((0, 3, 0, 0, 0, 0), pull_results(self.backend, poll))
+
+        # updated results moved their counts with -1/+1 deltas
+        self.assertEqual(0, counters.filter(flow_result_category=yes_category.flow_result_category).sum())
+        self.assertEqual(3, counters.filter(flow_result_category=no_category.flow_result_category).sum())
+
+        PollStatsCounter.squash_bulk()
+        PollEngagementDailyCount.squash_bulk()
+
+        def get_counts():
+            return (
+                {(c.flow_result_category_id, c.scope): c.count for c in counters.all()},
+                {
+                    (c.is_responded, c.scope, c.day): c.count
+                    for c in PollEngagementDailyCount.objects.filter(flow_result=question.flow_result)
+                },
+            )
+
+        # squashed deltas match a full rebuild
+        incremental_counts = get_counts()
+        poll.rebuild_poll_results_counts()
+        self.assertEqual(incremental_counts, get_counts())
+
+        # deltas are still written while the counts of the flow are being rebuilt
+        rebuild_key = Poll.POLL_REBUILD_COUNTS_LOCK % (poll.org_id, poll.flow_uuid)
+        valkey_client.set(rebuild_key, "rebuilding", ex=60)
+        mock_get_runs.side_effect = [MockClientQuery(create_runs("Yes", now + timedelta(minutes=2)))]
+        self.assertEqual((0, 3, 0, 0, 0, 0), pull_results(self.backend, poll))
+        valkey_client.delete(rebuild_key)
+
+        self.assertEqual(3, counters.filter(flow_result_category=yes_category.flow_result_category).sum())
+        self.assertEqual(0, counters.filter(flow_result_category=no_category.flow_result_category).sum())
+
+        # no deltas when counters were never built
+        Poll.objects.filter(pk=poll.pk).update(has_synced=False)
+        poll.refresh_from_db()
+        self.assertFalse(poll.has_incremental_results_counts())
+
+        with patch("ureport.polls.models.Poll.apply_poll_results_deltas") as mock_apply_deltas:
+            mock_get_runs.side_effect = [MockClientQuery(create_runs("No", now + timedelta(minutes=3)))]
+            self.assertEqual((0, 3, 0, 0, 0, 0), pull_results(self.backend, poll))
+            self.assertFalse(mock_apply_deltas.called)
+
     @patch("dash.orgs.models.TembaClient.get_runs")
     @patch("django.utils.timezone.now")
     @patch("django.core.cache.cache.get")
-    def test_pull_results(self, mock_cache_get, mock_timezone_now, mock_get_runs, mock_valkey_lock):
+    def test_pull_results(self, mock_cache_get, mock_timezone_now, mock_get_runs):
         mock_cache_get.return_value = None
 
         now_date = json_date_to_datetime("2015-04-08T12:48:44.320Z")
@@ -1377,7 +1498,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1385,16 +1506,13 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
             (1, 0, 0, 0, 0, 1),
         )
         mock_get_runs.assert_called_with(flow="flow-uuid", after=None, reverse=True, paths=True)
-        mock_valkey_lock.assert_called_once_with(
-            Poll.POLL_PULL_RESULTS_TASK_LOCK % (poll.org.pk, poll.flow_uuid), timeout=7200
-        )
 
         poll_result = PollResult.objects.filter(flow="flow-uuid", ruleset="ruleset-uuid", contact="C-001").first()
         self.assertEqual(poll_result.state, "R-LAGOS")
@@ -1440,7 +1558,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_1, temba_run_2])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1448,7 +1566,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1483,7 +1601,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_3])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1491,7 +1609,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1508,7 +1626,7 @@ class RapidProBackendTest(UreportTest):
         self.assertEqual(poll_result.text, "We'll celebrate today")
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_3])]
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             (
                 num_val_created,
                 num_val_updated,
@@ -1516,7 +1634,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1525,7 +1643,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_1, temba_run_2])]
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             (
                 num_val_created,
                 num_val_updated,
@@ -1533,7 +1651,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1568,7 +1686,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_4])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1576,7 +1694,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1612,7 +1730,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_4])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1620,7 +1738,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1639,7 +1757,7 @@ class RapidProBackendTest(UreportTest):
         PollResult.objects.filter(ruleset="ruleset-uuid-2").update(date=None)
         mock_get_runs.side_effect = [MockClientQuery([temba_run_4])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1647,7 +1765,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1657,7 +1775,7 @@ class RapidProBackendTest(UreportTest):
         PollResult.objects.filter(ruleset="ruleset-uuid").update(date=None)
         mock_get_runs.side_effect = [MockClientQuery([temba_run_4])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1665,7 +1783,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1701,7 +1819,7 @@ class RapidProBackendTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1733,7 +1851,7 @@ class RapidProBackendTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1763,7 +1881,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run_no_response])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1771,7 +1889,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1791,7 +1909,7 @@ class RapidProBackendTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1824,7 +1942,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -1832,7 +1950,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -1846,13 +1964,124 @@ class RapidProBackendTest(UreportTest):
         self.assertEqual(poll_result.category, "Win")
         self.assertEqual(poll_result.text, "We'll win today")
 
-    @patch("valkey.client.StrictValkey.lock")
+    @patch("dash.orgs.models.TembaClient.get_runs")
+    @patch("django.core.cache.cache.get")
+    def test_pull_results_bulk_updates(self, mock_cache_get, mock_get_runs):
+        mock_cache_get.return_value = None
+
+        PollResult.objects.all().delete()
+        now = timezone.now()
+
+        def pull_updates(num_results):
+            flow_uuid = "flow-%d" % num_results
+            poll = self.create_poll(
+                self.nigeria, "Flow %d" % num_results, flow_uuid, self.education_nigeria, self.admin
+            )
+            self.create_poll_question(self.admin, poll, "question 1", "ruleset-%d" % num_results)
+
+            temba_runs = []
+            for i in range(num_results):
+                contact_uuid = "C-%d-%d" % (num_results, i)
+                Contact.objects.create(org=self.nigeria, uuid=contact_uuid, gender="F", born=1995, state="R-KIGALI")
+                PollResult.objects.create(
+                    org=self.nigeria,
+                    flow=flow_uuid,
+                    ruleset="ruleset-%d" % num_results,
+                    contact=contact_uuid,
+                    category="No",
+                    text="No",
+                    date=now - timedelta(days=1),
+                    completed=False,
+                )
+                temba_runs.append(
+                    TembaRun.create(
+                        uuid=1000 * num_results + i,
+                        flow=ObjectRef.create(uuid=flow_uuid, name="Flow %d" % num_results),
+                        contact=ObjectRef.create(uuid=contact_uuid, name="Reporter"),
+                        responded=True,
+                        values={
+                            "yes": TembaRun.Value.create(
+                                value="Yes", category="Yes", node="ruleset-%d" % num_results, time=now
+                            )
+                        },
+                        path=[TembaRun.Step.create(node="ruleset-%d" % num_results, time=now - timedelta(minutes=1))],
+                        created_on=now - timedelta(minutes=1),
+                        modified_on=now,
+                        exited_on=now,
+                        exit_type="completed",
+                    )
+                )
+
+            mock_get_runs.side_effect = [MockClientQuery(temba_runs)]
+
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual((0, num_results, 0, 0, 0, num_results), pull_results(self.backend, poll))
+
+            self.assertEqual(
+                num_results,
+                PollResult.objects.filter(flow=flow_uuid, category="Yes", text="Yes", completed=True).count(),
+            )
+            self.assertEqual(
+                num_results,
+                PollResult.objects.filter(flow=flow_uuid, gender="F", born=1995, state="R-KIGALI", date=now).count(),
+            )
+
+            queries = [query["sql"] for query in captured.captured_queries]
+            updates = [sql for sql in queries if sql.startswith('UPDATE "polls_pollresult"')]
+            return len(queries), len(updates)
+
+        # a page updating a single result runs one UPDATE, where the single-row updates ran one per value and one
+        # per path step
+        single_queries, single_updates = pull_updates(1)
+        self.assertEqual((5, 1), (single_queries, single_updates))
+
+        # a page updating many results runs the same queries, where the single-row updates ran 2 UPDATEs per result
+        for num_results in (3, 10):
+            self.assertEqual((single_queries, single_updates), pull_updates(num_results))
+
+    @patch("requests.get")
+    def test_iter_archive_records(self, mock_request_get):
+        read_sizes = []
+
+        class ReadTrackingStream(io.BytesIO):
+            def read(self, size=-1):
+                read_sizes.append(size)
+                return super().read(size)
+
+        stream = io.BytesIO()
+        with gzip.GzipFile(fileobj=stream, mode="wb") as gz:
+            for i in range(20_000):
+                flow_uuid = "flow-uuid" if i % 1000 == 0 else "flow-%d" % (i % 7)
+                gz.write(json.dumps(dict(id=i, flow=dict(uuid=flow_uuid), values={})).encode("utf-8"))
+                gz.write(b"\n")
+
+        response = MockResponse(200, stream.getvalue())
+        response.raw = ReadTrackingStream(stream.getvalue())
+        mock_request_get.return_value = response
+
+        archive = TembaArchive.create(download_url="http://archives.com/run.jsonl.gz")
+
+        records = list(self.backend._iter_archive_records(archive, ["flow-uuid"]))
+        self.assertEqual([record["id"] for record in records], list(range(0, 20_000, 1000)))
+        mock_request_get.assert_called_once_with("http://archives.com/run.jsonl.gz", stream=True)
+
+        # the archive is read a block at a time rather than all at once
+        self.assertGreater(len(read_sizes), 1)
+        self.assertTrue(all(0 < size <= gzip.READ_BUFFER_SIZE for size in read_sizes))
+        self.assertTrue(response.raw.closed)
+
+        response = MockResponse(404, b"")
+        mock_request_get.return_value = response
+
+        with self.assertRaises(Exception):
+            list(self.backend._iter_archive_records(archive, ["flow-uuid"]))
+
     @patch("ureport.polls.models.Poll.get_flow_date")
     @patch("dash.orgs.models.TembaClient.get_archives")
     @patch("django.utils.timezone.now")
     @patch("requests.get")
-    def test_pull_results_from_archives(
-        self, mock_request_get, mock_timezone_now, mock_get_archives, mock_poll_flow_date, mock_valkey_lock
+    def test_pull_results_from_archives_fanout_chunk(
+        self, mock_request_get, mock_timezone_now, mock_get_archives, mock_poll_flow_date
     ):
         def gzipped_records(records):
             stream = io.BytesIO()
@@ -1916,25 +2145,23 @@ class RapidProBackendTest(UreportTest):
         ]
 
         with self.assertNumQueries(5):
-            (
-                num_val_created,
-                num_val_updated,
-                num_val_ignored,
-                num_path_created,
-                num_path_updated,
-                num_path_ignored,
-            ) = self.backend.pull_results_from_archives(poll)
+            result = self.backend.pull_results_from_archives_fanout_chunk([poll], {})[poll.id]
 
+        self.assertTrue(result.done)
         self.assertEqual(
-            (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
-            (1, 0, 0, 0, 0, 1),
+            result.counts,
+            dict(
+                num_val_created=1,
+                num_val_updated=0,
+                num_val_ignored=0,
+                num_path_created=0,
+                num_path_updated=0,
+                num_path_ignored=1,
+                num_synced=1,
+            ),
         )
 
-        mock_get_archives.assert_called_with(type="run", after=None)
-        mock_valkey_lock.assert_called_once_with(
-            Poll.POLL_PULL_RESULTS_TASK_LOCK % (poll.org.pk, poll.flow_uuid),
-            timeout=Poll.POLL_PULL_ARCHIVES_LOCK_TIMEOUT,
-        )
+        mock_get_archives.assert_called_with(type="run", after=None, before=None)
 
         poll_result = PollResult.objects.filter(flow="flow-uuid", ruleset="ruleset-uuid", contact="C-001").first()
         self.assertEqual(poll_result.state, "R-LAGOS")
@@ -1998,38 +2225,19 @@ class RapidProBackendTest(UreportTest):
         ]
 
         with self.assertNumQueries(5):
-            (
-                num_val_created,
-                num_val_updated,
-                num_val_ignored,
-                num_path_created,
-                num_path_updated,
-                num_path_ignored,
-            ) = self.backend.pull_results_from_archives(poll)
+            result = self.backend.pull_results_from_archives_fanout_chunk([poll], {})[poll.id]
 
-        self.assertEqual(
-            (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
-            (2, 0, 0, 0, 0, 2),
-        )
+        self.assertEqual((result.counts["num_val_created"], result.counts["num_path_ignored"]), (2, 2))
         self.assertEqual(3, PollResult.objects.all().count())
         self.assertEqual(1, Contact.objects.all().count())
 
         poll.stopped_syncing = True
         poll.save()
 
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results_from_archives(poll)
+        result = self.backend.pull_results_from_archives_fanout_chunk([poll], {})[poll.id]
 
-        self.assertEqual(
-            (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
-            (0, 0, 0, 0, 0, 0),
-        )
+        self.assertTrue(result.done)
+        self.assertFalse(any(result.counts.values()))
 
     @patch("dash.orgs.models.TembaClient.get_runs")
     @patch("django.utils.timezone.now")
@@ -2067,7 +2275,7 @@ class RapidProBackendTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery([temba_run])]
 
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(5):
             (
                 num_val_created,
                 num_val_updated,
@@ -2075,7 +2283,7 @@ class RapidProBackendTest(UreportTest):
                 num_path_created,
                 num_path_updated,
                 num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
+            ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2204,14 +2412,7 @@ class PerfTest(UreportTest):
     @override_settings(DEBUG=True)
     @patch("dash.orgs.models.TembaClient.get_runs")
     @patch("django.utils.timezone.now")
-    @patch("ureport.polls.models.Poll.get_pull_cached_params")
-    def test_pull_results(self, mock_get_pull_cached_params, mock_timezone_now, mock_get_runs):
-        mock_get_pull_cached_params.return_value = (None, None)
-
-        from django_valkey import get_valkey_connection
-
-        valkey_client = get_valkey_connection()
-
+    def test_pull_results(self, mock_timezone_now, mock_get_runs):
         now_date = json_date_to_datetime("2015-04-08T12:48:44.320Z")
         mock_timezone_now.return_value = now_date
 
@@ -2219,9 +2420,6 @@ class PerfTest(UreportTest):
 
         poll = self.create_poll(self.nigeria, "Flow 1", "flow-uuid", self.education_nigeria, self.admin)
 
-        key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (poll.org.pk, poll.flow_uuid)
-        valkey_client.delete(key)
-
         now = timezone.now()
 
         fetch_size = 250
@@ -2274,7 +2472,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         mock_get_runs.assert_called_once_with(flow=poll.flow_uuid, after=None, reverse=True, paths=True)
 
@@ -2294,7 +2492,6 @@ class PerfTest(UreportTest):
         # simulate a subsequent sync with no changes
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2302,7 +2499,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2323,7 +2520,6 @@ class PerfTest(UreportTest):
                 )
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2331,7 +2527,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2355,7 +2551,6 @@ class PerfTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2363,7 +2558,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2392,7 +2587,6 @@ class PerfTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2400,7 +2594,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2428,7 +2622,6 @@ class PerfTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2436,7 +2629,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2458,7 +2651,6 @@ class PerfTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2466,7 +2658,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2504,7 +2696,6 @@ class PerfTest(UreportTest):
 
         mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
 
-        valkey_client.delete(key)
         (
             num_val_created,
             num_val_updated,
@@ -2512,7 +2703,7 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
@@ -2527,26 +2718,6 @@ class PerfTest(UreportTest):
 
         reset_queries()
 
-        mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-        valkey_client.set(key, "lock-taken")
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        self.assertEqual(
-            (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
-            (0, 0, 0, 0, 0, 0),
-        )
-
-        valkey_client.delete(key)
-
         PollResult.objects.all().delete()
 
         # same contact, same ruleset, same or previous time should all be ignored, only insert one, ignore others
@@ -2595,384 +2766,9 @@ class PerfTest(UreportTest):
             num_path_created,
             num_path_updated,
             num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
+        ) = pull_results(self.backend, poll)
 
         self.assertEqual(
             (num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored),
             (1, 0, num_fetches * fetch_size * num_steps - 1, 0, 0, 0),
         )
-
-        valkey_client.delete(key)
-
-        PollResult.objects.all().delete()
-
-        with patch("ureport.polls.models.Poll.rebuild_poll_results_counts") as mock_rebuild_counts:
-            with patch(
-                "ureport.polls.models.Poll.POLL_RESULTS_MAX_SYNC_RUNS", new_callable=PropertyMock
-            ) as mock_max_runs:
-                mock_max_runs.return_value = 300
-                mock_rebuild_counts.return_value = "REBUILT"
-
-                mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-                (
-                    num_val_created,
-                    num_val_updated,
-                    num_val_ignored,
-                    num_path_created,
-                    num_path_updated,
-                    num_path_ignored,
-                ) = self.backend.pull_results(poll, None, None)
-
-                # we fetched two pages
-                self.assertEqual(
-                    (
-                        num_val_created,
-                        num_val_updated,
-                        num_val_ignored,
-                        num_path_created,
-                        num_path_updated,
-                        num_path_ignored,
-                    ),
-                    (1, 0, 2 * fetch_size * num_steps - 1, 0, 0, 0),
-                )
-
-                mock_rebuild_counts.assert_called_with()
-
-                mock_max_runs.return_value = 200
-                valkey_client.delete(key)
-
-                PollResult.objects.all().delete()
-
-                mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-                (
-                    num_val_created,
-                    num_val_updated,
-                    num_val_ignored,
-                    num_path_created,
-                    num_path_updated,
-                    num_path_ignored,
-                ) = self.backend.pull_results(poll, None, None)
-
-                # we fetched one pages
-                self.assertEqual(
-                    (
-                        num_val_created,
-                        num_val_updated,
-                        num_val_ignored,
-                        num_path_created,
-                        num_path_updated,
-                        num_path_ignored,
-                    ),
-                    (1, 0, fetch_size * num_steps - 1, 0, 0, 0),
-                )
-                mock_rebuild_counts.assert_called_with()
-
-        now_date = datetime_to_json_date(now_date)
-        mock_get_pull_cached_params.side_effect = [
-            (None, None),
-            (None, now_date),
-        ]
-        with patch("ureport.polls.models.Poll.delete_poll_results") as mock_delete_poll_results:
-            mock_delete_poll_results.return_value = "Deleted"
-
-            mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-            (
-                num_val_created,
-                num_val_updated,
-                num_val_ignored,
-                num_path_created,
-                num_path_updated,
-                num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
-
-            self.assertFalse(mock_delete_poll_results.called)
-
-            valkey_client.set(Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (poll.org_id, poll.pk), now_date, None)
-
-            mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-            (
-                num_val_created,
-                num_val_updated,
-                num_val_ignored,
-                num_path_created,
-                num_path_updated,
-                num_path_ignored,
-            ) = self.backend.pull_results(poll, None, None)
-
-            mock_delete_poll_results.assert_called_with()
-
-    def get_mock_args_list(self, mock_obj):
-        args_list = []
-        for elt in mock_obj.call_args_list:
-            args_list.append(elt[0])
-
-        return args_list
-
-    @override_settings(DEBUG=True)
-    @patch("ureport.polls.tasks.pull_refresh.apply_async")
-    @patch("django.core.cache.cache.delete")
-    @patch("django.core.cache.cache.set")
-    @patch("dash.orgs.models.TembaClient.get_runs")
-    @patch("django.utils.timezone.now")
-    @patch("ureport.polls.models.Poll.get_pull_cached_params")
-    @patch("ureport.polls.models.Poll.rebuild_poll_results_counts")
-    @patch("ureport.polls.models.Poll.POLL_RESULTS_MAX_SYNC_RUNS", new_callable=PropertyMock)
-    def test_pull_results_batching(
-        self,
-        mock_max_runs,
-        mock_rebuild_counts,
-        mock_get_pull_cached_params,
-        mock_timezone_now,
-        mock_get_runs,
-        mock_cache_set,
-        mock_cache_delete,
-        mock_pull_refresh,
-    ):
-        mock_max_runs.return_value = 300
-        mock_rebuild_counts.return_value = "REBUILT"
-        mock_get_pull_cached_params.side_effect = [(None, None)]
-
-        now_date = json_date_to_datetime("2015-04-08T12:48:44.320Z")
-        day_ago = now_date - timedelta(hours=24)
-        two_days_ago = now_date - timedelta(hours=24)
-
-        mock_timezone_now.return_value = now_date
-
-        PollResult.objects.all().delete()
-
-        poll = self.create_poll(self.nigeria, "Flow 1", "flow-uuid", self.education_nigeria, self.admin)
-
-        now = timezone.now()
-
-        fetch_size = 250
-        num_fetches = 4
-        num_steps = 5
-        names = ["Ann", "Bob", "Cat"]
-        dates = [day_ago, day_ago, two_days_ago, two_days_ago]
-
-        active_fetches = []
-        for b in range(0, num_fetches):
-            batch = []
-            for r in range(0, fetch_size):
-                num = b * fetch_size + r
-                batch.append(
-                    TembaRun.create(
-                        uuid=num,
-                        flow=ObjectRef.create(uuid="flow-uuid", name="Flow 1"),
-                        contact=ObjectRef.create(uuid="C-00%d" % num, name=names[num % len(names)]),
-                        responded=True,
-                        path=[],
-                        values={
-                            key: val
-                            for (key, val) in [
-                                (
-                                    "category %s" % s,
-                                    TembaRun.Value.create(
-                                        value="Text %s" % s,
-                                        category="Category %s" % s,
-                                        node="ruleset-uuid-%d" % s,
-                                        time=now,
-                                    ),
-                                )
-                                for s in range(0, num_steps)
-                            ]
-                        },
-                        created_on=dates[b],
-                        modified_on=dates[b],
-                        exited_on=now,
-                        exit_type="",
-                    )
-                )
-
-            active_fetches.append(batch)
-
-        mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (
-                Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-07T12:48:44.320Z",
-                None,
-            ),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_set)))
-        self.assertFalse(mock_cache_delete.called)
-        mock_pull_refresh.assert_called_once_with((poll.pk,), countdown=300, queue="sync")
-
-        mock_max_runs.return_value = 10000
-        mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-        mock_get_pull_cached_params.side_effect = [(None, None)]
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (
-                Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-07T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                60 * 60 * 24 * 2,
-            ),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_set)))
-
-        mock_cache_set.reset_mock()
-        mock_max_runs.return_value = 10000
-        mock_get_pull_cached_params.side_effect = [(None, None)]
-        mock_get_runs.side_effect = [MockClientQuery(*active_fetches)]
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (
-                Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-07T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                60 * 60 * 24 * 2,
-            ),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_set)))
-        mock_cache_set.reset_mock()
-
-        mock_get_pull_cached_params.side_effect = [("2015-04-05T12:48:44.320Z", None)]
-        mock_get_runs.side_effect = [MockClientQuery(*[])]
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (
-                Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-05T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                None,
-            ),
-            (
-                Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid),
-                "2015-04-08T12:48:44.320Z",
-                60 * 60 * 24 * 2,
-            ),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_set)))
-        mock_get_runs.reset_mock()
-        mock_get_pull_cached_params.side_effect = [
-            (
-                "2015-04-05T12:48:44.320Z",
-                "2015-04-07T12:48:44.320Z",
-            )
-        ]
-        mock_get_runs.side_effect = [MockClientQuery(*[])]
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (poll.org_id, poll.pk),),
-            (Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (poll.org.pk, poll.flow_uuid),),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_delete)))
-        mock_get_runs.assert_called_once_with(flow=poll.flow_uuid, after=None, reverse=True, paths=True)
-
-    @override_settings(DEBUG=True)
-    @patch("dash.orgs.models.TembaClient._request")
-    @patch("ureport.polls.tasks.pull_refresh.apply_async")
-    @patch("django.core.cache.cache.set")
-    @patch("django.utils.timezone.now")
-    @patch("ureport.polls.models.Poll.get_pull_cached_params")
-    def test_pull_results_batching_error(
-        self,
-        mock_get_pull_cached_params,
-        mock_timezone_now,
-        mock_cache_set,
-        mock_pull_refresh,
-        mock_base_client_request,
-    ):
-        now_date = json_date_to_datetime("2015-04-08T12:48:44.320Z")
-        mock_timezone_now.return_value = now_date
-
-        PollResult.objects.all().delete()
-
-        poll = self.create_poll(self.nigeria, "Flow 1", "flow-uuid", self.education_nigeria, self.admin)
-
-        mock_get_pull_cached_params.side_effect = [(None, None)]
-        mock_base_client_request.side_effect = [TembaRateExceededError(0)]
-
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = self.backend.pull_results(poll, None, None)
-
-        expected_args = [
-            (Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, poll.flow_uuid), None, None),
-        ]
-
-        self.assertEqual(set(expected_args), set(self.get_mock_args_list(mock_cache_set)))
-        mock_pull_refresh.assert_called_once_with((poll.pk,), countdown=300, queue="sync")
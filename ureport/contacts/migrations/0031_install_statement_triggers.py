@@ -0,0 +1,14 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:02
+
+from django.db import migrations
+
+from ureport.sql import InstallSQL
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contacts", "0030_install_triggers"),
+    ]
+
+    operations = [InstallSQL("contacts_0031")]
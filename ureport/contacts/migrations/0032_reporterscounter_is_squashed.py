@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contacts", "0031_install_statement_triggers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reporterscounter",
+            name="is_squashed",
+            field=models.BooleanField(db_default=False, default=False),
+        ),
+        migrations.RunSQL("DROP FUNCTION IF EXISTS ureport_squash_reporterscounters(INT, VARCHAR);", ""),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:21
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("contacts", "0032_reporterscounter_is_squashed"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="reporterscounter",
+            index=models.Index(
+                condition=models.Q(("is_squashed", False)),
+                fields=["org", "type"],
+                name="contacts_rptrscntr_unsquashed",
+            ),
+        ),
+    ]
@@ -7,12 +7,13 @@ from datetime import timedelta
 
 from django_valkey import get_valkey_connection
 
-from django.db import connection, models
-from django.db.models import Count
+from django.db import models
+from django.db.models import Q, Sum
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from dash.orgs.models import Org, OrgBackend
+from ureport.utils.counts import BaseSquashableCount
 
 CONTACT_LOCK_KEY = "lock:contact:%d:%s"
 CONTACT_FIELD_LOCK_KEY = "lock:contact-field:%d:%s"
@@ -142,7 +143,7 @@ class Contact(models.Model):
         for counter_tuple in counters_dict.keys():
             org_id, counter_type = counter_tuple
             count = counters_dict[counter_tuple]
-            counters_to_insert.append(ReportersCounter(org_id=org_id, type=counter_type, count=count))
+            counters_to_insert.append(ReportersCounter(org_id=org_id, type=counter_type, count=count, is_squashed=True))
 
         ReportersCounter.objects.bulk_create(counters_to_insert, batch_size=1000)
 
@@ -225,74 +226,34 @@ class Contact(models.Model):
         ]
 
 
-class ReportersCounter(models.Model):
+class ReportersCounter(BaseSquashableCount):
     COUNTS_SQUASH_LOCK = "org-reporters-counts-squash-lock"
-    LAST_SQUASHED_ID_KEY = "org-reporters-last-squashed-id"
 
-    org = models.ForeignKey(Org, on_delete=models.PROTECT, related_name="reporters_counters")
+    squash_max_distinct = 100000
+    squash_over = ("org_id", "type")
+    squash_non_negative = True
 
-    type = models.CharField(max_length=255)
+    # keep the column types of the table, which is too hot to rewrite, and default is_squashed in the database for
+    # the rows inserted by the counter triggers
+    id = models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")
 
     count = models.IntegerField(default=0, help_text=_("Number of items with this counter"))
 
+    is_squashed = models.BooleanField(default=False, db_default=False)
+
+    org = models.ForeignKey(Org, on_delete=models.PROTECT, related_name="reporters_counters")
+
+    type = models.CharField(max_length=255)
+
     @classmethod
     def squash_counts(cls):
-        # get the id of the last count we squashed
         r = get_valkey_connection()
         key = ReportersCounter.COUNTS_SQUASH_LOCK
         if r.get(key):
             logger.info("Squash reporters counts already running.")
         else:
             with r.lock(key, timeout=60 * 60):
-                last_squash = r.get(ReportersCounter.LAST_SQUASHED_ID_KEY)
-                if not last_squash:
-                    last_squash = 0
-
-                last_squash = int(last_squash)
-
-                start = time.time()
-                squash_count = 0
-
-                if last_squash < 1:
-                    counters = (
-                        ReportersCounter.objects.values("org_id", "type")
-                        .annotate(Count("id"))
-                        .filter(id__count__gt=1)
-                        .order_by("org_id", "type")
-                    )
-
-                else:
-                    counters = (
-                        ReportersCounter.objects.filter(id__gt=last_squash)
-                        .values("org_id", "type")
-                        .order_by("org_id", "type")
-                        .distinct("org_id", "type")
-                    )
-
-                total_counters = len(counters)
-
-                # get all the new added counters
-                for counter in counters:
-                    # perform our atomic squash in SQL by calling our squash method
-                    with connection.cursor() as c:
-                        c.execute(
-                            "SELECT ureport_squash_reporterscounters(%s, %s);", (counter["org_id"], counter["type"])
-                        )
-
-                    squash_count += 1
-
-                    if squash_count % 100 == 0:
-                        logger.info(
-                            "Squashing progress ... %0.2f/100 in in %0.3fs"
-                            % (squash_count * 100 / total_counters, time.time() - start)
-                        )
-
-                # insert our new top squashed id
-                max_id = ReportersCounter.objects.all().order_by("-id").first()
-                if max_id:
-                    r.set(ReportersCounter.LAST_SQUASHED_ID_KEY, max_id.id)
-
-                logger.info("Squashed poll results counts for %d types in %0.3fs" % (squash_count, time.time() - start))
+                cls.squash_bulk()
 
     @classmethod
     def get_counts(cls, org, types=None):
@@ -303,16 +264,18 @@ class ReportersCounter(models.Model):
         if types:
             counters = counters.filter(type__in=types)
 
-        counter_counts = counters.iterator(chunk_size=1000)
-
-        counts = defaultdict(int)
-        for c in counter_counts:
-            counts[c.type] += c.count
+        counts = counters.values_list("type").annotate(count_sum=Sum("count")).order_by()
 
-        return counts
+        return defaultdict(int, {counter_type: count for counter_type, count in counts})
 
     class Meta:
         indexes = [
             models.Index(name="contacts_rptrscntr_org_id_idx", fields=["org", "type"]),
             models.Index(name="contacts_rptrscntr_org_typ_cnt", fields=["org", "type", "count"]),
+            # for squashing task
+            models.Index(
+                name="contacts_rptrscntr_unsquashed",
+                fields=("org", "type"),
+                condition=Q(is_squashed=False),
+            ),
         ]
@@ -14,7 +14,10 @@ from dash.utils.sync import SyncOutcome
 from ureport.celery import app
 from ureport.contacts.models import Contact, ReportersCounter
 from ureport.stats.models import ContactActivity
+from ureport.syncjobs.models import SyncJob
+from ureport.syncjobs.tasks import chunked_task, trigger_job
 from ureport.utils import chunk_list, datetime_to_json_date, update_cache_org_contact_counts
+from ureport.utils.rate_budget import PRIORITY_CONTACTS
 
 logger = get_task_logger(__name__)
 
@@ -29,6 +32,11 @@ def rebuild_contacts_counts():
             Contact.recalculate_reporters_stats(org)
 
 
+@app.task(name="contacts.squash_reporters_counts")
+def squash_reporters_counts():
+    ReportersCounter.squash_counts()
+
+
 @app.task(name="contacts.check_contacts_count_mismatch")
 def check_contacts_count_mismatch():
     r = get_valkey_connection()
@@ -47,7 +55,8 @@ def check_contacts_count_mismatch():
         if db_contacts_counts:
             pct_diff = count_diff / db_contacts_counts
 
-        if r.get(key):
+        pull_jobs = SyncJob.objects.filter(org=org, job_type=pull_backend_contacts.job_type)
+        if r.get(key) or any(job.is_in_flight() for job in pull_jobs):
             if count_diff:
                 mismatch_counts[f"{org.id}"] = dict(
                     db=db_contacts_counts,
@@ -75,27 +84,72 @@ def update_org_contact_count(org, ignored_since, ignored_until):
     update_cache_org_contact_counts(org)
 
 
-@org_task("contact-pull", 60 * 60 * 12)
-def pull_contacts(org, ignored_since, ignored_until):
+@chunked_task("contact-pull", queue="sync", name="contacts.pull_backend_contacts")
+def pull_backend_contacts(job):
     """
-    Fetches updated contacts from RapidPro and updates local contacts accordingly
+    Pulls one chunk of the contacts of the backend of the job, the job scope being the backend slug. The time window
+    is frozen when a pull starts, the page cursors being only valid against the query they came from, and the next
+    pull carries on from its end.
     """
-    # from ureport.contacts.models import ReportersCounter
+    org = job.org
+    backend = org.get_backend(backend_slug=job.scope)
+
+    last_fetch_date_key = Contact.CONTACT_LAST_FETCHED_CACHE_KEY % (org.pk, job.scope)
+
+    cursor = dict(job.cursor)
+    if "until" not in cursor:
+        cursor = dict(since=cache.get(last_fetch_date_key, None), until=datetime_to_json_date(timezone.now()))
+
+        if not cursor["since"]:
+            logger.info("First time run for org #%d. Will sync all contacts" % org.pk)
+
+    result, wait = backend.pull_budgeted_chunk(
+        org,
+        PRIORITY_CONTACTS,
+        backend.CONTACTS_CHUNK_REQUESTS,
+        lambda granted: backend.pull_contacts_chunk(
+            org, cursor["since"], cursor["until"], cursor.get("pull", dict()), page_budget=granted
+        ),
+    )
+    if not result:
+        return wait
+
+    if result.done:
+        cache.set(last_fetch_date_key, cursor["until"], None)
+        next_cursor = dict()
+    else:
+        next_cursor = dict(cursor, pull=result.cursor)
+
+    job.checkpoint(cursor=next_cursor, progress=job.add_progress(chunks=1, **result.counts))
+
+    if wait:
+        return wait
+
+    if result.done:
+        logger.info(
+            "Fetched contacts for org #%d. Created %s, Updated %s, Deleted %d, Ignored %d"
+            % (
+                org.pk,
+                job.progress.get("created", 0),
+                job.progress.get("updated", 0),
+                job.progress.get("deleted", 0),
+                job.progress.get("ignored", 0),
+            )
+        )
+    return result.done
 
+
+@org_task("contact-pull", 60 * 30)
+def pull_contacts(org, ignored_since, ignored_until):
+    """
+    Fetches updated fields and boundaries from RapidPro and triggers the jobs pulling the updated contacts
+    """
     results = dict()
 
     backends = org.backends.filter(is_active=True)
     for backend_obj in backends:
         backend = org.get_backend(backend_slug=backend_obj.slug)
 
-        last_fetch_date_key = Contact.CONTACT_LAST_FETCHED_CACHE_KEY % (org.pk, backend_obj.slug)
-
-        until = datetime_to_json_date(timezone.now())
-        since = cache.get(last_fetch_date_key, None)
-
-        if not since:
-            logger.info("First time run for org #%d. Will sync all contacts" % org.pk)
-
         start = time.time()
 
         backend_fields_results = backend.pull_fields(org)
@@ -128,27 +182,8 @@ def pull_contacts(org, ignored_since, ignored_until):
         )
 
         logger.info("Fetch boundaries for org #%d took %ss" % (org.pk, time.time() - start_boundaries))
-        start_contacts = time.time()
-
-        backend_contact_results, resume_cursor = backend.pull_contacts(org, since, until)
-
-        contacts_created = backend_contact_results[SyncOutcome.created]
-        contacts_updated = backend_contact_results[SyncOutcome.updated]
-        contacts_deleted = backend_contact_results[SyncOutcome.deleted]
-        ignored = backend_contact_results[SyncOutcome.ignored]
-
-        cache.set(last_fetch_date_key, until, None)
-
-        logger.info(
-            "Fetched contacts for org #%d. "
-            "Created %s, Updated %s, Deleted %d, Ignored %d"
-            % (org.pk, contacts_created, contacts_updated, contacts_deleted, ignored)
-        )
-
-        logger.info("Fetch contacts for org #%d took %ss" % (org.pk, time.time() - start_contacts))
 
-        # Squash reporters counts
-        # ReportersCounter.squash_counts()
+        job = trigger_job(pull_backend_contacts, org, backend_obj.slug)
 
         results[backend_obj.slug] = {
             "fields": {"created": fields_created, "updated": fields_updated, "deleted": fields_deleted},
@@ -157,7 +192,7 @@ def pull_contacts(org, ignored_since, ignored_until):
                 "updated": boundaries_updated,
                 "deleted": boundaries_deleted,
             },
-            "contacts": {"created": contacts_created, "updated": contacts_updated, "deleted": contacts_deleted},
+            "contacts": {"job": job.id, "status": job.get_status_display(), "progress": job.progress},
         }
 
     return results
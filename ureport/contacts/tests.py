@@ -4,13 +4,22 @@ from datetime import timedelta
 
 from mock import patch
 
+from django.core.cache import cache
 from django.utils import timezone
 
 from dash.orgs.models import TaskState
 from dash.utils.sync import SyncOutcome
+from ureport.backend import ChunkResult
 from ureport.contacts.models import Contact, ContactField, ReportersCounter
-from ureport.contacts.tasks import check_contacts_count_mismatch, pull_contacts, update_org_contact_count
+from ureport.contacts.tasks import (
+    check_contacts_count_mismatch,
+    pull_backend_contacts,
+    pull_contacts,
+    squash_reporters_counts,
+    update_org_contact_count,
+)
 from ureport.locations.models import Boundary
+from ureport.syncjobs.models import SyncJob
 from ureport.tests import TestBackend, UreportTest
 from ureport.utils import json_date_to_datetime
 
@@ -278,6 +287,42 @@ class ContactTest(UreportTest):
             {"total-reporters": 2, "gender:m": 2},
         )
 
+        # a bulk insert adds one counter row per type for the whole statement
+        num_counters = ReportersCounter.objects.filter(org=self.nigeria).count()
+        Contact.objects.bulk_create(
+            [Contact(uuid=f"C-10{i}", org=self.nigeria, gender="F", born=2000, state="R-LAGOS") for i in range(5)]
+        )
+        self.assertEqual(ReportersCounter.objects.filter(org=self.nigeria).count(), num_counters + 4)
+
+        counts = ReportersCounter.get_counts(self.nigeria)
+        self.assertEqual(counts["total-reporters"], 7)
+        self.assertEqual(counts["gender:f"], 5)
+        self.assertEqual(counts["born:2000"], 5)
+        self.assertEqual(counts["state:R-LAGOS"], 7)
+
+        # a bulk update moves the counts of the changed values only
+        num_counters = ReportersCounter.objects.filter(org=self.nigeria).count()
+        Contact.objects.filter(org=self.nigeria, gender="F").update(gender="M")
+        self.assertEqual(ReportersCounter.objects.filter(org=self.nigeria).count(), num_counters + 2)
+
+        counts = ReportersCounter.get_counts(self.nigeria)
+        self.assertEqual(counts["gender:f"], 0)
+        self.assertEqual(counts["gender:m"], 7)
+        self.assertEqual(counts["total-reporters"], 7)
+
+        # deactivating and deleting decrement all the counters of the contacts
+        Contact.objects.filter(org=self.nigeria, born=2000).update(is_active=False)
+        self.assertEqual(ReportersCounter.get_counts(self.nigeria)["total-reporters"], 2)
+
+        Contact.objects.filter(org=self.nigeria, born=2000).update(is_active=True)
+        Contact.objects.filter(org=self.nigeria, born=2000).delete()
+
+        counts = ReportersCounter.get_counts(self.nigeria)
+        self.assertEqual(counts["total-reporters"], 2)
+        self.assertEqual(counts["gender:m"], 2)
+        self.assertEqual(counts["born:2000"], 0)
+        self.assertEqual(counts["state:R-LAGOS"], 2)
+
     @patch("valkey.client.StrictValkey.get")
     def test_squash_reporters(self, mock_valkey_get):
         mock_valkey_get.return_value = None
@@ -294,15 +339,37 @@ class ContactTest(UreportTest):
         ReportersCounter.squash_counts()
 
         self.assertEqual(ReportersCounter.objects.all().count(), 2)
-        # type-a counters are squashed into one row
-        self.assertFalse(ReportersCounter.objects.filter(pk__in=[counter1.pk, counter3.pk]))
+        self.assertFalse(ReportersCounter.objects.filter(is_squashed=False))
+        # every type with unsquashed rows is squashed into one row
+        self.assertFalse(ReportersCounter.objects.filter(pk__in=[counter1.pk, counter2.pk, counter3.pk]))
         self.assertEqual(ReportersCounter.objects.filter(type="type-a").count(), 1)
 
-        self.assertTrue(ReportersCounter.objects.filter(pk=counter2.pk))
-
         counter_type_a = ReportersCounter.objects.filter(type="type-a").first()
 
-        self.assertTrue(counter_type_a.count, 5)
+        self.assertEqual(counter_type_a.count, 5)
+        self.assertTrue(counter_type_a.is_squashed)
+
+        # squashed rows are left alone until new deltas come in for their type
+        ReportersCounter.objects.create(org=self.nigeria, type="type-b", count=-1)
+        ReportersCounter.objects.create(org=self.nigeria, type="type-c", count=4)
+
+        self.assertEqual(ReportersCounter.get_counts(self.nigeria), {"type-a": 5, "type-b": 0, "type-c": 4})
+
+        ReportersCounter.squash_counts()
+
+        # the type-b counts sum to zero so no row is kept for them
+        self.assertEqual(ReportersCounter.objects.all().count(), 2)
+        self.assertTrue(ReportersCounter.objects.filter(pk=counter_type_a.pk))
+        self.assertEqual(ReportersCounter.get_counts(self.nigeria), {"type-a": 5, "type-c": 4})
+        self.assertEqual(ReportersCounter.get_counts(self.nigeria, types=["type-c"]), {"type-c": 4})
+
+        # a type whose counts sum below zero is squashed to zero, so no row is kept for it either
+        ReportersCounter.objects.create(org=self.nigeria, type="type-c", count=-6)
+
+        ReportersCounter.squash_counts()
+
+        self.assertEqual(ReportersCounter.get_counts(self.nigeria), {"type-a": 5})
+        self.assertFalse(ReportersCounter.objects.filter(type="type-c"))
 
 
 class ContactsTasksTest(UreportTest):
@@ -381,13 +448,19 @@ class ContactsTasksTest(UreportTest):
 
         mock_update_cache_org_contact_counts.assert_called_once_with(self.nigeria)
 
-    @patch("dash.orgs.models.Org.get_backend")
     @patch("ureport.contacts.models.ReportersCounter.squash_counts")
+    def test_squash_reporters_counts(self, mock_squash_counts):
+        squash_reporters_counts()
+
+        mock_squash_counts.assert_called_once_with()
+
+    @patch("dash.orgs.models.Org.get_backend")
+    @patch("ureport.contacts.tasks.pull_backend_contacts.delay")
     @patch("ureport.tests.TestBackend.pull_fields")
     @patch("ureport.tests.TestBackend.pull_boundaries")
     @patch("ureport.tests.TestBackend.pull_contacts")
     def test_pull_contacts(
-        self, mock_pull_contacts, mock_pull_boundaries, mock_pull_fields, mock_squash_counts, mock_get_backend
+        self, mock_pull_contacts, mock_pull_boundaries, mock_pull_fields, mock_pull_backend_contacts, mock_get_backend
     ):
         mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
         mock_pull_fields.return_value = {
@@ -402,17 +475,17 @@ class ContactsTasksTest(UreportTest):
             SyncOutcome.deleted: 7,
             SyncOutcome.ignored: 8,
         }
-        mock_pull_contacts.return_value = (
-            {SyncOutcome.created: 9, SyncOutcome.updated: 10, SyncOutcome.deleted: 11, SyncOutcome.ignored: 12},
-            None,
-        )
-        mock_squash_counts.return_value = "Called"
 
         # keep only on backend config
         self.nigeria.backends.exclude(slug="rapidpro").delete()
 
         pull_contacts(self.nigeria.pk)
 
+        # the contacts are pulled by a sync job, not by the org task
+        job = SyncJob.objects.get(org=self.nigeria, job_type="contact-pull", scope="rapidpro")
+        mock_pull_backend_contacts.assert_called_once_with(job.id)
+        self.assertFalse(mock_pull_contacts.called)
+
         task_state = TaskState.objects.get(org=self.nigeria, task_key="contact-pull")
         self.assertEqual(
             task_state.get_last_results(),
@@ -420,9 +493,67 @@ class ContactsTasksTest(UreportTest):
                 "rapidpro": {
                     "fields": {"created": 1, "updated": 2, "deleted": 3},
                     "boundaries": {"created": 5, "updated": 6, "deleted": 7},
-                    "contacts": {"created": 9, "updated": 10, "deleted": 11},
+                    "contacts": {"job": job.id, "status": "Pending", "progress": {}},
                 }
             },
         )
 
-        # mock_squash_counts.assert_called_once_with()
+    @patch("dash.orgs.models.Org.get_backend")
+    @patch("ureport.tests.TestBackend.get_rate_budget", return_value=None)
+    @patch("ureport.tests.TestBackend.pull_contacts_chunk")
+    def test_pull_backend_contacts(self, mock_pull_contacts_chunk, mock_get_rate_budget, mock_get_backend):
+        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
+        mock_pull_contacts_chunk.side_effect = [
+            ChunkResult(counts=dict(created=2, updated=1), cursor={"stage": "deleted"}),
+            ChunkResult(counts=dict(deleted=1), rate_limited=True, cursor={"stage": "deleted", "resume": "abc"}),
+            ChunkResult(counts=dict(deleted=3), cursor=dict(), done=True),
+        ]
+
+        last_fetch_date_key = Contact.CONTACT_LAST_FETCHED_CACHE_KEY % (self.nigeria.pk, "rapidpro")
+        cache.set(last_fetch_date_key, "2026-01-01T00:00:00.000Z", None)
+
+        job = SyncJob.get_or_create_job(self.nigeria, "contact-pull", "rapidpro")
+
+        now = json_date_to_datetime("2026-02-01T00:00:00.000Z")
+        with patch.object(timezone, "now", return_value=now):
+            with patch.object(pull_backend_contacts, "apply_async") as mock_continue:
+                pull_backend_contacts(job.id)
+                mock_continue.assert_called_once_with((job.id,), queue="sync", countdown=None)
+
+                # the window is frozen for the whole pull
+                job.refresh_from_db()
+                self.assertEqual(
+                    job.cursor,
+                    {
+                        "since": "2026-01-01T00:00:00.000Z",
+                        "until": "2026-02-01T00:00:00.000Z",
+                        "pull": {"stage": "deleted"},
+                    },
+                )
+
+                # rate limited, so the next chunk waits
+                pull_backend_contacts(job.id)
+                mock_continue.assert_called_with((job.id,), queue="sync", countdown=TestBackend.RATE_LIMIT_BACKOFF)
+
+                pull_backend_contacts(job.id)
+                self.assertEqual(mock_continue.call_count, 2)
+
+        self.assertEqual(
+            [call.args[1:] for call in mock_pull_contacts_chunk.call_args_list],
+            [
+                ("2026-01-01T00:00:00.000Z", "2026-02-01T00:00:00.000Z", {}),
+                ("2026-01-01T00:00:00.000Z", "2026-02-01T00:00:00.000Z", {"stage": "deleted"}),
+                ("2026-01-01T00:00:00.000Z", "2026-02-01T00:00:00.000Z", {"stage": "deleted", "resume": "abc"}),
+            ],
+        )
+
+        # without a rate budget the deleted contacts pages are bounded by the backend default
+        self.assertEqual({call.kwargs["page_budget"] for call in mock_pull_contacts_chunk.call_args_list}, {None})
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.STATUS_COMPLETE)
+        self.assertEqual(job.cursor, {})
+        self.assertEqual(job.progress, {"chunks": 3, "created": 2, "updated": 1, "deleted": 4})
+
+        # the next pull carries on from the end of the window
+        self.assertEqual(cache.get(last_fetch_date_key), "2026-02-01T00:00:00.000Z")
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import gzip
+import hashlib
 import json
+import unicodedata
+import uuid
+from collections import defaultdict
 
 from django_valkey import get_valkey_connection
 
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
 from dash.orgs.models import Org, OrgBackend
@@ -25,6 +32,15 @@ class Boundary(models.Model):
     BOUNDARIES_CACHE_TIMEOUT = 60 * 60 * 24 * 15
     BOUNDARIES_CACHE_KEY = "org:%d:boundaries-osm-ids"
 
+    INDEX_CACHE_KEY = "org:%d:boundaries-index:%s"
+
+    GEOJSON_CACHE_KEY = "org:%d:boundaries-geojson:%s:%s:%s"
+    GEOJSON_VERSION_CACHE_KEY = "org:%d:boundaries-geojson-version"
+
+    # the decimals kept in the served coordinates by level, larger boundaries are drawn at lower zooms
+    GEOJSON_PRECISION = {COUNTRY_LEVEL: 3, STATE_LEVEL: 4}
+    GEOJSON_DEFAULT_PRECISION = 5
+
     org = models.ForeignKey(Org, on_delete=models.PROTECT, verbose_name=_("Organization"), related_name="boundaries")
 
     is_active = models.BooleanField(default=True)
@@ -98,6 +114,174 @@ class Boundary(models.Model):
             properties=dict(id=self.osm_id, level=self.level, name=self.name),
         )
 
+    @classmethod
+    def normalize_name(cls, name: str) -> str:
+        """
+        Normalizes a boundary name for lookups, ignoring case, compatibility forms and extra whitespace
+        """
+        return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+    @classmethod
+    def get_index_cache_key(cls, org, backend=None) -> str:
+        return cls.INDEX_CACHE_KEY % (org.pk, backend.slug if backend else "")
+
+    @classmethod
+    def build_index(cls, org, backend=None) -> tuple:
+        """
+        Builds the maps of normalized names to osm ids of the states, of the districts by state osm id and of the
+        wards by district osm id, from a single query over the boundaries of the org, or only those of the backend
+        """
+        boundaries = cls.objects.filter(org=org, level__in=(cls.STATE_LEVEL, cls.DISTRICT_LEVEL, cls.WARD_LEVEL))
+        if backend:
+            boundaries = boundaries.filter(backend=backend)
+
+        states = dict()
+        districts = defaultdict(dict)
+        wards = defaultdict(dict)
+        for level, name, osm_id, parent_osm_id in boundaries.values_list("level", "name", "osm_id", "parent__osm_id"):
+            if level == cls.STATE_LEVEL:
+                states[cls.normalize_name(name)] = osm_id
+            elif level == cls.DISTRICT_LEVEL and parent_osm_id:
+                districts[parent_osm_id][cls.normalize_name(name)] = osm_id
+            elif level == cls.WARD_LEVEL and parent_osm_id:
+                wards[parent_osm_id][cls.normalize_name(name)] = osm_id
+
+        return states, dict(districts), dict(wards)
+
+    @classmethod
+    def get_index(cls, org, backend=None) -> tuple:
+        """
+        Gets the boundaries names index of the org, shared by all the processes until the boundaries are pulled again
+        """
+        from ureport.utils.tiered_cache import tiered_cache
+
+        key = cls.get_index_cache_key(org, backend)
+        index = tiered_cache.get(key, None, family="boundaries-index")
+        if index is None:
+            index = cls.build_index(org, backend)
+            tiered_cache.set(key, index, cls.BOUNDARIES_CACHE_TIMEOUT)
+
+        return index
+
+    @classmethod
+    def clear_index(cls, org, backend=None):
+        from ureport.utils.tiered_cache import tiered_cache
+
+        # the index of all the org boundaries is built from the boundaries of every backend
+        tiered_cache.delete(cls.get_index_cache_key(org))
+        if backend:
+            tiered_cache.delete(cls.get_index_cache_key(org, backend))
+
+    @classmethod
+    def get_org_geojson_boundaries(cls, org, osm_id=None):
+        """
+        Gets the boundaries of the org map, the children of the given boundary or the top level boundaries
+        """
+        if org.get_config("common.is_global"):
+            location_boundaries = org.boundaries.filter(level=cls.COUNTRY_LEVEL)
+            limit_states = org.get_config("common.limit_states")
+            if limit_states:
+                limit_states = [elt.strip() for elt in limit_states.split(",")]
+                location_boundaries = location_boundaries.filter(osm_id__in=limit_states)
+
+        else:
+            org_boundaries = org.boundaries.all()
+
+            limit_states = org.get_config("common.limit_states")
+            if limit_states:
+                limit_states = [elt.strip() for elt in limit_states.split(",")]
+                org_boundaries = org_boundaries.filter(
+                    Q(level=cls.STATE_LEVEL, name__in=limit_states)
+                    | Q(parent__name__in=limit_states, level=cls.DISTRICT_LEVEL)
+                    | Q(parent__parent__name__in=limit_states, level=cls.WARD_LEVEL)
+                )
+
+            if osm_id:
+                location_boundaries = org_boundaries.filter(parent__osm_id=osm_id)
+            else:
+                location_boundaries = org_boundaries.filter(level=cls.STATE_LEVEL)
+
+        return location_boundaries
+
+    @classmethod
+    def simplify_coordinates(cls, coordinates, precision):
+        """
+        Rounds the positions of the coordinates to the precision and drops the consecutive positions of lines and rings
+        which become equal, lines and rings which would lose their shape are only rounded
+        """
+        if isinstance(coordinates, (int, float)):
+            return round(coordinates, precision)
+
+        if coordinates and all(isinstance(elt, list) and elt and not isinstance(elt[0], list) for elt in coordinates):
+            positions = [cls.simplify_coordinates(position, precision) for position in coordinates]
+            simplified = [
+                position for idx, position in enumerate(positions) if idx == 0 or position != positions[idx - 1]
+            ]
+            return simplified if len(simplified) >= min(len(positions), 4) else positions
+
+        return [cls.simplify_coordinates(elt, precision) for elt in coordinates]
+
+    @classmethod
+    def build_geojson(cls, boundaries) -> bytes:
+        """
+        Serializes the boundaries with a geometry as a FeatureCollection with their coordinates simplified for their
+        level
+        """
+        features = []
+        for boundary in boundaries.values("osm_id", "level", "name", "geometry").order_by("osm_id"):
+            geometry = json.loads(boundary["geometry"]) if boundary["geometry"] else None
+            if not geometry:
+                continue
+
+            precision = cls.GEOJSON_PRECISION.get(boundary["level"], cls.GEOJSON_DEFAULT_PRECISION)
+            if "coordinates" in geometry:
+                geometry["coordinates"] = cls.simplify_coordinates(geometry["coordinates"], precision)
+
+            features.append(
+                dict(
+                    type="Feature",
+                    geometry=geometry,
+                    properties=dict(id=boundary["osm_id"], level=boundary["level"], name=boundary["name"]),
+                )
+            )
+
+        return json.dumps(dict(type="FeatureCollection", features=features), separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def get_org_geojson(cls, org, osm_id=None) -> dict:
+        """
+        Gets the serialized FeatureCollection of the org map boundaries for the given parent, as the plain and the
+        gzipped content with their ETag, from the cache if it was built since the last boundaries change
+        """
+        version = cache.get(cls.GEOJSON_VERSION_CACHE_KEY % org.pk)
+        if version is None:
+            version = cls.clear_geojson_cache(org)
+
+        # the boundaries served depend on the org config too
+        config = json.dumps([org.get_config("common.is_global"), org.get_config("common.limit_states")])
+        config_hash = hashlib.md5(config.encode("utf-8")).hexdigest()[:8]
+
+        key = cls.GEOJSON_CACHE_KEY % (org.pk, version, config_hash, osm_id or "")
+        geojson = cache.get(key)
+        if geojson is None:
+            content = cls.build_geojson(cls.get_org_geojson_boundaries(org, osm_id))
+            geojson = dict(
+                etag=hashlib.md5(content).hexdigest(), content=content, gzipped=gzip.compress(content, mtime=0)
+            )
+            cache.set(key, geojson, cls.BOUNDARIES_CACHE_TIMEOUT)
+
+        return geojson
+
+    @classmethod
+    def clear_geojson_cache(cls, org) -> str:
+        """
+        Moves the org to a new version of the GeoJSON cache, the cached FeatureCollections of the previous version
+        are no longer read and expire
+        """
+        version = uuid.uuid4().hex[:12]
+        cache.set(cls.GEOJSON_VERSION_CACHE_KEY % org.pk, version, None)
+        return version
+
     @classmethod
     def get_org_top_level_boundaries_name(cls, org):
         if org.get_config("common.is_global"):
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import gzip
 import json
 
 from mock import Mock, patch
@@ -111,3 +112,170 @@ class LocationTest(UreportTest):
             self.assertEqual(faroe.level, 0)
             self.assertEqual(faroe.geometry.type, "Polygon")
             self.assertEqual(faroe.geometry.coordinates, [[[5, 6], [7, 8]]])
+
+    def test_get_org_geojson(self):
+        Boundary.clear_geojson_cache(self.nigeria)
+
+        lagos = Boundary.objects.create(
+            org=self.nigeria,
+            osm_id="R-LAGOS",
+            name="Lagos",
+            parent=None,
+            level=Boundary.STATE_LEVEL,
+            geometry=json.dumps(
+                dict(
+                    type="Polygon",
+                    coordinates=[[[1.00001, 2.00001], [1.00002, 2.00002], [3.123456, 4.5], [5, 6], [1.00001, 2.00001]]],
+                )
+            ),
+        )
+        Boundary.objects.create(
+            org=self.nigeria,
+            osm_id="R-OYO",
+            name="Oyo",
+            parent=lagos,
+            level=Boundary.DISTRICT_LEVEL,
+            geometry='{"type":"MultiPolygon", "coordinates":[[1, 2]]}',
+        )
+        Boundary.objects.create(
+            org=self.nigeria,
+            osm_id="R-EMPTY",
+            name="Empty",
+            parent=lagos,
+            level=Boundary.DISTRICT_LEVEL,
+            geometry="{}",
+        )
+
+        geojson = Boundary.get_org_geojson(self.nigeria)
+        self.assertEqual(gzip.decompress(geojson["gzipped"]), geojson["content"])
+        self.assertEqual(
+            json.loads(geojson["content"]),
+            dict(
+                type="FeatureCollection",
+                features=[
+                    dict(
+                        type="Feature",
+                        # states keep 4 decimals, the positions which become equal are dropped
+                        geometry=dict(type="Polygon", coordinates=[[[1.0, 2.0], [3.1235, 4.5], [5, 6], [1.0, 2.0]]]),
+                        properties=dict(id="R-LAGOS", level=1, name="Lagos"),
+                    )
+                ],
+            ),
+        )
+
+        # boundaries without geometry are left out
+        self.assertEqual(
+            [
+                feature["properties"]["id"]
+                for feature in json.loads(Boundary.get_org_geojson(self.nigeria, "R-LAGOS")["content"])["features"]
+            ],
+            ["R-OYO"],
+        )
+
+        # served from the cache until the boundaries change
+        with self.assertNumQueries(0):
+            self.assertEqual(Boundary.get_org_geojson(self.nigeria), geojson)
+
+        Boundary.objects.filter(osm_id="R-LAGOS").update(name="Lagos State")
+        self.assertEqual(Boundary.get_org_geojson(self.nigeria), geojson)
+
+        Boundary.clear_geojson_cache(self.nigeria)
+        self.assertNotEqual(Boundary.get_org_geojson(self.nigeria)["etag"], geojson["etag"])
+
+        geojson = Boundary.get_org_geojson(self.nigeria)
+        etag = '"%s"' % geojson["etag"]
+
+        response = self.client.get(reverse("public.boundaries"), SERVER_NAME="nigeria.ureport.io")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.content, geojson["content"])
+
+        response = self.client.get(
+            reverse("public.boundaries"), SERVER_NAME="nigeria.ureport.io", HTTP_ACCEPT_ENCODING="gzip, deflate"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), geojson["content"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        # each encoding of the body has its own validator
+        gzip_etag = '"%s-gzip"' % geojson["etag"]
+        self.assertEqual(response["ETag"], gzip_etag)
+
+        response = self.client.get(
+            reverse("public.boundaries"), SERVER_NAME="nigeria.ureport.io", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get(
+            reverse("public.boundaries"),
+            SERVER_NAME="nigeria.ureport.io",
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=gzip_etag,
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], gzip_etag)
+
+        # a validator of one encoding doesn't match the other
+        response = self.client.get(
+            reverse("public.boundaries"), SERVER_NAME="nigeria.ureport.io", HTTP_IF_NONE_MATCH=gzip_etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, geojson["content"])
+
+        response = self.client.get(
+            reverse("public.boundaries"),
+            SERVER_NAME="nigeria.ureport.io",
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(gzip.decompress(response.content), geojson["content"])
+
+        response = self.client.get(
+            reverse("public.boundaries", args=["R-LAGOS"]), SERVER_NAME="nigeria.ureport.io", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["features"][0]["properties"]["id"], "R-OYO")
+
+    def test_get_index(self):
+        Boundary.clear_index(self.nigeria, self.rapidpro_backend)
+
+        lagos = Boundary.objects.create(
+            org=self.nigeria, osm_id="R-LAGOS", name="Lagos", parent=None, level=Boundary.STATE_LEVEL, geometry="{}"
+        )
+        oyo = Boundary.objects.create(
+            org=self.nigeria,
+            osm_id="R-OYO",
+            name="Oyo  State",
+            parent=lagos,
+            level=Boundary.DISTRICT_LEVEL,
+            geometry="{}",
+        )
+        Boundary.objects.create(
+            org=self.nigeria, osm_id="R-IKEJA", name="IKEJA", parent=oyo, level=Boundary.WARD_LEVEL, geometry="{}"
+        )
+
+        self.assertEqual(Boundary.normalize_name("  Oyo \tSTATE "), "oyo state")
+        self.assertEqual(Boundary.normalize_name("Ｌａｇｏｓ"), "lagos")
+
+        expected = ({"lagos": "R-LAGOS"}, {"R-LAGOS": {"oyo state": "R-OYO"}}, {"R-OYO": {"ikeja": "R-IKEJA"}})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Boundary.get_index(self.nigeria), expected)
+
+        # shared until the index is cleared
+        Boundary.objects.filter(osm_id="R-IKEJA").update(name="Ikeja North")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Boundary.get_index(self.nigeria), expected)
+
+        # only the boundaries of the backend are indexed for it
+        with self.assertNumQueries(1):
+            self.assertEqual(Boundary.get_index(self.nigeria, self.rapidpro_backend), (dict(), dict(), dict()))
+
+        Boundary.clear_index(self.nigeria, self.rapidpro_backend)
+
+        self.assertEqual(Boundary.get_index(self.nigeria)[2], {"R-OYO": {"ikeja north": "R-IKEJA"}})
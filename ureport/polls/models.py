@@ -2,18 +2,20 @@
 
 import json
 import logging
+import time
 import uuid
 from collections import defaultdict
 from datetime import timedelta, timezone as tzone
 
 from django_valkey import get_valkey_connection
+from psycopg.errors import SerializationFailure
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db import connection, models
-from django.db.models import Count, F, Prefetch, Sum
-from django.db.models.functions import Lower
+from django.db import OperationalError, connection, models, transaction
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Lower, Trunc
 from django.utils import timezone
 from django.utils.html import strip_tags
 from django.utils.text import slugify
@@ -24,6 +26,7 @@ from dash.orgs.models import Org, OrgBackend
 from dash.tags.models import Tag
 from smartmin.models import SmartModel
 from ureport.flows.models import FlowResult, FlowResultCategory
+from ureport.locations.models import Boundary
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +39,9 @@ BRICK_POLLS_CACHE_TIME = getattr(settings, "BRICK_POLLS_CACHE_TIME", 60 * 60 * 3
 
 POLL_RESULTS_CACHE_TIME = getattr(settings, "POLL_RESULTS_CACHE_TIME", 60 * 60 * 24)
 
+# update results counters with deltas on sync, the full rebuild only runs nightly
+POLL_RESULTS_INCREMENTAL_COUNTS = getattr(settings, "POLL_RESULTS_INCREMENTAL_COUNTS", True)
+
 # big cache time for task cached data, we run more often the task to update the data
 UREPORT_ASYNC_FETCHED_DATA_CACHE_TIME = getattr(settings, "UREPORT_ASYNC_FETCHED_DATA_CACHE_TIME", 60 * 60 * 24 * 15)
 
@@ -87,6 +93,13 @@ class Poll(SmartModel):
 
     POLL_REBUILD_COUNTS_LOCK = "poll-rebuild-counts-lock:org:%d:poll:%s"
 
+    POLL_REBUILD_COUNTS_LOCK_PATTERN = "poll-rebuild-counts-lock:org:*:poll:*"
+
+    # attempts of the rebuild snapshot when a squash of the counters of the flow commits while it is open
+    POLL_REBUILD_COUNTS_ATTEMPTS = 3
+
+    REBUILD_COUNTS_BATCH_SIZE = 1000
+
     POLL_RESULTS_LAST_PULL_CACHE_KEY = "last:pull_results:reverse:org:%d:poll:%s"
 
     POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY = "last:sync_time:org:%d:poll:%s"
@@ -101,8 +114,13 @@ class Poll(SmartModel):
 
     POLL_SYNC_LOCK_TIMEOUT = 60 * 60 * 2
 
-    # archive pulls have no pause/resume checkpoint so their lock lease must cover a full worst-case run
-    POLL_PULL_ARCHIVES_LOCK_TIMEOUT = 60 * 60 * 12
+    # the flows waiting for the next chunk of the archives sync job of the org to pick them up
+    POLL_PULL_ARCHIVES_FLOWS_KEY = "poll-pull-archives-flows:org:%d"
+
+    # polls created within these days are recent, their syncs coming right after the main poll's
+    POLL_RECENT_DAYS = 45
+
+    POLL_RESULTS_COUNTS_KEYS = ("num_val_created", "num_val_updated", "num_path_created", "num_path_updated")
 
     published = models.BooleanField(
         default=True, help_text=_("Whether this poll should be visible/hidden on the public site")
@@ -161,73 +179,327 @@ class Poll(SmartModel):
 
     tags = models.ManyToManyField(Tag, blank=True)
 
-    def get_sync_progress(self):
-        if not self.runs_count:
-            return float(0)
+    @classmethod
+    def get_sync_statuses(cls, polls):
+        """
+        Gets the sync status of a page of polls at once, from one MGET of their last sync times and one query of the
+        results sync jobs of their flows and the archives sync jobs of their orgs. A poll is locked while a run of a
+        job syncing its flow is in flight, and the progress of the polls still being synced for the first time is the
+        share of their runs the jobs have synced.
+        """
+        from ureport.polls.tasks import pull_flow_results, pull_org_archives
+        from ureport.syncjobs.models import SyncJob
+
+        polls = list(polls)
+        if not polls:
+            return dict()
+
+        last_synced_keys = {
+            poll.id: Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (poll.org_id, poll.flow_uuid) for poll in polls
+        }
+        last_synced = cache.get_many(set(last_synced_keys.values()))
+
+        jobs = SyncJob.objects.filter(
+            Q(job_type=pull_flow_results.job_type, scope__in={poll.flow_uuid for poll in polls})
+            | Q(job_type=pull_org_archives.job_type),
+            org_id__in={poll.org_id for poll in polls},
+        )
 
-        results_added = PollResult.objects.filter(flow=self.flow_uuid, org=self.org_id).values("ruleset").distinct()
-        results_added = results_added.annotate(Count("id")).order_by("-id__count").first()
-        pulled_runs = 0
-        if results_added:
-            pulled_runs = results_added.get("id__count", 0)
+        syncing = set()
+        synced_runs = defaultdict(int)
+        for job in jobs:
+            in_flight = job.is_in_flight()
 
-        return pulled_runs * 100 / float(self.runs_count)
+            if job.job_type == pull_org_archives.job_type:
+                # the archives sync job of the org keeps its flows, and the runs it synced of each, in its cursor
+                archives_flows = job.cursor.get("flows", dict())
+                if in_flight:
+                    syncing.update((job.org_id, flow_uuid) for flow_uuid in archives_flows)
+
+                for flow_uuid, archives_flow in dict(job.cursor.get("finished", dict()), **archives_flows).items():
+                    synced_runs[(job.org_id, flow_uuid)] += archives_flow.get("num_synced", 0)
+            else:
+                if in_flight:
+                    syncing.add((job.org_id, job.scope))
+
+                synced_runs[(job.org_id, job.scope)] += job.progress.get("num_synced", 0)
+
+        statuses = dict()
+        for poll in polls:
+            progress = None
+            if not poll.has_synced:
+                runs = synced_runs[(poll.org_id, poll.flow_uuid)]
+                progress = min(100.0, runs * 100 / float(poll.runs_count)) if poll.runs_count else float(0)
+
+            statuses[poll.id] = dict(
+                locked=(poll.org_id, poll.flow_uuid) in syncing,
+                last_synced=last_synced.get(last_synced_keys[poll.id]),
+                progress=progress,
+            )
+        return statuses
 
     @classmethod
-    def pull_results_from_archives(cls, poll_id):
-        poll = Poll.objects.get(pk=poll_id)
+    def get_flow_polls(cls, org_id, flow_uuid):
+        """
+        Gets the polls of a flow, those still syncing first. Polls sharing a flow share their results, which are
+        synced through the first of them.
+        """
+        return list(Poll.objects.filter(org_id=org_id, flow_uuid=flow_uuid).order_by("stopped_syncing", "-created_on"))
+
+    @classmethod
+    def pull_results_chunk(cls, job):
+        """
+        Pulls one chunk of the results of the flow of a results sync job, the job scope being the flow UUID. Returns
+        whether the flow has no results left to pull, or the seconds to wait before the next chunk when rate limited.
+        """
+        from ureport.utils import json_date_to_datetime
+
+        flow_polls = Poll.get_flow_polls(job.org_id, job.scope)
+        if not flow_polls:
+            return True
+
+        poll = flow_polls[0]
         backend = poll.org.get_backend(backend_slug=poll.backend.slug)
 
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = backend.pull_results_from_archives(poll)
+        cursor = dict(job.cursor)
+        if not cursor:
+            # first run of the job, carry on from where the pulls before sync jobs stopped
+            cursor["after"], _ = poll.get_pull_cached_params()
 
-        if num_val_created + num_val_updated + num_path_created + num_path_updated != 0:
-            poll.rebuild_poll_results_counts()
+        pull_after_delete_keys = [
+            Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (job.org_id, flow_poll.pk) for flow_poll in flow_polls
+        ]
+        pull_after_delete = cache.get_many(pull_after_delete_keys)
+
+        # a first pull or a pull refresh needs the archived results too
+        if not job.progress or pull_after_delete:
+            flow_date_json = poll.get_flow_date()
+            has_archives_results = flow_date_json is None or (
+                json_date_to_datetime(flow_date_json) + timedelta(days=90) < timezone.now()
+            )
+            if pull_after_delete or (has_archives_results and not poll.has_synced):
+                poll.start_pull_archives_job()
+
+        if pull_after_delete:
+            # restart from scratch before deleting, so the deletion can't be lost behind the old position
+            cursor = dict()
+            job.checkpoint(cursor=cursor, progress=job.add_progress(reset=1))
+
+            poll.delete_poll_results()
+            cache.delete_many(pull_after_delete_keys)
+
+        # counters built for the results of the flow are kept up to date by deltas, until a reset rebuilds them
+        incremental_counts = (
+            backend.supports_incremental_results_counts
+            and poll.has_incremental_results_counts()
+            and not job.progress.get("reset")
+        )
+
+        result, wait = backend.pull_budgeted_chunk(
+            poll.org,
+            poll.get_sync_priority(),
+            backend.RESULTS_CHUNK_REQUESTS,
+            lambda granted: backend.pull_results_chunk(
+                poll, cursor, page_budget=granted, incremental_counts=incremental_counts
+            ),
+        )
+        if not result:
+            return wait
 
-        Poll.objects.filter(org=poll.org_id, flow_uuid=poll.flow_uuid).update(has_synced=True)
+        job.checkpoint(cursor=result.cursor, progress=Poll.add_results_job_progress(job, result, incremental_counts))
 
-        return num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored
+        return wait or result.done
 
     @classmethod
-    def pull_results(cls, poll_id):
-        from ureport.utils import json_date_to_datetime
+    def pull_archives_chunk(cls, job):
+        """
+        Pulls one chunk of the archived results of the flows queued for the org of an archives sync job, in a single
+        pass over the archives for all of them. Every run goes through all the archives again for its flows, and the
+        flows queued while it runs join it with their own position in the archives.
+        """
+        from ureport.backend import ChunkResult
+        from ureport.utils.rate_budget import PRIORITY_ARCHIVES
 
-        poll = Poll.objects.get(pk=poll_id)
-        backend = poll.org.get_backend(backend_slug=poll.backend.slug)
+        # no progress yet means this is the first chunk of the run, the previous run's flows are finalized
+        cursor = dict(job.cursor) if job.progress else dict()
+        flows = {flow_uuid: dict(flow) for flow_uuid, flow in cursor.get("flows", dict()).items()}
+        finished = dict(cursor.get("finished", dict()))
 
-        flow_date_json = poll.get_flow_date()
-        now = timezone.now()
+        # a flow queued again, e.g. by a pull refresh, starts over from the newest archive
+        r = get_valkey_connection()
+        queued_key = Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % job.org_id
+        queued = [
+            flow_uuid.decode() if isinstance(flow_uuid, bytes) else flow_uuid for flow_uuid in r.smembers(queued_key)
+        ]
+        for flow_uuid in queued:
+            flows[flow_uuid] = dict(flows.get(flow_uuid) or finished.pop(flow_uuid, None) or dict(), cursor=dict())
+
+        polls = []
+        for flow_uuid in list(flows.keys()):
+            flow_polls = Poll.get_flow_polls(job.org_id, flow_uuid)
+            if flow_polls:
+                polls.append(flow_polls[0])
+            else:
+                del flows[flow_uuid]
+
+        wait = 0
+        counts = defaultdict(int)
+        if polls:
+            # the polls of the first flow's backend, the flows of other backends follow in the next chunks
+            backend_polls = [poll for poll in polls if poll.backend_id == polls[0].backend_id]
+            backend = job.org.get_backend(backend_slug=polls[0].backend.slug)
+            cursors = {poll.id: flows[poll.flow_uuid]["cursor"] for poll in backend_polls}
+            results = dict()
+
+            def pull(granted):
+                # the grant is charged for the archives listing requests, the archive files downloaded aren't API
+                # requests and stay bounded by the backend's archive budget
+                results.update(backend.pull_results_from_archives_fanout_chunk(backend_polls, cursors))
+                return ChunkResult(
+                    rate_limited=any(result.rate_limited for result in results.values()),
+                    requests=max((result.requests or 0 for result in results.values()), default=0),
+                    retry_after=max((result.retry_after or 0 for result in results.values()), default=0) or None,
+                )
 
-        has_archives_results = flow_date_json is None or (
-            json_date_to_datetime(flow_date_json) + timedelta(days=90) < now
-        )
+            result, wait = backend.pull_budgeted_chunk(
+                job.org, PRIORITY_ARCHIVES, backend.ARCHIVES_CHUNK_REQUESTS, pull
+            )
+            if not result:
+                return wait
+
+            for poll in backend_polls:
+                poll_result = results[poll.id]
+                flow = flows[poll.flow_uuid]
+                flow["cursor"] = poll_result.cursor
+                flow["num_synced"] = flow.get("num_synced", 0) + poll_result.counts.get("num_synced", 0)
+
+                # archived results are saved without the counters deltas
+                if any(poll_result.counts.get(key) for key in Poll.POLL_RESULTS_COUNTS_KEYS):
+                    flow["rebuild"] = 1
+
+                for key, value in poll_result.counts.items():
+                    counts[key] += value
+
+                if poll_result.done:
+                    finished[poll.flow_uuid] = flows.pop(poll.flow_uuid)
+
+        job.checkpoint(cursor=dict(flows=flows, finished=finished), progress=job.add_progress(chunks=1, **counts))
+
+        # only forget the queued flows once they are in the job cursor, so a crash in between pulls them again
+        if queued:
+            r.srem(queued_key, *queued)
+
+        return wait or (not flows and not r.scard(queued_key))
+
+    @classmethod
+    def finalize_archives_job(cls, job):
+        """
+        Completes a run of an archives sync job, marking the flows it pulled as synced and rebuilding the counts of
+        those it changed the results of. Idempotent, it can run again for the same run.
+        """
+        for flow_uuid, flow in job.cursor.get("finished", dict()).items():
+            flow_polls = Poll.get_flow_polls(job.org_id, flow_uuid)
+            if not flow_polls:
+                continue
+
+            Poll.objects.filter(org_id=job.org_id, flow_uuid=flow_uuid).update(has_synced=True)
+
+            if flow.get("rebuild"):
+                flow_polls[0].rebuild_poll_results_counts()
+
+    @classmethod
+    def add_results_job_progress(cls, job, result, incremental_counts):
+        """
+        Returns the progress of a results sync job with the counts of a chunk added in, flagging that the
+        run needs a full rebuild of the counts when the chunk changed results without adding the counters deltas
+        """
+        counts = dict(result.counts)
+        if not incremental_counts and any(counts.get(key) for key in Poll.POLL_RESULTS_COUNTS_KEYS):
+            counts["rebuild"] = 1
 
-        if has_archives_results and not poll.has_synced:
-            from ureport.polls.tasks import pull_refresh_from_archives
+        return job.add_progress(chunks=1, **counts)
 
-            pull_refresh_from_archives.apply_async((poll.pk,), queue="sync")
+    @classmethod
+    def finalize_results_job(cls, job):
+        """
+        Completes a run of a results sync job, rebuilding the counts of the flow only if the run reset its
+        results or changed them without the counters deltas. Idempotent, it can run again for the same run.
+        """
+        flow_polls = Poll.get_flow_polls(job.org_id, job.scope)
+        if not flow_polls:
+            return
 
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = backend.pull_results(poll, None, None)
+        poll = flow_polls[0]
 
-        if num_val_created + num_val_updated + num_path_created + num_path_updated != 0:
+        # synced first, so the chunks committing after the rebuild snapshot add their deltas
+        Poll.objects.filter(org_id=job.org_id, flow_uuid=job.scope).update(has_synced=True)
+
+        if job.progress.get("reset") or job.progress.get("rebuild"):
             poll.rebuild_poll_results_counts()
+        elif any(job.progress.get(key) for key in Poll.POLL_RESULTS_COUNTS_KEYS):
+            # the counters deltas were added as the results were synced
+            poll.update_flow_polls_results_cache()
+
+        if "after" in job.cursor:
+            poll.mark_results_sync_completed(job.cursor["after"])
 
-        Poll.objects.filter(org=poll.org_id, flow_uuid=poll.flow_uuid).update(has_synced=True)
+    def get_sync_priority(self):
+        """
+        Gets the rate budget priority class of the results syncs of this poll
+        """
+        from ureport.utils.rate_budget import PRIORITY_MAIN_POLL, PRIORITY_OTHER_POLLS, PRIORITY_RECENT_POLLS
+
+        main_poll = Poll.get_main_poll(self.org)
+        if main_poll and main_poll.flow_uuid == self.flow_uuid:
+            return PRIORITY_MAIN_POLL
+
+        if self.created_on > timezone.now() - timedelta(days=Poll.POLL_RECENT_DAYS):
+            return PRIORITY_RECENT_POLLS
+        return PRIORITY_OTHER_POLLS
+
+    def start_pull_results_job(self):
+        from ureport.polls.tasks import pull_flow_results
+        from ureport.syncjobs.tasks import trigger_job
+
+        return trigger_job(pull_flow_results, self.org, self.flow_uuid)
+
+    def start_pull_archives_job(self):
+        """
+        Queues the flow of this poll for the archives sync job of the org, which pulls the archived results of all the
+        queued flows at once
+        """
+        from ureport.polls.tasks import pull_org_archives
+        from ureport.syncjobs.tasks import trigger_job
 
-        return num_val_created, num_val_updated, num_val_ignored, num_path_created, num_path_updated, num_path_ignored
+        get_valkey_connection().sadd(Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % self.org_id, self.flow_uuid)
+        return trigger_job(pull_org_archives, self.org)
+
+    def mark_results_sync_completed(self, latest_synced_obj_time):
+        """
+        Records the results of the poll as synced up to the given time, which the next sync carries on from
+        """
+        from ureport.utils import datetime_to_json_date
+
+        # update the time for this poll from which we fetch next time
+        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.org_id, self.flow_uuid), latest_synced_obj_time, None)
+
+        # update the last time the sync happened, for displaying in polls list on admin page
+        now = timezone.now()
+        cache.set(
+            Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (self.org_id, self.flow_uuid),
+            datetime_to_json_date(now),
+            None,
+        )
+
+        # Use valkey cache with expiring(in 48 hrs) key to allow other polls task
+        # to sync all polls without hitting the API rate limit
+        cache.set(
+            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (self.org_id, self.flow_uuid),
+            datetime_to_json_date(now),
+            Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_TIMEOUT,
+        )
+
+        Poll.objects.filter(id=self.pk).update(modified_on=now)
 
     def get_pull_cached_params(self):
         latest_synced_obj_time = cache.get(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.org.pk, self.flow_uuid), None)
@@ -292,15 +564,18 @@ class Poll(SmartModel):
         cache.delete(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.org.pk, self.flow_uuid))
 
     def update_questions_results_cache(self):
+        # collect the values to write them to the cache at once
+        cache_values = dict()
+
         for question in self.questions.all():
-            question.calculate_polled()
-            question.calculate_responded()
-            question.calculate_results()
-            question.calculate_results(segment=dict(location="State"))
-            question.calculate_results(segment=dict(age="Age"))
-            question.calculate_results(segment=dict(gender="Gender"))
+            # all the segments are built from the same counts, fetched once per question
+            results_counts = question.get_results_counts()
+            for segment in PollQuestion.POLL_QUESTION_RESULTS_SEGMENTS:
+                question.calculate_results(segment=segment, results_counts=results_counts, cache_values=cache_values)
+
+        self.update_poll_participation_maps_cache(cache_values=cache_values)
 
-        self.update_poll_participation_maps_cache()
+        cache.set_many(cache_values, None)
 
     def update_questions_results_cache_task(self):
         from ureport.polls.tasks import update_questions_results_cache
@@ -311,18 +586,12 @@ class Poll(SmartModel):
         for question in self.questions.all().select_related("flow_result"):
             question.generate_word_cloud()
 
-    def update_poll_participation_maps_cache(self):
+    def update_poll_participation_maps_cache(self, cache_values=None):
         top_question = self.get_questions().first()
         if not top_question:
             return
 
-        org = self.org
-        states = org.get_segment_org_boundaries({"location": "State"})
-        for state in states:
-            top_question.calculate_results(segment=dict(location="District", parent=state["osm_id"]))
-            districts = org.get_segment_org_boundaries(dict(location="state", parent=state["osm_id"]))
-            for district in districts:
-                top_question.calculate_results(segment=dict(location="Ward", parent=district["osm_id"]))
+        return top_question.build_map_results(cache_values=cache_values)
 
     @classmethod
     def pull_poll_results_task(cls, poll):
@@ -357,35 +626,47 @@ class Poll(SmartModel):
                 flow_poll.update_question_word_clouds()
                 flow_poll.update_questions_results_cache()
 
+    @classmethod
+    def get_rebuild_counts_units(cls, org_id=None):
+        """
+        Gets the (org id, flow uuid, poll id) units the counts rebuild is split into. Polls sharing a flow share their
+        counters so each flow is rebuilt once, through a syncing poll if it has any, and the caches of all the polls of
+        the flow are then updated. Units are ordered by the number of results of their flow so that the longest
+        rebuilds are started first.
+        """
+        polls = Poll.objects.filter(is_active=True)
+        if org_id:
+            polls = polls.filter(org_id=org_id)
+
+        units = list(
+            polls.order_by("org_id", "flow_uuid", "stopped_syncing", "-created_on")
+            .distinct("org_id", "flow_uuid")
+            .values_list("org_id", "flow_uuid", "id")
+        )
+
+        org_ids = {unit[0] for unit in units}
+        flow_uuids = {unit[1] for unit in units}
+        results_counts = {
+            (result_org_id, flow): count
+            for result_org_id, flow, count in PollResult.objects.filter(org_id__in=org_ids, flow__in=flow_uuids)
+            .values_list("org_id", "flow")
+            .annotate(Count("id"))
+            .order_by()
+        }
+
+        return sorted(units, key=lambda unit: results_counts.get((unit[0], unit[1]), 0), reverse=True)
+
     def rebuild_poll_results_counts(self):
         import time
 
-        from ureport.locations.models import Boundary
-        from ureport.stats.models import (
-            AgeSegment,
-            GenderSegment,
-            PollEngagementDailyCount,
-            PollStatsCounter,
-            SchemeSegment,
-        )
-
         start = time.time()
 
         poll_id = self.pk
         org_id = self.org_id
         flow = self.flow_uuid
-        poll_year = self.poll_date.year
 
         if self.stopped_syncing:
-            flow_polls = Poll.objects.filter(org_id=org_id, flow_uuid=flow, stopped_syncing=True)
-            for flow_poll in flow_polls:
-                if flow_poll.is_active:
-                    flow_poll.update_questions_results_cache()
-                else:
-                    logger.info(
-                        "Skipping rebuilding results counts for inactive poll #%d on org #%d"
-                        % (flow_poll.pk, flow_poll.org_id)
-                    )
+            self.update_stopped_flow_polls_results_cache()
 
             logger.info("Poll stopped regenerating new stats for poll #%d on org #%d" % (self.pk, self.org_id))
             return
@@ -399,181 +680,262 @@ class Poll(SmartModel):
 
         else:
             with r.lock(key, timeout=Poll.POLL_SYNC_LOCK_TIMEOUT):
-                poll_results = PollResult.objects.filter(org_id=org_id, flow=flow).iterator(chunk_size=1000)
-
-                questions = self.questions.all().select_related("flow_result").prefetch_related("response_categories")
-                results_dict = dict()
+                results_dict = self.get_results_counters_lookup()
 
-                if not questions.exists():
+                if not results_dict:
                     logger.info("Poll cannot sync without questions for poll #%d on org #%d" % (poll_id, org_id))
                     return
 
-                for qsn in questions:
-                    categories = qsn.response_categories.all().select_related("flow_result_category")
-                    categories_dict = {elt.flow_result_category.category.lower(): elt.id for elt in categories}
-                    flow_categories_dict = {
-                        elt.flow_result_category.category.lower(): elt.flow_result_category.id for elt in categories
-                    }
-                    results_dict[qsn.flow_result.result_uuid] = dict(
-                        id=qsn.id,
-                        flow_result_id=qsn.flow_result_id,
-                        categories=categories_dict,
-                        flow_categories=flow_categories_dict,
-                    )
-
-                gender_dict = {elt.gender.lower(): elt.id for elt in GenderSegment.objects.all()}
-                age_dict = {elt.min_age: elt.id for elt in AgeSegment.objects.all()}
-                scheme_dict = {elt.scheme.lower(): elt.id for elt in SchemeSegment.objects.all()}
-
-                boundaries = Boundary.objects.filter(org_id=org_id)
-                location_dict = {elt.osm_id.upper(): elt.id for elt in boundaries}
-
-                logger.info("Results query time for pair %s, %s took %ds" % (org_id, flow, time.time() - start))
-
-                processed_results = 0
-                stats_dict = defaultdict(int)
+                # the results are read and the counters replaced in a single snapshot, so the deltas saved with the
+                # results synced meanwhile are either already counted and replaced, or kept on top of the new counters
+                repeatable_read = not connection.in_atomic_block
+                for attempt in range(1, Poll.POLL_REBUILD_COUNTS_ATTEMPTS + 1):
+                    try:
+                        with transaction.atomic():
+                            if repeatable_read:
+                                with connection.cursor() as cursor:
+                                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+                            stats_dict = PollResult.generate_flow_poll_stats(org_id, flow)
+
+                            logger.info(
+                                "Rebuild counts progress... build counters dict for pair %s, %s, %d distinct keys in %ds"
+                                % (org_id, flow, len(stats_dict), time.time() - start)
+                            )
 
-                for result in poll_results:
-                    gen_stats = result.generate_poll_stats()
-                    for dict_key in gen_stats.keys():
-                        stats_dict[dict_key] += gen_stats[dict_key]
+                            # Delete existing counters and then create new counters
+                            self.delete_poll_stats()
 
-                    processed_results += 1
+                            num_stats_counters, num_engagement_counts = self.create_results_counters(
+                                stats_dict, results_dict
+                            )
+                        break
+                    except OperationalError as e:
+                        # the squash skips the flows being rebuilt, but may have started before this rebuild did
+                        if (
+                            not repeatable_read
+                            or not isinstance(e.__cause__, SerializationFailure)
+                            or attempt == Poll.POLL_REBUILD_COUNTS_ATTEMPTS
+                        ):
+                            raise
 
-                    if processed_results % 50000 == 0:
                         logger.info(
-                            "Rebuild counts progress... build counters dict for pair %s, %s, processed %d in %ds"
-                            % (org_id, flow, processed_results, time.time() - start)
+                            "Rebuild counts snapshot of pair %s, %s conflicted with a squash, retrying (attempt %d)"
+                            % (org_id, flow, attempt)
                         )
 
                 logger.info(
-                    "Rebuild counts progress... build counters dict for pair %s, %s, processed %d in %ds"
-                    % (org_id, flow, processed_results, time.time() - start)
+                    "Rebuild counts created %d stats counters and %d engagement counts for pair %s, %s in %ds"
+                    % (num_stats_counters, num_engagement_counts, org_id, flow, time.time() - start)
                 )
 
+                self.update_flow_polls_results_cache()
+
+    @classmethod
+    def get_rebuilding_flow_result_ids(cls):
+        """
+        Gets the ids of the flow results of the flows having their counts rebuilt, whose counters the squash leaves
+        alone until the rebuild has replaced them
+        """
+        flows = Q()
+        for key in get_valkey_connection().scan_iter(match=Poll.POLL_REBUILD_COUNTS_LOCK_PATTERN):
+            key = key.decode() if isinstance(key, bytes) else key
+            _, _, org_id, _, flow_uuid = key.split(":")
+            flows |= Q(poll__org_id=int(org_id), poll__flow_uuid=flow_uuid)
+
+        if not flows:
+            return set()
+
+        return set(PollQuestion.objects.filter(flows).values_list("flow_result_id", flat=True))
+
+    def apply_poll_results_deltas(self, stats_deltas):
+        """
+        Adds unsquashed counters for the given +1/-1 deltas of results stats tuples, the counters squash task then
+        folds them into the existing counters. Must be called in the transaction saving the results, so that a rebuild
+        of the flow snapshot either sees both the results and their deltas or neither of them.
+        """
+        import time
+
+        start = time.time()
+
+        stats_deltas = {stat_tuple: count for stat_tuple, count in stats_deltas.items() if count}
+        if not stats_deltas or self.stopped_syncing:
+            return 0, 0
+
+        results_dict = self.get_results_counters_lookup()
+        num_stats_counters, num_engagement_counts = self.create_results_counters(stats_deltas, results_dict)
+
+        logger.info(
+            "Added %d stats counters and %d engagement counts deltas for poll #%d on org #%d in %0.3fs"
+            % (num_stats_counters, num_engagement_counts, self.pk, self.org_id, time.time() - start)
+        )
+        return num_stats_counters, num_engagement_counts
+
+    def get_results_counters_lookup(self):
+        """
+        Maps the result uuid of each question to its flow result and categories ids
+        """
+        questions = self.questions.all().select_related("flow_result").prefetch_related("response_categories")
+        results_dict = dict()
+
+        for qsn in questions:
+            categories = qsn.response_categories.all().select_related("flow_result_category")
+            categories_dict = {elt.flow_result_category.category.lower(): elt.id for elt in categories}
+            flow_categories_dict = {
+                elt.flow_result_category.category.lower(): elt.flow_result_category.id for elt in categories
+            }
+            results_dict[qsn.flow_result.result_uuid] = dict(
+                id=qsn.id,
+                flow_result_id=qsn.flow_result_id,
+                categories=categories_dict,
+                flow_categories=flow_categories_dict,
+            )
+
+        return results_dict
+
+    def create_results_counters(self, stats_dict, results_dict):
+        """
+        Creates the counters for the given results stats tuples counts in bounded batches, returns the number of
+        stats counters and engagement counts created
+        """
+        from ureport.stats.models import PollEngagementDailyCount, PollStatsCounter
+
+        poll_stats_counter_obj_to_insert = []
+        poll_engagement_daily_count_obj_to_insert = []
+        num_stats_counters = 0
+        num_engagement_counts = 0
+
+        for counter in self.iter_results_counters(stats_dict, results_dict):
+            if isinstance(counter, PollStatsCounter):
+                poll_stats_counter_obj_to_insert.append(counter)
+            else:
+                poll_engagement_daily_count_obj_to_insert.append(counter)
+
+            # flush counters in bounded batches rather than holding them all in memory
+            if len(poll_stats_counter_obj_to_insert) >= Poll.REBUILD_COUNTS_BATCH_SIZE:
+                PollStatsCounter.objects.bulk_create(poll_stats_counter_obj_to_insert)
+                num_stats_counters += len(poll_stats_counter_obj_to_insert)
                 poll_stats_counter_obj_to_insert = []
+
+            if len(poll_engagement_daily_count_obj_to_insert) >= Poll.REBUILD_COUNTS_BATCH_SIZE:
+                PollEngagementDailyCount.objects.bulk_create(poll_engagement_daily_count_obj_to_insert)
+                num_engagement_counts += len(poll_engagement_daily_count_obj_to_insert)
                 poll_engagement_daily_count_obj_to_insert = []
-                for stat_tuple in stats_dict.keys():
-                    org_id, ruleset, category, born, gender, state, district, ward, scheme, date = stat_tuple
-                    count = stats_dict.get(stat_tuple)
-                    stat_kwargs = dict(org_id=org_id, count=count, date=date)
-
-                    if ruleset not in results_dict:
-                        continue
-
-                    flow_result_id = results_dict[ruleset].get("flow_result_id")
-                    if not flow_result_id:
-                        continue
-
-                    flow_category_id = results_dict[ruleset].get("flow_categories", dict()).get(category)
-
-                    gender_id = None
-                    if gender:
-                        gender_id = gender_dict.get(gender, gender_dict.get("O"))
-
-                    age_id = None
-                    if born:
-                        age_id = age_dict.get(AgeSegment.get_age_segment_min_age(max(poll_year - int(born), 0)))
-
-                    scheme_id = None
-                    if scheme:
-                        scheme_id = scheme_dict.get(scheme, None)
-                        if scheme_id is None:
-                            scheme_obj, created_flag = SchemeSegment.objects.get_or_create(scheme=scheme.lower())
-                            scheme_dict[scheme.lower()] = scheme_obj.id
-
-                    location_id = None
-                    if ward:
-                        location_id = location_dict.get(ward)
-                    elif district:
-                        location_id = location_dict.get(district)
-                    elif state:
-                        location_id = location_dict.get(state)
-
-                    if flow_result_id:
-                        stat_kwargs["flow_result_id"] = flow_result_id
-
-                    if flow_category_id:
-                        stat_kwargs["flow_result_category_id"] = flow_category_id
-
-                    if age_id:
-                        stat_kwargs["age_segment_id"] = age_id
-                    if gender_id:
-                        stat_kwargs["gender_segment_id"] = gender_id
-                    if scheme_id:
-                        stat_kwargs["scheme_segment_id"] = scheme_id
-                    if location_id:
-                        stat_kwargs["location_id"] = location_id
-
-                    stat_counter_kwargs = dict(
+
+        PollStatsCounter.objects.bulk_create(poll_stats_counter_obj_to_insert)
+        PollEngagementDailyCount.objects.bulk_create(poll_engagement_daily_count_obj_to_insert)
+        num_stats_counters += len(poll_stats_counter_obj_to_insert)
+        num_engagement_counts += len(poll_engagement_daily_count_obj_to_insert)
+
+        return num_stats_counters, num_engagement_counts
+
+    def iter_results_counters(self, stats_dict, results_dict):
+        """
+        Yields the PollStatsCounter and PollEngagementDailyCount objects for the given results stats tuples counts
+        """
+        from ureport.stats.models import AgeSegment, PollEngagementDailyCount, PollStatsCounter, SchemeSegment
+
+        poll_year = self.poll_date.year
+        scheme_dict = {elt.scheme.lower(): elt.id for elt in SchemeSegment.objects.all()}
+        engagement_since = timezone.now() - timedelta(days=400)
+
+        for stat_tuple, count in stats_dict.items():
+            org_id, ruleset, category, born, gender, state, district, ward, scheme, date = stat_tuple
+
+            if ruleset not in results_dict:
+                continue
+
+            flow_result_id = results_dict[ruleset].get("flow_result_id")
+            if not flow_result_id:
+                continue
+
+            flow_category_id = results_dict[ruleset].get("flow_categories", dict()).get(category)
+
+            if scheme and scheme not in scheme_dict:
+                scheme_obj, created_flag = SchemeSegment.objects.get_or_create(scheme=scheme.lower())
+                scheme_dict[scheme.lower()] = scheme_obj.id
+
+            scopes = ["all"]
+            if born:
+                scopes.append("age:%s" % AgeSegment.get_age_segment_min_age(max(poll_year - int(born), 0)))
+            if gender:
+                scopes.append("gender:%s" % gender)
+            if scheme:
+                scopes.append("scheme:%s" % scheme)
+            if ward:
+                scopes.append("ward:%s" % ward)
+            if district:
+                scopes.append("district:%s" % district)
+            if state:
+                scopes.append("state:%s" % state)
+
+            for scope in scopes:
+                yield PollStatsCounter(
+                    org_id=org_id,
+                    flow_result_id=flow_result_id,
+                    flow_result_category_id=flow_category_id,
+                    scope=scope,
+                    count=count,
+                )
+
+                if date is not None and "district:" not in scope and "ward:" not in scope and date >= engagement_since:
+                    yield PollEngagementDailyCount(
                         org_id=org_id,
                         flow_result_id=flow_result_id,
-                        flow_result_category_id=flow_category_id,
+                        is_responded=bool(flow_category_id),
+                        scope=scope,
+                        day=date.date(),
                         count=count,
                     )
-                    engagement_counter_kwargs = dict()
-                    if date is not None:
-                        engagement_counter_kwargs = dict(
-                            org_id=org_id,
-                            flow_result_id=flow_result_id,
-                            is_responded=bool(flow_category_id),
-                            day=date.date(),
-                            count=count,
-                        )
 
-                    scopes = ["all"]
-                    if born:
-                        scopes.append("age:%s" % AgeSegment.get_age_segment_min_age(max(poll_year - int(born), 0)))
-                    if gender:
-                        scopes.append("gender:%s" % gender)
-                    if scheme:
-                        scopes.append("scheme:%s" % scheme)
-                    if ward:
-                        scopes.append("ward:%s" % ward)
-                    if district:
-                        scopes.append("district:%s" % district)
-                    if state:
-                        scopes.append("state:%s" % state)
-
-                    for scope in scopes:
-                        stat_counter_kwargs["scope"] = scope
-                        poll_stats_counter_obj_to_insert.append(PollStatsCounter(**stat_counter_kwargs))
-
-                        if (
-                            engagement_counter_kwargs
-                            and "district:" not in scope
-                            and "ward:" not in scope
-                            and date
-                            and date >= (timezone.now() - timedelta(days=400))
-                        ):
-                            engagement_counter_kwargs["scope"] = scope
-                            poll_engagement_daily_count_obj_to_insert.append(
-                                PollEngagementDailyCount(**engagement_counter_kwargs)
-                            )
+    def update_stopped_flow_polls_results_cache(self):
+        """
+        Updates the results cache of the active polls of the flow which stopped syncing, their counters are no longer
+        rebuilt but are shared with the other polls of the flow
+        """
+        flow_polls = Poll.objects.filter(org_id=self.org_id, flow_uuid=self.flow_uuid, stopped_syncing=True)
+        for flow_poll in flow_polls:
+            if flow_poll.is_active:
+                flow_poll.update_questions_results_cache()
+            else:
+                logger.info(
+                    "Skipping rebuilding results counts for inactive poll #%d on org #%d"
+                    % (flow_poll.pk, flow_poll.org_id)
+                )
 
-                # Delete existing counters and then create new counters
-                self.delete_poll_stats()
+    def update_flow_polls_results_cache(self):
+        import time
 
-                PollStatsCounter.objects.bulk_create(poll_stats_counter_obj_to_insert, batch_size=1000)
-                PollEngagementDailyCount.objects.bulk_create(poll_engagement_daily_count_obj_to_insert, batch_size=1000)
+        flow_polls = Poll.objects.filter(org_id=self.org_id, flow_uuid=self.flow_uuid, stopped_syncing=False)
+        for flow_poll in flow_polls:
+            start_update_cache = time.time()
 
-                flow_polls = Poll.objects.filter(org_id=org_id, flow_uuid=flow, stopped_syncing=False)
-                for flow_poll in flow_polls:
-                    start_update_cache = time.time()
+            # update the word clouds for questions
+            flow_poll.update_question_word_clouds()
 
-                    # update the word clouds for questions
-                    flow_poll.update_question_word_clouds()
+            flow_poll.update_questions_results_cache()
+            logger.info(
+                "Calculated questions results and updated the cache for poll #%d on org #%d in %ds"
+                % (self.pk, self.org_id, time.time() - start_update_cache)
+            )
 
-                    flow_poll.update_questions_results_cache()
-                    logger.info(
-                        "Calculated questions results and updated the cache for poll #%d on org #%d in %ds"
-                        % (poll_id, org_id, time.time() - start_update_cache)
-                    )
+            logger.info(
+                "Poll responses counts for poll #%d on org #%d: %s responses received out of %s participants polled"
+                % (self.pk, self.org_id, flow_poll.responded_runs(), flow_poll.runs())
+            )
 
-                    logger.info(
-                        "Poll responses counts for poll #%d on org #%d: %s responses received out of %s participants polled"
-                        % (poll_id, org_id, flow_poll.responded_runs(), flow_poll.runs())
-                    )
+    def has_incremental_results_counts(self):
+        """
+        Whether synced results can update the counters with deltas, which needs counters already built for all the
+        existing results of the flow
+        """
+        pull_after_delete = cache.get(Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (self.org_id, self.pk), None)
+        return (
+            POLL_RESULTS_INCREMENTAL_COUNTS
+            and self.has_synced
+            and not self.stopped_syncing
+            and pull_after_delete is None
+        )
 
     def get_question_uuids(self):
         question_uuids = FlowResult.objects.filter(org=self.org, flow_uuid=self.flow_uuid).values_list(
@@ -615,7 +977,9 @@ class Poll(SmartModel):
 
     @classmethod
     def get_main_poll(cls, org):
-        cached_value = cache.get(Poll.ORG_MAIN_POLL_ID % org.id, None)
+        from ureport.utils.tiered_cache import tiered_cache
+
+        cached_value = tiered_cache.get(Poll.ORG_MAIN_POLL_ID % org.id, None, family="main-poll")
         main_poll = None
         if cached_value:
             main_poll = (
@@ -649,6 +1013,8 @@ class Poll(SmartModel):
 
     @classmethod
     def find_main_poll(cls, org):
+        from ureport.utils.tiered_cache import tiered_cache
+
         poll_with_questions = (
             PollQuestion.objects.filter(is_active=True, poll__org=org).only("poll_id").values_list("poll_id", flat=True)
         )
@@ -663,7 +1029,7 @@ class Poll(SmartModel):
             main_poll = polls.first()
 
         if main_poll:
-            cache.set(Poll.ORG_MAIN_POLL_ID % org.id, main_poll.pk, None)
+            tiered_cache.set(Poll.ORG_MAIN_POLL_ID % org.id, main_poll.pk, None)
         return main_poll
 
     @classmethod
@@ -687,7 +1053,7 @@ class Poll(SmartModel):
     @classmethod
     def get_recent_polls(cls, org):
         now = timezone.now()
-        recent_window = now - timedelta(days=45)
+        recent_window = now - timedelta(days=Poll.POLL_RECENT_DAYS)
         main_poll = Poll.get_main_poll(org)
 
         recent_other_polls = Poll.get_valid_polls(org)
@@ -755,6 +1121,28 @@ class Poll(SmartModel):
             .order_by("-priority", "pk")
         )
 
+    def prefetch_questions_results(self):
+        """
+        Fetches the questions of the poll and all their cached results in a single cache call, later get_questions
+        calls return these same questions
+        """
+        Poll.prefetch_polls_questions_results([self])
+        return self.prefetched_questions
+
+    @classmethod
+    def prefetch_polls_questions_results(cls, polls):
+        """
+        Fetches the questions of a page of polls and all their cached results in a single cache call for the whole
+        page, later get_questions calls on these polls return these same questions
+        """
+        questions = []
+        for poll in polls:
+            if not hasattr(poll, "prefetched_questions"):
+                poll.prefetched_questions = list(poll.get_questions())
+            questions += poll.prefetched_questions
+
+        PollQuestion.prefetch_results(questions)
+
     def get_top_question(self):
         questions = self.get_questions()
         if questions:
@@ -851,6 +1239,12 @@ class PollQuestion(SmartModel):
     POLL_QUESTION_RESULTS_CACHE_KEY = "org:%d:poll:%d:question_results:%d"
     POLL_QUESTION_RESULTS_CACHE_TIMEOUT = 60 * 12
 
+    # the segments of the results cached for every question
+    POLL_QUESTION_RESULTS_SEGMENTS = (None, dict(age="Age"), dict(gender="Gender"), dict(location="State"))
+
+    # process local counts of the results cache lookups
+    RESULTS_CACHE_STATS = dict(hits=0, misses=0)
+
     QUESTION_COLOR_CHOICES = (
         (None, "-----"),
         ("D1", _("Dark 1 background and White text")),
@@ -991,12 +1385,62 @@ class PollQuestion(SmartModel):
                 org_id,
             )
 
-    def get_results(self, segment=None):
+    def get_results_cache_key(self, segment=None):
         key = PollQuestion.POLL_QUESTION_RESULTS_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
         if segment:
             key += ":" + slugify(str(json.dumps(segment)))
+        return key
+
+    def get_responded_cache_key(self):
+        return PollQuestion.POLL_QUESTION_RESPONDED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
+
+    def get_polled_cache_key(self):
+        return PollQuestion.POLL_QUESTION_POLLED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
+
+    @classmethod
+    def prefetch_results(cls, questions, segments=POLL_QUESTION_RESULTS_SEGMENTS):
+        """
+        Fetches the cached results of all the given questions for all the given segments, and their responded and
+        polled counts, in a single cache call. Later get_results, get_responded and get_polled calls on these questions
+        don't hit the cache again
+        """
+        questions_keys = [
+            (
+                question,
+                [question.get_results_cache_key(segment) for segment in segments]
+                + [question.get_responded_cache_key(), question.get_polled_cache_key()],
+            )
+            for question in questions
+        ]
+        keys = [key for question, question_keys in questions_keys for key in question_keys]
+        if not keys:
+            return
+
+        cached_values = cache.get_many(keys)
+
+        for question, question_keys in questions_keys:
+            question.prefetched_results = {key: cached_values.get(key) for key in question_keys}
+
+        cls.RESULTS_CACHE_STATS["hits"] += len(cached_values)
+        cls.RESULTS_CACHE_STATS["misses"] += len(keys) - len(cached_values)
+
+    @classmethod
+    def get_results_cache_stats(cls):
+        hits = cls.RESULTS_CACHE_STATS["hits"]
+        misses = cls.RESULTS_CACHE_STATS["misses"]
+        return dict(hits=hits, misses=misses, hit_ratio=hits / (hits + misses) if hits + misses else 0)
+
+    def get_cached_value(self, key):
+        prefetched_results = getattr(self, "prefetched_results", dict())
+        if key in prefetched_results:
+            return prefetched_results[key]
 
         cached_value = cache.get(key, None)
+        PollQuestion.RESULTS_CACHE_STATS["hits" if cached_value is not None else "misses"] += 1
+        return cached_value
+
+    def get_results(self, segment=None):
+        cached_value = self.get_cached_value(self.get_results_cache_key(segment))
         if cached_value:
             return cached_value["results"]
 
@@ -1045,15 +1489,133 @@ class PollQuestion(SmartModel):
             poll_word_cloud.words = categories
             poll_word_cloud.save()
 
-    def calculate_results(self, segment=None):
+    def get_results_counts(self):
+        """
+        Sums the counters of the question flow result by scope and category in a single query, as a dict of scope to
+        a dict of lowercase category to count, with the None category holding the unset count
+        """
+        from ureport.stats.models import PollStatsCounter
+
+        counts = (
+            PollStatsCounter.objects.filter(org_id=self.poll.org_id, flow_result=self.flow_result)
+            .values_list("scope", "flow_result_category_id", "flow_result_category__category")
+            .annotate(count_sum=Sum("count"))
+            .order_by()
+        )
+
+        results_counts = defaultdict(lambda: defaultdict(int))
+        for scope, category_id, category, count in counts:
+            key = (category or "").lower() if category_id is not None else None
+            results_counts[scope][key] += count
+
+        return results_counts
+
+    def get_results_categories(self):
+        return list(
+            self.response_categories.filter(is_active=True).select_related("flow_result_category").order_by("pk")
+        )
+
+    @classmethod
+    def get_scope_categories(cls, results_counts, categories_qs, scope):
+        """
+        Gets the categories counts of the scope with its set and unset counts
+        """
+        scope_counts = results_counts.get(scope, dict())
+        categories = []
+        for category_obj in categories_qs:
+            key = category_obj.flow_result_category.category.lower()
+            categorie_label = category_obj.category_displayed or category_obj.flow_result_category.category
+            if key not in PollResponseCategory.IGNORED_CATEGORY_RULES:
+                category_count = scope_counts.get(key, 0)
+                categories.append(dict(count=category_count, label=strip_tags(categorie_label)))
+
+        set_count = sum([elt["count"] for elt in categories])
+        unset_count = scope_counts.get(None, 0)
+        return categories, set_count, unset_count
+
+    def build_map_results(self, results_counts=None, cache_values=None):
+        """
+        Builds the district results of every state and the ward results of every district, for the levels the org
+        has configured, from one read of the org boundaries and one read of the question counts. Returns the time
+        taken by level.
+        """
+        org = self.poll.org
+        backend_options = org.backends.filter(is_active=True).values_list("slug", flat=True)
+        levels = [
+            (location, level)
+            for location, level in (("district", Boundary.DISTRICT_LEVEL), ("ward", Boundary.WARD_LEVEL))
+            if any(org.get_config("%s.%s_label" % (option, location)) for option in backend_options)
+        ]
+        if not levels:
+            return dict()
+
+        if results_counts is None:
+            results_counts = self.get_results_counts()
+
+        flush_cache = cache_values is None
+        if flush_cache:
+            cache_values = dict()
+
+        open_ended = self.is_open_ended()
+        categories_qs = self.get_results_categories()
+
+        # the parents of each level are the boundaries of the level above it
+        tree_levels = {level for location, level in levels} | {level - 1 for location, level in levels}
+        boundaries = (
+            org.boundaries.filter(level__in=tree_levels, is_active=True)
+            .values("osm_id", "name", "level", "parent__osm_id")
+            .order_by("osm_id")
+        )
+        boundaries_by_level = defaultdict(list)
+        children = defaultdict(list)
+        for boundary in boundaries:
+            boundaries_by_level[boundary["level"]].append(boundary)
+            children[(boundary["level"], boundary["parent__osm_id"])].append(boundary)
+
+        timings = dict()
+        for location, level in levels:
+            start = time.time()
+            for parent in boundaries_by_level[level - 1]:
+                results = []
+                for boundary in children[(level, parent["osm_id"])]:
+                    osm_id = boundary["osm_id"].upper()
+                    categories, set_count, unset_count = self.get_scope_categories(
+                        results_counts, categories_qs, "%s:%s" % (location, osm_id)
+                    )
+                    results.append(
+                        dict(
+                            open_ended=open_ended,
+                            set=set_count,
+                            unset=unset_count,
+                            boundary=osm_id,
+                            label=strip_tags(boundary["name"]),
+                            categories=categories,
+                        )
+                    )
+
+                segment = dict(location=location.capitalize(), parent=parent["osm_id"])
+                cache_values[self.get_results_cache_key(segment)] = {"results": results}
+
+            timings[location] = time.time() - start
+            logger.info(
+                "Built %s map results of %d parents for question #%d on org #%d in %0.3fs"
+                % (location, len(boundaries_by_level[level - 1]), self.pk, org.pk, timings[location])
+            )
+
+        if flush_cache:
+            cache.set_many(cache_values, None)
+
+        return timings
+
+    def calculate_results(self, segment=None, results_counts=None, cache_values=None):
         from stop_words import safe_get_stop_words
 
-        from ureport.stats.models import AgeSegment, GenderSegment, PollStatsCounter, PollWordCloud
+        from ureport.stats.models import AgeSegment, GenderSegment, PollWordCloud
 
         org = self.poll.org
         open_ended = self.is_open_ended()
-        responded = self.calculate_responded()
-        polled = self.calculate_polled()
+        responded = self.calculate_responded(results_counts=results_counts, cache_values=cache_values)
+        polled = self.calculate_polled(results_counts=results_counts, cache_values=cache_values)
         org_gender_labels = org.get_gender_labels()
 
         results = []
@@ -1088,9 +1650,13 @@ class PollQuestion(SmartModel):
             results.append(dict(open_ended=open_ended, set=responded, unset=polled - responded, categories=categories))
 
         else:
-            categories_qs = (
-                self.response_categories.filter(is_active=True).select_related("flow_result_category").order_by("pk")
-            )
+            if results_counts is None:
+                results_counts = self.get_results_counts()
+
+            categories_qs = self.get_results_categories()
+
+            def get_scope_categories(scope):
+                return self.get_scope_categories(results_counts, categories_qs, scope)
 
             if segment:
                 location_part = segment.get("location", "").lower()
@@ -1101,43 +1667,8 @@ class PollQuestion(SmartModel):
                     location_boundaries = org.get_segment_org_boundaries(segment)
 
                     for boundary in location_boundaries:
-                        categories = []
                         osm_id = boundary.get("osm_id").upper()
-
-                        categories_results = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="%s:%s" % (location_part, osm_id),
-                            )
-                            .exclude(flow_result_category=None)
-                            .values("flow_result_category__category")
-                            .annotate(label=F("flow_result_category__category"), count=Sum("count"))
-                            .values("label", "count")
-                        )
-                        categories_results_dict = {elt["label"].lower(): elt["count"] for elt in categories_results}
-
-                        unset_count_stats = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="%s:%s" % (location_part, osm_id),
-                            )
-                            .filter(flow_result_category=None)
-                            .aggregate(Sum("count"))
-                        )
-                        unset_count = unset_count_stats.get("count__sum", 0) or 0
-
-                        for category_obj in categories_qs:
-                            key = category_obj.flow_result_category.category.lower()
-                            categorie_label = (
-                                category_obj.category_displayed or category_obj.flow_result_category.category
-                            )
-                            if key not in PollResponseCategory.IGNORED_CATEGORY_RULES:
-                                category_count = categories_results_dict.get(key, 0)
-                                categories.append(dict(count=category_count, label=strip_tags(categorie_label)))
-
-                        set_count = sum([elt["count"] for elt in categories])
+                        categories, set_count, unset_count = get_scope_categories("%s:%s" % (location_part, osm_id))
 
                         results.append(
                             dict(
@@ -1166,41 +1697,7 @@ class PollQuestion(SmartModel):
                         elif age["min_age"] == 35:
                             data_key = "35+"
 
-                        categories_results = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="age:%s" % age["min_age"],
-                            )
-                            .exclude(flow_result_category=None)
-                            .values("flow_result_category__category")
-                            .annotate(label=F("flow_result_category__category"), count=Sum("count"))
-                            .values("label", "count")
-                        )
-                        categories_results_dict = {elt["label"].lower(): elt["count"] for elt in categories_results}
-
-                        unset_count_stats = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="age:%s" % age["min_age"],
-                            )
-                            .filter(flow_result_category=None)
-                            .aggregate(Sum("count"))
-                        )
-                        unset_count = unset_count_stats.get("count__sum", 0) or 0
-
-                        categories = []
-                        for category_obj in categories_qs:
-                            key = category_obj.flow_result_category.category.lower()
-                            categorie_label = (
-                                category_obj.category_displayed or category_obj.flow_result_category.category
-                            )
-                            if key not in PollResponseCategory.IGNORED_CATEGORY_RULES:
-                                category_count = categories_results_dict.get(key, 0)
-                                categories.append(dict(count=category_count, label=strip_tags(categorie_label)))
-
-                        set_count = sum([elt["count"] for elt in categories])
+                        categories, set_count, unset_count = get_scope_categories("age:%s" % age["min_age"])
 
                         results.append(dict(set=set_count, unset=unset_count, label=data_key, categories=categories))
 
@@ -1215,41 +1712,10 @@ class PollQuestion(SmartModel):
 
                     results = []
                     for gender in genders:
-                        categories_results = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="gender:%s" % gender["gender"].lower(),
-                            )
-                            .exclude(flow_result_category=None)
-                            .values("flow_result_category__category")
-                            .annotate(label=F("flow_result_category__category"), count=Sum("count"))
-                            .values("label", "count")
+                        categories, set_count, unset_count = get_scope_categories(
+                            "gender:%s" % gender["gender"].lower()
                         )
-                        categories_results_dict = {elt["label"].lower(): elt["count"] for elt in categories_results}
-                        categories = []
-
-                        unset_count_stats = (
-                            PollStatsCounter.objects.filter(
-                                org_id=org.id,
-                                flow_result=self.flow_result,
-                                scope="gender:%s" % gender["gender"].lower(),
-                            )
-                            .filter(flow_result_category=None)
-                            .aggregate(Sum("count"))
-                        )
-                        unset_count = unset_count_stats.get("count__sum", 0) or 0
-
-                        for category_obj in categories_qs:
-                            key = category_obj.flow_result_category.category.lower()
-                            categorie_label = (
-                                category_obj.category_displayed or category_obj.flow_result_category.category
-                            )
-                            if key not in PollResponseCategory.IGNORED_CATEGORY_RULES:
-                                category_count = categories_results_dict.get(key, 0)
-                                categories.append(dict(count=category_count, label=strip_tags(categorie_label)))
 
-                        set_count = sum([elt["count"] for elt in categories])
                         results.append(
                             dict(
                                 set=set_count,
@@ -1260,33 +1726,18 @@ class PollQuestion(SmartModel):
                         )
 
             else:
-                stats_count = (
-                    PollStatsCounter.objects.filter(org_id=org.id, flow_result=self.flow_result, scope="all")
-                    .exclude(flow_result_category=None)
-                    .values("flow_result_category__category")
-                    .annotate(label=F("flow_result_category__category"), count=Sum("count"))
-                    .values("label", "count")
-                )
-                categories_results_dict = {elt["label"].lower(): elt["count"] for elt in stats_count}
-
-                categories = []
-
-                for category_obj in categories_qs:
-                    key = category_obj.flow_result_category.category.lower()
-                    categorie_label = category_obj.category_displayed or category_obj.flow_result_category.category
-                    if key not in PollResponseCategory.IGNORED_CATEGORY_RULES:
-                        category_count = categories_results_dict.get(key, 0)
-                        categories.append(dict(count=category_count, label=strip_tags(categorie_label)))
+                categories, set_count, unset_count = get_scope_categories("all")
 
                 results.append(
                     dict(open_ended=open_ended, set=responded, unset=polled - responded, categories=categories)
                 )
 
-        key = PollQuestion.POLL_QUESTION_RESULTS_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
-        if segment:
-            key += ":" + slugify(str(json.dumps(segment)))
+        key = self.get_results_cache_key(segment)
 
-        cache.set(key, {"results": results}, None)
+        if cache_values is not None:
+            cache_values[key] = {"results": results}
+        else:
+            cache.set(key, {"results": results}, None)
 
         return results
 
@@ -1308,8 +1759,7 @@ class PollQuestion(SmartModel):
         )
 
     def get_responded(self):
-        key = PollQuestion.POLL_QUESTION_RESPONDED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
-        cached_value = cache.get(key, None)
+        cached_value = self.get_cached_value(self.get_responded_cache_key())
         if cached_value:
             return cached_value["results"]
         if getattr(settings, "IS_PROD", False):
@@ -1317,24 +1767,31 @@ class PollQuestion(SmartModel):
 
         return self.calculate_responded()
 
-    def calculate_responded(self):
+    def calculate_responded(self, results_counts=None, cache_values=None):
         from ureport.stats.models import PollStatsCounter
 
-        key = PollQuestion.POLL_QUESTION_RESPONDED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
+        key = self.get_responded_cache_key()
 
-        responded_stats = (
-            PollStatsCounter.objects.filter(org_id=self.poll.org_id, flow_result=self.flow_result, scope="all")
-            .exclude(flow_result_category=None)
-            .aggregate(Sum("count"))
-        )
+        if results_counts is not None:
+            results = sum(
+                count for category, count in results_counts.get("all", dict()).items() if category is not None
+            )
+        else:
+            responded_stats = (
+                PollStatsCounter.objects.filter(org_id=self.poll.org_id, flow_result=self.flow_result, scope="all")
+                .exclude(flow_result_category=None)
+                .aggregate(Sum("count"))
+            )
+            results = responded_stats.get("count__sum", 0) or 0
 
-        results = responded_stats.get("count__sum", 0) or 0
-        cache.set(key, {"results": results}, None)
+        if cache_values is not None:
+            cache_values[key] = {"results": results}
+        else:
+            cache.set(key, {"results": results}, None)
         return results
 
     def get_polled(self):
-        key = PollQuestion.POLL_QUESTION_POLLED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
-        cached_value = cache.get(key, None)
+        cached_value = self.get_cached_value(self.get_polled_cache_key())
         if cached_value:
             return cached_value["results"]
         if getattr(settings, "IS_PROD", False):
@@ -1342,17 +1799,23 @@ class PollQuestion(SmartModel):
 
         return self.calculate_polled()
 
-    def calculate_polled(self):
+    def calculate_polled(self, results_counts=None, cache_values=None):
         from ureport.stats.models import PollStatsCounter
 
-        key = PollQuestion.POLL_QUESTION_POLLED_CACHE_KEY % (self.poll.org.pk, self.poll.pk, self.pk)
+        key = self.get_polled_cache_key()
 
-        polled_stats = PollStatsCounter.objects.filter(
-            org_id=self.poll.org_id, flow_result=self.flow_result, scope="all"
-        ).aggregate(Sum("count"))
-        results = polled_stats.get("count__sum", 0) or 0
+        if results_counts is not None:
+            results = sum(results_counts.get("all", dict()).values())
+        else:
+            polled_stats = PollStatsCounter.objects.filter(
+                org_id=self.poll.org_id, flow_result=self.flow_result, scope="all"
+            ).aggregate(Sum("count"))
+            results = polled_stats.get("count__sum", 0) or 0
 
-        cache.set(key, {"results": results}, None)
+        if cache_values is not None:
+            cache_values[key] = {"results": results}
+        else:
+            cache.set(key, {"results": results}, None)
         return results
 
     def get_response_percentage(self):
@@ -1450,6 +1913,8 @@ class PollResponseCategory(models.Model):
 
 
 class PollResult(models.Model):
+    GROUPED_RESULTS_CHUNK_SIZE = 10000
+
     id = models.BigAutoField(auto_created=True, primary_key=True, verbose_name="ID")
 
     org = models.ForeignKey(Org, on_delete=models.PROTECT, related_name="poll_results", db_index=False)
@@ -1543,6 +2008,54 @@ class PollResult(models.Model):
 
         return generated_stats
 
+    @classmethod
+    def generate_flow_poll_stats(cls, org_id, flow):
+        """
+        Equivalent to summing generate_poll_stats() over all the results of a flow, but the grouping is done by the
+        database so memory depends on the number of distinct keys rather than the number of results
+        """
+        grouped_results = (
+            cls.objects.filter(org_id=org_id, flow=flow)
+            .annotate(day=Trunc("date", "day", tzinfo=tzone.utc))
+            .values_list("ruleset", "category", "born", "gender", "state", "district", "ward", "scheme", "day")
+            .annotate(results_count=Count("id"))
+            .order_by()
+        )
+
+        generated_stats = defaultdict(int)
+        for (
+            ruleset,
+            category,
+            born,
+            gender,
+            state,
+            district,
+            ward,
+            scheme,
+            day,
+            results_count,
+        ) in grouped_results.iterator(chunk_size=cls.GROUPED_RESULTS_CHUNK_SIZE):
+            # normalize the grouped values the same way as a single result, text can only matter for an empty
+            # category which is normalized to the empty category anyway
+            result = cls(
+                org_id=org_id,
+                flow=flow,
+                ruleset=ruleset,
+                category=category,
+                born=born,
+                gender=gender,
+                state=state,
+                district=district,
+                ward=ward,
+                scheme=scheme,
+                date=day,
+            )
+            result_tuple = result.get_result_tuple()
+            if result_tuple:
+                generated_stats[result_tuple] += results_count
+
+        return generated_stats
+
     class Meta:
         indexes = [
             models.Index(fields=["org", "flow"], name="polls_pollresult_org_flow_idx"),
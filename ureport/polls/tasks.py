@@ -2,17 +2,22 @@
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from functools import partial
 
 from django_valkey import get_valkey_connection
-from temba_client.exceptions import TembaRateExceededError
 
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
 from django.utils import timezone
 
 from dash.orgs.models import Org
 from dash.orgs.tasks import org_task
 from ureport.celery import app
+from ureport.syncjobs.models import SyncJob
+from ureport.syncjobs.tasks import chunked_task
 from ureport.utils import (
     fetch_flows,
     fetch_old_sites_count as do_fetch_old_sites_count,
@@ -24,7 +29,37 @@ from ureport.utils import (
 logger = logging.getLogger(__name__)
 
 
-@org_task("backfill-poll-results", 60 * 60 * 3)
+def finalize_flow_results(job):
+    from .models import Poll
+
+    Poll.finalize_results_job(job)
+
+
+@chunked_task("poll-results", queue="sync", finalize=finalize_flow_results, name="polls.pull_flow_results")
+def pull_flow_results(job):
+    from .models import Poll
+
+    return Poll.pull_results_chunk(job)
+
+
+def finalize_org_archives(job):
+    from .models import Poll
+
+    Poll.finalize_archives_job(job)
+
+
+@chunked_task("poll-archives", queue="sync", finalize=finalize_org_archives, name="polls.pull_org_archives")
+def pull_org_archives(job):
+    from .models import Poll
+
+    return Poll.pull_archives_chunk(job)
+
+
+def get_results_job_log(job):
+    return {"job": job.id, "status": job.get_status_display(), "progress": job.progress}
+
+
+@org_task("backfill-poll-results", 60 * 10)
 def backfill_poll_results(org, since, until):
     from .models import Poll
 
@@ -36,54 +71,26 @@ def backfill_poll_results(org, since, until):
         .exclude(flow_uuid="")
         .distinct("flow_uuid")
     ):
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = Poll.pull_results(poll.id)
-        results_log["flow-%s" % poll.flow_uuid] = {
-            "num_val_created": num_val_created,
-            "num_val_updated": num_val_updated,
-            "num_val_ignored": num_val_ignored,
-            "num_path_created": num_path_created,
-            "num_path_updated": num_path_updated,
-            "num_path_ignored": num_path_ignored,
-        }
+        job = poll.start_pull_results_job()
+        results_log["flow-%s" % poll.flow_uuid] = get_results_job_log(job)
 
     return results_log
 
 
-@org_task("results-pull-main-poll", 60 * 60 * 2)
+@org_task("results-pull-main-poll", 60 * 10)
 def pull_results_main_poll(org, since, until):
     from .models import Poll
 
     results_log = dict()
     main_poll = Poll.get_main_poll(org)
     if main_poll:
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = Poll.pull_results(main_poll.id)
-        results_log["flow-%s" % main_poll.flow_uuid] = {
-            "num_val_created": num_val_created,
-            "num_val_updated": num_val_updated,
-            "num_val_ignored": num_val_ignored,
-            "num_path_created": num_path_created,
-            "num_path_updated": num_path_updated,
-            "num_path_ignored": num_path_ignored,
-        }
+        job = main_poll.start_pull_results_job()
+        results_log["flow-%s" % main_poll.flow_uuid] = get_results_job_log(job)
 
     return results_log
 
 
-@org_task("results-pull-other-polls", 60 * 60 * 24)
+@org_task("results-pull-other-polls", 60 * 10)
 def pull_results_other_polls(org, since, until):
     from .models import Poll
 
@@ -97,32 +104,13 @@ def pull_results_other_polls(org, since, until):
     for poll in other_polls:
         key = Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (org.id, poll.flow_uuid)
         if not cache.get(key):
-            try:
-                (
-                    num_val_created,
-                    num_val_updated,
-                    num_val_ignored,
-                    num_path_created,
-                    num_path_updated,
-                    num_path_ignored,
-                ) = Poll.pull_results(poll.id)
-
-                results_log["flow-%s" % poll.flow_uuid] = {
-                    "num_val_created": num_val_created,
-                    "num_val_updated": num_val_updated,
-                    "num_val_ignored": num_val_ignored,
-                    "num_path_created": num_path_created,
-                    "num_path_updated": num_path_updated,
-                    "num_path_ignored": num_path_ignored,
-                }
-
-            except TembaRateExceededError:
-                pass
+            job = poll.start_pull_results_job()
+            results_log["flow-%s" % poll.flow_uuid] = get_results_job_log(job)
 
     return results_log
 
 
-@org_task("results-pull-recent-polls", 60 * 60 * 6)
+@org_task("results-pull-recent-polls", 60 * 10)
 def pull_results_recent_polls(org, since, until):
     from .models import Poll
 
@@ -132,22 +120,8 @@ def pull_results_recent_polls(org, since, until):
 
     recent_polls = Poll.objects.filter(id__in=recent_polls_ids).order_by("-created_on")
     for poll in recent_polls:
-        (
-            num_val_created,
-            num_val_updated,
-            num_val_ignored,
-            num_path_created,
-            num_path_updated,
-            num_path_ignored,
-        ) = Poll.pull_results(poll.id)
-        results_log["flow-%s" % poll.flow_uuid] = {
-            "num_val_created": num_val_created,
-            "num_val_updated": num_val_updated,
-            "num_val_ignored": num_val_ignored,
-            "num_path_created": num_path_created,
-            "num_path_updated": num_path_updated,
-            "num_path_ignored": num_path_ignored,
-        }
+        job = poll.start_pull_results_job()
+        results_log["flow-%s" % poll.flow_uuid] = get_results_job_log(job)
 
     return results_log
 
@@ -170,9 +144,19 @@ def clear_old_poll_results(org, since, until):
         .exclude(stopped_syncing=True)
         .order_by("pk")
     )
+    archives_job = SyncJob.objects.filter(org=org, job_type=pull_org_archives.job_type, scope="").first()
+    archives_flows = set()
+    if archives_job and archives_job.is_in_flight():
+        archives_flows = set(archives_job.cursor.get("flows", dict()))
+    archives_flows.update(
+        flow_uuid.decode() if isinstance(flow_uuid, bytes) else flow_uuid
+        for flow_uuid in r.smembers(Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % org.pk)
+    )
+
     for poll in old_polls:
         key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (org.pk, poll.flow_uuid)
-        if r.get(key):
+        syncing_jobs = SyncJob.objects.filter(org=org, job_type=pull_flow_results.job_type, scope=poll.flow_uuid)
+        if r.get(key) or poll.flow_uuid in archives_flows or any(job.is_in_flight() for job in syncing_jobs):
             logger.info(
                 "Skipping clearing old results for poll #%d on org #%d as it is still syncing" % (poll.pk, org.pk)
             )
@@ -218,7 +202,9 @@ def update_or_create_questions(poll_ids):
 def pull_refresh(poll_id):
     from .models import Poll
 
-    Poll.pull_results(poll_id)
+    poll = Poll.objects.filter(id=poll_id).first()
+    if poll:
+        poll.start_pull_results_job()
 
 
 # acks late so an admin-triggered action interrupted by a worker stop is redelivered
@@ -236,7 +222,9 @@ def update_questions_results_cache(poll_id):
 def pull_refresh_from_archives(poll_id):
     from .models import Poll
 
-    Poll.pull_results_from_archives(poll_id)
+    poll = Poll.objects.filter(id=poll_id).first()
+    if poll:
+        poll.start_pull_archives_job()
 
 
 @app.task(name="polls.rebuild_counts")
@@ -254,15 +242,70 @@ def rebuild_counts():
         with r.lock(key, timeout=lock_timeout):
             start_time = time.time()
 
-            logger.info("Task: polls.rebuild_counts started")
-            polls = Poll.objects.filter(is_active=True)
+            units = Poll.get_rebuild_counts_units()
+            concurrency = getattr(settings, "POLL_REBUILD_COUNTS_CONCURRENCY", 4)
 
-            for poll in polls:
-                poll.rebuild_poll_results_counts()
+            logger.info(f"Task: polls.rebuild_counts started for {len(units)} flows with concurrency {concurrency}")
+
+            if concurrency > 1:
+                with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rebuild-counts") as executor:
+                    durations = list(executor.map(partial(_rebuild_flow_counts, close_connection=True), units))
+            else:
+                durations = [_rebuild_flow_counts(unit) for unit in units]
 
             elapsed = time.time() - start_time
 
-            logger.info(f"Task: polls.rebuild_counts finished in {elapsed:.1f} seconds")
+            summary = dict(
+                flows=len(durations),
+                failed=len([duration for duration in durations if duration["failed"]]),
+                elapsed=elapsed,
+                flows_elapsed=sum(duration["elapsed"] for duration in durations),
+                slowest=sorted(durations, key=lambda duration: duration["elapsed"], reverse=True)[:10],
+            )
+
+            logger.info(
+                f"Task: polls.rebuild_counts finished {summary['flows']} flows ({summary['failed']} failed) in "
+                f"{elapsed:.1f} seconds, {summary['flows_elapsed']:.1f} seconds of flow rebuilds"
+            )
+            for duration in summary["slowest"]:
+                logger.info(
+                    f"Task: polls.rebuild_counts flow {duration['flow']} on org #{duration['org_id']} "
+                    f"took {duration['elapsed']:.1f} seconds"
+                )
+
+            return summary
+
+
+def _rebuild_flow_counts(unit, close_connection=False):
+    """
+    Rebuilds the counts for one (org id, flow uuid, poll id) unit, the per flow lock is still taken by the poll rebuild
+    so a unit already being rebuilt elsewhere is skipped
+    """
+    from .models import Poll
+
+    org_id, flow_uuid, poll_id = unit
+    start_time = time.time()
+    failed = False
+
+    try:
+        poll = Poll.objects.filter(id=poll_id).first()
+        if poll:
+            poll.rebuild_poll_results_counts()
+
+            # a syncing poll only updates the caches of the syncing polls of the flow
+            if not poll.stopped_syncing:
+                poll.update_stopped_flow_polls_results_cache()
+    except Exception:
+        failed = True
+        logger.error(
+            "Error rebuilding counts for poll #%s on org #%s" % (poll_id, org_id), exc_info=True, extra={"stack": True}
+        )
+    finally:
+        # pool threads each open their own database connection
+        if close_connection:
+            connection.close()
+
+    return dict(org_id=org_id, flow=flow_uuid, poll_id=poll_id, elapsed=time.time() - start_time, failed=failed)
 
 
 @app.task(name="update_results_age_gender")
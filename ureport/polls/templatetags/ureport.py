@@ -8,6 +8,7 @@ from django.template import TemplateSyntaxError
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 
+from ureport.polls.models import PollQuestion
 from ureport.utils import UNICEF_REGIONS, get_linked_orgs
 
 register = template.Library()
@@ -20,12 +21,22 @@ def add_placeholder(field):
     return field
 
 
+def prefetch_question_results(question):
+    """
+    Fetches all the cached results of a question the view didn't prefetch at once, so the other results filters on the
+    same question don't hit the cache again
+    """
+    if not hasattr(question, "prefetched_results"):
+        PollQuestion.prefetch_results([question])
+
+
 @register.filter
 def question_results(question):
     if not question:
         return None
 
     try:
+        prefetch_question_results(question)
         results = question.get_results()
         if results:
             return results[0]
@@ -51,6 +62,7 @@ def question_segmented_results(question, field):
         segment = dict(gender="Gender")
 
     try:
+        prefetch_question_results(question)
         results = question.get_results(segment=segment)
         if results:
             return results
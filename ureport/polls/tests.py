@@ -2,14 +2,17 @@
 
 import uuid
 import zoneinfo
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone as tzone
 
-from mock import Mock, patch
-from temba_client.exceptions import TembaRateExceededError
+from django_valkey import get_valkey_connection
+from mock import MagicMock, Mock, patch
+from psycopg.errors import SerializationFailure
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.db import OperationalError
 from django.db.models import Count, ExpressionWrapper, F, IntegerField, Sum, TextField, Value
 from django.db.models.functions import Cast, ExtractYear
 from django.http import HttpRequest
@@ -21,12 +24,15 @@ from dash.categories.fields import CategoryChoiceField
 from dash.categories.models import Category, CategoryImage
 from dash.orgs.models import TaskState
 from dash.tags.models import Tag
+from ureport.backend import ChunkResult
 from ureport.flows.models import FlowResultCategory
 from ureport.locations.models import Boundary
 from ureport.polls.models import Poll, PollImage, PollQuestion, PollResponseCategory, PollResult
 from ureport.polls.tasks import (
     backfill_poll_results,
     fetch_old_sites_count,
+    pull_flow_results,
+    pull_org_archives,
     pull_refresh,
     pull_results_main_poll,
     pull_results_other_polls,
@@ -36,7 +42,7 @@ from ureport.polls.tasks import (
     update_or_create_questions,
     update_results_age_gender,
 )
-from ureport.polls.templatetags.ureport import question_segmented_results
+from ureport.polls.templatetags.ureport import question_results, question_segmented_results
 from ureport.stats.models import (
     AgeSegment,
     ContactActivity,
@@ -47,6 +53,8 @@ from ureport.stats.models import (
     PollStatsCounter,
     PollWordCloud,
 )
+from ureport.stats.tasks import stats_counts_squash
+from ureport.syncjobs.models import SyncJob
 from ureport.tests import MockTembaClient, TestBackend, UreportTest
 from ureport.utils import datetime_to_json_date, json_date_to_datetime
 
@@ -318,6 +326,70 @@ class PollTest(UreportTest):
         self.assertTrue(Poll.get_recent_polls(self.uganda))
         self.assertEqual(list(Poll.get_recent_polls(self.uganda)), list(reversed(polls[2:9])))
 
+    def test_get_sync_statuses(self):
+        poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin)
+        poll2 = self.create_poll(self.uganda, "Poll 2", "uuid-2", self.health_uganda, self.admin, has_synced=True)
+        poll3 = self.create_poll(self.uganda, "Poll 3", "uuid-3", self.health_uganda, self.admin)
+        Poll.objects.filter(pk=poll1.pk).update(runs_count=200)
+        poll1.refresh_from_db()
+
+        self.assertEqual(Poll.get_sync_statuses([]), dict())
+
+        results_job = SyncJob.get_or_create_job(self.uganda, "poll-results", "uuid-1")
+        archives_job = SyncJob.get_or_create_job(self.uganda, "poll-archives")
+        SyncJob.objects.filter(id=results_job.id).update(progress=dict(chunks=2, num_synced=30))
+        SyncJob.objects.filter(id=archives_job.id).update(
+            cursor=dict(flows={"uuid-1": dict(cursor=dict(), num_synced=15)}, finished={"uuid-4": dict(num_synced=5)}),
+            progress=dict(chunks=1, num_synced=20),
+        )
+
+        last_synced = datetime_to_json_date(timezone.now())
+        cache.set(Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (self.uganda.pk, "uuid-2"), last_synced, None)
+
+        # a run of the results job of the flow of poll 2 is in flight
+        SyncJob.get_or_create_job(self.uganda, "poll-results", "uuid-2").claim("worker-1")
+
+        # the jobs are the only query
+        with self.assertNumQueries(1):
+            statuses = Poll.get_sync_statuses([poll1, poll2, poll3])
+
+        self.assertEqual(
+            statuses,
+            {
+                poll1.id: dict(locked=False, last_synced=None, progress=22.5),
+                poll2.id: dict(locked=True, last_synced=last_synced, progress=None),
+                poll3.id: dict(locked=False, last_synced=None, progress=0.0),
+            },
+        )
+
+        # a run of the archives job of the org in flight locks the flows in its cursor
+        archives_job.claim("worker-1")
+
+        statuses = Poll.get_sync_statuses([poll1, poll2, poll3])
+        self.assertTrue(statuses[poll1.id]["locked"])
+        self.assertTrue(statuses[poll2.id]["locked"])
+        self.assertFalse(statuses[poll3.id]["locked"])
+
+    @patch("ureport.polls.models.Poll.get_main_poll")
+    def test_get_sync_priority(self, mock_get_main_poll):
+        poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin)
+        poll2 = self.create_poll(self.uganda, "Poll 2", "uuid-1", self.health_uganda, self.admin)
+        poll3 = self.create_poll(self.uganda, "Poll 3", "uuid-3", self.health_uganda, self.admin)
+        Poll.objects.filter(pk=poll3.pk).update(created_on=timezone.now() - timedelta(days=60))
+        poll3.refresh_from_db()
+
+        mock_get_main_poll.return_value = poll1
+
+        # the polls sharing the flow of the main poll share its priority
+        self.assertEqual(poll1.get_sync_priority(), "main-poll")
+        self.assertEqual(poll2.get_sync_priority(), "main-poll")
+        self.assertEqual(poll3.get_sync_priority(), "other-polls")
+
+        mock_get_main_poll.return_value = None
+
+        self.assertEqual(poll1.get_sync_priority(), "recent-polls")
+        self.assertEqual(poll3.get_sync_priority(), "other-polls")
+
     def test_get_flow(self):
         with patch("dash.orgs.models.Org.get_flows") as mock:
             mock.return_value = {"uuid-1": "Flow"}
@@ -839,6 +911,7 @@ class PollTest(UreportTest):
         self.assertTrue(poll1 in response.context["object_list"])
 
         self.assertContains(response, reverse("polls.poll_questions", args=[poll1.pk]))
+        self.assertContains(response, "Sync currently in progress... 0.0")
 
         poll1.has_synced = True
         poll1.save()
@@ -1222,68 +1295,6 @@ class PollTest(UreportTest):
 
         self.assertFalse(PollResult.objects.filter(org=self.nigeria, flow=poll.flow_uuid))
 
-    @patch("ureport.polls.tasks.pull_refresh_from_archives.apply_async")
-    @patch("ureport.polls.models.Poll.get_flow_date")
-    @patch("dash.orgs.models.Org.get_backend")
-    @patch("ureport.tests.TestBackend.pull_results")
-    def test_poll_pull_results(
-        self, mock_pull_results, mock_get_backend, mock_poll_flow_date, mock_pull_refresh_from_archives_task
-    ):
-        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
-        mock_pull_results.return_value = (1, 2, 3, 4, 5, 6)
-        mock_poll_flow_date.return_value = None
-
-        poll = self.create_poll(self.nigeria, "Poll 1", "flow-uuid", self.education_nigeria, self.admin)
-
-        self.assertFalse(poll.has_synced)
-        Poll.pull_results(poll.pk)
-
-        poll = Poll.objects.get(pk=poll.pk)
-        self.assertTrue(poll.has_synced)
-
-        mock_pull_refresh_from_archives_task.assert_called_once_with((poll.pk,), queue="sync")
-
-        self.assertEqual(mock_get_backend.call_args[1], {"backend_slug": "rapidpro"})
-        mock_pull_results.assert_called_once()
-
-    @patch("ureport.polls.tasks.pull_refresh_from_archives.apply_async")
-    @patch("ureport.polls.models.Poll.get_flow_date")
-    @patch("dash.orgs.models.Org.get_backend")
-    @patch("ureport.tests.TestBackend.pull_results")
-    def test_poll_pull_results_old_flows(
-        self, mock_pull_results, mock_get_backend, mock_poll_flow_date, mock_pull_refresh_from_archives_task
-    ):
-        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
-        mock_pull_results.return_value = (1, 2, 3, 4, 5, 6)
-
-        mock_poll_flow_date.return_value = datetime_to_json_date(timezone.now() - timedelta(days=88))
-        poll = self.create_poll(self.nigeria, "Poll 1", "flow-uuid", self.education_nigeria, self.admin)
-
-        self.assertFalse(poll.has_synced)
-        Poll.pull_results(poll.pk)
-
-        poll = Poll.objects.get(pk=poll.pk)
-        self.assertTrue(poll.has_synced)
-
-        self.assertFalse(mock_pull_refresh_from_archives_task.called)
-
-        poll.has_synced = False
-        poll.save()
-
-        mock_pull_results.reset_mock()
-        mock_poll_flow_date.return_value = datetime_to_json_date(timezone.now() - timedelta(days=91))
-
-        self.assertFalse(poll.has_synced)
-        Poll.pull_results(poll.pk)
-
-        poll = Poll.objects.get(pk=poll.pk)
-        self.assertTrue(poll.has_synced)
-
-        mock_pull_refresh_from_archives_task.assert_called_once_with((poll.pk,), queue="sync")
-
-        self.assertEqual(mock_get_backend.call_args[1], {"backend_slug": "rapidpro"})
-        mock_pull_results.assert_called_once()
-
 
 class PollQuestionTest(UreportTest):
     def setUp(self):
@@ -1530,6 +1541,69 @@ class PollQuestionTest(UreportTest):
         ]
         self.assertEqual(poll_question1.calculate_results(), calculated_results)
 
+    def test_poll_question_prefetch_results(self):
+        poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin, featured=True)
+        poll_question1 = self.create_poll_question(self.admin, poll1, "question 1", "uuid-101")
+        self.create_poll_response_category(poll_question1, "rule-uuid-1", "Yes")
+        self.create_poll_response_category(poll_question1, "rule-uuid-2", "No")
+
+        segments = PollQuestion.POLL_QUESTION_RESULTS_SEGMENTS
+        cache.delete_many(
+            [poll_question1.get_results_cache_key(segment) for segment in segments]
+            + [poll_question1.get_responded_cache_key(), poll_question1.get_polled_cache_key()]
+        )
+
+        stats = PollQuestion.get_results_cache_stats()
+        PollQuestion.prefetch_results([poll_question1])
+        self.assertEqual(stats["misses"] + 6, PollQuestion.get_results_cache_stats()["misses"])
+
+        # all the segments are written to the cache together
+        with patch("django.core.cache.cache.set_many") as mock_cache_set_many:
+            poll1.update_questions_results_cache()
+
+            self.assertEqual(1, mock_cache_set_many.call_count)
+            cache_values = mock_cache_set_many.call_args[0][0]
+            for segment in segments:
+                self.assertIn(poll_question1.get_results_cache_key(segment), cache_values)
+
+        poll1.update_questions_results_cache()
+        expected_results = [poll_question1.calculate_results(segment=segment) for segment in segments]
+        poll_question1.calculate_responded()
+        poll_question1.calculate_polled()
+
+        question = PollQuestion.objects.get(pk=poll_question1.pk)
+        stats = PollQuestion.get_results_cache_stats()
+        PollQuestion.prefetch_results([question])
+        self.assertEqual(stats["hits"] + 4, PollQuestion.get_results_cache_stats()["hits"])
+
+        # prefetched results are read without any cache call
+        with patch("django.core.cache.cache.get") as mock_cache_get:
+            self.assertEqual(expected_results, [question.get_results(segment=segment) for segment in segments])
+            self.assertEqual(0, question.get_responded())
+            self.assertEqual(0, question.get_polled())
+            self.assertFalse(mock_cache_get.called)
+
+        # the poll questions are prefetched with all their results in a single cache call
+        poll = Poll.objects.get(pk=poll1.pk)
+        with patch("django.core.cache.cache.get_many", wraps=cache.get_many) as mock_cache_get_many:
+            questions = poll.prefetch_questions_results()
+            self.assertEqual(1, mock_cache_get_many.call_count)
+
+        self.assertEqual([question], questions)
+        self.assertIs(questions[0], poll.get_questions()[0])
+        self.assertTrue(hasattr(poll.get_top_question(), "prefetched_results"))
+
+        # the template filters prefetch all the results of a question on their first call
+        question = PollQuestion.objects.get(pk=poll_question1.pk)
+        with patch("django.core.cache.cache.get_many", wraps=cache.get_many) as mock_cache_get_many:
+            with patch("django.core.cache.cache.get") as mock_cache_get:
+                self.assertEqual(expected_results[0][0], question_results(question))
+                self.assertEqual(expected_results[2] or None, question_segmented_results(question, "gender"))
+                self.assertEqual(expected_results[1] or None, question_segmented_results(question, "age"))
+                self.assertFalse(mock_cache_get.called)
+
+            self.assertEqual(1, mock_cache_get_many.call_count)
+
     def test_poll_question_calculate_results(self):
         poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin, featured=True)
 
@@ -2417,6 +2491,256 @@ class PollQuestionTest(UreportTest):
         self.assertEqual(11, PollStatsCounter.objects.all().count())
         self.assertEqual(poll_question1.calculate_results(segment=dict(age="Age")), calculated_results)
 
+        # every segment can be built from the counts fetched once for the question
+        with self.assertNumQueries(1):
+            results_counts = poll_question1.get_results_counts()
+
+        self.assertEqual(13, results_counts["age:25"][None])
+        self.assertEqual(8, results_counts["age:25"]["yes"])
+
+        for segment in (None, dict(age="Age"), dict(gender="gender"), dict(location="State")):
+            self.assertEqual(
+                poll_question1.calculate_results(segment=segment),
+                poll_question1.calculate_results(segment=segment, results_counts=results_counts),
+            )
+
+    def test_squash_bulk_poll_stats_counters(self):
+        poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin, featured=True)
+        poll_question1 = self.create_poll_question(self.admin, poll1, "question 1", "uuid-101")
+        yes_category = self.create_poll_response_category(poll_question1, "rule-uuid-1", "Yes")
+        no_category = self.create_poll_response_category(poll_question1, "rule-uuid-2", "No")
+
+        PollStatsCounter.objects.all().delete()
+
+        categories = [None, yes_category.flow_result_category, no_category.flow_result_category]
+        scopes = ["all", "gender:f", "gender:m", "age:20", "state:R3713501"]
+
+        # synthetic unsquashed rows, 3 rows for every set
+        expected = {}
+        for category in categories:
+            for scope in scopes:
+                for count in (1, 2, 3):
+                    PollStatsCounter.objects.create(
+                        org=self.uganda,
+                        flow_result=poll_question1.flow_result,
+                        flow_result_category=category,
+                        scope=scope,
+                        count=count,
+                    )
+                expected[(category.id if category else None, scope)] = 6
+
+        # a set which sums to zero should be removed entirely
+        for count in (4, -4):
+            PollStatsCounter.objects.create(
+                org=self.uganda,
+                flow_result=poll_question1.flow_result,
+                flow_result_category=no_category.flow_result_category,
+                scope="scheme:tel",
+                count=count,
+            )
+
+        self.assertEqual(47, PollStatsCounter.objects.all().count())
+        calculated_results = poll_question1.calculate_results(segment=dict(gender="gender"))
+
+        with patch.object(PollStatsCounter, "squash_batch_size", 4):
+            self.assertEqual(16, PollStatsCounter.squash_bulk())
+
+        self.assertEqual(15, PollStatsCounter.objects.all().count())
+        self.assertFalse(PollStatsCounter.objects.filter(is_squashed=False).exists())
+        self.assertEqual(
+            expected,
+            {
+                (c.flow_result_category_id, c.scope): c.count
+                for c in PollStatsCounter.objects.filter(flow_result=poll_question1.flow_result)
+            },
+        )
+        self.assertEqual(calculated_results, poll_question1.calculate_results(segment=dict(gender="gender")))
+
+        # new deltas are merged into the existing squashed rows
+        PollStatsCounter.objects.create(
+            org=self.uganda, flow_result=poll_question1.flow_result, flow_result_category=None, scope="all", count=5
+        )
+        self.assertEqual(1, PollStatsCounter.squash_bulk())
+        self.assertEqual(15, PollStatsCounter.objects.all().count())
+        self.assertEqual(11, PollStatsCounter.objects.get(flow_result_category=None, scope="all").count)
+
+        # nothing left to squash
+        self.assertEqual(0, PollStatsCounter.squash_bulk())
+
+        # max distinct is still respected across batches
+        for scope in scopes:
+            PollStatsCounter.objects.create(
+                org=self.uganda, flow_result=poll_question1.flow_result, flow_result_category=None, scope=scope, count=1
+            )
+
+        with (
+            patch.object(PollStatsCounter, "squash_batch_size", 2),
+            patch.object(PollStatsCounter, "squash_max_distinct", 3),
+        ):
+            self.assertEqual(3, PollStatsCounter.squash_bulk())
+
+        self.assertEqual(2, PollStatsCounter.objects.filter(is_squashed=False).count())
+
+        # per-set squash agrees with the bulk squash
+        PollStatsCounter.squash()
+        self.assertEqual(15, PollStatsCounter.objects.all().count())
+        self.assertEqual(12, PollStatsCounter.objects.get(flow_result_category=None, scope="all").count)
+
+        PollEngagementDailyCount.objects.all().delete()
+        day = timezone.now().date()
+        for is_responded in (None, True, False):
+            for count in (2, 3):
+                PollEngagementDailyCount.objects.create(
+                    org=self.uganda,
+                    flow_result=poll_question1.flow_result,
+                    is_responded=is_responded,
+                    scope="all",
+                    day=day,
+                    count=count,
+                )
+
+        self.assertEqual(3, PollEngagementDailyCount.squash_bulk())
+        self.assertEqual(
+            {None: 5, True: 5, False: 5},
+            {c.is_responded: c.count for c in PollEngagementDailyCount.objects.filter(is_squashed=True)},
+        )
+        self.assertEqual(3, PollEngagementDailyCount.objects.all().count())
+
+    def test_squash_during_rebuild_poll_results_counts(self):
+        poll1 = self.create_poll(self.uganda, "Poll 1", "uuid-1", self.health_uganda, self.admin)
+        poll_question1 = self.create_poll_question(self.admin, poll1, "question 1", "uuid-101")
+        self.create_poll_response_category(poll_question1, "rule-uuid-1", "Yes")
+        poll2 = self.create_poll(self.uganda, "Poll 2", "uuid-2", self.health_uganda, self.admin)
+        poll_question2 = self.create_poll_question(self.admin, poll2, "question 2", "uuid-201")
+
+        PollStatsCounter.objects.all().delete()
+
+        for question in (poll_question1, poll_question2):
+            for count in (1, 2):
+                PollStatsCounter.objects.create(
+                    org=self.uganda,
+                    flow_result=question.flow_result,
+                    flow_result_category=None,
+                    scope="all",
+                    count=count,
+                )
+
+        r = get_valkey_connection()
+        rebuild_key = Poll.POLL_REBUILD_COUNTS_LOCK % (self.uganda.pk, poll1.flow_uuid)
+        r.set(rebuild_key, "rebuilding", ex=60)
+        self.addCleanup(r.delete, rebuild_key)
+
+        self.assertEqual({poll_question1.flow_result_id}, Poll.get_rebuilding_flow_result_ids())
+
+        # the counters of the flow being rebuilt are left for a later squash
+        stats_counts_squash()
+
+        self.assertEqual(
+            [(False, 1), (False, 2)],
+            list(
+                PollStatsCounter.objects.filter(flow_result=poll_question1.flow_result)
+                .order_by("count")
+                .values_list("is_squashed", "count")
+            ),
+        )
+        self.assertEqual(
+            [(True, 3)],
+            list(
+                PollStatsCounter.objects.filter(flow_result=poll_question2.flow_result).values_list(
+                    "is_squashed", "count"
+                )
+            ),
+        )
+
+        r.delete(rebuild_key)
+        self.assertEqual(set(), Poll.get_rebuilding_flow_result_ids())
+
+        # a squash which started before the rebuild conflicts with its snapshot, the rebuild takes a new one
+        PollResult.objects.create(
+            org=self.uganda,
+            flow=poll1.flow_uuid,
+            ruleset=poll_question1.flow_result.result_uuid,
+            contact="contact-uuid",
+            category="Yes",
+            text="Yes",
+            completed=False,
+            date=timezone.now(),
+        )
+        conflict = OperationalError("could not serialize access due to concurrent delete")
+        conflict.__cause__ = SerializationFailure()
+        stats_dict = PollResult.generate_flow_poll_stats(self.uganda.pk, poll1.flow_uuid)
+
+        with (
+            patch("ureport.polls.models.connection", MagicMock(in_atomic_block=False)),
+            patch("ureport.polls.models.PollResult.generate_flow_poll_stats") as mock_generate_stats,
+        ):
+            mock_generate_stats.side_effect = [conflict, stats_dict]
+            poll1.rebuild_poll_results_counts()
+            self.assertEqual(2, mock_generate_stats.call_count)
+
+            mock_generate_stats.side_effect = [conflict] * Poll.POLL_REBUILD_COUNTS_ATTEMPTS
+            with self.assertRaises(OperationalError):
+                poll1.rebuild_poll_results_counts()
+
+        self.assertEqual([{"count": 1, "label": "Yes"}], poll_question1.calculate_results()[0]["categories"])
+        self.assertFalse(r.exists(rebuild_key))
+
+    def test_get_rebuild_counts_units(self):
+        poll1 = self.create_poll(self.nigeria, "Poll 1", "flow-uuid-1", self.education_nigeria, self.admin)
+        self.create_poll(self.nigeria, "Poll 2", "flow-uuid-2", self.education_nigeria, self.admin)
+        poll3 = self.create_poll(self.uganda, "Poll 3", "flow-uuid-1", self.health_uganda, self.admin)
+
+        # polls sharing the flow of a syncing poll are rebuilt through it
+        self.create_poll(self.nigeria, "Poll 4", "flow-uuid-2", self.education_nigeria, self.admin)
+        poll5 = self.create_poll(self.nigeria, "Poll 5", "flow-uuid-2", self.education_nigeria, self.admin)
+        poll5.stopped_syncing = True
+        poll5.save()
+
+        inactive_poll = self.create_poll(self.nigeria, "Poll 6", "flow-uuid-3", self.education_nigeria, self.admin)
+        inactive_poll.is_active = False
+        inactive_poll.save()
+
+        for i in range(3):
+            PollResult.objects.create(
+                org=self.nigeria, flow="flow-uuid-2", ruleset="ruleset-1", contact=f"contact-{i}", completed=False
+            )
+        PollResult.objects.create(
+            org=self.uganda, flow="flow-uuid-1", ruleset="ruleset-1", contact="contact-1", completed=False
+        )
+
+        units = Poll.get_rebuild_counts_units()
+        poll4 = Poll.objects.get(title="Poll 4")
+
+        self.assertEqual(
+            units,
+            [
+                (self.nigeria.id, "flow-uuid-2", poll4.id),
+                (self.uganda.id, "flow-uuid-1", poll3.id),
+                (self.nigeria.id, "flow-uuid-1", poll1.id),
+            ],
+        )
+        self.assertEqual(
+            Poll.get_rebuild_counts_units(org_id=self.uganda.id), [(self.uganda.id, "flow-uuid-1", poll3.id)]
+        )
+
+        with (
+            patch("ureport.polls.models.Poll.rebuild_poll_results_counts") as mock_rebuild_counts,
+            patch("ureport.polls.models.Poll.update_questions_results_cache") as mock_update_cache,
+        ):
+            mock_rebuild_counts.side_effect = [None, Exception("boom"), None]
+
+            summary = rebuild_counts()
+            self.assertEqual(mock_rebuild_counts.call_count, 3)
+
+            # the poll which stopped syncing on a flow rebuilt through a syncing poll still has its cache updated
+            mock_update_cache.assert_called_once_with()
+            self.assertEqual(summary["flows"], 3)
+            self.assertEqual(summary["failed"], 1)
+            self.assertEqual(
+                sorted((duration["org_id"], duration["flow"], duration["poll_id"]) for duration in summary["slowest"]),
+                sorted(units),
+            )
+
     def test_tasks(self):
         self.org = self.create_org("burundi", zoneinfo.ZoneInfo("Africa/Bujumbura"), self.admin)
 
@@ -2444,11 +2768,9 @@ class PollQuestionTest(UreportTest):
             recheck_poll_flow_data(self.org.pk)
             mock_update_poll_flow_data.assert_called_once_with(self.org)
 
-        with patch("ureport.polls.models.Poll.pull_results") as mock_pull_results:
-            mock_pull_results.return_value = "Pulled"
-
+        with patch("ureport.polls.models.Poll.start_pull_results_job") as mock_start_pull_results_job:
             pull_refresh(self.poll.pk)
-            mock_pull_results.assert_called_once_with(self.poll.pk)
+            mock_start_pull_results_job.assert_called_once_with()
 
         with patch("ureport.polls.models.Poll.rebuild_poll_results_counts") as mock_rebuild_counts:
             mock_rebuild_counts.return_value = "Rebuilt"
@@ -2724,6 +3046,8 @@ class PollResultsTest(UreportTest):
 
         verify_counts()
 
+        # each poll result inserts the activities of a single contact, so the statement triggers insert one counter
+        # row per (date, type, value) of that contact: 12 for contact-uuid and 60 for each of the 3 others
         self.assertEqual(192, ContactActivityCounter.objects.all().count())
         ContactActivityCounter.squash()
         self.assertEqual(96, ContactActivityCounter.objects.all().count())
@@ -2740,6 +3064,96 @@ class PollResultsTest(UreportTest):
         ContactActivity.recalculate_contact_activity_counts(self.nigeria)
         verify_counts()
 
+        # rebuilding in SQL gives the same counters as the python recalculation
+        python_counters = ContactActivity.recalculate_contact_activity_counts(self.nigeria)
+        ContactActivity.rebuild_contact_activity_counts(self.nigeria, batch_size=5)
+        verify_counts()
+
+        sql_counters = {
+            (elt["org_id"], elt["date"], elt["type"], elt["value"]): elt["count__sum"]
+            for elt in ContactActivityCounter.objects.filter(org=self.nigeria)
+            .values("org_id", "date", "type", "value")
+            .annotate(Sum("count"))
+        }
+        self.assertEqual(sql_counters, {(k[0], k[1], k[2], str(k[3])): v for k, v in python_counters.items()})
+
+        rebuild_job = SyncJob.objects.get(org=self.nigeria, job_type=ContactActivity.REBUILD_COUNTS_JOB_TYPE)
+        self.assertEqual(SyncJob.STATUS_COMPLETE, rebuild_job.status)
+        self.assertEqual({}, rebuild_job.cursor)
+        self.assertIsNone(rebuild_job.lease_owner)
+
+        # a rebuild interrupted while counting its third batch keeps the first two batches and their checkpoint only
+        activity_ids = list(
+            ContactActivity.objects.filter(org=self.nigeria).order_by("id").values_list("id", flat=True)
+        )
+        checkpoint = SyncJob.checkpoint
+        checkpoints = []
+
+        def interrupted_checkpoint(job, cursor=None, progress=None, lease_seconds=None):
+            # the first checkpoint is the one resetting the counters
+            if len(checkpoints) == 3:
+                raise Exception("worker lost")
+            checkpoints.append(cursor)
+            return checkpoint(job, cursor=cursor, progress=progress, lease_seconds=lease_seconds)
+
+        with patch.object(SyncJob, "checkpoint", autospec=True, side_effect=interrupted_checkpoint):
+            with self.assertRaises(Exception):
+                ContactActivity.rebuild_contact_activity_counts(self.nigeria, batch_size=5)
+
+        self.assertEqual([dict(last_id=0), dict(last_id=activity_ids[4]), dict(last_id=activity_ids[9])], checkpoints)
+
+        rebuild_job.refresh_from_db()
+        self.assertEqual(SyncJob.STATUS_FAILED, rebuild_job.status)
+        self.assertEqual(dict(last_id=activity_ids[9]), rebuild_job.cursor)
+
+        # the counters of the batch being counted were rolled back with its checkpoint
+        self.assertEqual(
+            ContactActivity.objects.filter(org=self.nigeria, id__lte=activity_ids[9]).count(),
+            ContactActivityCounter.objects.filter(org=self.nigeria, type=ContactActivityCounter.TYPE_ALL).aggregate(
+                total=Sum("count")
+            )["total"],
+        )
+
+        # the next rebuild resumes after the last activity checkpointed, without counting any batch twice
+        ContactActivity.rebuild_contact_activity_counts(self.nigeria, batch_size=5)
+        verify_counts()
+
+        rebuild_job.refresh_from_db()
+        self.assertEqual(SyncJob.STATUS_COMPLETE, rebuild_job.status)
+        self.assertEqual({}, rebuild_job.cursor)
+
+    def test_rebuild_contact_activity_counts_edge_values(self):
+        ContactActivity.objects.filter(org=self.nigeria).delete()
+        ContactActivityCounter.objects.filter(org=self.nigeria).delete()
+
+        date = self.now.date().replace(day=1)
+        for contact, born, gender, state, scheme in (
+            ("contact-1", 0, "", "", ""),
+            ("contact-2", None, None, None, None),
+            ("contact-3", 1990, "F", "R-LAGOS", "tel"),
+            ("contact-4", 0, "M", "", "facebook"),
+        ):
+            ContactActivity.objects.create(
+                org=self.nigeria, contact=contact, born=born, gender=gender, state=state, scheme=scheme, date=date
+            )
+
+        def get_counters():
+            return {
+                (elt["date"], elt["type"], elt["value"]): elt["count__sum"]
+                for elt in ContactActivityCounter.objects.filter(org=self.nigeria)
+                .values("date", "type", "value")
+                .annotate(Sum("count"))
+            }
+
+        # the rebuild counts zero and empty values like the triggers do
+        trigger_counters = get_counters()
+        self.assertEqual(2, trigger_counters[(date, "B", str(date.year))])
+        self.assertEqual(1, trigger_counters[(date, "G", "")])
+        self.assertEqual(2, trigger_counters[(date, "L", "")])
+
+        ContactActivity.rebuild_contact_activity_counts(self.nigeria)
+        self.assertEqual(trigger_counters, get_counters())
+
     def test_contact_activity(self):
         self.assertFalse(ContactActivity.objects.filter(org=self.nigeria, contact="contact-uuid"))
         self.assertFalse(ContactActivityCounter.objects.filter(org=self.nigeria))
@@ -3001,6 +3415,38 @@ class PollResultsTest(UreportTest):
             [(self.nigeria.id, self.poll_question.flow_result.result_uuid, "", "", "", "", "", "", "", None)],
         )
 
+        for category, text, gender in (
+            ("YES", "Yeah", "M"),
+            ("yes", None, "m"),
+            ("Other", "Hmm", "F"),
+            ("", "Hi", None),
+        ):
+            PollResult.objects.create(
+                org=self.nigeria,
+                flow=self.poll.flow_uuid,
+                ruleset=self.poll_question.flow_result.result_uuid,
+                contact="contact-uuid",
+                category=category,
+                text=text,
+                completed=True,
+                born=2000,
+                gender=gender,
+                date=self.now - timedelta(hours=3),
+                state="r-lagos",
+            )
+
+        # grouping in the database gives the same stats as summing the stats of every result
+        expected_stats = defaultdict(int)
+        for result in PollResult.objects.filter(org=self.nigeria, flow=self.poll.flow_uuid):
+            for key, count in result.generate_poll_stats().items():
+                expected_stats[key] += count
+
+        flow_stats = PollResult.generate_flow_poll_stats(self.nigeria.id, self.poll.flow_uuid)
+        self.assertEqual(dict(expected_stats), dict(flow_stats))
+        self.assertEqual(
+            PollResult.objects.filter(org=self.nigeria, flow=self.poll.flow_uuid).count(), sum(flow_stats.values())
+        )
+
     def test_poll_results_stats(self):
         nigeria_boundary = Boundary.objects.create(
             org=self.nigeria,
@@ -3128,6 +3574,51 @@ class PollResultsTest(UreportTest):
             [{"count": 1, "label": "Yes"}, {"count": 0, "label": "No"}],
         )
 
+        district_segment = dict(location="District", parent="R-LAGOS")
+        ward_segment = dict(location="Ward", parent="R-OYO")
+
+        # no map levels configured, nothing to build
+        cache_values = dict()
+        self.assertEqual(self.poll_question.build_map_results(cache_values=cache_values), dict())
+        self.assertEqual(cache_values, dict())
+
+        self.nigeria.set_config("rapidpro.district_label", "LGA")
+
+        cache_values = dict()
+        self.assertEqual(set(self.poll_question.build_map_results(cache_values=cache_values)), {"district"})
+        self.assertEqual(
+            cache_values,
+            {
+                self.poll_question.get_results_cache_key(district_segment): {
+                    "results": self.poll_question.calculate_results(segment=district_segment)
+                }
+            },
+        )
+
+        self.nigeria.set_config("rapidpro.ward_label", "Ward")
+
+        cache_values = dict()
+        with patch("ureport.polls.models.PollQuestion.calculate_results") as mock_calculate_results:
+            timings = self.poll_question.build_map_results(cache_values=cache_values)
+            self.assertFalse(mock_calculate_results.called)
+
+        self.assertEqual(set(timings), {"district", "ward"})
+        self.assertEqual(
+            cache_values,
+            {
+                self.poll_question.get_results_cache_key(segment): {
+                    "results": self.poll_question.calculate_results(segment=segment)
+                }
+                for segment in (district_segment, ward_segment)
+            },
+        )
+
+        self.poll.update_poll_participation_maps_cache()
+        self.assertEqual(
+            self.poll_question.get_results(segment=ward_segment),
+            self.poll_question.calculate_results(segment=ward_segment),
+        )
+
 
 class PollsTasksTest(UreportTest):
     def setUp(self):
@@ -3147,104 +3638,305 @@ class PollsTasksTest(UreportTest):
         self.create_poll(self.nigeria, "Poll 4", "", self.education_nigeria, self.admin, has_synced=False)
         self.create_poll(self.nigeria, "Poll 5", "", self.education_nigeria, self.admin, has_synced=True)
 
-    @patch("ureport.polls.models.Poll.get_flow_date")
-    @patch("dash.orgs.models.Org.get_backend")
-    @patch("ureport.tests.TestBackend.pull_results")
+    def get_results_job(self, poll):
+        return SyncJob.objects.get(org=poll.org, job_type="poll-results", scope=poll.flow_uuid)
+
+    @patch("ureport.polls.tasks.pull_flow_results.delay")
     @patch("ureport.polls.models.Poll.get_main_poll")
-    def test_pull_results_main_poll(self, mock_get_main_poll, mock_pull_results, mock_get_backend, mock_get_flow_date):
-        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
+    def test_pull_results_main_poll(self, mock_get_main_poll, mock_pull_flow_results):
         mock_get_main_poll.return_value = self.poll
-        mock_pull_results.return_value = (1, 2, 3, 4, 5, 6)
-        mock_get_flow_date.return_value = None
 
         pull_results_main_poll(self.nigeria.pk)
 
+        job = self.get_results_job(self.poll)
+        mock_pull_flow_results.assert_called_once_with(job.id)
+
         task_state = TaskState.objects.get(org=self.nigeria, task_key="results-pull-main-poll")
         self.assertEqual(
             task_state.get_last_results()["flow-%s" % self.poll.flow_uuid],
-            {
-                "num_val_created": 1,
-                "num_val_updated": 2,
-                "num_val_ignored": 3,
-                "num_path_created": 4,
-                "num_path_updated": 5,
-                "num_path_ignored": 6,
-            },
+            {"job": job.id, "status": "Pending", "progress": {}},
         )
 
-    @patch("ureport.polls.models.Poll.get_flow_date")
-    @patch("dash.orgs.models.Org.get_backend")
-    @patch("django.core.cache.cache.get")
-    @patch("ureport.tests.TestBackend.pull_results")
+        # a run in flight isn't triggered again
+        job.claim("worker-1")
+        job.release_lease()
+        mock_pull_flow_results.reset_mock()
+
+        pull_results_main_poll(self.nigeria.pk)
+        self.assertFalse(mock_pull_flow_results.called)
+
+        task_state = TaskState.objects.get(org=self.nigeria, task_key="results-pull-main-poll")
+        self.assertEqual(
+            task_state.get_last_results()["flow-%s" % self.poll.flow_uuid],
+            {"job": job.id, "status": "Running", "progress": {}},
+        )
+
+    @patch("ureport.polls.tasks.pull_flow_results.delay")
     @patch("ureport.polls.models.Poll.get_other_polls")
-    def test_pull_results_other_polls(
-        self, mock_get_other_polls, mock_pull_results, mock_cache_get, mock_get_backend, mock_get_flow_date
-    ):
-        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
+    def test_pull_results_other_polls(self, mock_get_other_polls, mock_pull_flow_results):
         mock_get_other_polls.return_value = self.polls_query
-        mock_pull_results.return_value = (1, 2, 3, 4, 5, 6)
-        mock_cache_get.return_value = None
-        mock_get_flow_date.return_value = None
 
         self.poll.created_on = timezone.now() - timedelta(days=8)
         self.poll.save()
 
         pull_results_other_polls(self.nigeria.pk)
 
+        job = self.get_results_job(self.poll)
+        mock_pull_flow_results.assert_called_once_with(job.id)
+
         task_state = TaskState.objects.get(org=self.nigeria, task_key="results-pull-other-polls")
         self.assertEqual(
-            task_state.get_last_results()["flow-%s" % self.poll.flow_uuid],
-            {
-                "num_val_created": 1,
-                "num_val_updated": 2,
-                "num_val_ignored": 3,
-                "num_path_created": 4,
-                "num_path_updated": 5,
-                "num_path_ignored": 6,
-            },
+            task_state.get_last_results(),
+            {"flow-%s" % self.poll.flow_uuid: {"job": job.id, "status": "Pending", "progress": {}}},
         )
 
-        mock_pull_results.assert_called_once()
-
-        mock_pull_results.reset_mock()
-        mock_pull_results.side_effect = [TembaRateExceededError(3)]
+        # polls synced recently are left for later
+        self.poll.mark_results_sync_completed("2026-01-01T00:00:00.000Z")
+        mock_pull_flow_results.reset_mock()
 
         pull_results_other_polls(self.nigeria.pk)
 
         task_state = TaskState.objects.get(org=self.nigeria, task_key="results-pull-other-polls")
         self.assertEqual(task_state.get_last_results(), {})
-        mock_pull_results.assert_called_once()
-
-    @patch("ureport.polls.models.Poll.get_flow_date")
-    @patch("dash.orgs.models.Org.get_backend")
-    @patch("ureport.tests.TestBackend.pull_results")
-    def test_backfill_poll_results(self, mock_pull_results, mock_get_backend, mock_get_flow_date):
-        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
-        mock_pull_results.return_value = (1, 2, 3, 4, 5, 6)
-        mock_get_flow_date.return_value = None
+        self.assertFalse(mock_pull_flow_results.called)
 
+    @patch("ureport.polls.tasks.pull_flow_results.delay")
+    def test_backfill_poll_results(self, mock_pull_flow_results):
         self.poll.has_synced = True
         self.poll.save()
 
         backfill_poll_results(self.nigeria.pk)
-        self.assertFalse(mock_pull_results.called)
+        self.assertFalse(mock_pull_flow_results.called)
 
         self.poll.has_synced = False
         self.poll.save()
 
         backfill_poll_results(self.nigeria.pk)
 
+        job = self.get_results_job(self.poll)
+        mock_pull_flow_results.assert_called_once_with(job.id)
+
         task_state = TaskState.objects.get(org=self.nigeria, task_key="backfill-poll-results")
         self.assertEqual(
             task_state.get_last_results()["flow-%s" % self.poll.flow_uuid],
+            {"job": job.id, "status": "Pending", "progress": {}},
+        )
+
+    @patch("ureport.polls.tasks.pull_org_archives.delay")
+    @patch("ureport.polls.models.Poll.rebuild_poll_results_counts")
+    @patch("ureport.polls.models.Poll.get_flow_date")
+    @patch("dash.orgs.models.Org.get_backend")
+    @patch("ureport.tests.TestBackend.get_rate_budget", return_value=None)
+    @patch("ureport.tests.TestBackend.pull_results_chunk")
+    def test_pull_flow_results(
+        self,
+        mock_pull_results_chunk,
+        mock_get_rate_budget,
+        mock_get_backend,
+        mock_get_flow_date,
+        mock_rebuild_counts,
+        mock_pull_archives,
+    ):
+        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
+        mock_get_flow_date.return_value = datetime_to_json_date(timezone.now() - timedelta(days=7))
+        mock_pull_results_chunk.side_effect = [
+            ChunkResult(counts=dict(num_val_created=2, num_synced=2), cursor={"after": "t1", "resume": "p2"}),
+            ChunkResult(counts=dict(num_synced=1), cursor={"after": "t1", "resume": "p3"}, rate_limited=True),
+            ChunkResult(counts=dict(num_val_updated=1, num_synced=1), cursor={"after": "t2"}, done=True),
+        ]
+
+        # the pulls before sync jobs left their position in the cache
+        cache.set(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, self.poll.flow_uuid), "t0", None)
+
+        job = SyncJob.get_or_create_job(self.nigeria, "poll-results", self.poll.flow_uuid)
+
+        with patch.object(pull_flow_results, "apply_async") as mock_continue:
+            pull_flow_results(job.id)
+            mock_continue.assert_called_once_with((job.id,), queue="sync", countdown=None)
+
+            pull_flow_results(job.id)
+            mock_continue.assert_called_with((job.id,), queue="sync", countdown=TestBackend.RATE_LIMIT_BACKOFF)
+
+            self.assertFalse(mock_rebuild_counts.called)
+
+            pull_flow_results(job.id)
+            self.assertEqual(mock_continue.call_count, 2)
+
+        # the results are pulled through the most recent poll of the flow still syncing
+        self.assertEqual(
+            [call.args for call in mock_pull_results_chunk.call_args_list],
+            [
+                (self.poll_same_flow, {"after": "t0"}),
+                (self.poll_same_flow, {"after": "t1", "resume": "p2"}),
+                (self.poll_same_flow, {"after": "t1", "resume": "p3"}),
+            ],
+        )
+
+        # recent flows have no archives
+        self.assertFalse(mock_pull_archives.called)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.STATUS_COMPLETE)
+        self.assertEqual(job.cursor, {"after": "t2"})
+        self.assertEqual(
+            job.progress, {"chunks": 3, "num_val_created": 2, "num_val_updated": 1, "num_synced": 4, "rebuild": 2}
+        )
+
+        # the counts of the first sync are rebuilt once, when the run completes
+        mock_rebuild_counts.assert_called_once_with()
+        self.assertEqual(Poll.objects.filter(org=self.nigeria, flow_uuid="uuid-1", has_synced=False).count(), 0)
+        self.assertEqual(
+            cache.get(Poll.POLL_RESULTS_LAST_PULL_CACHE_KEY % (self.nigeria.pk, self.poll.flow_uuid)), "t2"
+        )
+        self.assertTrue(
+            cache.get(Poll.POLL_RESULTS_LAST_OTHER_POLLS_SYNCED_CACHE_KEY % (self.nigeria.pk, self.poll.flow_uuid))
+        )
+
+        # a run without changes doesn't rebuild the counts
+        mock_rebuild_counts.reset_mock()
+        mock_pull_results_chunk.side_effect = [
+            ChunkResult(counts=dict(num_synced=0), cursor={"after": "t2"}, done=True)
+        ]
+
+        pull_flow_results(job.id)
+
+        mock_pull_results_chunk.assert_called_with(
+            self.poll_same_flow, {"after": "t2"}, page_budget=None, incremental_counts=False
+        )
+        self.assertFalse(mock_rebuild_counts.called)
+
+        # a run of a synced flow adds the counters deltas instead of rebuilding the counts
+        mock_pull_results_chunk.side_effect = [
+            ChunkResult(counts=dict(num_val_created=1, num_synced=1), cursor={"after": "t3"}, done=True)
+        ]
+
+        with patch("ureport.tests.TestBackend.supports_incremental_results_counts", True):
+            with patch("ureport.polls.models.Poll.update_flow_polls_results_cache") as mock_update_cache:
+                pull_flow_results(job.id)
+                mock_update_cache.assert_called_once_with()
+
+        mock_pull_results_chunk.assert_called_with(
+            self.poll_same_flow, {"after": "t2"}, page_budget=None, incremental_counts=True
+        )
+        self.assertFalse(mock_rebuild_counts.called)
+
+        # a pull refresh restarts from scratch, with the archived results
+        cache.set(Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (self.nigeria.pk, self.poll.pk), "t3", None)
+        mock_pull_results_chunk.side_effect = [
+            ChunkResult(counts=dict(num_synced=0), cursor={"after": "t4"}, done=True)
+        ]
+
+        with patch("ureport.polls.models.Poll.delete_poll_results") as mock_delete_poll_results:
+            pull_flow_results(job.id)
+            mock_delete_poll_results.assert_called_once_with()
+
+        mock_pull_results_chunk.assert_called_with(self.poll_same_flow, {}, page_budget=None, incremental_counts=False)
+        self.addCleanup(get_valkey_connection().delete, Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % self.nigeria.pk)
+        mock_pull_archives.assert_called_once_with(
+            SyncJob.objects.get(org=self.nigeria, job_type="poll-archives", scope="").id
+        )
+        self.assertEqual(
+            get_valkey_connection().smembers(Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % self.nigeria.pk),
+            {self.poll.flow_uuid.encode()},
+        )
+        self.assertIsNone(cache.get(Poll.POLL_PULL_ALL_RESULTS_AFTER_DELETE_FLAG % (self.nigeria.pk, self.poll.pk)))
+
+        # and rebuilds the counts of the deleted results
+        mock_rebuild_counts.assert_called_once_with()
+
+    @patch("ureport.polls.models.Poll.rebuild_poll_results_counts")
+    @patch("dash.orgs.models.Org.get_backend")
+    @patch("ureport.tests.TestBackend.get_rate_budget", return_value=None)
+    @patch("ureport.tests.TestBackend.pull_results_from_archives_fanout_chunk")
+    def test_pull_org_archives(
+        self, mock_pull_archives_chunk, mock_get_rate_budget, mock_get_backend, mock_rebuild_counts
+    ):
+        mock_get_backend.return_value = TestBackend(self.rapidpro_backend)
+        other_poll = self.create_poll(self.nigeria, "Poll 2", "uuid-2", self.education_nigeria, self.admin)
+
+        queued_key = Poll.POLL_PULL_ARCHIVES_FLOWS_KEY % self.nigeria.pk
+        self.addCleanup(get_valkey_connection().delete, queued_key)
+
+        with patch.object(pull_org_archives, "delay") as mock_start:
+            job = self.poll.start_pull_archives_job()
+            mock_start.assert_called_once_with(job.id)
+
+        # one job pulls the archives of all the flows of the org
+        self.assertEqual((job.job_type, job.scope), ("poll-archives", ""))
+
+        mock_pull_archives_chunk.side_effect = [
+            {
+                self.poll_same_flow.id: ChunkResult(
+                    counts=dict(num_val_created=2, num_synced=2), cursor={"before": "2026-02-01", "seen": ["a"]}
+                )
+            },
+            {
+                self.poll_same_flow.id: ChunkResult(
+                    counts=dict(num_val_created=1, num_synced=1),
+                    cursor={"before": "2026-01-01", "seen": ["b"]},
+                    done=True,
+                ),
+                other_poll.id: ChunkResult(
+                    counts=dict(num_synced=3), cursor={"before": "2026-01-01", "seen": ["b"]}, done=True
+                ),
+            },
+        ]
+
+        with patch.object(pull_org_archives, "apply_async") as mock_continue:
+            pull_org_archives(job.id)
+            mock_continue.assert_called_once_with((job.id,), queue="sync", countdown=None)
+
+            # a flow queued while the job runs joins the run in flight
+            with patch.object(pull_org_archives, "delay") as mock_start:
+                other_poll.start_pull_archives_job()
+                self.assertFalse(mock_start.called)
+
+            pull_org_archives(job.id)
+            self.assertEqual(mock_continue.call_count, 1)
+
+        # each chunk makes a single pass over the archives for all the flows
+        self.assertEqual(
+            [call.args[:2] for call in mock_pull_archives_chunk.call_args_list],
+            [
+                ([self.poll_same_flow], {self.poll_same_flow.id: {}}),
+                (
+                    [self.poll_same_flow, other_poll],
+                    {self.poll_same_flow.id: {"before": "2026-02-01", "seen": ["a"]}, other_poll.id: {}},
+                ),
+            ],
+        )
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.STATUS_COMPLETE)
+        self.assertEqual(job.progress, {"chunks": 2, "num_val_created": 3, "num_synced": 6})
+        self.assertEqual(
+            job.cursor,
             {
-                "num_val_created": 1,
-                "num_val_updated": 2,
-                "num_val_ignored": 3,
-                "num_path_created": 4,
-                "num_path_updated": 5,
-                "num_path_ignored": 6,
+                "flows": {},
+                "finished": {
+                    "uuid-1": {"cursor": {"before": "2026-01-01", "seen": ["b"]}, "num_synced": 3, "rebuild": 1},
+                    "uuid-2": {"cursor": {"before": "2026-01-01", "seen": ["b"]}, "num_synced": 3},
+                },
             },
         )
+        self.assertFalse(get_valkey_connection().exists(queued_key))
+
+        # only the flow with changed results has its counts rebuilt, both are synced
+        mock_rebuild_counts.assert_called_once_with()
+        self.assertFalse(Poll.objects.filter(flow_uuid__in=("uuid-1", "uuid-2"), has_synced=False).exists())
+
+        # a new run goes through all the archives again
+        mock_pull_archives_chunk.side_effect = [
+            {self.poll_same_flow.id: ChunkResult(cursor={"before": "2026-02-01"}, done=True)}
+        ]
+
+        with patch.object(pull_org_archives, "delay"):
+            self.poll.start_pull_archives_job()
+
+        pull_org_archives(job.id)
+        self.assertEqual(
+            mock_pull_archives_chunk.call_args.args[:2], ([self.poll_same_flow], {self.poll_same_flow.id: {}})
+        )
 
-        mock_pull_results.assert_called_once()
+        # the archive files of a chunk are bounded by the backend, not by the API requests granted
+        self.assertEqual(mock_pull_archives_chunk.call_args.kwargs, {})
@@ -4,12 +4,10 @@ import ast
 import re
 from datetime import timedelta
 
-from django_valkey import get_valkey_connection
-
 from django import forms
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_image_file_extension
+from django.db.models import Count, Q
 from django.db.models.functions import Lower
 from django.forms import ModelForm
 from django.http import HttpResponseRedirect
@@ -637,7 +635,7 @@ class PollCRUDL(SmartCRUDL):
             if not self.request.user.is_superuser:
                 queryset = queryset.filter(is_active=True)
 
-            return queryset
+            return queryset.annotate(questions_count=Count("questions", filter=Q(questions__is_active=True)))
 
         def get_context_data(self, **kwargs):
             context = super(PollCRUDL.List, self).get_context_data(**kwargs)
@@ -653,16 +651,19 @@ class PollCRUDL(SmartCRUDL):
             context["other_polls"] = Poll.get_other_polls(org)
             context["recent_polls"] = Poll.get_recent_polls(org)
 
+            # the sync statuses of the whole page, rather than a few lookups per row
+            self.sync_statuses = Poll.get_sync_statuses(context["object_list"])
+
             return context
 
         def get_sync_status(self, obj):
+            sync_status = self.sync_statuses[obj.id]
+
             if obj.has_synced:
-                r = get_valkey_connection()
-                key = Poll.POLL_PULL_RESULTS_TASK_LOCK % (obj.org.pk, obj.flow_uuid)
-                if r.get(key):
+                if sync_status["locked"]:
                     return _("Scheduled Sync currently in progress...")
 
-                last_synced = cache.get(Poll.POLL_RESULTS_LAST_SYNC_TIME_CACHE_KEY % (obj.org.pk, obj.flow_uuid), None)
+                last_synced = sync_status["last_synced"]
                 if last_synced:
                     return _(
                         "Last results synced %(time)s ago" % dict(time=timesince(json_date_to_datetime(last_synced)))
@@ -671,11 +672,10 @@ class PollCRUDL(SmartCRUDL):
                 # we know we synced do not check the the progress since that is slow
                 return _("Synced")
 
-            sync_progress = obj.get_sync_progress()
-            return _("Sync currently in progress... %.1f" % sync_progress)
+            return _("Sync currently in progress... %.1f" % sync_status["progress"])
 
         def get_questions(self, obj):
-            return obj.get_questions().count()
+            return obj.questions_count
 
         def get_images(self, obj):
             return obj.get_images().count()
@@ -52,13 +52,8 @@ urlpatterns = [
         {},
         "public.pollquestion_results",
     ),
-    re_path(r"^boundaries/$", cache_page(60 * 30)(BoundaryView.as_view()), {}, "public.boundaries"),
-    re_path(
-        r"^boundaries/(?P<osm_id>[\.a-zA-Z0-9_-]+)/$",
-        cache_page(60 * 30)(BoundaryView.as_view()),
-        {},
-        "public.boundaries",
-    ),
+    re_path(r"^boundaries/$", BoundaryView.as_view(), {}, "public.boundaries"),
+    re_path(r"^boundaries/(?P<osm_id>[\.a-zA-Z0-9_-]+)/$", BoundaryView.as_view(), {}, "public.boundaries"),
     re_path(r"^engagement/$", UreportersView.as_view(), {}, "public.engagement"),
     re_path(r"^ureporters/$", RedirectView.as_view(pattern_name="public.engagement"), {}, "public.ureporters"),
     re_path(r"^engagement_data/$", csrf_exempt(EngagementDataView.as_view()), {}, "public.engagement_data"),
@@ -14,10 +14,12 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Prefetch, Q
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.urls import reverse
 from django.utils import timezone, translation
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import RedirectView
@@ -42,7 +44,6 @@ from ureport.utils import (
     get_global_count,
     get_shared_countries_number,
     get_shared_global_count,
-    get_shared_sites_count,
 )
 
 
@@ -79,11 +80,7 @@ class IndexView(SmartTemplateView):
         latest_poll = Poll.get_main_poll(org)
         context["latest_poll"] = latest_poll
 
-        cache_value = cache.get("shared_sites", None)
-        if not cache_value:
-            get_shared_sites_count()
-
-        # global counters
+        # global counters, read through the tiered cache which fetches the shared sites counts when they are missing
         context["global_contact_count"] = get_shared_global_count()
         context["global_org_count"] = get_shared_countries_number()
 
@@ -252,6 +249,9 @@ class PollContextMixin(object):
         context["latest_poll"] = main_poll
 
         if main_poll:
+            # the page shows the results of every question, read them all at once
+            main_poll.prefetch_questions_results()
+
             top_question = main_poll.get_top_question()
             context["top_question"] = top_question
 
@@ -627,40 +627,23 @@ class JobsView(RedirectConfigMixin, SmartTemplateView):
 
 class BoundaryView(RedirectConfigMixin, SmartTemplateView):
     def render_to_response(self, context, **kwargs):
-        org = self.request.org
+        geojson = Boundary.get_org_geojson(self.request.org, self.kwargs.get("osm_id", None))
 
-        if org.get_config("common.is_global"):
-            location_boundaries = org.boundaries.filter(level=0)
-            limit_states = org.get_config("common.limit_states")
-            if limit_states:
-                limit_states = [elt.strip() for elt in limit_states.split(",")]
-                location_boundaries = location_boundaries.filter(osm_id__in=limit_states)
+        # the gzipped and identity bodies are different representations, each with its own strong validator
+        gzipped = "gzip" in self.request.headers.get("Accept-Encoding", "")
+        etag = quote_etag(geojson["etag"] + "-gzip" if gzipped else geojson["etag"])
 
+        if etag in parse_etags(self.request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        elif gzipped:
+            response = HttpResponse(geojson["gzipped"], content_type="application/json")
+            response["Content-Encoding"] = "gzip"
         else:
-            osm_id = self.kwargs.get("osm_id", None)
-
-            org_boundaries = org.boundaries.all()
-
-            limit_states = org.get_config("common.limit_states")
-            if limit_states:
-                limit_states = [elt.strip() for elt in limit_states.split(",")]
-                org_boundaries = org_boundaries.filter(
-                    Q(level=1, name__in=limit_states)
-                    | Q(parent__name__in=limit_states, level=2)
-                    | Q(parent__parent__name__in=limit_states, level=3)
-                )
-
-            if osm_id:
-                location_boundaries = org_boundaries.filter(parent__osm_id=osm_id)
-            else:
-                location_boundaries = org_boundaries.filter(level=1)
-
-        boundaries = dict(
-            type="FeatureCollection",
-            features=[elt.as_geojson() for elt in location_boundaries if elt.geometry and json.loads(elt.geometry)],
-        )
+            response = HttpResponse(geojson["content"], content_type="application/json")
 
-        return HttpResponse(json.dumps(boundaries))
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
 
 
 class PollQuestionResultsView(RedirectConfigMixin, SmartReadView):
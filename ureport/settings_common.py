@@ -937,6 +937,10 @@ CELERY_TASK_TIME_LIMIT = 60 * 60 * 24
 
 CELERY_TIMEZONE = "UTC"
 
+# flows rebuilt at the same time by the nightly counts rebuild, tests run them inline as threads don't see the test
+# transaction
+POLL_REBUILD_COUNTS_CONCURRENCY = 1 if TESTING else 4
+
 CACHES = {
     "default": {
         "BACKEND": "django_valkey.cache.ValkeyCache",
@@ -947,6 +951,15 @@ CACHES = {
 if "test" in sys.argv:
     CACHES["default"]["LOCATION"] = "redis://127.0.0.1:6379/15"
 
+# seconds that hot values like the main poll or the reporters counts are kept in each process in front of the cache,
+# 0 disables the per-process tier
+TIERED_CACHE_TIMEOUT = 0 if TESTING else 30
+TIERED_CACHE_MAX_ENTRIES = 1000
+
+# API requests an hour the RapidPro pulls of each org backend share, drawn from by priority so backfills and contact
+# syncs can't starve the main poll
+RAPIDPRO_API_RATE_LIMIT = 2500
+
 # -----------------------------------------------------------------------------------
 # SMS Configs
 # -----------------------------------------------------------------------------------
@@ -1044,6 +1057,11 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(hour=22, minute=0),
         "args": ("ureport.stats.tasks.delete_old_contact_activities", "slow"),
     },
+    "delete-old-engagement-counts": {
+        "task": "dash.orgs.tasks.trigger_org_task",
+        "schedule": crontab(hour=22, minute=30),
+        "args": ("ureport.stats.tasks.delete_old_engagement_counts", "slow"),
+    },
     "rebuild-poll-results-count": {
         "task": "polls.rebuild_counts",
         "schedule": crontab(hour=4, minute=0),
@@ -1059,6 +1077,12 @@ CELERY_BEAT_SCHEDULE = {
         "relative": True,
         "options": {"queue": "slow"},
     },
+    "reporters_counts_squash": {
+        "task": "contacts.squash_reporters_counts",
+        "schedule": timedelta(minutes=10),
+        "relative": True,
+        "options": {"queue": "slow"},
+    },
     "stats_activities_squash": {
         "task": "stats.squash_contact_activities_counts",
         "schedule": timedelta(minutes=15),
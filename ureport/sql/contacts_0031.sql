@@ -0,0 +1,141 @@
+-----------------------------------------------------------------------------
+-- The reporters counter types of a contact
+-----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION
+  ureport_contact_counter_types(_gender VARCHAR, _born INT, _registered_on TIMESTAMP WITH TIME ZONE, _state VARCHAR, _district VARCHAR, _ward VARCHAR, _scheme VARCHAR)
+RETURNS SETOF VARCHAR AS $$
+  SELECT t."type"::VARCHAR FROM (
+    VALUES
+      ('total-reporters'),
+      (CASE WHEN _gender IS NOT NULL THEN CONCAT('gender:', LOWER(_gender)) END),
+      (CASE WHEN _born IS NOT NULL THEN CONCAT('born:', LOWER(CAST(_born AS VARCHAR ))) END),
+      (CASE WHEN _registered_on >= (NOW() - INTERVAL '400 days') THEN CONCAT('registered_on:', DATE(_registered_on)) END),
+      (CASE WHEN _registered_on >= (NOW() - INTERVAL '400 days') AND _gender IS NOT NULL THEN CONCAT('registered_gender:', DATE(date_trunc('day', _registered_on)::timestamp), ':', LOWER(_gender)) END),
+      (CASE WHEN _registered_on >= (NOW() - INTERVAL '400 days') AND _born IS NOT NULL THEN CONCAT('registered_born:', DATE(date_trunc('day', _registered_on)::timestamp), ':', LOWER(CAST(_born AS VARCHAR ))) END),
+      (CASE WHEN _registered_on >= (NOW() - INTERVAL '400 days') AND _state IS NOT NULL THEN CONCAT('registered_state:', DATE(date_trunc('day', _registered_on)::timestamp), ':', UPPER(_state)) END),
+      (CASE WHEN _registered_on >= (NOW() - INTERVAL '400 days') AND _scheme IS NOT NULL THEN CONCAT('registered_scheme:', DATE(date_trunc('day', _registered_on)::timestamp), ':', LOWER(_scheme)) END),
+      (CASE WHEN _state IS NOT NULL THEN CONCAT('state:', UPPER(_state)) END),
+      (CASE WHEN _district IS NOT NULL THEN CONCAT('district:', UPPER(_district)) END),
+      (CASE WHEN _ward IS NOT NULL THEN CONCAT('ward:', UPPER(_ward)) END),
+      (CASE WHEN _scheme IS NOT NULL THEN CONCAT('scheme:', LOWER(_scheme)) END)
+  ) AS t("type")
+  WHERE t."type" IS NOT NULL;
+$$ LANGUAGE sql STABLE;
+
+-----------------------------------------------------------------------------
+-- Updates our reporters counters, once per statement with the counts of all
+-- the rows changed summed by org and type
+-----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ureport_update_counters() RETURNS TRIGGER AS $$
+BEGIN
+  -- Contacts being created, increment counters for the new contacts
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO contacts_reporterscounter("org_id", "type", "count")
+    SELECT n."org_id", t."type", COUNT(*)
+    FROM newtab n
+    CROSS JOIN LATERAL ureport_contact_counter_types(n."gender", n."born", n."registered_on", n."state", n."district", n."ward", n."scheme") AS t("type")
+    WHERE n."org_id" IS NOT NULL
+    GROUP BY n."org_id", t."type";
+
+  -- Contacts being changed, adjust the counters
+  ELSIF TG_OP = 'UPDATE' THEN
+    INSERT INTO contacts_reporterscounter("org_id", "type", "count")
+    SELECT d."org_id", d."type", SUM(d."count")
+    FROM (
+      -- no org id, decrement all reporters counters for the previous values
+      SELECT o."org_id", t."type", -1 AS "count"
+      FROM oldtab o
+      JOIN newtab n ON n."id" = o."id"
+      CROSS JOIN LATERAL ureport_contact_counter_types(o."gender", o."born", o."registered_on", o."state", o."district", o."ward", o."scheme") AS t("type")
+      WHERE n."org_id" IS NULL AND o."org_id" IS NOT NULL
+
+      UNION ALL
+
+      -- activated or deactivated, increment or decrement all reporters counters for the previous values
+      SELECT o."org_id", t."type", CASE WHEN n."is_active" THEN 1 ELSE -1 END AS "count"
+      FROM oldtab o
+      JOIN newtab n ON n."id" = o."id"
+      CROSS JOIN LATERAL ureport_contact_counter_types(o."gender", o."born", o."registered_on", o."state", o."district", o."ward", o."scheme") AS t("type")
+      WHERE n."org_id" IS NOT NULL AND n."is_active" != o."is_active" AND o."org_id" IS NOT NULL
+
+      UNION ALL
+
+      -- same org, move the counts of the changed values
+      SELECT n."org_id", c."type", c."count"
+      FROM oldtab o
+      JOIN newtab n ON n."id" = o."id"
+      CROSS JOIN LATERAL (
+        SELECT n."registered_on" IS DISTINCT FROM o."registered_on" AND n."registered_on" >= (NOW() - INTERVAL '400 days') AS "registered"
+      ) f
+      CROSS JOIN LATERAL (
+        VALUES
+          (n."gender" IS DISTINCT FROM o."gender", CONCAT('gender:', LOWER(o."gender")), -1),
+          (n."gender" IS DISTINCT FROM o."gender", CONCAT('gender:', LOWER(n."gender")), 1),
+          (n."born" IS DISTINCT FROM o."born", CONCAT('born:', LOWER(CAST(o."born" AS VARCHAR ))), -1),
+          (n."born" IS DISTINCT FROM o."born", CONCAT('born:', LOWER(CAST(n."born" AS VARCHAR ))), 1),
+          (f."registered", CONCAT('registered_on:', DATE(o."registered_on")), -1),
+          (f."registered", CONCAT('registered_on:', DATE(n."registered_on")), 1),
+          (f."registered" AND n."gender" IS DISTINCT FROM o."gender", CONCAT('registered_gender:', DATE(date_trunc('day', o."registered_on")::timestamp), ':', LOWER(o."gender")), -1),
+          (f."registered" AND n."gender" IS DISTINCT FROM o."gender", CONCAT('registered_gender:', DATE(date_trunc('day', n."registered_on")::timestamp), ':', LOWER(n."gender")), 1),
+          (f."registered" AND n."born" IS DISTINCT FROM o."born", CONCAT('registered_born:', DATE(date_trunc('day', o."registered_on")::timestamp), ':', LOWER(CAST(o."born" AS VARCHAR ))), -1),
+          (f."registered" AND n."born" IS DISTINCT FROM o."born", CONCAT('registered_born:', DATE(date_trunc('day', n."registered_on")::timestamp), ':', LOWER(CAST(n."born" AS VARCHAR ))), 1),
+          (f."registered" AND n."state" IS DISTINCT FROM o."state", CONCAT('registered_state:', DATE(date_trunc('day', o."registered_on")::timestamp), ':', UPPER(o."state")), -1),
+          (f."registered" AND n."state" IS DISTINCT FROM o."state", CONCAT('registered_state:', DATE(date_trunc('day', n."registered_on")::timestamp), ':', UPPER(n."state")), 1),
+          (f."registered" AND n."scheme" IS DISTINCT FROM o."scheme", CONCAT('registered_scheme:', DATE(date_trunc('day', o."registered_on")::timestamp), ':', LOWER(o."scheme")), -1),
+          (f."registered" AND n."scheme" IS DISTINCT FROM o."scheme", CONCAT('registered_scheme:', DATE(date_trunc('day', n."registered_on")::timestamp), ':', LOWER(n."scheme")), 1),
+          (n."state" IS DISTINCT FROM o."state", CONCAT('state:', UPPER(o."state")), -1),
+          (n."state" IS DISTINCT FROM o."state", CONCAT('state:', UPPER(n."state")), 1),
+          (n."district" IS DISTINCT FROM o."district", CONCAT('district:', UPPER(o."district")), -1),
+          (n."district" IS DISTINCT FROM o."district", CONCAT('district:', UPPER(n."district")), 1),
+          (n."ward" IS DISTINCT FROM o."ward", CONCAT('ward:', UPPER(o."ward")), -1),
+          (n."ward" IS DISTINCT FROM o."ward", CONCAT('ward:', UPPER(n."ward")), 1),
+          (n."scheme" IS DISTINCT FROM o."scheme", CONCAT('scheme:', LOWER(o."scheme")), -1),
+          (n."scheme" IS DISTINCT FROM o."scheme", CONCAT('scheme:', LOWER(n."scheme")), 1)
+      ) AS c("changed", "type", "count")
+      WHERE n."org_id" IS NOT NULL AND (n."is_active" != o."is_active") IS NOT TRUE AND n."org_id" = o."org_id" AND c."changed"
+    ) d
+    GROUP BY d."org_id", d."type"
+    HAVING SUM(d."count") != 0;
+
+  -- Contacts being deleted, decrement all reporters counters for their values
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO contacts_reporterscounter("org_id", "type", "count")
+    SELECT o."org_id", t."type", -COUNT(*)
+    FROM oldtab o
+    CROSS JOIN LATERAL ureport_contact_counter_types(o."gender", o."born", o."registered_on", o."state", o."district", o."ward", o."scheme") AS t("type")
+    WHERE o."org_id" IS NOT NULL
+    GROUP BY o."org_id", t."type";
+
+  -- Contacts table is being truncated
+  ELSIF TG_OP = 'TRUNCATE' THEN
+   -- Clear all counters
+   TRUNCATE contacts_reporterscounter;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Replace the row trigger by one statement trigger per operation, transition tables are only allowed on triggers
+-- for a single event
+DROP TRIGGER IF EXISTS ureport_when_contacts_insert_then_update_counters on contacts_contact;
+CREATE TRIGGER ureport_when_contacts_insert_then_update_counters
+  AFTER INSERT ON contacts_contact
+  REFERENCING NEW TABLE AS newtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_counters();
+
+DROP TRIGGER IF EXISTS ureport_when_contacts_update_then_update_counters on contacts_contact;
+CREATE TRIGGER ureport_when_contacts_update_then_update_counters
+  AFTER UPDATE ON contacts_contact
+  REFERENCING OLD TABLE AS oldtab NEW TABLE AS newtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_counters();
+
+DROP TRIGGER IF EXISTS ureport_when_contacts_delete_then_update_counters on contacts_contact;
+CREATE TRIGGER ureport_when_contacts_delete_then_update_counters
+  AFTER DELETE ON contacts_contact
+  REFERENCING OLD TABLE AS oldtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_counters();
+
+-- The row functions are no longer used
+DROP FUNCTION IF EXISTS ureport_adjust_counter_for_contact(contacts_contact, contacts_contact);
+DROP FUNCTION IF EXISTS ureport_increment_counter_for_contact(contacts_contact, BOOLEAN);
+DROP FUNCTION IF EXISTS ureport_insert_reporters_counter(INT, VARCHAR, INT);
@@ -0,0 +1,94 @@
+-----------------------------------------------------------------------------
+-- The activity counters (type, value) of a contact activity
+-----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION
+  ureport_activity_counter_values(_date DATE, _born INT, _gender VARCHAR, _state VARCHAR, _scheme VARCHAR)
+RETURNS TABLE("type" VARCHAR, "value" VARCHAR) AS $$
+  SELECT t."type"::VARCHAR, t."value"::VARCHAR FROM (
+    VALUES
+      ('A', ''),
+      ('B', CASE WHEN _born IS NOT NULL THEN (EXTRACT('year' FROM _date::date) - _born)::VARCHAR END),
+      ('G', _gender),
+      ('L', _state),
+      ('S', _scheme)
+  ) AS t("type", "value")
+  WHERE t."value" IS NOT NULL;
+$$ LANGUAGE sql IMMUTABLE;
+
+-----------------------------------------------------------------------------
+-- Updates our activity counters, once per statement with the counts of all
+-- the rows changed summed by org, date, type and value
+-----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION ureport_update_activity_counters() RETURNS TRIGGER AS $$
+BEGIN
+  -- Activities being created, increment activity counters for the new activities
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO stats_contactactivitycounter("org_id", "date", "type", "value", "count", "is_squashed")
+    SELECT n."org_id", n."date", c."type", c."value", COUNT(*), FALSE
+    FROM newtab n
+    CROSS JOIN LATERAL ureport_activity_counter_values(n."date", n."born", n."gender", n."state", n."scheme") AS c
+    WHERE n."org_id" IS NOT NULL
+    GROUP BY n."org_id", n."date", c."type", c."value";
+
+  -- Activities being changed, move the counts from the old to the new values
+  ELSIF TG_OP = 'UPDATE' THEN
+    INSERT INTO stats_contactactivitycounter("org_id", "date", "type", "value", "count", "is_squashed")
+    SELECT d."org_id", d."date", d."type", d."value", SUM(d."count"), FALSE
+    FROM (
+      SELECT n."org_id", n."date", c."type", c."value", 1 AS "count"
+      FROM newtab n
+      CROSS JOIN LATERAL ureport_activity_counter_values(n."date", n."born", n."gender", n."state", n."scheme") AS c
+      WHERE n."org_id" IS NOT NULL
+
+      UNION ALL
+
+      SELECT o."org_id", o."date", c."type", c."value", -1 AS "count"
+      FROM oldtab o
+      CROSS JOIN LATERAL ureport_activity_counter_values(o."date", o."born", o."gender", o."state", o."scheme") AS c
+      WHERE o."org_id" IS NOT NULL
+    ) d
+    GROUP BY d."org_id", d."date", d."type", d."value"
+    HAVING SUM(d."count") != 0;
+
+  -- Activities being deleted, decrement all activity counters for their values
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO stats_contactactivitycounter("org_id", "date", "type", "value", "count", "is_squashed")
+    SELECT o."org_id", o."date", c."type", c."value", -COUNT(*), FALSE
+    FROM oldtab o
+    CROSS JOIN LATERAL ureport_activity_counter_values(o."date", o."born", o."gender", o."state", o."scheme") AS c
+    WHERE o."org_id" IS NOT NULL
+    GROUP BY o."org_id", o."date", c."type", c."value";
+
+  -- Activities table is being truncated
+  ELSIF TG_OP = 'TRUNCATE' THEN
+   -- Clear all activity counters
+   TRUNCATE stats_contactactivitycounter;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Replace the row trigger by one statement trigger per operation, transition tables are only allowed on triggers
+-- for a single event
+DROP TRIGGER IF EXISTS ureport_when_activity_update_then_update_activity_counters on stats_contactactivity;
+
+DROP TRIGGER IF EXISTS ureport_when_activity_insert_then_update_activity_counters on stats_contactactivity;
+CREATE TRIGGER ureport_when_activity_insert_then_update_activity_counters
+  AFTER INSERT ON stats_contactactivity
+  REFERENCING NEW TABLE AS newtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_activity_counters();
+
+CREATE TRIGGER ureport_when_activity_update_then_update_activity_counters
+  AFTER UPDATE ON stats_contactactivity
+  REFERENCING OLD TABLE AS oldtab NEW TABLE AS newtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_activity_counters();
+
+DROP TRIGGER IF EXISTS ureport_when_activity_delete_then_update_activity_counters on stats_contactactivity;
+CREATE TRIGGER ureport_when_activity_delete_then_update_activity_counters
+  AFTER DELETE ON stats_contactactivity
+  REFERENCING OLD TABLE AS oldtab
+  FOR EACH STATEMENT EXECUTE PROCEDURE ureport_update_activity_counters();
+
+-- The row functions are no longer used
+DROP FUNCTION IF EXISTS ureport_increment_counter_for_activity(stats_contactactivity, BOOLEAN);
+DROP FUNCTION IF EXISTS ureport_insert_activity_counter(INT, DATE, VARCHAR, VARCHAR, INT);
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("flows", "0002_alter_flowresult_unique_together_and_more"),
+        ("orgs", "0033_rename_orgs_orgbac_org_id_607508_idx_orgs_orgbac_org_slug_idx_and_more"),
+        ("stats", "0033_backfill_poll_stats_counters_dedupes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="pollstatscounter",
+            name="stats_psc_org_flowresult_idx",
+        ),
+        migrations.AddIndex(
+            model_name="pollstatscounter",
+            index=models.Index(
+                fields=["org", "flow_result", "scope"],
+                include=("flow_result_category", "count"),
+                name="stats_psc_org_result_scope_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="pollengagementdailycount",
+            name="stats_pedc_org_date_idx",
+        ),
+        migrations.AddIndex(
+            model_name="pollengagementdailycount",
+            index=models.Index(
+                fields=["org", "day"],
+                include=("scope", "flow_result", "is_responded", "count"),
+                name="stats_pedc_org_day_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollengagementdailycount",
+            index=models.Index(
+                fields=["org", "scope", "day"],
+                include=("flow_result", "is_responded", "count"),
+                name="stats_pedc_org_scope_day_idx",
+            ),
+        ),
+    ]
@@ -1,12 +1,12 @@
 import logging
 import time
+import uuid
 from collections import defaultdict
 from datetime import timedelta
 
 from django.core.cache import cache
-from django.db import connection, models
-from django.db.models import IntegerField, JSONField, Q, Sum
-from django.db.models.functions import Cast
+from django.db import connection, models, transaction
+from django.db.models import JSONField, Q, Sum
 from django.utils import timezone, translation
 from django.utils.translation import gettext_lazy as _
 
@@ -14,8 +14,10 @@ from dash.orgs.models import Org
 from ureport.flows.models import FlowResult, FlowResultCategory
 from ureport.locations.models import Boundary
 from ureport.polls.models import Poll, PollQuestion, PollResponseCategory
+from ureport.syncjobs.models import SyncJob
 from ureport.utils.counts import BaseDailyCount, BaseScopedCount
 from ureport.utils.models import SquashableModel
+from ureport.utils.time_buckets import get_time_buckets
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,8 @@ class GenderSegment(models.Model):
 
 
 class AgeSegment(models.Model):
+    SEGMENT_NAMES = {0: "0-14", 15: "15-19", 20: "20-24", 25: "25-30", 31: "31-34", 35: "35+"}
+
     min_age = models.IntegerField(null=True)
     max_age = models.IntegerField(null=True)
 
@@ -223,8 +227,10 @@ class PollStatsCounter(BaseScopedCount):
 
     @classmethod
     def get_average_response_rate(cls, org):
+        from ureport.utils.tiered_cache import tiered_cache
+
         key = f"org:{org.id}:average_response_rate"
-        output_data = cache.get(key, None)
+        output_data = tiered_cache.get(key, None, family="average-response-rate")
         if output_data:
             return output_data["results"]
 
@@ -232,6 +238,8 @@ class PollStatsCounter(BaseScopedCount):
 
     @classmethod
     def calculate_average_response_rate(cls, org):
+        from ureport.utils.tiered_cache import tiered_cache
+
         key = f"org:{org.id}:average_response_rate"
 
         poll_ids = list(
@@ -260,13 +268,18 @@ class PollStatsCounter(BaseScopedCount):
             return 0
 
         percentage = responded * 100 / polled
-        cache.set(key, {"results": percentage}, None)
+        tiered_cache.set(key, {"results": percentage}, None)
 
         return percentage
 
     class Meta:
         indexes = [
-            models.Index(fields=["org", "flow_result"], name="stats_psc_org_flowresult_idx"),
+            # for results by scope, covering the counts
+            models.Index(
+                name="stats_psc_org_result_scope_idx",
+                fields=("org", "flow_result", "scope"),
+                include=("flow_result_category", "count"),
+            ),
             # for squashing task
             models.Index(
                 name="stats_psc_unsquashed",
@@ -303,9 +316,13 @@ class PollEngagementDailyCount(BaseDailyCount):
 
     is_responded = models.BooleanField(null=True)
 
+    @classmethod
+    def get_engagement_key(cls, org, metric, segment_slug, time_filter):
+        return f"org:{org.id}:metric:{metric}:segment:{segment_slug}:filter:{time_filter}"
+
     @classmethod
     def get_engagement_data(cls, org, metric, segment_slug, time_filter):
-        key = f"org:{org.id}:metric:{metric}:segment:{segment_slug}:filter:{time_filter}"
+        key = PollEngagementDailyCount.get_engagement_key(org, metric, segment_slug, time_filter)
         output_data = cache.get(key, None)
         if output_data:
             return output_data["results"]
@@ -314,162 +331,89 @@ class PollEngagementDailyCount(BaseDailyCount):
 
     @classmethod
     def refresh_engagement_data(cls, org, metric, segment_slug, time_filter):
-        key = f"org:{org.id}:metric:{metric}:segment:{segment_slug}:filter:{time_filter}"
+        key = PollEngagementDailyCount.get_engagement_key(org, metric, segment_slug, time_filter)
 
-        output_data = []
-        if metric == "opinion-responses":
-            if segment_slug == "all":
-                output_data = PollEngagementDailyCount.get_all_opinion_responses(org, time_filter)
-            if segment_slug == "age":
-                output_data = PollEngagementDailyCount.get_age_opinion_responses(org, time_filter)
-            if segment_slug == "gender":
-                output_data = PollEngagementDailyCount.get_gender_opinion_responses(org, time_filter)
-            if segment_slug == "location":
-                output_data = PollEngagementDailyCount.get_location_opinion_responses(org, time_filter)
-            if segment_slug == "scheme":
-                output_data = PollEngagementDailyCount.get_scheme_opinion_responses(org, time_filter)
-
-        if metric == "sign-up-rate":
-            if segment_slug == "all":
-                output_data = org.get_sign_up_rate(time_filter)
-            if segment_slug == "age":
-                output_data = org.get_sign_up_rate_age(time_filter)
-            if segment_slug == "gender":
-                output_data = org.get_sign_up_rate_gender(time_filter)
-            if segment_slug == "location":
-                output_data = org.get_sign_up_rate_location(time_filter)
-            if segment_slug == "scheme":
-                output_data = org.get_sign_up_rate_scheme(time_filter)
-
-        if metric == "response-rate":
-            if segment_slug == "all":
-                output_data = PollEngagementDailyCount.get_all_response_rate_series(org, time_filter)
-            if segment_slug == "age":
-                output_data = PollEngagementDailyCount.get_age_response_rate_series(org, time_filter)
-            if segment_slug == "gender":
-                output_data = PollEngagementDailyCount.get_gender_response_rate_series(org, time_filter)
-            if segment_slug == "location":
-                output_data = PollEngagementDailyCount.get_location_response_rate_series(org, time_filter)
-            if segment_slug == "scheme":
-                output_data = PollEngagementDailyCount.get_scheme_response_rate_series(org, time_filter)
-
-        if metric == "active-users":
-            if segment_slug == "all":
-                output_data = ContactActivity.get_activity(org, time_filter)
-            if segment_slug == "age":
-                output_data = ContactActivity.get_activity_age(org, time_filter)
-            if segment_slug == "gender":
-                output_data = ContactActivity.get_activity_gender(org, time_filter)
-            if segment_slug == "location":
-                output_data = ContactActivity.get_contact_activity_location(org, time_filter)
-            if segment_slug == "scheme":
-                output_data = ContactActivity.get_contact_activity_scheme(org, time_filter)
+        engagement_data = PollEngagementDailyCount.build_engagement_data(org, [metric], [segment_slug], [time_filter])
+        output_data = engagement_data[(metric, segment_slug, time_filter)]
 
         if output_data:
             cache.set(key, {"results": output_data}, None)
         return output_data
 
     @classmethod
-    def get_all_opinion_responses(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        translation.activate(org.language)
-
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        responses = (
-            PollEngagementDailyCount.objects.filter(
-                org=org, day__gte=start, scope="all", flow_result_id__in=flow_result_ids, is_responded=True
-            )
-            .values(date=Cast("day", output_field=models.DateTimeField()))
-            .annotate(Sum("count"))
-        )
-        return [
-            dict(
-                name=str(_("Opinion Responses")), data=PollEngagementDailyCount.get_counts_data(responses, time_filter)
-            )
-        ]
-
-    @classmethod
-    def get_gender_opinion_responses(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        org_gender_labels = org.get_gender_labels()
-
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
+    def refresh_org_engagement_data(cls, org, metrics=None):
+        """
+        Refreshes the cached engagement data of the metrics for every segment and time filter at once
+        """
+        metrics = metrics or list(PollEngagementDailyCount.DATA_METRICS.keys())
+        segments = list(PollEngagementDailyCount.DATA_SEGMENTS.keys())
+        time_filters = list(PollEngagementDailyCount.DATA_TIME_FILTERS.keys())
+
+        engagement_data = PollEngagementDailyCount.build_engagement_data(org, metrics, segments, time_filters)
+
+        cache.set_many(
+            {
+                PollEngagementDailyCount.get_engagement_key(org, *data_key): {"results": output_data}
+                for data_key, output_data in engagement_data.items()
+                if output_data
+            },
+            None,
         )
-
-        genders = GenderSegment.objects.all()
-        if not org.get_config("common.has_extra_gender"):
-            genders = genders.exclude(gender="O")
-
-        genders = genders.values("gender", "id")
-
-        output_data = []
-        for gender in genders:
-            responses = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"gender:{gender['gender'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            series = PollEngagementDailyCount.get_counts_data(responses, time_filter)
-            output_data.append(dict(name=org_gender_labels.get(gender["gender"]), data=series))
-        return output_data
+        return engagement_data
 
     @classmethod
-    def get_scheme_opinion_responses(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
+    def build_engagement_data(cls, org, metrics, segments, time_filters):
+        """
+        Builds the series of the metrics for the segments and time filters, keyed by (metric, segment, time filter).
+        The daily counts of each metric are read once and bucketed by time filter in memory.
+        """
         translation.activate(org.language)
 
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        schemes = SchemeSegment.objects.all().values("scheme", "id")
-        org_contacts_counts = org.get_org_contacts_counts()
-        org_schemes = [k[7:] for k, v in org_contacts_counts.items() if k.startswith("scheme:") if k[7:]]
-
-        output_data = []
-        for scheme in schemes:
-            if scheme["scheme"] not in org_schemes:
-                continue
-
-            responses = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"scheme:{scheme['scheme'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            series = PollEngagementDailyCount.get_counts_data(responses, time_filter)
-
-            name = SchemeSegment.SCHEME_DISPLAY.get(scheme["scheme"], scheme["scheme"].upper())
-            if not name:
-                continue
-            output_data.append(dict(name=name, data=series))
-        return output_data
+        engagement_data = dict()
+        daily_rows = None
+        daily_segment_series = dict()
+
+        for metric in metrics:
+            if metric in ("opinion-responses", "response-rate") and daily_rows is None:
+                daily_rows = PollEngagementDailyCount.get_daily_rows(org)
+
+            if metric == "active-users":
+                activity_rows = ContactActivity.get_activity_rows(org)
+
+            for segment_slug in segments:
+                if metric in ("opinion-responses", "response-rate"):
+                    if segment_slug not in daily_segment_series:
+                        daily_segment_series[segment_slug] = PollEngagementDailyCount.get_segment_series(
+                            org, segment_slug
+                        )
+                    segment_series = daily_segment_series[segment_slug]
+                if metric == "active-users":
+                    segment_series = ContactActivity.get_segment_series(org, segment_slug)
+
+                for time_filter in time_filters:
+                    output_data = []
+                    if metric == "opinion-responses":
+                        output_data = PollEngagementDailyCount.get_opinion_responses_series(
+                            daily_rows, segment_series, time_filter
+                        )
+                    if metric == "response-rate":
+                        output_data = PollEngagementDailyCount.get_response_rate_series(
+                            daily_rows, segment_series, time_filter
+                        )
+                    if metric == "sign-up-rate":
+                        output_data = PollEngagementDailyCount.get_sign_up_rate_series(org, segment_slug, time_filter)
+                    if metric == "active-users":
+                        output_data = ContactActivity.get_activity_series(activity_rows, segment_series, time_filter)
+
+                    engagement_data[(metric, segment_slug, time_filter)] = output_data
+
+        return engagement_data
 
     @classmethod
-    def get_location_opinion_responses(cls, org, time_filter):
+    def get_daily_rows(cls, org):
+        """
+        Gets the daily counts of the active poll questions for the last year, summed by scope, day and responded
+        """
         now = timezone.now()
         year_ago = now - timedelta(days=365)
         start = year_ago.replace(day=1)
@@ -478,338 +422,114 @@ class PollEngagementDailyCount(BaseDailyCount):
             PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
         )
 
-        top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
-        output_data = []
-        for osm_id, name in top_boundaries.items():
-            responses = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"state:{osm_id.upper()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            series = PollEngagementDailyCount.get_counts_data(responses, time_filter)
-            output_data.append(dict(name=name, osm_id=osm_id, data=series))
-        return output_data
-
-    @classmethod
-    def get_age_opinion_responses(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        ages = AgeSegment.objects.all().values("id", "min_age", "max_age")
-        output_data = []
-        for age in ages:
-            if age["min_age"] == 0:
-                data_key = "0-14"
-            elif age["min_age"] == 15:
-                data_key = "15-19"
-            elif age["min_age"] == 20:
-                data_key = "20-24"
-            elif age["min_age"] == 25:
-                data_key = "25-30"
-            elif age["min_age"] == 31:
-                data_key = "31-34"
-            elif age["min_age"] == 35:
-                data_key = "35+"
-
-            responses = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"age:{age['min_age']}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            series = PollEngagementDailyCount.get_counts_data(responses, time_filter)
-            output_data.append(dict(name=data_key, data=series))
-        return output_data
-
-    @classmethod
-    def get_counts_data(cls, stats_qs, time_filter):
-        from ureport.utils import get_time_filter_dates_map
-
-        dates_map = get_time_filter_dates_map(time_filter=time_filter)
-        keys = list(set(dates_map.values()))
-
-        responses_data_dict = defaultdict(int)
-        for elt in stats_qs:
-            key = dates_map.get(str(elt["date"].date()))
-            responses_data_dict[key] += elt["count__sum"]
-
-        data = dict()
-        for key in keys:
-            data[key] = responses_data_dict[key]
-
-        return data
-
-    @classmethod
-    def get_all_response_rate_series(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        translation.activate(org.language)
-
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        polled_stats = (
-            PollEngagementDailyCount.objects.filter(
-                org=org, day__gte=start, scope="all", flow_result_id__in=flow_result_ids
-            )
-            .values(date=Cast("day", output_field=models.DateTimeField()))
+        return list(
+            PollEngagementDailyCount.objects.filter(org=org, day__gte=start, flow_result_id__in=flow_result_ids)
+            .values("scope", "day", "is_responded")
             .annotate(Sum("count"))
         )
 
-        responded_stats = (
-            PollEngagementDailyCount.objects.filter(
-                org=org, day__gte=start, scope="all", flow_result_id__in=flow_result_ids, is_responded=True
-            )
-            .values(date=Cast("day", output_field=models.DateTimeField()))
-            .annotate(Sum("count"))
-        )
-
-        return [
-            dict(
-                name=str(_("Response Rate")),
-                data=PollEngagementDailyCount.get_response_rate_data(polled_stats, responded_stats, time_filter),
-            )
-        ]
-
     @classmethod
-    def get_location_response_rate_series(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
-        output_data = []
-        for osm_id, name in top_boundaries.items():
-            polled_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org, day__gte=start, scope=f"state:{osm_id.upper()}", flow_result_id__in=flow_result_ids
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            responded_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"state:{osm_id.upper()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            series = PollEngagementDailyCount.get_response_rate_data(polled_stats, responded_stats, time_filter)
-            output_data.append(dict(name=name, osm_id=osm_id, data=series))
-        return output_data
+    def get_segment_series(cls, org, segment_slug):
+        """
+        Gets the series of the segment as the scope of their daily counts and their series data without the data
+        """
+        if segment_slug == "gender":
+            org_gender_labels = org.get_gender_labels()
+
+            genders = GenderSegment.objects.all()
+            if not org.get_config("common.has_extra_gender"):
+                genders = genders.exclude(gender="O")
+
+            return [
+                (f"gender:{gender.lower()}", dict(name=org_gender_labels.get(gender)))
+                for gender in genders.values_list("gender", flat=True)
+            ]
+
+        if segment_slug == "age":
+            return [
+                (f"age:{min_age}", dict(name=AgeSegment.SEGMENT_NAMES.get(min_age)))
+                for min_age in AgeSegment.objects.all().values_list("min_age", flat=True)
+            ]
+
+        if segment_slug == "scheme":
+            org_schemes = org.get_org_contacts_counts_snapshot()["scheme"]
+
+            segment_series = []
+            for scheme in SchemeSegment.objects.all().values_list("scheme", flat=True):
+                name = SchemeSegment.SCHEME_DISPLAY.get(scheme, scheme.upper())
+                if scheme in org_schemes and name:
+                    segment_series.append((f"scheme:{scheme.lower()}", dict(name=name)))
+            return segment_series
+
+        if segment_slug == "location":
+            top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
+            return [
+                (f"state:{osm_id.upper()}", dict(name=name, osm_id=osm_id)) for osm_id, name in top_boundaries.items()
+            ]
+
+        return [("all", dict())]
 
     @classmethod
-    def get_scheme_response_rate_series(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
+    def get_opinion_responses_series(cls, daily_rows, segment_series, time_filter):
+        time_buckets = get_time_buckets(time_filter)
+        responded_counts = time_buckets.sum_series(
+            [row for row in daily_rows if row["is_responded"]], series_field="scope", date_field="day"
         )
 
-        schemes = SchemeSegment.objects.all().values("scheme", "id")
-        org_contacts_counts = org.get_org_contacts_counts()
-        org_schemes = [k[7:] for k, v in org_contacts_counts.items() if k.startswith("scheme:") if k[7:]]
-
         output_data = []
-        for scheme in schemes:
-            if scheme["scheme"] not in org_schemes:
-                continue
-
-            polled_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"scheme:{scheme['scheme'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            responded_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"scheme:{scheme['scheme'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            scheme_rate_series = PollEngagementDailyCount.get_response_rate_data(
-                polled_stats, responded_stats, time_filter
-            )
-
-            name = SchemeSegment.SCHEME_DISPLAY.get(scheme["scheme"], scheme["scheme"].upper())
-            if not name:
-                continue
-            output_data.append(dict(name=name, data=scheme_rate_series))
-
+        for scope, series in segment_series:
+            name = series.get("name") if scope != "all" else str(_("Opinion Responses"))
+            output_data.append(dict(series, name=name, data=time_buckets.to_data(responded_counts[scope])))
         return output_data
 
     @classmethod
-    def get_gender_response_rate_series(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
+    def get_response_rate_series(cls, daily_rows, segment_series, time_filter):
+        time_buckets = get_time_buckets(time_filter)
+        polled_counts = time_buckets.sum_series(daily_rows, series_field="scope", date_field="day")
+        responded_counts = time_buckets.sum_series(
+            [row for row in daily_rows if row["is_responded"]], series_field="scope", date_field="day"
         )
-        org_gender_labels = org.get_gender_labels()
-
-        genders = GenderSegment.objects.all()
-        if not org.get_config("common.has_extra_gender"):
-            genders = genders.exclude(gender="O")
-
-        genders = genders.values("gender", "id")
 
         output_data = []
-        for gender in genders:
-            polled_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"gender:{gender['gender'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            responded_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"gender:{gender['gender'].lower()}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            gender_rate_series = PollEngagementDailyCount.get_response_rate_data(
-                polled_stats, responded_stats, time_filter
-            )
-            output_data.append(dict(name=org_gender_labels.get(gender["gender"]), data=gender_rate_series))
-
+        for scope, series in segment_series:
+            name = series.get("name") if scope != "all" else str(_("Response Rate"))
+            rates = PollEngagementDailyCount.get_response_rates(polled_counts[scope], responded_counts[scope])
+            output_data.append(dict(series, name=name, data=time_buckets.to_data(rates)))
         return output_data
 
     @classmethod
-    def get_age_response_rate_series(cls, org, time_filter):
-        now = timezone.now()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1)
-        flow_result_ids = list(
-            PollQuestion.objects.filter(is_active=True, poll__org_id=org.id).values_list("flow_result_id", flat=True)
-        )
-
-        ages = AgeSegment.objects.all().values("id", "min_age", "max_age")
-        output_data = []
-        for age in ages:
-            if age["min_age"] == 0:
-                data_key = "0-14"
-            elif age["min_age"] == 15:
-                data_key = "15-19"
-            elif age["min_age"] == 20:
-                data_key = "20-24"
-            elif age["min_age"] == 25:
-                data_key = "25-30"
-            elif age["min_age"] == 31:
-                data_key = "31-34"
-            elif age["min_age"] == 35:
-                data_key = "35+"
-
-            polled_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org, day__gte=start, scope=f"age:{age['min_age']}", flow_result_id__in=flow_result_ids
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            responded_stats = (
-                PollEngagementDailyCount.objects.filter(
-                    org=org,
-                    day__gte=start,
-                    scope=f"age:{age['min_age']}",
-                    flow_result_id__in=flow_result_ids,
-                    is_responded=True,
-                )
-                .values(date=Cast("day", output_field=models.DateTimeField()))
-                .annotate(Sum("count"))
-            )
-
-            age_rate_series = PollEngagementDailyCount.get_response_rate_data(
-                polled_stats, responded_stats, time_filter
-            )
-            output_data.append(dict(name=data_key, data=age_rate_series))
-        return output_data
+    def get_response_rates(cls, polled_counts, responded_counts):
+        return [
+            round(responded * 100 / polled, 2) if polled and responded else 0
+            for polled, responded in zip(polled_counts, responded_counts)
+        ]
 
     @classmethod
-    def get_response_rate_data(cls, polled_qs, responded_qs, time_filter):
-        from ureport.utils import get_time_filter_dates_map
-
-        dates_map = get_time_filter_dates_map(time_filter=time_filter)
-        keys = list(set(dates_map.values()))
-
-        polled_data_dict = defaultdict(int)
-        for elt in polled_qs:
-            key = dates_map.get(str(elt["date"].date()))
-            polled_data_dict[key] += elt["count__sum"]
-
-        responded_data_dict = defaultdict(int)
-        for elt in responded_qs:
-            key = dates_map.get(str(elt["date"].date()))
-            responded_data_dict[key] += elt["count__sum"]
-
-        data = dict()
-        for key in keys:
-            responded = responded_data_dict.get(key)
-            polled = polled_data_dict.get(key)
-            if responded is None or polled is None or polled == 0:
-                rate = 0
-            else:
-                rate = round(responded * 100 / polled, 2)
-            data[key] = rate
-
-        return data
+    def get_sign_up_rate_series(cls, org, segment_slug, time_filter):
+        if segment_slug == "age":
+            return org.get_sign_up_rate_age(time_filter)
+        if segment_slug == "gender":
+            return org.get_sign_up_rate_gender(time_filter)
+        if segment_slug == "location":
+            return org.get_sign_up_rate_location(time_filter)
+        if segment_slug == "scheme":
+            return org.get_sign_up_rate_scheme(time_filter)
+        return org.get_sign_up_rate(time_filter)
 
     class Meta:
         indexes = [
             models.Index(fields=["org", "flow_result"], name="stats_pedc_org_flowresult_idx"),
-            models.Index(fields=["org", "day"], name="stats_pedc_org_date_idx"),
+            # for engagement series, covering the counts
+            models.Index(
+                name="stats_pedc_org_day_idx",
+                fields=("org", "day"),
+                include=("scope", "flow_result", "is_responded", "count"),
+            ),
+            models.Index(
+                name="stats_pedc_org_scope_day_idx",
+                fields=("org", "scope", "day"),
+                include=("flow_result", "is_responded", "count"),
+            ),
             # for squashing task
             models.Index(
                 name="stats_pedc_unsquashed",
@@ -917,168 +637,177 @@ class ContactActivity(models.Model):
 
         return counters_dict
 
-    @classmethod
-    def get_activity_data(cls, activities_qs, time_filter):
-        from ureport.utils import get_time_filter_dates_map
+    REBUILD_COUNTS_JOB_TYPE = "activity-counts-rebuild"
+    REBUILD_COUNTS_LEASE_SECONDS = 60 * 30
 
-        dates_map = get_time_filter_dates_map(time_filter=time_filter)
-        keys = list(set(dates_map.values()))
+    # the counters of an activity are those the statement triggers add for it, from the same SQL function
+    REBUILD_COUNTERS_SQL = """
+    INSERT INTO stats_contactactivitycounter ("org_id", "date", "type", "value", "count", "is_squashed")
+    SELECT a."org_id", a."date", c."type", c."value", COUNT(*), FALSE
+    FROM stats_contactactivity a
+    CROSS JOIN LATERAL ureport_activity_counter_values(a."date", a."born", a."gender", a."state", a."scheme") AS c
+    WHERE a."org_id" = %s AND a."id" > %s AND a."id" <= %s
+    GROUP BY a."org_id", a."date", c."type", c."value"
+    """
 
-        activity_data = defaultdict(int)
-        for elt in activities_qs:
-            key = dates_map.get(str(elt["date"]))
-            activity_data[key] += elt["count__sum"]
+    @classmethod
+    def rebuild_contact_activity_counts(cls, org, batch_size=100000):
+        """
+        Rebuilds the activity counters of the org in SQL, inserting the counters of each batch of activities with one
+        INSERT ... SELECT, the counters being squashed later. The rebuild runs as a sync job whose cursor, the last
+        activity id counted, is checkpointed in the same transaction as each batch, so an interrupted rebuild resumes
+        from the next batch without counting any batch twice.
+        """
+        start = time.time()
+        lease_seconds = ContactActivity.REBUILD_COUNTS_LEASE_SECONDS
+
+        job = SyncJob.get_or_create_job(org, ContactActivity.REBUILD_COUNTS_JOB_TYPE)
+        resuming = job.status in (SyncJob.STATUS_RUNNING, SyncJob.STATUS_FAILED) and "last_id" in job.cursor
+
+        job = job.claim(f"rebuild-activity-counts:{uuid.uuid4().hex[:8]}", lease_seconds)
+        if not job:
+            logger.info("Already rebuilding the contacts activities counters for org #%d" % org.id)
+            return
+
+        num_batches = 0
+        try:
+            if resuming:
+                last_id = job.cursor["last_id"]
+                logger.info(
+                    "Resuming the contacts activities counters rebuild for org #%d after #%d" % (org.id, last_id)
+                )
+            else:
+                last_id = 0
+                with transaction.atomic():
+                    ContactActivityCounter.objects.filter(org_id=org.id).delete()
+                    job.checkpoint(cursor=dict(last_id=last_id), lease_seconds=lease_seconds)
+
+            max_id = ContactActivity.objects.filter(org=org).aggregate(max_id=models.Max("id"))["max_id"] or 0
+
+            while last_id < max_id:
+                batch_ids = list(
+                    ContactActivity.objects.filter(org=org, id__gt=last_id, id__lte=max_id)
+                    .order_by("id")
+                    .values_list("id", flat=True)[batch_size - 1 : batch_size]
+                )
+                batch_last_id = batch_ids[0] if batch_ids else max_id
 
-        data = dict()
-        for key in keys:
-            data_key = key[:-2] + "01"
-            data[key] = activity_data[data_key]
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(ContactActivity.REBUILD_COUNTERS_SQL, [org.id, last_id, batch_last_id])
 
-        return dict(data)
+                    job.checkpoint(
+                        cursor=dict(last_id=batch_last_id),
+                        progress=job.add_progress(batches=1),
+                        lease_seconds=lease_seconds,
+                    )
 
-    @classmethod
-    def get_activity(cls, org, time_filter):
-        now = timezone.now()
-        today = now.date()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1).date()
-        translation.activate(org.language)
+                last_id = batch_last_id
+                num_batches += 1
 
-        activities = (
-            ContactActivityCounter.objects.filter(
-                org=org, type=ContactActivityCounter.TYPE_ALL, date__lte=today, date__gte=start
-            )
-            .values("date")
-            .annotate(Sum("count"))
-        )
-        return [dict(name=str(_("Active Users")), data=ContactActivity.get_activity_data(activities, time_filter))]
+            # the next run starts over
+            job.checkpoint(cursor=dict(), lease_seconds=lease_seconds)
+        except Exception as e:
+            job.record_failure(e)
+            raise
 
-    @classmethod
-    def get_activity_age(cls, org, time_filter):
-        now = timezone.now()
-        today = now.date()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1).date()
+        job.mark_complete()
+        job.release_lease()
 
-        ages = AgeSegment.objects.all().values("id", "min_age", "max_age")
-        output_data = []
-        for age in ages:
-            if age["min_age"] == 0:
-                data_key = "0-14"
-            elif age["min_age"] == 15:
-                data_key = "15-19"
-            elif age["min_age"] == 20:
-                data_key = "20-24"
-            elif age["min_age"] == 25:
-                data_key = "25-30"
-            elif age["min_age"] == 31:
-                data_key = "31-34"
-            elif age["min_age"] == 35:
-                data_key = "35+"
-
-            activities = (
-                ContactActivityCounter.objects.filter(
-                    org=org, type=ContactActivityCounter.TYPE_AGE, date__lte=today, date__gte=start
-                )
-                .annotate(age=Cast("value", output_field=IntegerField()))
-                .filter(age__gte=age["min_age"], age__lte=age["max_age"])
-                .values("date")
-                .annotate(Sum("count"))
-            )
-            series = ContactActivity.get_activity_data(activities, time_filter)
-            output_data.append(dict(name=data_key, data=series))
-        return output_data
+        logger.info(
+            "Finished rebuilding the contacts activities counters in SQL for org #%d in %ds, in %d batches"
+            % (org.id, time.time() - start, num_batches)
+        )
 
     @classmethod
-    def get_activity_gender(cls, org, time_filter):
+    def get_activity_rows(cls, org):
+        """
+        Gets the monthly activity counts for the last year, summed by type, value and month, with the (type, value)
+        of their series, ages being counted in the series of the min age of their age segment
+        """
         now = timezone.now()
         today = now.date()
         year_ago = now - timedelta(days=365)
         start = year_ago.replace(day=1).date()
-        org_gender_labels = org.get_gender_labels()
 
-        genders = GenderSegment.objects.all()
-        if not org.get_config("common.has_extra_gender"):
-            genders = genders.exclude(gender="O")
+        age_ranges = list(AgeSegment.objects.all().values_list("min_age", "max_age"))
 
-        genders = genders.values("gender", "id")
+        activity_rows = list(
+            ContactActivityCounter.objects.filter(org=org, date__lte=today, date__gte=start)
+            .values("type", "value", "date")
+            .annotate(Sum("count"))
+        )
 
-        output_data = []
-        for gender in genders:
-            activities = (
-                ContactActivityCounter.objects.filter(
-                    org=org,
-                    type=ContactActivityCounter.TYPE_GENDER,
-                    date__lte=today,
-                    date__gte=start,
-                    value__iexact=gender["gender"],
+        for row in activity_rows:
+            if row["type"] == ContactActivityCounter.TYPE_AGE:
+                age = int(row["value"])
+                row["series"] = next(
+                    ((row["type"], min_age) for min_age, max_age in age_ranges if min_age <= age <= max_age), None
                 )
-                .values("date")
-                .annotate(Sum("count"))
-            )
-            series = ContactActivity.get_activity_data(activities, time_filter)
-            output_data.append(dict(name=org_gender_labels.get(gender["gender"]), data=series))
+            else:
+                row["series"] = (row["type"], row["value"].lower())
 
-        return output_data
+        return activity_rows
 
     @classmethod
-    def get_contact_activity_location(cls, org, time_filter):
-        now = timezone.now()
-        today = now.date()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1).date()
-
-        top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
-        output_data = []
-        for osm_id, name in top_boundaries.items():
-            activities = (
-                ContactActivityCounter.objects.filter(
-                    org=org,
-                    type=ContactActivityCounter.TYPE_LOCATION,
-                    date__lte=today,
-                    date__gte=start,
-                    value__iexact=osm_id,
-                )
-                .values("date")
-                .annotate(Sum("count"))
-            )
-            series = ContactActivity.get_activity_data(activities, time_filter)
-            output_data.append(dict(name=name, osm_id=osm_id, data=series))
-        return output_data
+    def get_segment_series(cls, org, segment_slug):
+        """
+        Gets the series of the segment as the (type, value) of their activity counters and their series data without
+        the data, the age series being keyed by the min age of the age segment
+        """
+        if segment_slug == "gender":
+            org_gender_labels = org.get_gender_labels()
+
+            genders = GenderSegment.objects.all()
+            if not org.get_config("common.has_extra_gender"):
+                genders = genders.exclude(gender="O")
+
+            return [
+                ((ContactActivityCounter.TYPE_GENDER, gender.lower()), dict(name=org_gender_labels.get(gender)))
+                for gender in genders.values_list("gender", flat=True)
+            ]
+
+        if segment_slug == "age":
+            return [
+                ((ContactActivityCounter.TYPE_AGE, min_age), dict(name=AgeSegment.SEGMENT_NAMES.get(min_age)))
+                for min_age in AgeSegment.objects.all().values_list("min_age", flat=True)
+            ]
+
+        if segment_slug == "scheme":
+            segment_series = []
+            for scheme in org.get_org_contacts_counts_snapshot()["scheme"]:
+                name = SchemeSegment.SCHEME_DISPLAY.get(scheme, scheme.upper())
+                if name:
+                    segment_series.append(((ContactActivityCounter.TYPE_SCHEME, scheme.lower()), dict(name=name)))
+            return segment_series
+
+        if segment_slug == "location":
+            top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
+            return [
+                ((ContactActivityCounter.TYPE_LOCATION, osm_id.lower()), dict(name=name, osm_id=osm_id))
+                for osm_id, name in top_boundaries.items()
+            ]
+
+        return [((ContactActivityCounter.TYPE_ALL, ""), dict())]
 
     @classmethod
-    def get_contact_activity_scheme(cls, org, time_filter):
-        now = timezone.now()
-        today = now.date()
-        year_ago = now - timedelta(days=365)
-        start = year_ago.replace(day=1).date()
-
-        org_contacts_counts = org.get_org_contacts_counts()
-        schemes = [k[7:] for k, v in org_contacts_counts.items() if k.startswith("scheme:") if k[7:]]
+    def get_activity_series(cls, activity_rows, segment_series, time_filter):
+        time_buckets = get_time_buckets(time_filter)
+        activity_counts = time_buckets.sum_series(activity_rows, series_field="series")
 
         output_data = []
-        for scheme in schemes:
-            activities = (
-                ContactActivityCounter.objects.filter(
-                    org=org,
-                    type=ContactActivityCounter.TYPE_SCHEME,
-                    date__lte=today,
-                    date__gte=start,
-                    value__iexact=scheme,
-                )
-                .values("date")
-                .annotate(Sum("count"))
-            )
-            series = ContactActivity.get_activity_data(activities, time_filter)
-
-            name = SchemeSegment.SCHEME_DISPLAY.get(scheme, scheme.upper())
-            if not name:
-                continue
-
-            output_data.append(dict(name=name, data=series))
-
+        for series_key, series in segment_series:
+            name = series.get("name") if series_key[0] != ContactActivityCounter.TYPE_ALL else str(_("Active Users"))
+            data = ContactActivity.get_activity_data(time_buckets, activity_counts[series_key])
+            output_data.append(dict(series, name=name, data=data))
         return output_data
 
+    @classmethod
+    def get_activity_data(cls, time_buckets, activity_counts):
+        # activities are counted by month, every period reports the count of the period starting its month
+        month_counts = {key: count for key, count in zip(time_buckets.keys, activity_counts) if key.endswith("-01")}
+        return {key: month_counts.get(key[:-2] + "01", 0) for key in time_buckets.keys}
+
 
 class ContactActivityCounter(SquashableModel):
     TYPE_ALL = "A"
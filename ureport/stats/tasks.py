@@ -20,17 +20,8 @@ def refresh_engagement_data(org, since, until):
 
     start = time.time()
 
-    time_filters = list(PollEngagementDailyCount.DATA_TIME_FILTERS.keys())
-    segments = list(PollEngagementDailyCount.DATA_SEGMENTS.keys())
-    metrics = list(PollEngagementDailyCount.DATA_METRICS.keys())
-
-    for time_filter in time_filters:
-        for segment in segments:
-            for metric in metrics:
-                PollEngagementDailyCount.refresh_engagement_data(org, metric, segment, time_filter)
-                logger.info(
-                    f"Task: refresh_engagement_data org {org.id} in progress for {time.time() - start}s, for time_filter - {time_filter}, segment - {segment}, metric - {metric}"
-                )
+    PollEngagementDailyCount.refresh_org_engagement_data(org)
+    logger.info(f"Task: refresh_engagement_data org {org.id} refreshed engagement data in {time.time() - start}s")
 
     PollStatsCounter.calculate_average_response_rate(org)
 
@@ -68,6 +59,34 @@ def delete_old_contact_activities(org, since, until):
     )
 
 
+@org_task("delete-old-engagement-counts", 60 * 60 * 1)
+def delete_old_engagement_counts(org, since, until):
+    from .models import PollEngagementDailyCount
+
+    start_time = time.time()
+    engagement_since = (timezone.now() - timedelta(days=400)).date()
+
+    # engagement counts are only kept for the last 400 days, the day range the counts are built for
+    old_engagement_counts_ids = (
+        PollEngagementDailyCount.objects.filter(org=org, day__lt=engagement_since)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    org_count = 0
+
+    for batch in chunk_list(old_engagement_counts_ids, 1000):
+        batch_ids = list(batch)
+        deleted, _ = PollEngagementDailyCount.objects.filter(id__in=batch_ids).delete()
+
+        org_count += deleted
+
+    elapsed = time.time() - start_time
+    logger.info(
+        f"Task: Finished deleting {org_count} old engagement counts before {engagement_since} on org #{org.id} in {elapsed:.1f} seconds"
+    )
+
+
 @app.task(name="stats.squash_contact_activities_counts")
 def squash_contact_activities_counts():
     from .models import ContactActivityCounter
@@ -88,27 +107,16 @@ def squash_contact_activities_counts():
 def rebuild_contacts_activities_counts():
     from .models import ContactActivity, PollEngagementDailyCount
 
-    time_filters = list(PollEngagementDailyCount.DATA_TIME_FILTERS.keys())
-    segments = list(PollEngagementDailyCount.DATA_SEGMENTS.keys())
-    metric = "active-users"
-
     orgs = Org.objects.filter(is_active=True)
     for org in orgs:
         start_rebuild = time.time()
 
-        ContactActivity.recalculate_contact_activity_counts(org)
+        ContactActivity.rebuild_contact_activity_counts(org)
         logger.info(
             f"Task: rebuild_contacts_activities_counts finished recalculating contact activity counts for org {org.id} in {time.time() - start_rebuild}s"
         )
 
-        start_refresh = time.time()
-
-        for time_filter in time_filters:
-            for segment in segments:
-                PollEngagementDailyCount.refresh_engagement_data(org, metric, segment, time_filter)
-                logger.info(
-                    f"Task: rebuild_contacts_activities_counts refreshing contacts activities engagement stats for org {org.id} in progress for {time.time() - start_refresh}s, for time_filter - {time_filter}, segment - {segment}, metric - {metric}"
-                )
+        PollEngagementDailyCount.refresh_org_engagement_data(org, metrics=["active-users"])
         logger.info(
             f"Task: rebuild_contacts_activities_counts finished recalculating contact activity and refreshing contacts activities engagement stats for org {org.id} in {time.time() - start_rebuild}s"
         )
@@ -116,6 +124,7 @@ def rebuild_contacts_activities_counts():
 
 @app.task(name="stats.stats_counts_squash")
 def stats_counts_squash():
+    from ureport.polls.models import Poll
     from ureport.stats.models import PollEngagementDailyCount, PollStatsCounter
 
     r = get_valkey_connection()
@@ -127,5 +136,8 @@ def stats_counts_squash():
         logger.info("Skipping stats app squashing stats as it is still running")
     else:
         with r.lock(key, timeout=lock_timeout):
-            PollStatsCounter.squash()
-            PollEngagementDailyCount.squash()
+            # the counters of the flows being rebuilt are replaced by the rebuild, squashing them would conflict
+            exclude = dict(flow_result_id=Poll.get_rebuilding_flow_result_ids())
+
+            PollStatsCounter.squash_bulk(exclude=exclude)
+            PollEngagementDailyCount.squash_bulk(exclude=exclude)
@@ -0,0 +1,165 @@
+from datetime import timedelta
+
+from mock import patch
+
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from dash.categories.models import Category
+from ureport.stats.models import ContactActivityCounter, PollEngagementDailyCount, PollStatsCounter
+from ureport.stats.tasks import delete_old_engagement_counts
+from ureport.tests import UreportTest
+from ureport.utils.time_buckets import get_time_buckets
+
+
+class PollEngagementDailyCountTest(UreportTest):
+    def setUp(self):
+        super(PollEngagementDailyCountTest, self).setUp()
+
+        self.education_nigeria = Category.objects.create(
+            org=self.nigeria, name="Education", created_by=self.admin, modified_by=self.admin
+        )
+        self.poll = self.create_poll(self.nigeria, "Poll 1", "flow-uuid", self.education_nigeria, self.admin)
+        self.poll_question = self.create_poll_question(self.admin, self.poll, "question 1", "step-uuid")
+
+    def test_refresh_org_engagement_data(self):
+        day = timezone.now().date() - timedelta(days=1)
+        flow_result = self.poll_question.flow_result
+
+        for scope, is_responded, count in (("all", True, 3), ("all", False, 1), ("gender:f", True, 2)):
+            PollEngagementDailyCount.objects.create(
+                org=self.nigeria,
+                flow_result=flow_result,
+                is_responded=is_responded,
+                scope=scope,
+                day=day,
+                count=count,
+            )
+
+        ContactActivityCounter.objects.create(
+            org=self.nigeria, date=day.replace(day=1), type=ContactActivityCounter.TYPE_ALL, value="", count=5
+        )
+
+        with patch("django.core.cache.cache.set_many") as mock_cache_set_many:
+            engagement_data = PollEngagementDailyCount.refresh_org_engagement_data(self.nigeria)
+
+            self.assertEqual(mock_cache_set_many.call_count, 1)
+            cached = mock_cache_set_many.call_args[0][0]
+
+        self.assertEqual(len(engagement_data), 4 * 5 * 3)
+        self.assertEqual(
+            cached[f"org:{self.nigeria.id}:metric:opinion-responses:segment:all:filter:12"],
+            {"results": engagement_data[("opinion-responses", "all", 12)]},
+        )
+
+        # the empty series are not cached
+        self.assertEqual(engagement_data[("opinion-responses", "location", 12)], [])
+        self.assertNotIn(f"org:{self.nigeria.id}:metric:opinion-responses:segment:location:filter:12", cached)
+
+        day_key = get_time_buckets(12).get_key(day)
+        female_label = self.nigeria.get_gender_labels()["F"]
+
+        opinion_responses = engagement_data[("opinion-responses", "all", 12)]
+        self.assertEqual(len(opinion_responses), 1)
+        self.assertEqual(opinion_responses[0]["name"], "Opinion Responses")
+        self.assertEqual(opinion_responses[0]["data"][day_key], 3)
+        self.assertEqual(sum(opinion_responses[0]["data"].values()), 3)
+
+        gender_responses = {elt["name"]: elt["data"] for elt in engagement_data[("opinion-responses", "gender", 12)]}
+        self.assertEqual(gender_responses[female_label][day_key], 2)
+
+        response_rate = engagement_data[("response-rate", "all", 12)]
+        self.assertEqual(response_rate[0]["data"][day_key], 75.0)
+
+        gender_rates = {elt["name"]: elt["data"] for elt in engagement_data[("response-rate", "gender", 12)]}
+        self.assertEqual(gender_rates[female_label][day_key], 100.0)
+
+        # periods polled without responses have a rate of 0, like those not polled at all
+        self.assertEqual(PollEngagementDailyCount.get_response_rates([4, 0, 3], [3, 0, 0]), [75.0, 0, 0])
+        self.assertIsInstance(PollEngagementDailyCount.get_response_rates([3], [0])[0], int)
+
+        active_users = engagement_data[("active-users", "all", 12)]
+        self.assertEqual(active_users[0]["data"][str(day.replace(day=1))], 5)
+
+        # the single series refresh builds the same data
+        for metric in PollEngagementDailyCount.DATA_METRICS.keys():
+            self.assertEqual(
+                PollEngagementDailyCount.refresh_engagement_data(self.nigeria, metric, "gender", 6),
+                engagement_data[(metric, "gender", 6)],
+            )
+
+    def test_delete_old_engagement_counts(self):
+        today = timezone.now().date()
+        flow_result = self.poll_question.flow_result
+
+        old_count = PollEngagementDailyCount.objects.create(
+            org=self.nigeria, flow_result=flow_result, scope="all", day=today - timedelta(days=401), count=1
+        )
+        recent_count = PollEngagementDailyCount.objects.create(
+            org=self.nigeria, flow_result=flow_result, scope="all", day=today - timedelta(days=399), count=1
+        )
+
+        delete_old_engagement_counts(self.nigeria.pk)
+
+        self.assertFalse(PollEngagementDailyCount.objects.filter(pk=old_count.pk).exists())
+        self.assertTrue(PollEngagementDailyCount.objects.filter(pk=recent_count.pk).exists())
+
+    def test_counts_query_plans(self):
+        today = timezone.now().date()
+        flow_result = self.poll_question.flow_result
+
+        scopes = ["all", "gender:f", "gender:m"] + [f"state:R-{i}" for i in range(40)]
+
+        PollEngagementDailyCount.objects.bulk_create(
+            [
+                PollEngagementDailyCount(
+                    org=self.nigeria,
+                    flow_result=flow_result,
+                    is_responded=bool(i % 2),
+                    scope=scope,
+                    day=today - timedelta(days=i),
+                    count=1,
+                    is_squashed=True,
+                )
+                for scope in scopes
+                for i in range(100)
+            ]
+        )
+        PollStatsCounter.objects.bulk_create(
+            [
+                PollStatsCounter(org=self.nigeria, flow_result=flow_result, scope=scope, count=1, is_squashed=True)
+                for scope in scopes
+            ]
+        )
+
+        # tables this small could be read with sequential scans whatever the indexes, so they are disabled for the
+        # rest of the test transaction to check which index the planner picks
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE stats_pollengagementdailycount")
+            cursor.execute("ANALYZE stats_pollstatscounter")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+        # the scoped engagement series read the scope and day index
+        plan = (
+            PollEngagementDailyCount.objects.filter(
+                org=self.nigeria,
+                scope="gender:f",
+                day__gte=today - timedelta(days=30),
+                flow_result_id__in=[flow_result.id],
+                is_responded=True,
+            )
+            .values("day")
+            .annotate(Sum("count"))
+            .explain()
+        )
+        self.assertIn("stats_pedc_org_scope_day_idx", plan)
+
+        # the results counts read the result and scope index
+        plan = (
+            PollStatsCounter.objects.filter(org=self.nigeria, flow_result=flow_result, scope="all")
+            .values("flow_result_category")
+            .annotate(Sum("count"))
+            .explain()
+        )
+        self.assertIn("stats_psc_org_result_scope_idx", plan)
@@ -189,6 +189,18 @@ class SyncJob(models.Model):
         for field, value in updates.items():
             setattr(self, field, value)
 
+    def is_in_flight(self, grace_seconds=DEFAULT_STALE_GRACE_SECONDS):
+        """
+        Whether a run of this job is under way and still moving forward, i.e. its chain of
+        chunks carries on by itself and triggering the job again would only start a second
+        chain. A stale run is not in flight - only a trigger revives it.
+        """
+        if self.status != self.STATUS_RUNNING:
+            return False
+
+        cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+        return (self.lease_expires_on or self.modified_on) >= cutoff
+
     def add_progress(self, **counts):
         """
         Returns this job's progress with the given counters added in, for passing to
@@ -292,6 +304,7 @@ class SyncJob(models.Model):
             stale_jobs=cached.get("stale_jobs", dict()),
             failing_jobs=cached.get("failing_jobs", dict()),
             totals=cached.get("totals", dict(running=0, stale=0, failing=0)),
+            rate_budgets=cached.get("rate_budgets", dict()),
             checked_on=cached.get("checked_on"),
         )
 
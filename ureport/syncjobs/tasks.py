@@ -8,6 +8,7 @@ from django.core.cache import cache
 from django.utils import timezone
 
 from ureport.celery import app
+from ureport.utils.rate_budget import RateBudget
 
 from .models import DEFAULT_LEASE_SECONDS, STATUS_CACHE_KEY, LeaseLost, SyncJob
 
@@ -50,6 +51,7 @@ def check_jobs():
         stale_jobs=stale_jobs,
         failing_jobs=failing_jobs,
         totals=totals,
+        rate_budgets=RateBudget.get_usage_report(),
         checked_on=now.isoformat(),
     )
     cache.set(STATUS_CACHE_KEY, output, None)
@@ -162,6 +164,23 @@ def chunked_task(job_type, queue="celery", lease_seconds=DEFAULT_LEASE_SECONDS,
             else:
                 logger.info("Job #%s (%s) not claimable, skipping", job_id, job_type)
 
+        _task.job_type = job_type
         return _task
 
     return decorator
+
+
+def trigger_job(task, org, scope=""):
+    """
+    Starts a run of the job of a chunked task for the given org and scope, creating the job
+    if needed. Jobs already in flight or paused are left alone - a beat nudge must not add
+    a second chain of chunks to a run that carries on by itself. Returns the job.
+    """
+    job = SyncJob.get_or_create_job(org, task.job_type, scope)
+
+    if job.status == SyncJob.STATUS_PAUSED or job.is_in_flight():
+        logger.info("Job #%s (%s:%s) not triggered, it is %s", job.id, job.job_type, scope, job.get_status_display())
+    else:
+        task.delay(job.id)
+
+    return job
@@ -13,7 +13,7 @@ from django.utils import timezone
 
 from dash.orgs.models import Org
 from ureport.syncjobs.models import MAX_ERROR_LENGTH, MAX_ERROR_SUMMARY_LENGTH, STATUS_CACHE_KEY, LeaseLost, SyncJob
-from ureport.syncjobs.tasks import MAX_REPORTED_JOBS, check_jobs, chunked_task
+from ureport.syncjobs.tasks import MAX_REPORTED_JOBS, check_jobs, chunked_task, trigger_job
 from ureport.tests import UreportTest
 
 
@@ -406,6 +406,38 @@ class ChunkedTaskTest(TestCase):
         self.assertEqual(delayed, [True])
         self.assertEqual(SyncJob.objects.get(id=self.job.id).status, SyncJob.STATUS_COMPLETE)
 
+    def test_trigger_job(self):
+        task, ran = _make_task(chunks_to_run=2)
+
+        with patch.object(task, "delay") as mock_delay:
+            job = trigger_job(task, None, "flow-1")
+            self.assertEqual(job, self.job)
+            mock_delay.assert_called_once_with(self.job.id)
+            mock_delay.reset_mock()
+
+            # a new job is created for a new scope
+            other = trigger_job(task, None, "flow-2")
+            self.assertEqual(other.job_type, "test-sync")
+            mock_delay.assert_called_once_with(other.id)
+            mock_delay.reset_mock()
+
+            # a run in flight already has its chain of chunks
+            self.job.claim("worker-1")
+            self.job.release_lease()
+            trigger_job(task, None, "flow-1")
+            mock_delay.assert_not_called()
+
+            # as a paused job is deliberately left alone
+            self.job.pause()
+            trigger_job(task, None, "flow-1")
+            mock_delay.assert_not_called()
+
+            # but a stale run is revived
+            self.job.resume()
+            SyncJob.objects.filter(id=self.job.id).update(modified_on=timezone.now() - timedelta(hours=1))
+            trigger_job(task, None, "flow-1")
+            mock_delay.assert_called_once_with(self.job.id)
+
     def test_missing_job_is_skipped(self):
         task, ran = _make_task(chunks_to_run=1)
 
@@ -497,6 +529,28 @@ class SyncJobQueriesTest(TestCase):
 
         self.assertEqual(list(SyncJob.objects.stale()), [])
 
+    def test_is_in_flight(self):
+        self.assertFalse(self.job.is_in_flight())
+
+        self.job.claim("worker-1")
+        self.assertTrue(self.job.is_in_flight())
+
+        # between chunks the continuation carries the run on
+        self.job.release_lease()
+        self.assertTrue(self.job.is_in_flight())
+
+        # until it is lost and the run goes stale
+        self.set_modified(self.job, 60 * 30)
+        self.assertFalse(self.job.is_in_flight())
+
+        self.job.claim("worker-1")
+        self.expire_lease(self.job, 60 * 30)
+        self.assertFalse(self.job.is_in_flight())
+
+        self.job.claim("worker-2")
+        self.job.mark_complete()
+        self.assertFalse(self.job.is_in_flight())
+
     def test_failing_respects_threshold(self):
         other = SyncJob.get_or_create_job(None, "test-sync", "flow-2")
         SyncJob.objects.filter(id=self.job.id).update(consecutive_failures=2)
@@ -748,6 +802,7 @@ class StatusReportTest(TestCase):
                 stale_jobs={},
                 failing_jobs={},
                 totals=dict(running=0, stale=0, failing=0),
+                rate_budgets={},
                 checked_on=None,
             ),
         )
@@ -816,6 +871,16 @@ class SyncJobCRUDLTest(UreportTest):
         response = self.client.get(reverse("syncjobs.syncjob_list"), SERVER_NAME="uganda.ureport.io")
         self.assertEqual(response.context["report"]["totals"], dict(running=1, stale=0, failing=0))
 
+    def test_list_shows_tiered_cache_stats(self):
+        self.login(self.superuser)
+
+        stats = {"main-poll": dict(hits=3, misses=1, hit_ratio=0.75)}
+        with patch("ureport.syncjobs.views.tiered_cache.get_stats", return_value=stats):
+            response = self.client.get(reverse("syncjobs.syncjob_list"), SERVER_NAME="uganda.ureport.io")
+
+        self.assertEqual(response.context["tiered_cache_stats"], stats)
+        self.assertContains(response, "main-poll tiered cache: 3 hits, 1 misses, 0.75 hit ratio")
+
     def test_actions(self):
         pause_url = reverse("syncjobs.syncjob_pause", args=[self.job.id])
         resume_url = reverse("syncjobs.syncjob_resume", args=[self.job.id])
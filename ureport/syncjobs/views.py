@@ -6,6 +6,7 @@ from django.utils.translation import gettext_lazy as _
 
 from smartmin.views import SmartCRUDL, SmartListView, SmartUpdateView
 from ureport.syncjobs.models import SyncJob
+from ureport.utils.tiered_cache import tiered_cache
 
 
 class SyncJobCRUDL(SmartCRUDL):
@@ -40,6 +41,8 @@ class SyncJobCRUDL(SmartCRUDL):
         def get_context_data(self, **kwargs):
             context = super().get_context_data(**kwargs)
             context["report"] = SyncJob.get_status_report()
+            # the local tier is per process, these are the hit ratios of the web process serving the page
+            context["tiered_cache_stats"] = tiered_cache.get_stats()
             context["job_types"] = SyncJob.objects.order_by("job_type").values_list("job_type", flat=True).distinct()
             context["statuses"] = SyncJob.STATUS_CHOICES
             context["filter_job_type"] = self.request.GET.get("job_type", "")
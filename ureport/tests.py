@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import io
 import json
 import uuid
 import zoneinfo
@@ -21,7 +22,7 @@ from django.http.request import HttpRequest
 from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.encoding import force_str
+from django.utils.encoding import force_bytes, force_str
 
 from dash.orgs.middleware import SetOrgMiddleware
 from dash.orgs.models import Org
@@ -124,6 +125,16 @@ class MockResponse(object):
     def __init__(self, status_code, content=""):
         self.content = content
         self.status_code = status_code
+        self.raw = io.BytesIO(force_bytes(content))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.raw.close()
 
     def raise_for_status(self):
         if self.status_code != 200:
@@ -132,6 +143,9 @@ class MockResponse(object):
     def json(self, **kwargs):
         return json.loads(self.content)
 
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        return iter(lambda: self.raw.read(chunk_size), b"")
+
     def __next__(self):
         return self
 
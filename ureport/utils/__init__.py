@@ -22,10 +22,13 @@ from dash.utils import datetime_to_ms
 from ureport.assets.models import LOGO, Image
 from ureport.locations.models import Boundary
 from ureport.polls.models import Poll, PollResult
+from ureport.utils.tiered_cache import tiered_cache
+from ureport.utils.time_buckets import get_time_buckets
 
 GLOBAL_COUNT_CACHE_KEY = "global_count"
 
 ORG_CONTACT_COUNT_KEY = "org:%d:contacts-counts"
+ORG_CONTACT_COUNTS_SNAPSHOT_KEY = "org:%d:contacts-counts-snapshot"
 ORG_CONTACT_COUNT_TIMEOUT = 3600
 
 logger = logging.getLogger(__name__)
@@ -81,37 +84,6 @@ def get_last_months(months_num=12, start_time=None):
     return months
 
 
-def get_time_filter_dates_map(time_filter=12):
-    start_time = datetime.now()
-    end_time = start_time - timedelta(days=time_filter * 30)
-
-    if time_filter != 3:
-        end_time = end_time.replace(day=1)
-
-    keys_map = dict()
-    while start_time >= end_time:
-        val = start_time.date()
-        if time_filter == 12:
-            val = start_time.date().replace(day=1)
-        if time_filter == 6:
-            if val.day < 16:
-                val = start_time.date().replace(day=1)
-            else:
-                val = start_time.date().replace(day=16)
-        if time_filter == 3:
-            if val.day < 11:
-                val = start_time.date().replace(day=1)
-            elif val.day < 21:
-                val = start_time.date().replace(day=11)
-            else:
-                val = start_time.date().replace(day=21)
-
-        keys_map[str(start_time.date())] = str(val)
-        start_time = start_time - timedelta(days=1)
-
-    return keys_map
-
-
 def get_dict_from_cursor(cursor):
     """
     Returns all rows from a cursor as a dict
@@ -228,7 +200,7 @@ def fetch_shared_sites_count():
         response.raise_for_status()
 
         value = {"time": datetime_to_ms(this_time), "results": response.json()}
-        cache.set("shared_sites", value, None)
+        tiered_cache.set("shared_sites", value, None)
         return value["results"]
     except Exception:
         import traceback
@@ -237,7 +209,7 @@ def fetch_shared_sites_count():
 
 
 def get_shared_sites_count():
-    cache_value = cache.get("shared_sites", None)
+    cache_value = tiered_cache.get("shared_sites", None, family="shared-sites")
     if cache_value:
         return cache_value["results"]
     if getattr(settings, "IS_PROD", False):
@@ -295,14 +267,14 @@ def fetch_old_sites_count():
                 traceback.print_exc()
 
     # delete the global count cache to force a recalculate at the end
-    cache.delete(GLOBAL_COUNT_CACHE_KEY)
+    tiered_cache.delete(GLOBAL_COUNT_CACHE_KEY)
 
     logger.info("Fetch old sites counts took %ss" % (time.time() - start))
     return old_site_values
 
 
 def get_global_count():
-    count_cached_value = cache.get(GLOBAL_COUNT_CACHE_KEY, None)
+    count_cached_value = tiered_cache.get(GLOBAL_COUNT_CACHE_KEY, None, family="global-count")
     if count_cached_value:
         return count_cached_value
 
@@ -325,7 +297,7 @@ def get_global_count():
         count = sum([elt["results"].get("size", 0) for elt in cached_values if elt.get("results", None)])
 
         # cached for 10 min
-        cache.set(GLOBAL_COUNT_CACHE_KEY, count, None)
+        tiered_cache.set(GLOBAL_COUNT_CACHE_KEY, count, None)
     except AttributeError:
         import traceback
 
@@ -337,9 +309,8 @@ def get_global_count():
 
 def get_org_contacts_counts(org):
     key = ORG_CONTACT_COUNT_KEY % org.pk
-    org_contacts_counts = cache.get(key, None)
+    org_contacts_counts = tiered_cache.get(key, None, family="org-contacts-counts")
     if org_contacts_counts:
-        cache.set(f"{key}-total-reporters", org_contacts_counts.get("total-reporters", 0), None)
         return org_contacts_counts
 
     return update_cache_org_contact_counts(org)
@@ -350,10 +321,69 @@ def update_cache_org_contact_counts(org):
 
     key = ORG_CONTACT_COUNT_KEY % org.pk
     org_contacts_counts = ReportersCounter.get_counts(org)
-    cache.set(key, org_contacts_counts, None)
+    tiered_cache.set(key, org_contacts_counts, None)
+    tiered_cache.set(f"{key}-total-reporters", org_contacts_counts.get("total-reporters", 0), None)
+    tiered_cache.set(
+        ORG_CONTACT_COUNTS_SNAPSHOT_KEY % org.pk, build_org_contacts_counts_snapshot(org_contacts_counts), None
+    )
     return org_contacts_counts
 
 
+def build_org_contacts_counts_snapshot(org_contacts_counts):
+    """
+    Builds the snapshot of the reporters counts the stats are read from, the flat counts by counter type indexed by the
+    dimension of the counter, e.g. snapshot["state"]["R-LAGOS"] or snapshot["registered_born"]["1990"]["2024-01-31"].
+    Registration counts are keyed by date in ascending order so the recent dates can be read without a full scan.
+    """
+    snapshot = dict(
+        born=dict(),
+        state=dict(),
+        district=dict(),
+        ward=dict(),
+        scheme=dict(),
+        registered_on=dict(),
+        registered_gender=dict(),
+        registered_born=dict(),
+        registered_state=dict(),
+        registered_scheme=dict(),
+    )
+
+    for counter_type, count in sorted(org_contacts_counts.items()):
+        counter_name, _, value = counter_type.partition(":")
+
+        if counter_name in ("state", "district", "ward", "registered_on"):
+            snapshot[counter_name][value] = count
+        elif counter_name == "born":
+            if len(value) == 4:
+                snapshot["born"][value] = count
+        elif counter_name == "scheme":
+            if value:
+                snapshot["scheme"][value] = count
+        elif counter_name in ("registered_gender", "registered_born", "registered_state", "registered_scheme"):
+            date_key, _, segment = value.partition(":")
+            snapshot[counter_name].setdefault(segment, dict())[date_key] = count
+
+    return snapshot
+
+
+def get_org_contacts_counts_snapshot(org):
+    snapshot = tiered_cache.get(ORG_CONTACT_COUNTS_SNAPSHOT_KEY % org.pk, None, family="org-contacts-counts-snapshot")
+    if snapshot:
+        return snapshot
+
+    return build_org_contacts_counts_snapshot(update_cache_org_contact_counts(org))
+
+
+def iter_counts_since(date_counts, since, inclusive=False):
+    """
+    Iterates the (date, count) of the snapshot registration counts after the given date, from the most recent one
+    """
+    for date_key in reversed(date_counts):
+        if date_key < since or (date_key == since and not inclusive):
+            break
+        yield date_key, date_counts[date_key]
+
+
 def get_gender_labels(org):
     from ureport.stats.models import GenderSegment
 
@@ -407,9 +437,7 @@ def get_age_stats(org):
     now = timezone.now()
     current_year = now.year
 
-    org_contacts_counts = get_org_contacts_counts(org)
-
-    year_counts = {k[-4:]: v for k, v in org_contacts_counts.items() if k.startswith("born:") and len(k) == 9}
+    year_counts = get_org_contacts_counts_snapshot(org)["born"]
 
     age_counts_interval = dict()
     age_counts_interval["0-14"] = 0
@@ -451,10 +479,8 @@ def get_age_stats(org):
 def get_schemes_stats(org):
     from ureport.stats.models import SchemeSegment
 
-    org_contacts_counts = get_org_contacts_counts(org)
-    schemes_counts = {
-        k[7:]: v for k, v in org_contacts_counts.items() if k.startswith("scheme:") if k[7:] and k[7:] != "ext"
-    }
+    snapshot = get_org_contacts_counts_snapshot(org)
+    schemes_counts = {k: v for k, v in snapshot["scheme"].items() if k != "ext"}
 
     total = 0
     schemes_stats_data = defaultdict(int)
@@ -494,71 +520,32 @@ def get_sign_up_rate(org, time_filter):
     now = timezone.now()
     year_ago = now - timedelta(days=365)
     start = year_ago.replace(day=1)
-    tz = zoneinfo.ZoneInfo("UTC")
 
-    org_contacts_counts = get_org_contacts_counts(org)
+    snapshot = get_org_contacts_counts_snapshot(org)
 
-    registered_on_counts = {k[14:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_on")}
+    time_buckets = get_time_buckets(time_filter)
+    counts = time_buckets.sum_dates(iter_counts_since(snapshot["registered_on"], str(start.date())))
 
-    interval_dict = defaultdict(int)
-
-    dates_map = get_time_filter_dates_map(time_filter=time_filter)
-    keys = list(set(dates_map.values()))
-
-    for date_key, date_count in registered_on_counts.items():
-        parsed_time = datetime.strptime(date_key, "%Y-%m-%d").replace(
-            hour=0, minute=0, second=0, microsecond=0, tzinfo=tz
-        )
-
-        if parsed_time > start:
-            key = dates_map.get(str(parsed_time.date()))
-
-            interval_dict[key] += date_count
-
-    data = dict()
-    for key in keys:
-        data[key] = interval_dict[key]
-
-    return [dict(name="Sign-Up Rate", data=data)]
+    return [dict(name="Sign-Up Rate", data=time_buckets.to_data(counts))]
 
 
 def get_sign_up_rate_location(org, time_filter):
     now = timezone.now()
     year_ago = now - timedelta(days=365)
     start = year_ago.replace(day=1)
-    tz = zoneinfo.ZoneInfo("UTC")
-
-    org_contacts_counts = get_org_contacts_counts(org)
 
-    registered_on_counts = {k[17:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_state")}
+    snapshot = get_org_contacts_counts_snapshot(org)
 
     top_boundaries = Boundary.get_org_top_level_boundaries_name(org)
 
-    dates_map = get_time_filter_dates_map(time_filter=time_filter)
-    keys = list(set(dates_map.values()))
+    time_buckets = get_time_buckets(time_filter)
 
     output_data = []
 
     for osm_id, name in top_boundaries.items():
-        interval_dict = defaultdict(int)
-        for date_key, date_count in registered_on_counts.items():
-            if date_key.endswith(f":{osm_id.upper()}"):
-                date_key = date_key[:10]
-            else:
-                continue
-
-            parsed_time = datetime.strptime(date_key, "%Y-%m-%d").replace(
-                hour=0, minute=0, second=0, microsecond=0, tzinfo=tz
-            )
-
-            if parsed_time > start:
-                key = dates_map.get(str(parsed_time.date()))
-                interval_dict[key] += date_count
-
-        data = dict()
-        for key in keys:
-            data[key] = interval_dict[key]
-        output_data.append(dict(name=name, osm_id=osm_id, data=data))
+        date_counts = snapshot["registered_state"].get(osm_id.upper(), dict())
+        counts = time_buckets.sum_dates(iter_counts_since(date_counts, str(start.date())))
+        output_data.append(dict(name=name, osm_id=osm_id, data=time_buckets.to_data(counts)))
     return output_data
 
 
@@ -568,13 +555,10 @@ def get_sign_up_rate_gender(org, time_filter):
     now = timezone.now()
     year_ago = now - timedelta(days=365)
     start = year_ago.replace(day=1)
-    tz = zoneinfo.ZoneInfo("UTC")
 
     org_gender_labels = org.get_gender_labels()
 
-    org_contacts_counts = get_org_contacts_counts(org)
-
-    registered_on_counts = {k[18:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_gender")}
+    snapshot = get_org_contacts_counts_snapshot(org)
 
     genders = GenderSegment.objects.all()
     if not org.get_config("common.has_extra_gender"):
@@ -582,30 +566,13 @@ def get_sign_up_rate_gender(org, time_filter):
 
     genders = genders.values("gender", "id")
 
-    dates_map = get_time_filter_dates_map(time_filter=time_filter)
-    keys = list(set(dates_map.values()))
+    time_buckets = get_time_buckets(time_filter)
     output_data = []
 
     for gender in genders:
-        interval_dict = defaultdict(int)
-        for date_key, date_count in registered_on_counts.items():
-            if date_key.endswith(f":{gender['gender'].lower()}"):
-                date_key = date_key[:-2]
-            else:
-                continue
-
-            parsed_time = datetime.strptime(date_key, "%Y-%m-%d").replace(
-                hour=0, minute=0, second=0, microsecond=0, tzinfo=tz
-            )
-
-            if parsed_time > start:
-                key = dates_map.get(str(parsed_time.date()))
-                interval_dict[key] += date_count
-
-        data = dict()
-        for key in keys:
-            data[key] = interval_dict[key]
-        output_data.append(dict(name=org_gender_labels.get(gender["gender"]), data=data))
+        date_counts = snapshot["registered_gender"].get(gender["gender"].lower(), dict())
+        counts = time_buckets.sum_dates(iter_counts_since(date_counts, str(start.date())))
+        output_data.append(dict(name=org_gender_labels.get(gender["gender"]), data=time_buckets.to_data(counts)))
     return output_data
 
 
@@ -616,46 +583,41 @@ def get_sign_up_rate_age(org, time_filter):
     current_year = now.year
     year_ago = now - timedelta(days=365)
     start = year_ago.replace(day=1)
-    tz = zoneinfo.ZoneInfo("UTC")
+    # registrations on the start date itself are counted when the start is at midnight
+    start_inclusive = start == start.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    org_contacts_counts = get_org_contacts_counts(org)
+    snapshot = get_org_contacts_counts_snapshot(org)
+
+    time_buckets = get_time_buckets(time_filter)
 
-    registered_on_counts = {k[16:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_born")}
     registered_on_counts_by_age = {
-        "0-14": defaultdict(int),
-        "15-19": defaultdict(int),
-        "20-24": defaultdict(int),
-        "25-30": defaultdict(int),
-        "31-34": defaultdict(int),
-        "35+": defaultdict(int),
+        "0-14": time_buckets.new_counts(),
+        "15-19": time_buckets.new_counts(),
+        "20-24": time_buckets.new_counts(),
+        "25-30": time_buckets.new_counts(),
+        "31-34": time_buckets.new_counts(),
+        "35+": time_buckets.new_counts(),
     }
 
-    dates_map = get_time_filter_dates_map(time_filter=time_filter)
-    keys = list(set(dates_map.values()))
-
-    for date_key, date_count in registered_on_counts.items():
-        date_key_date, date_key_year = date_key.split(":")
-        parsed_time = datetime.strptime(date_key_date, "%Y-%m-%d").replace(
-            hour=0, minute=0, second=0, microsecond=0, tzinfo=tz
-        )
-        if parsed_time < start:
-            continue
-
-        date_key_date = dates_map.get(str(parsed_time.date()))
-
+    for date_key_year, date_counts in snapshot["registered_born"].items():
         age = current_year - int(date_key_year)
         if age > 34:
-            registered_on_counts_by_age["35+"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["35+"]
         elif age > 30:
-            registered_on_counts_by_age["31-34"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["31-34"]
         elif age > 24:
-            registered_on_counts_by_age["25-30"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["25-30"]
         elif age > 19:
-            registered_on_counts_by_age["20-24"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["20-24"]
         elif age > 14:
-            registered_on_counts_by_age["15-19"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["15-19"]
         else:
-            registered_on_counts_by_age["0-14"][date_key_date] += date_count
+            age_counts = registered_on_counts_by_age["0-14"]
+
+        for date_key, date_count in iter_counts_since(date_counts, str(start.date()), inclusive=start_inclusive):
+            index = time_buckets.get_index(date_key)
+            if index is not None:
+                age_counts[index] += date_count
 
     ages = AgeSegment.objects.all().values("id", "min_age", "max_age")
     output_data = []
@@ -673,12 +635,7 @@ def get_sign_up_rate_age(org, time_filter):
         elif age["min_age"] == 35:
             data_key = "35+"
 
-        age_data = registered_on_counts_by_age[data_key]
-        data = dict()
-        for key in keys:
-            data[key] = age_data[key]
-
-        output_data.append(dict(name=data_key, data=data))
+        output_data.append(dict(name=data_key, data=time_buckets.to_data(registered_on_counts_by_age[data_key])))
 
     return output_data
 
@@ -689,46 +646,35 @@ def get_sign_up_rate_scheme(org, time_filter):
     now = timezone.now()
     year_ago = now - timedelta(days=365)
     start = year_ago.replace(day=1)
-    tz = zoneinfo.ZoneInfo("UTC")
+    # registrations on the start date itself are counted when the start is at midnight
+    start_inclusive = start == start.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    org_contacts_counts = get_org_contacts_counts(org)
+    snapshot = get_org_contacts_counts_snapshot(org)
 
-    registered_on_counts = {k[18:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_scheme")}
+    time_buckets = get_time_buckets(time_filter)
 
-    schemes = [k[7:] for k, v in org_contacts_counts.items() if k.startswith("scheme:") if k[7:] and k[7:] != "ext"]
+    schemes = [scheme for scheme in snapshot["scheme"] if scheme != "ext"]
     registered_on_counts_by_scheme = {}
 
     for scheme in schemes:
-        registered_on_counts_by_scheme[scheme] = defaultdict(int)
-
-    dates_map = get_time_filter_dates_map(time_filter=time_filter)
-    keys = list(set(dates_map.values()))
-
-    for date_key, date_count in registered_on_counts.items():
-        date_key_date, scheme = date_key.split(":")
-        parsed_time = datetime.strptime(date_key_date, "%Y-%m-%d").replace(
-            hour=0, minute=0, second=0, microsecond=0, tzinfo=tz
-        )
-        if parsed_time < start:
-            continue
-
-        date_key_date = dates_map.get(str(parsed_time.date()))
+        registered_on_counts_by_scheme[scheme] = time_buckets.new_counts()
 
+    for scheme, date_counts in snapshot["registered_scheme"].items():
         if scheme not in registered_on_counts_by_scheme:
-            registered_on_counts_by_scheme[scheme] = defaultdict(int)
-        registered_on_counts_by_scheme[scheme][date_key_date] += date_count
+            registered_on_counts_by_scheme[scheme] = time_buckets.new_counts()
 
-    output_data = []
-    for scheme in registered_on_counts_by_scheme.keys():
-        scheme_data = registered_on_counts_by_scheme[scheme]
-        data = dict()
-        for key in keys:
-            data[key] = scheme_data[key]
+        scheme_counts = registered_on_counts_by_scheme[scheme]
+        for date_key, date_count in iter_counts_since(date_counts, str(start.date()), inclusive=start_inclusive):
+            index = time_buckets.get_index(date_key)
+            if index is not None:
+                scheme_counts[index] += date_count
 
+    output_data = []
+    for scheme, scheme_counts in registered_on_counts_by_scheme.items():
         name = SchemeSegment.SCHEME_DISPLAY.get(scheme, scheme.upper())
         if not name:
             continue
-        output_data.append(dict(name=name, data=data))
+        output_data.append(dict(name=name, data=time_buckets.to_data(scheme_counts)))
 
     return output_data
 
@@ -739,24 +685,21 @@ def get_registration_stats(org):
     six_months_ago = six_months_ago - timedelta(six_months_ago.weekday())
     tz = zoneinfo.ZoneInfo("UTC")
 
-    org_contacts_counts = get_org_contacts_counts(org)
-
-    registered_on_counts = {k[14:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_on")}
+    snapshot = get_org_contacts_counts_snapshot(org)
 
     interval_dict = dict()
 
-    for date_key, date_count in registered_on_counts.items():
+    # only the dates in the range we care about
+    for date_key, date_count in iter_counts_since(snapshot["registered_on"], str(six_months_ago.date())):
         parsed_time = datetime.strptime(date_key, "%Y-%m-%d").replace(tzinfo=tz)
 
-        # this is in the range we care about
-        if parsed_time > six_months_ago:
-            # get the week of the year
-            dict_key = parsed_time.strftime("%W")
+        # get the week of the year
+        dict_key = parsed_time.strftime("%W")
 
-            if interval_dict.get(dict_key, None):
-                interval_dict[dict_key] += date_count
-            else:
-                interval_dict[dict_key] = date_count
+        if interval_dict.get(dict_key, None):
+            interval_dict[dict_key] += date_count
+        else:
+            interval_dict[dict_key] = date_count
 
     # build our final dict using week numbers
     categories = []
@@ -777,24 +720,21 @@ def get_reporter_registration_dates(org):
     one_year_ago = one_year_ago - timedelta(one_year_ago.weekday())
     tz = zoneinfo.ZoneInfo("UTC")
 
-    org_contacts_counts = get_org_contacts_counts(org)
-
-    registered_on_counts = {k[14:]: v for k, v in org_contacts_counts.items() if k.startswith("registered_on")}
+    snapshot = get_org_contacts_counts_snapshot(org)
 
     interval_dict = dict()
 
-    for date_key, date_count in registered_on_counts.items():
+    # only the dates in the range we care about
+    for date_key, date_count in iter_counts_since(snapshot["registered_on"], str(one_year_ago.date())):
         parsed_time = datetime.strptime(date_key, "%Y-%m-%d").replace(tzinfo=tz)
 
-        # this is in the range we care about
-        if parsed_time > one_year_ago:
-            # get the week of the year
-            dict_key = parsed_time.strftime("%W")
+        # get the week of the year
+        dict_key = parsed_time.strftime("%W")
 
-            if interval_dict.get(dict_key, None):
-                interval_dict[dict_key] += date_count
-            else:
-                interval_dict[dict_key] = date_count
+        if interval_dict.get(dict_key, None):
+            interval_dict[dict_key] += date_count
+        else:
+            interval_dict[dict_key] = date_count
 
     # build our final dict using week numbers
     categories = []
@@ -832,7 +772,8 @@ def get_ureporters_locations_stats(org, segment):
 
     field_type = field_type.lower()
 
-    org_contacts_counts = get_org_contacts_counts(org)
+    snapshot = get_org_contacts_counts_snapshot(org)
+    location_counts = snapshot[field_type]
 
     if field_type == "state":
         boundary_top_level = Boundary.COUNTRY_LEVEL if org.get_config("common.is_global") else Boundary.STATE_LEVEL
@@ -841,7 +782,6 @@ def get_ureporters_locations_stats(org, segment):
             .values("osm_id", "name")
             .order_by("osm_id")
         )
-        location_counts = {k[6:]: v for k, v in org_contacts_counts.items() if k.startswith("state")}
 
     elif field_type == "ward":
         boundaries = (
@@ -849,7 +789,6 @@ def get_ureporters_locations_stats(org, segment):
             .values("osm_id", "name")
             .order_by("osm_id")
         )
-        location_counts = {k[5:]: v for k, v in org_contacts_counts.items() if k.startswith("ward")}
     else:
         boundaries = (
             Boundary.objects.filter(
@@ -858,7 +797,6 @@ def get_ureporters_locations_stats(org, segment):
             .values("osm_id", "name")
             .order_by("osm_id")
         )
-        location_counts = {k[9:]: v for k, v in org_contacts_counts.items() if k.startswith("district")}
 
     return [
         dict(boundary=elt["osm_id"], label=elt["name"], set=location_counts.get(elt["osm_id"], 0)) for elt in boundaries
@@ -943,7 +881,7 @@ def get_ureporters_locations_response_rates(org, segment):
 
 def get_reporters_count(org):
     key = ORG_CONTACT_COUNT_KEY % org.pk
-    cached_value = cache.get(f"{key}-total-reporters", None)
+    cached_value = tiered_cache.get(f"{key}-total-reporters", None, family="org-reporters-count")
     if cached_value:
         return cached_value
 
@@ -952,13 +890,11 @@ def get_reporters_count(org):
 
 
 def get_regions_stats(org):
-    org_contacts_counts = get_org_contacts_counts(org)
+    snapshot = get_org_contacts_counts_snapshot(org)
     boundaries_name = Boundary.get_org_top_level_boundaries_name(org)
 
-    boundaries_stats = {k[6:]: v for k, v in org_contacts_counts.items() if len(k) > 7 and k.startswith("state")}
-
     regions_stats = sorted(
-        [dict(name=boundaries_name[k], count=v) for k, v in boundaries_stats.items() if k and k in boundaries_name],
+        [dict(name=boundaries_name[k], count=v) for k, v in snapshot["state"].items() if k in boundaries_name],
         key=lambda i: i["count"],
         reverse=True,
     )
@@ -1105,6 +1041,7 @@ def populate_contact_activity(org):
 
 Org.get_gender_labels = get_gender_labels
 Org.get_org_contacts_counts = get_org_contacts_counts
+Org.get_org_contacts_counts_snapshot = get_org_contacts_counts_snapshot
 Org.get_reporters_count = get_reporters_count
 Org.get_ureporters_locations_stats = get_ureporters_locations_stats
 Org.get_registration_stats = get_registration_stats
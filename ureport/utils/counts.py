@@ -30,6 +30,10 @@ class BaseSquashableCount(models.Model):
 
     squash_over = ()
     squash_max_distinct = 5000
+    squash_batch_size = 5000
+
+    # whether a set which sums to a negative count is squashed to zero, for counts which can't go below zero
+    squash_non_negative = False
 
     id = models.BigAutoField(auto_created=True, primary_key=True)
     count = models.BigIntegerField(default=0)
@@ -76,6 +80,87 @@ class BaseSquashableCount(models.Model):
         logger.info("Squashed %d distinct sets of %s in %0.3fs" % (num_sets, cls.__name__, time_taken))
         return num_sets
 
+    @classmethod
+    def squash_bulk(cls, exclude: dict | None = None) -> int:
+        """
+        Squashes distinct sets of counts with unsquashed rows like squash() but in batches of squash_batch_size sets,
+        each collapsed by a single set-based statement rather than a statement per set. Sets with a value in exclude,
+        a dict of squash_over fields to values, are left for a later squash. Returns the number of sets squashed.
+        """
+        start = time.time()
+        num_sets = 0
+        squash_over = cls.get_squash_over()
+        if not squash_over:
+            raise ValueError(f"{cls.__name__} must define squash_over tuple with at least one field")
+
+        while num_sets < cls.squash_max_distinct:
+            batch_start = time.time()
+            batch_size = min(cls.squash_batch_size, cls.squash_max_distinct - num_sets)
+
+            with connection.cursor() as cursor:
+                sql, params = cls.get_bulk_squash_query(batch_size, exclude)
+                cursor.execute(sql, params)
+                batch_sets, rows_in, rows_out = cursor.fetchone()
+
+            num_sets += batch_sets
+
+            logger.info(
+                "Bulk squashed %d distinct sets of %s, %d rows in, %d rows out in %0.3fs"
+                % (batch_sets, cls.__name__, rows_in, rows_out, time.time() - batch_start)
+            )
+
+            if batch_sets < batch_size:
+                break
+
+        time_taken = time.time() - start
+        logger.info("Squashed %d distinct sets of %s in %0.3fs" % (num_sets, cls.__name__, time_taken))
+        return num_sets
+
+    @classmethod
+    def get_bulk_squash_query(cls, batch_size: int, exclude: dict | None = None) -> tuple:
+        """
+        Builds a single statement which picks up to batch_size distinct sets with unsquashed rows, other than those
+        with a value in exclude, deletes every row of those sets and inserts one squashed row per set which sums to
+        non-zero. The statement returns the number of sets, deleted rows and inserted rows.
+        """
+        table = cls._meta.db_table
+        columns = [cls._meta.get_field(col) for col in cls.get_squash_over()]
+
+        # nullable columns need IS NOT DISTINCT FROM to match NULL sets, others keep plain equality for the indexes
+        join_conditions = []
+        for field in columns:
+            operator = "IS NOT DISTINCT FROM" if field.null else "="
+            join_conditions.append(f'c."{field.column}" {operator} s."{field.column}"')
+
+        join_cond = " AND ".join(join_conditions)
+        cols = ", ".join([f'"{field.column}"' for field in columns])
+        removed_cols = ", ".join([f'c."{field.column}"' for field in columns])
+
+        set_conditions = ['"is_squashed" = FALSE']
+        set_params = []
+        for col, values in (exclude or dict()).items():
+            if values:
+                set_conditions.append(f'NOT ("{cls._meta.get_field(col).column}" = ANY(%s))')
+                set_params.append(list(values))
+
+        set_cond = " AND ".join(set_conditions)
+        total = 'GREATEST(0, SUM("count"))' if cls.squash_non_negative else 'SUM("count")'
+
+        sql = f"""
+        WITH sets AS (
+            SELECT DISTINCT {cols} FROM {table} WHERE {set_cond} LIMIT %s
+        ), removed AS (
+            DELETE FROM {table} c USING sets s WHERE {join_cond} RETURNING {removed_cols}, c."count"
+        ), inserted AS (
+            INSERT INTO {table}({cols}, "count", "is_squashed")
+            SELECT {cols}, {total}, TRUE FROM removed GROUP BY {cols} HAVING {total} != 0
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM sets), (SELECT COUNT(*) FROM removed), (SELECT COUNT(*) FROM inserted);
+        """
+
+        return sql, (*set_params, batch_size)
+
     @classmethod
     def get_squash_query(cls, distinct_set: dict) -> tuple:
         squash_over = cls.get_squash_over()
@@ -94,6 +179,7 @@ class BaseSquashableCount(models.Model):
         delete_cond = " AND ".join(delete_conditions)
         insert_cols = ", ".join([f'"{col}"' for col in squash_over])
         insert_vals = ", ".join(["%s"] * len(squash_over))
+        total = 'GREATEST(0, COALESCE(SUM("count"), 0))' if cls.squash_non_negative else 'COALESCE(SUM("count"), 0)'
 
         sql = f"""
         WITH removed as (
@@ -101,7 +187,7 @@ class BaseSquashableCount(models.Model):
         )
         INSERT INTO {cls._meta.db_table}({insert_cols}, "count", "is_squashed")
         SELECT {insert_vals}, s.total, TRUE FROM (
-            SELECT COALESCE(SUM("count"), 0) AS "total" FROM removed
+            SELECT {total} AS "total" FROM removed
         ) s WHERE s.total != 0;
         """
 
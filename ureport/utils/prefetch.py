@@ -0,0 +1,83 @@
+import queue
+import threading
+
+# how often a blocked producer checks whether the consumer has gone away
+PUT_TIMEOUT = 0.1
+
+_END = (None, None, None)
+
+
+class PrefetchedFetches:
+    """
+    Wraps the page iterator of an API query (e.g. iterfetches) to fetch the next pages in a background thread while
+    the current page is processed, so the API latency and the database writes overlap instead of adding up. At most
+    depth pages are fetched ahead, and no more than limit pages in total, so a pull that stops at a page budget
+    doesn't spend API requests on pages it won't process.
+
+    get_cursor follows the consumer rather than the thread: it returns the cursor the wrapped iterator had right
+    after fetching the last page handed out, None until one has been, and an error raised fetching a page is only
+    raised once the pages fetched before it have been processed. Callers must close it if they stop iterating early.
+    """
+
+    def __init__(self, fetches, depth: int = 2, limit: int = None):
+        self.fetches = fetches
+        self.limit = limit
+        self.cursor = None
+        self.pages = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __iter__(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._produce, name="prefetch-fetches", daemon=True)
+            self.thread.start()
+
+        try:
+            while True:
+                fetch, cursor, error = self.pages.get()
+                if error is not None:
+                    raise error
+                if fetch is None:
+                    return
+
+                self.cursor = cursor
+                yield fetch
+        finally:
+            self.close()
+
+    def get_cursor(self):
+        return self.cursor
+
+    def close(self):
+        """
+        Stops the fetching thread, leaving any page it fetched ahead unprocessed
+        """
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _produce(self):
+        # any iterable of pages will do, those without a cursor to resume from just never have one
+        get_cursor = getattr(self.fetches, "get_cursor", lambda: None)
+
+        try:
+            num_fetched = 0
+            for fetch in self.fetches:
+                num_fetched += 1
+                if not self._put((fetch, get_cursor(), None)):
+                    return
+                if self.limit and num_fetched >= self.limit:
+                    break
+        except Exception as e:
+            self._put((None, None, e))
+        finally:
+            self._put(_END)
+
+    def _put(self, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.pages.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -0,0 +1,223 @@
+import logging
+import math
+import time
+
+from django_valkey import get_valkey_connection
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_MAIN_POLL = "main-poll"
+PRIORITY_RECENT_POLLS = "recent-polls"
+PRIORITY_OTHER_POLLS = "other-polls"
+PRIORITY_ARCHIVES = "archives"
+PRIORITY_CONTACTS = "contacts"
+
+# the share of the bucket each priority class leaves to the classes above it, so a backfill drains the budget down
+# to what the main poll sync needs and no further
+PRIORITY_RESERVES = {
+    PRIORITY_MAIN_POLL: 0.0,
+    PRIORITY_RECENT_POLLS: 0.1,
+    PRIORITY_OTHER_POLLS: 0.25,
+    PRIORITY_ARCHIVES: 0.4,
+    PRIORITY_CONTACTS: 0.5,
+}
+
+# the smallest share of the requested cost worth granting, so a thin budget doesn't turn into a stream of tiny chunks
+MIN_GRANT_SHARE = 0.25
+
+# usage is kept by hour, long enough to look back over a day
+USAGE_TIMEOUT = 60 * 60 * 48
+
+BUDGET_KEY = "rate-budget:org:%d:backend:%s"
+USAGE_KEY = "rate-budget-usage:org:%d:backend:%s:%d"
+BUDGETS_SET_KEY = "rate-budgets"
+
+# refills the bucket for the time elapsed since its last update, then takes up to the requested tokens if at least
+# the minimum is available above the reserve floor
+ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local floor = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+local min_cost = tonumber(ARGV[6])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local granted = 0
+local available = math.floor(tokens - floor)
+if available >= min_cost then
+    granted = math.min(cost, available)
+    tokens = tokens - granted
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[7]))
+return {granted, tostring(tokens)}
+"""
+
+
+class RateBudget:
+    """
+    A token bucket per org backend, kept in Valkey and shared by every worker, that the API pulls draw their requests
+    from before making them. The bucket refills at the hourly rate the API allows and holds up to an hour of requests.
+    Lower priority classes can only draw down to a reserve floor, so a long backfill or contact sync leaves room for
+    the main poll sync instead of starving it.
+    """
+
+    def __init__(self, org_id: int, backend_slug: str, hourly_limit: int):
+        self.org_id = org_id
+        self.backend_slug = backend_slug
+        self.capacity = hourly_limit
+        self.rate = hourly_limit / 3600
+        self.key = BUDGET_KEY % (org_id, backend_slug)
+
+    def get_floor(self, priority: str) -> float:
+        return self.capacity * PRIORITY_RESERVES[priority]
+
+    def get_min_cost(self, cost: int) -> int:
+        return max(1, math.ceil(cost * MIN_GRANT_SHARE))
+
+    def acquire(self, priority: str, cost: int) -> tuple:
+        """
+        Takes up to cost requests from the budget for the priority class. Returns the number of requests granted,
+        which may be less than asked, and when nothing is granted the seconds to wait before the budget for the
+        priority class has refilled enough to try again.
+        """
+        r = get_valkey_connection()
+        now = time.time()
+        floor = self.get_floor(priority)
+        min_cost = self.get_min_cost(cost)
+
+        script = r.register_script(ACQUIRE_SCRIPT)
+        granted, tokens = script(
+            keys=[self.key], args=[self.capacity, self.rate, now, floor, cost, min_cost, USAGE_TIMEOUT]
+        )
+        granted = int(granted)
+
+        usage_key = self.get_usage_key(now)
+        with r.pipeline() as pipe:
+            pipe.sadd(BUDGETS_SET_KEY, f"{self.org_id}:{self.backend_slug}")
+            if granted:
+                pipe.hincrby(usage_key, f"used:{priority}", granted)
+            else:
+                pipe.hincrby(usage_key, f"denied:{priority}", 1)
+            pipe.expire(usage_key, USAGE_TIMEOUT)
+            pipe.execute()
+
+        if granted:
+            return granted, 0
+
+        wait = (floor + min_cost - float(tokens)) / self.rate
+        logger.info(
+            "Rate budget for org #%d on %s exhausted for %s, %d tokens left, retry in %ds"
+            % (self.org_id, self.backend_slug, priority, float(tokens), wait)
+        )
+        return 0, max(1, math.ceil(wait))
+
+    def settle(self, priority: str, granted: int, used: int = None):
+        """
+        Gives back the part of a grant the pull didn't use, or charges the requests it made beyond it, which can take
+        the budget below zero until it refills. A pull that can't tell how many requests it made keeps the whole
+        grant.
+        """
+        if used is None or used == granted:
+            return
+
+        r = get_valkey_connection()
+
+        # negative when the pull made more requests than granted
+        unused = granted - used
+
+        with r.pipeline() as pipe:
+            pipe.hincrbyfloat(self.key, "tokens", unused)
+            pipe.hincrby(self.get_usage_key(time.time()), f"used:{priority}", -unused)
+            pipe.execute()
+
+    def exhaust(self, priority: str, cost: int) -> int:
+        """
+        Empties the budget after the API refused a request as over its rate limit, which means other clients of the
+        same token drew from it too. Returns the seconds to wait before the budget for the priority class has refilled
+        enough for the refused pull.
+        """
+        r = get_valkey_connection()
+        now = time.time()
+
+        with r.pipeline() as pipe:
+            pipe.hset(self.key, mapping={"tokens": 0, "updated": now})
+            pipe.expire(self.key, USAGE_TIMEOUT)
+            pipe.hincrby(self.get_usage_key(now), "rate-limited", 1)
+            pipe.execute()
+
+        return max(1, math.ceil((self.get_floor(priority) + self.get_min_cost(cost)) / self.rate))
+
+    def get_tokens(self) -> float:
+        tokens, updated = get_valkey_connection().hmget(self.key, "tokens", "updated")
+        if tokens is None:
+            return float(self.capacity)
+
+        elapsed = max(0, time.time() - float(updated))
+        return min(self.capacity, float(tokens) + elapsed * self.rate)
+
+    def get_usage_key(self, now: float) -> str:
+        return USAGE_KEY % (self.org_id, self.backend_slug, int(now // 3600))
+
+    def get_usage(self, hours: int = 1) -> dict:
+        """
+        Gets the requests each priority class used and was denied, and the rate limit refusals, over the last hours
+        """
+        r = get_valkey_connection()
+        now = time.time()
+
+        with r.pipeline() as pipe:
+            for hour in range(hours):
+                pipe.hgetall(self.get_usage_key(now - hour * 3600))
+            hours_usage = pipe.execute()
+
+        used, denied, rate_limited = dict(), dict(), 0
+        for hour_usage in hours_usage:
+            for field, value in hour_usage.items():
+                field, value = field.decode() if isinstance(field, bytes) else field, int(value)
+                if field == "rate-limited":
+                    rate_limited += value
+                else:
+                    counter, priority = field.split(":", 1)
+                    totals = used if counter == "used" else denied
+                    totals[priority] = totals.get(priority, 0) + value
+
+        return dict(
+            capacity=self.capacity,
+            tokens=int(self.get_tokens()),
+            used=used,
+            denied=denied,
+            rate_limited=rate_limited,
+        )
+
+    @classmethod
+    def get_usage_report(cls, hours: int = 1) -> dict:
+        """
+        Gets the usage of every budget drawn from, keyed by org id and backend slug
+        """
+        from dash.orgs.models import Org
+
+        report = dict()
+        members = sorted(
+            member.decode() if isinstance(member, bytes) else member
+            for member in get_valkey_connection().smembers(BUDGETS_SET_KEY)
+        )
+        orgs = {org.id: org for org in Org.objects.filter(id__in={int(member.split(":")[0]) for member in members})}
+
+        for member in members:
+            org_id, backend_slug = member.split(":", 1)
+            org = orgs.get(int(org_id))
+            if not org:
+                continue
+
+            budget = org.get_backend(backend_slug=backend_slug).get_rate_budget(org)
+            if budget:
+                report[member] = budget.get_usage(hours)
+
+        return report
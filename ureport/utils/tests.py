@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import json
+import time
 import zoneinfo
 from datetime import datetime, timezone as tzone
 
 import mock
 import valkey
+from django_valkey import get_valkey_connection
 from mock import patch
+from temba_client.exceptions import TembaRateExceededError
 from temba_client.v2 import Flow
 
 from django.conf import settings
@@ -21,6 +24,7 @@ from ureport.tests import UreportTest
 from ureport.utils import (
     GLOBAL_COUNT_CACHE_KEY,
     ORG_CONTACT_COUNT_KEY,
+    build_org_contacts_counts_snapshot,
     datetime_to_json_date,
     fetch_flows,
     fetch_old_sites_count,
@@ -34,9 +38,20 @@ from ureport.utils import (
     get_registration_stats,
     get_reporters_count,
     get_ureporters_locations_stats,
+    iter_counts_since,
     json_date_to_datetime,
     update_poll_flow_data,
 )
+from ureport.utils.prefetch import PrefetchedFetches
+from ureport.utils.rate_budget import (
+    PRIORITY_CONTACTS,
+    PRIORITY_MAIN_POLL,
+    PRIORITY_OTHER_POLLS,
+    PRIORITY_RECENT_POLLS,
+    RateBudget,
+)
+from ureport.utils.tiered_cache import TieredCache
+from ureport.utils.time_buckets import TimeBuckets
 
 
 class UtilsTest(UreportTest):
@@ -500,9 +515,7 @@ class UtilsTest(UreportTest):
 
                     self.assertEqual(get_org_contacts_counts(self.org), {"total-reporters": 13})
                     mock_cache_get.assert_called_once_with(ORG_CONTACT_COUNT_KEY % self.org.pk, None)
-                    mock_cache_set.assert_called_once_with(
-                        f"{ORG_CONTACT_COUNT_KEY % self.org.pk}-total-reporters", 13, None
-                    )
+                    self.assertFalse(mock_cache_set.called)
 
                     self.assertFalse(mock_get_counts.called)
 
@@ -511,9 +524,47 @@ class UtilsTest(UreportTest):
 
                     self.assertEqual(get_org_contacts_counts(self.org), {"total-reporters": 50})
                     mock_get_counts.assert_called_once_with(self.org)
-                    mock_cache_set.assert_called_once_with(
-                        ORG_CONTACT_COUNT_KEY % self.org.pk, {"total-reporters": 50}, None
-                    )
+                    mock_cache_set.assert_any_call(ORG_CONTACT_COUNT_KEY % self.org.pk, {"total-reporters": 50}, None)
+                    mock_cache_set.assert_any_call(f"{ORG_CONTACT_COUNT_KEY % self.org.pk}-total-reporters", 50, None)
+
+    def test_build_org_contacts_counts_snapshot(self):
+        snapshot = build_org_contacts_counts_snapshot(
+            {
+                "total-reporters": 50,
+                "born:1990": 3,
+                "born:19900": 1,
+                "state:R-LAGOS": 5,
+                "district:R-OYO": 2,
+                "ward:R-IKEJA": 1,
+                "scheme:": 4,
+                "scheme:tel": 10,
+                "scheme:ext": 2,
+                "registered_on:2024-01-02": 4,
+                "registered_on:2024-01-01": 6,
+                "registered_gender:2024-01-01:f": 3,
+                "registered_born:2024-01-02:1990": 2,
+                "registered_state:2024-01-01:R-LAGOS": 5,
+                "registered_scheme:2024-01-02:tel": 1,
+            }
+        )
+
+        self.assertEqual(snapshot["born"], {"1990": 3})
+        self.assertEqual(snapshot["state"], {"R-LAGOS": 5})
+        self.assertEqual(snapshot["district"], {"R-OYO": 2})
+        self.assertEqual(snapshot["ward"], {"R-IKEJA": 1})
+        self.assertEqual(snapshot["scheme"], {"ext": 2, "tel": 10})
+        self.assertEqual(list(snapshot["registered_on"].items()), [("2024-01-01", 6), ("2024-01-02", 4)])
+        self.assertEqual(snapshot["registered_gender"], {"f": {"2024-01-01": 3}})
+        self.assertEqual(snapshot["registered_born"], {"1990": {"2024-01-02": 2}})
+        self.assertEqual(snapshot["registered_state"], {"R-LAGOS": {"2024-01-01": 5}})
+        self.assertEqual(snapshot["registered_scheme"], {"tel": {"2024-01-02": 1}})
+
+        date_counts = {"2024-01-01": 1, "2024-01-02": 2, "2024-01-03": 3}
+        self.assertEqual(list(iter_counts_since(date_counts, "2024-01-02")), [("2024-01-03", 3)])
+        self.assertEqual(
+            list(iter_counts_since(date_counts, "2024-01-02", inclusive=True)), [("2024-01-03", 3), ("2024-01-02", 2)]
+        )
+        self.assertEqual(list(iter_counts_since(date_counts, "2024-01-04")), [])
 
     def test_get_flows(self):
         with patch("ureport.utils.fetch_flows") as mock_fetch_flows:
@@ -570,3 +621,357 @@ class UtilsTest(UreportTest):
 
                 self.assertEqual(get_global_count(), 20)
                 cache_get_mock.assert_called_once_with("global_count", None)
+
+
+class RateBudgetTest(UreportTest):
+    def setUp(self):
+        super(RateBudgetTest, self).setUp()
+        self.budget = RateBudget(self.nigeria.id, "rapidpro", 3600)
+
+        self.addCleanup(get_valkey_connection().delete, self.budget.key, self.budget.get_usage_key(time.time()))
+
+    def test_acquire(self):
+        # a fresh budget is full
+        self.assertEqual(self.budget.acquire(PRIORITY_CONTACTS, 100), (100, 0))
+        self.assertAlmostEqual(self.budget.get_tokens(), 3500, delta=1)
+
+        # contacts only draw down to half of the budget
+        self.assertEqual(self.budget.acquire(PRIORITY_CONTACTS, 1700), (1700, 0))
+
+        granted, wait = self.budget.acquire(PRIORITY_CONTACTS, 100)
+        self.assertEqual(granted, 0)
+        self.assertAlmostEqual(wait, 25, delta=1)
+
+        # the grant can be less than the cost, down to the floor of the priority class
+        granted, wait = self.budget.acquire(PRIORITY_RECENT_POLLS, 2000)
+        self.assertAlmostEqual(granted, 1440, delta=2)
+        self.assertEqual(wait, 0)
+
+        self.assertEqual(self.budget.acquire(PRIORITY_OTHER_POLLS, 100)[0], 0)
+
+        # unused requests are given back
+        self.budget.settle(PRIORITY_RECENT_POLLS, granted, 100)
+        left = self.budget.get_tokens()
+        self.assertAlmostEqual(left, 1700, delta=2)
+
+        # the main poll can take everything left
+        granted, wait = self.budget.acquire(PRIORITY_MAIN_POLL, 5000)
+        self.assertAlmostEqual(granted, left, delta=2)
+
+        usage = self.budget.get_usage()
+        self.assertEqual(usage["capacity"], 3600)
+        self.assertEqual(usage["used"][PRIORITY_CONTACTS], 1800)
+        self.assertEqual(usage["used"][PRIORITY_RECENT_POLLS], 100)
+        self.assertEqual(usage["denied"], {PRIORITY_CONTACTS: 1, PRIORITY_OTHER_POLLS: 1})
+        self.assertEqual(usage["rate_limited"], 0)
+
+    def test_settle(self):
+        self.assertEqual(self.budget.acquire(PRIORITY_MAIN_POLL, 10), (10, 0))
+
+        # a pull that can't tell its requests keeps the whole grant
+        self.budget.settle(PRIORITY_MAIN_POLL, 10)
+        self.assertAlmostEqual(self.budget.get_tokens(), 3590, delta=1)
+
+        # requests made beyond the grant are charged too
+        self.budget.settle(PRIORITY_MAIN_POLL, 10, 25)
+        self.assertAlmostEqual(self.budget.get_tokens(), 3575, delta=1)
+        self.assertEqual(self.budget.get_usage()["used"], {PRIORITY_MAIN_POLL: 25})
+
+        # and can take the budget below zero until it refills
+        get_valkey_connection().hset(self.budget.key, mapping={"tokens": 5, "updated": time.time()})
+        self.budget.settle(PRIORITY_MAIN_POLL, 10, 30)
+        self.assertLess(self.budget.get_tokens(), 0)
+        self.assertEqual(self.budget.acquire(PRIORITY_MAIN_POLL, 10)[0], 0)
+
+    def test_exhaust(self):
+        self.budget.acquire(PRIORITY_MAIN_POLL, 10)
+
+        # after being rate limited, a main poll chunk waits for its minimum share, contacts for half the budget too
+        self.assertEqual(self.budget.exhaust(PRIORITY_MAIN_POLL, 20), 5)
+        self.assertEqual(self.budget.exhaust(PRIORITY_CONTACTS, 20), 1805)
+        self.assertLess(self.budget.get_tokens(), 5)
+        self.assertEqual(self.budget.acquire(PRIORITY_RECENT_POLLS, 20)[0], 0)
+
+        usage = self.budget.get_usage()
+        self.assertEqual(usage["used"], {PRIORITY_MAIN_POLL: 10})
+        self.assertEqual(usage["rate_limited"], 2)
+
+    def test_get_usage_report(self):
+        with self.settings(RAPIDPRO_API_RATE_LIMIT=3600):
+            self.budget.acquire(PRIORITY_MAIN_POLL, 10)
+
+            report = RateBudget.get_usage_report()
+
+        self.assertEqual(report[f"{self.nigeria.id}:rapidpro"]["used"], {PRIORITY_MAIN_POLL: 10})
+        self.assertEqual(report[f"{self.nigeria.id}:rapidpro"]["capacity"], 3600)
+
+
+class FakeRunsAPI:
+    """
+    Pages of a fake API query served with latency, with the cursor semantics of the client's iterfetches
+    """
+
+    def __init__(self, pages, latency=0.0, raise_on_fetch=None):
+        self.pages = pages
+        self.latency = latency
+        self.raise_on_fetch = raise_on_fetch
+        self.pos = 0
+        self.fetched = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        time.sleep(self.latency)
+        if self.pos == self.raise_on_fetch:
+            raise TembaRateExceededError(0)
+        if self.pos >= len(self.pages):
+            raise StopIteration()
+
+        self.fetched.append(self.pos)
+        self.pos += 1
+        return self.pages[self.pos - 1]
+
+    def get_cursor(self):
+        if not self.fetched:
+            return None
+        return str(self.pos) if self.pos < len(self.pages) else None
+
+
+class PrefetchedFetchesTest(UreportTest):
+    def test_pages_are_fetched_while_processing(self):
+        api = FakeRunsAPI([["a"], ["b"], ["c"], ["d"]], latency=0.05)
+        fetches = PrefetchedFetches(api, depth=2)
+
+        pages, cursors = [], []
+        start = time.time()
+        for fetch in fetches:
+            # the page being processed takes as long as fetching the next one
+            time.sleep(0.05)
+            pages.append(fetch)
+            cursors.append(fetches.get_cursor())
+
+        self.assertEqual(pages, [["a"], ["b"], ["c"], ["d"]])
+
+        # the cursor is the one for the page after the last one processed, not after the last one fetched
+        self.assertEqual(cursors, ["1", "2", "3", None])
+
+        # sequentially, fetching and processing would have taken 0.45s
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_fetches_ahead_up_to_depth_and_limit(self):
+        api = FakeRunsAPI([["a"], ["b"], ["c"], ["d"], ["e"]])
+        fetches = PrefetchedFetches(api, depth=1, limit=3)
+
+        for fetch in fetches:
+            if fetch == ["a"]:
+                # one page is waiting and another one is fetched, blocked on handing it over
+                time.sleep(0.2)
+                self.assertEqual(api.fetched, [0, 1, 2])
+
+        self.assertEqual(api.fetched, [0, 1, 2])
+        self.assertEqual(fetches.get_cursor(), "3")
+
+    def test_stopping_early(self):
+        api = FakeRunsAPI([["a"], ["b"], ["c"], ["d"], ["e"]], latency=0.01)
+        fetches = PrefetchedFetches(api, depth=1)
+
+        for fetch in fetches:
+            break
+
+        fetches.close()
+
+        self.assertFalse(fetches.thread.is_alive())
+        self.assertLessEqual(len(api.fetched), 3)
+
+        # the next pull resumes after the pages processed, not those fetched ahead
+        self.assertEqual(fetches.get_cursor(), "1")
+
+    def test_errors_follow_pages_fetched_before(self):
+        api = FakeRunsAPI([["a"], ["b"], ["c"]], raise_on_fetch=2)
+        fetches = PrefetchedFetches(api, depth=2)
+
+        pages = []
+        with self.assertRaises(TembaRateExceededError):
+            for fetch in fetches:
+                pages.append(fetch)
+
+        self.assertEqual(pages, [["a"], ["b"]])
+        self.assertEqual(fetches.get_cursor(), "2")
+
+        # no cursor when no page is fetched
+        fetches = PrefetchedFetches(FakeRunsAPI([["a"]], raise_on_fetch=0))
+        with self.assertRaises(TembaRateExceededError):
+            list(fetches)
+
+        self.assertIsNone(fetches.get_cursor())
+
+    def test_pages_without_cursor(self):
+        self.assertEqual(list(PrefetchedFetches([["a"], ["b"]])), [["a"], ["b"]])
+        self.assertEqual(list(PrefetchedFetches([])), [])
+
+
+class TieredCacheTest(UreportTest):
+    def setUp(self):
+        super(TieredCacheTest, self).setUp()
+        self.tiered = TieredCache()
+
+    def test_disabled(self):
+        from django.core.cache import cache
+
+        cache.set("tiered-key", 1, None)
+        self.assertEqual(self.tiered.get("tiered-key", family="tests"), 1)
+
+        cache.set("tiered-key", 2, None)
+        self.assertEqual(self.tiered.get("tiered-key", family="tests"), 2)
+        self.assertEqual(self.tiered.get("tiered-missing", "default"), "default")
+
+        # nothing kept locally and nothing counted
+        self.assertEqual(self.tiered.get_stats(), dict())
+
+    @patch("ureport.utils.tiered_cache.get_valkey_connection")
+    @patch("ureport.utils.tiered_cache.TieredCache._ensure_listener")
+    def test_get_and_invalidate(self, mock_ensure_listener, mock_valkey_connection):
+        from django.core.cache import cache
+
+        mock_ensure_listener.return_value = True
+
+        with self.settings(TIERED_CACHE_TIMEOUT=30, TIERED_CACHE_MAX_ENTRIES=2):
+            cache.set("tiered-key", 1, None)
+
+            self.assertEqual(self.tiered.get("tiered-key", family="tests"), 1)
+            self.assertEqual(self.tiered.get_stats(), dict(tests=dict(hits=0, misses=1, hit_ratio=0)))
+
+            # direct writes to the cache aren't seen until the local copy expires
+            cache.set("tiered-key", 2, None)
+            self.assertEqual(self.tiered.get("tiered-key", family="tests"), 1)
+            self.assertEqual(self.tiered.get_stats(), dict(tests=dict(hits=1, misses=1, hit_ratio=0.5)))
+
+            # writes through the tier drop the local copy and are broadcast
+            self.tiered.set("tiered-key", 3, None)
+            mock_valkey_connection.return_value.publish.assert_called_once_with("tiered-cache:invalidate", "tiered-key")
+            self.assertEqual(self.tiered.get("tiered-key", family="tests"), 3)
+            self.assertEqual(self.tiered.get("tiered-key", family="tests"), 3)
+            self.assertEqual(self.tiered.get_stats(), dict(tests=dict(hits=2, misses=2, hit_ratio=0.5)))
+
+            # as do invalidations from other processes
+            cache.set("tiered-key", 4, None)
+            self.tiered._evict("tiered-key")
+            self.assertEqual(self.tiered.get("tiered-key", family="tests"), 4)
+
+            # missing keys aren't kept locally
+            self.assertIsNone(self.tiered.get("tiered-missing", family="tests"))
+            cache.set("tiered-missing", 5, None)
+            self.assertEqual(self.tiered.get("tiered-missing", family="tests"), 5)
+
+            # only the most recently used keys are kept
+            cache.set("tiered-other", 6, None)
+            self.assertEqual(self.tiered.get("tiered-other", family="tests"), 6)
+            self.assertEqual(list(self.tiered._entries.keys()), ["tiered-missing", "tiered-other"])
+
+            self.tiered.delete("tiered-other")
+            self.assertIsNone(cache.get("tiered-other"))
+            self.assertEqual(list(self.tiered._entries.keys()), ["tiered-missing"])
+
+    @patch("ureport.utils.tiered_cache.SUBSCRIBE_TIMEOUT", 0.05)
+    @patch("ureport.utils.tiered_cache.get_valkey_connection")
+    def test_ensure_listener(self, mock_valkey_connection):
+        import threading
+
+        confirm_subscribe = threading.Event()
+        stop_listening = threading.Event()
+
+        def listen():
+            confirm_subscribe.wait(5)
+            yield dict(type="subscribe", channel=b"tiered-cache:invalidate", data=1)
+            stop_listening.wait(5)
+            yield dict(type="message", channel=b"tiered-cache:invalidate", data=b"tiered-key")
+
+        mock_valkey_connection.return_value.pubsub.return_value.listen.side_effect = listen
+
+        # the local tier isn't used until the listener is subscribed
+        self.assertFalse(self.tiered._ensure_listener())
+        mock_valkey_connection.return_value.pubsub.return_value.subscribe.assert_called_once_with(
+            "tiered-cache:invalidate"
+        )
+
+        confirm_subscribe.set()
+        self.assertTrue(self.tiered._ensure_listener())
+        self.assertTrue(self.tiered._is_listening())
+
+        # the same listener is kept while it runs
+        self.assertTrue(self.tiered._ensure_listener())
+        self.assertEqual(mock_valkey_connection.return_value.pubsub.call_count, 1)
+
+        stop_listening.set()
+        self.tiered._listener.join(5)
+        self.assertFalse(self.tiered._is_listening())
+
+
+class TimeBucketsTest(UreportTest):
+    def test_buckets(self):
+        from datetime import date, timedelta
+
+        def day_bucket(day, time_filter):
+            if time_filter == 12:
+                return day.replace(day=1)
+            if time_filter == 6:
+                return day.replace(day=1 if day.day < 16 else 16)
+            if time_filter == 3:
+                return day.replace(day=1 if day.day < 11 else 11 if day.day < 21 else 21)
+            return day
+
+        for today in (date(2024, 2, 29), date(2024, 3, 31), date(2024, 12, 15), date(2025, 1, 1)):
+            for time_filter in (3, 6, 12):
+                time_buckets = TimeBuckets(time_filter, today)
+
+                # walk the range day by day, every day falls in the period of its own day bucket
+                first_day = today - timedelta(days=time_filter * 30)
+                if time_filter != 3:
+                    first_day = first_day.replace(day=1)
+
+                expected_keys = set()
+                day = today
+                while day >= first_day:
+                    expected_keys.add(str(day_bucket(day, time_filter)))
+                    self.assertEqual(time_buckets.get_key(day), str(day_bucket(day, time_filter)))
+                    day -= timedelta(days=1)
+
+                self.assertEqual(time_buckets.keys, sorted(expected_keys))
+                self.assertIsNone(time_buckets.get_index(first_day - timedelta(days=1)))
+                self.assertIsNone(time_buckets.get_index(today + timedelta(days=1)))
+
+        time_buckets = TimeBuckets(3, date(2024, 3, 31))
+        self.assertEqual(
+            time_buckets.keys,
+            ["2024-01-01", "2024-01-11", "2024-01-21", "2024-02-01", "2024-02-11", "2024-02-21"]
+            + ["2024-03-01", "2024-03-11", "2024-03-21"],
+        )
+        self.assertEqual(time_buckets.get_key("2024-02-29"), "2024-02-21")
+        self.assertEqual(time_buckets.get_key(datetime(2024, 1, 11, 23, 59, tzinfo=tzone.utc)), "2024-01-11")
+
+        rows = [
+            dict(date=date(2024, 3, 30), series="a", count__sum=2),
+            dict(date=date(2024, 3, 21), series="a", count__sum=3),
+            dict(date=date(2024, 3, 20), series="b", count__sum=4),
+            dict(date=date(2023, 1, 1), series="b", count__sum=10),
+        ]
+        series_counts = time_buckets.sum_series(rows, series_field="series")
+        self.assertEqual(series_counts["a"], [0, 0, 0, 0, 0, 0, 0, 0, 5])
+        self.assertEqual(series_counts["b"], [0, 0, 0, 0, 0, 0, 0, 4, 0])
+        self.assertEqual(time_buckets.sum_series(rows)[None], [0, 0, 0, 0, 0, 0, 0, 4, 5])
+
+        self.assertEqual(
+            time_buckets.to_data(time_buckets.sum_dates([("2024-03-11", 1), ("2024-03-12", 2)])),
+            {
+                "2024-01-01": 0,
+                "2024-01-11": 0,
+                "2024-01-21": 0,
+                "2024-02-01": 0,
+                "2024-02-11": 0,
+                "2024-02-21": 0,
+                "2024-03-01": 0,
+                "2024-03-11": 3,
+                "2024-03-21": 0,
+            },
+        )
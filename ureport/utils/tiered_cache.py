@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django_valkey import get_valkey_connection
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "tiered-cache:invalidate"
+
+# how long a get waits for a new listener to be subscribed before reading from the default cache instead
+SUBSCRIBE_TIMEOUT = 1
+
+_missing = object()
+
+
+class TieredCache:
+    """
+    A bounded per-process LRU with a short timeout in front of the default cache, for small values read on every
+    request but rarely rewritten. Keys written or deleted through it are broadcast over Valkey pub/sub so that every
+    process drops its local copy, values written directly to the default cache are only picked up once the local
+    timeout expires.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: dict(hits=0, misses=0))
+        self._listener = None
+        self._listener_pid = None
+        self._subscribed = threading.Event()
+        self._listener_retry_at = 0
+
+    @staticmethod
+    def get_timeout() -> int:
+        return getattr(settings, "TIERED_CACHE_TIMEOUT", 30)
+
+    @staticmethod
+    def get_max_entries() -> int:
+        return getattr(settings, "TIERED_CACHE_MAX_ENTRIES", 1000)
+
+    def get(self, key: str, default=None, family: str = None):
+        """
+        Gets the value for the key from the local tier if it's there and fresh, otherwise from the default cache. The
+        family groups related keys, e.g. one per org, for the hit ratios.
+        """
+        timeout = self.get_timeout()
+        if timeout <= 0 or not self._ensure_listener():
+            return cache.get(key, default)
+
+        family = family or key
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats[family]["hits"] += 1
+                return entry[1]
+
+            self._stats[family]["misses"] += 1
+
+        value = cache.get(key, _missing)
+        if value is _missing:
+            return default
+
+        with self._lock:
+            self._entries[key] = (now + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.get_max_entries():
+                self._entries.popitem(last=False)
+
+        return value
+
+    def set(self, key: str, value, timeout=DEFAULT_TIMEOUT):
+        cache.set(key, value, timeout)
+        self.invalidate(key)
+
+    def delete(self, key: str):
+        cache.delete(key)
+        self.invalidate(key)
+
+    def invalidate(self, key: str):
+        """
+        Drops the key from the local tier of this process and of all the other processes
+        """
+        self._evict(key)
+
+        if self.get_timeout() <= 0:
+            return
+
+        try:
+            get_valkey_connection().publish(INVALIDATION_CHANNEL, key)
+        except Exception:
+            logger.warning("Unable to broadcast tiered cache invalidation for %s" % key, exc_info=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Gets the hits, misses and hit ratio of the local tier by key family
+        """
+        with self._lock:
+            stats = {family: dict(counts) for family, counts in self._stats.items()}
+
+        for counts in stats.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_ratio"] = counts["hits"] / lookups if lookups else 0
+
+        return stats
+
+    def _evict(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _is_running(self) -> bool:
+        return self._listener is not None and self._listener_pid == os.getpid() and self._listener.is_alive()
+
+    def _is_listening(self) -> bool:
+        return self._is_running() and self._subscribed.is_set()
+
+    def _ensure_listener(self) -> bool:
+        """
+        Starts the invalidation listener thread in this process if it isn't running, e.g. after a fork, and waits for
+        it to be subscribed. Returns whether the local tier can be used, which it can't until the listener receives
+        the invalidations of the other processes, nor for a while after the listener failed.
+        """
+        if self._is_listening():
+            return True
+
+        with self._lock:
+            if not self._is_running():
+                if time.monotonic() < self._listener_retry_at:
+                    return False
+
+                # we may have missed invalidations while there was no listener
+                self._entries.clear()
+
+                self._subscribed = threading.Event()
+                self._listener_pid = os.getpid()
+                self._listener = threading.Thread(
+                    target=self._listen, args=(self._subscribed,), name="tiered-cache-invalidation", daemon=True
+                )
+                self._listener.start()
+
+            subscribed = self._subscribed
+
+        return subscribed.wait(SUBSCRIBE_TIMEOUT)
+
+    def _listen(self, subscribed):
+        try:
+            pubsub = get_valkey_connection().pubsub()
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+
+            for message in pubsub.listen():
+                if message.get("type") == "subscribe":
+                    subscribed.set()
+                    continue
+
+                if message.get("type") != "message":
+                    continue
+
+                key = message.get("data")
+                if isinstance(key, bytes):
+                    key = key.decode()
+                self._evict(key)
+        except Exception:
+            logger.warning("Tiered cache invalidation listener stopped", exc_info=True)
+            self._listener_retry_at = time.monotonic() + self.get_timeout()
+        finally:
+            # local values can't be trusted without a listener, the next get restarts one
+            self.clear()
+
+
+tiered_cache = TieredCache()
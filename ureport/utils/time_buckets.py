@@ -0,0 +1,120 @@
+import bisect
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+
+def get_bucket_start(day: date, time_filter: int) -> date:
+    """
+    Gets the first day of the period of the time filter the day falls in, months for 12, half months for 6, thirds of
+    months for 3 and the day itself otherwise
+    """
+    if time_filter == 12:
+        return day.replace(day=1)
+    if time_filter == 6:
+        return day.replace(day=1 if day.day < 16 else 16)
+    if time_filter == 3:
+        return day.replace(day=1 if day.day < 11 else 11 if day.day < 21 else 21)
+    return day
+
+
+def get_next_bucket_start(bucket_start: date, time_filter: int) -> date:
+    if time_filter == 12 or (time_filter, bucket_start.day) in ((6, 16), (3, 21)):
+        return (bucket_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if time_filter == 6:
+        return bucket_start.replace(day=16)
+    if time_filter == 3:
+        return bucket_start.replace(day=bucket_start.day + 10)
+    return bucket_start + timedelta(days=1)
+
+
+class TimeBuckets:
+    """
+    The periods the daily counts of the engagement charts are summed by for a time filter, from the first day of the
+    time filter range up to today. Days are mapped to the index of their period by a binary search on the period
+    boundaries rather than a lookup in a map of every day of the range.
+    """
+
+    def __init__(self, time_filter: int, today: date):
+        first_day = today - timedelta(days=time_filter * 30)
+        if time_filter != 3:
+            first_day = first_day.replace(day=1)
+
+        bucket_starts = []
+        bucket_start = get_bucket_start(first_day, time_filter)
+        while bucket_start <= today:
+            bucket_starts.append(bucket_start)
+            bucket_start = get_next_bucket_start(bucket_start, time_filter)
+
+        self.time_filter = time_filter
+        self.first_day = first_day
+        self.last_day = today
+        self.keys = [str(bucket_start) for bucket_start in bucket_starts]
+
+        self._ordinals = [bucket_start.toordinal() for bucket_start in bucket_starts]
+        self._first_ordinal = first_day.toordinal()
+        self._last_ordinal = today.toordinal()
+
+    def get_index(self, day) -> int | None:
+        """
+        Gets the index of the period of the day, a date, a datetime or an ISO date string, or None if the day is out of
+        the time filter range
+        """
+        if isinstance(day, str):
+            day = date.fromisoformat(day[:10])
+        elif isinstance(day, datetime):
+            day = day.date()
+
+        ordinal = day.toordinal()
+        if ordinal < self._first_ordinal or ordinal > self._last_ordinal:
+            return None
+
+        return bisect.bisect_right(self._ordinals, ordinal) - 1
+
+    def get_key(self, day) -> str | None:
+        index = self.get_index(day)
+        return self.keys[index] if index is not None else None
+
+    def new_counts(self) -> list:
+        return [0] * len(self.keys)
+
+    def sum_series(self, rows, series_field: str = None, date_field: str = "date", value_field: str = "count__sum"):
+        """
+        Sums the values of the rows by period in one pass over the rows, by the value of the series field if given,
+        returning the list of the period sums by series, None without a series field
+        """
+        series_counts = defaultdict(self.new_counts)
+        for row in rows:
+            index = self.get_index(row[date_field])
+            if index is not None:
+                series_counts[row[series_field] if series_field else None][index] += row[value_field]
+        return series_counts
+
+    def sum_dates(self, date_counts) -> list:
+        """
+        Sums the (day, count) pairs by period
+        """
+        counts = self.new_counts()
+        for day, count in date_counts:
+            index = self.get_index(day)
+            if index is not None:
+                counts[index] += count
+        return counts
+
+    def to_data(self, counts) -> dict:
+        """
+        Gets the chart data of the period sums, keyed by the first day of each period
+        """
+        return dict(zip(self.keys, counts))
+
+
+@lru_cache(maxsize=32)
+def _get_time_buckets(time_filter: int, today: date) -> TimeBuckets:
+    return TimeBuckets(time_filter, today)
+
+
+def get_time_buckets(time_filter: int = 12) -> TimeBuckets:
+    """
+    Gets the periods of the time filter up to today, built once per day per process
+    """
+    return _get_time_buckets(time_filter, datetime.now().date())